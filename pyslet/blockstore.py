@@ -4,8 +4,10 @@ import binascii
 import hashlib
 import io
 import logging
+import mmap
 import os
 import random
+import struct
 import threading
 import time
 
@@ -15,10 +17,17 @@ from .odata2 import core
 from .odata2 import csdl as edm
 from .py2 import (
     byte,
+    dict_items,
     join_bytes,
+    py2,
     range3)
 from .vfs import OSFilePath as FilePath
 
+if py2:
+    import Queue as queue
+else:
+    import queue
+
 
 MAX_BLOCK_SIZE = 65536
 """The default maximum block size for block stores: 64K"""
@@ -103,6 +112,17 @@ class BlockStore(object):
         raised."""
         raise BlockMissing(key)
 
+    def retrieve_view(self, key):
+        """Returns the block of data referenced by key without copying
+
+        The result is a bytes-like object that must be treated as read
+        only and should not be kept for longer than necessary as it may
+        refer to storage managed by the block store.  The default
+        implementation simply returns the result of :py:meth:`retrieve`,
+        stores that can return blocks without copying them override it.
+        It is used by :py:class:`BlockStream` when reading."""
+        return self.retrieve(key)
+
     def delete(self, key):
         """Deletes the block of data referenced by key
 
@@ -187,6 +207,385 @@ class FileBlockStore(BlockStore):
                 pass
 
 
+class PackedBlockStore(BlockStore):
+
+    """Class for storing blocks of data in packed segment files.
+
+    Additional keyword arguments:
+
+    dpath
+        A :py:class:`FilePath` instance pointing to a directory in which
+        to store the segment and index files.  If this argument is
+        omitted then a temporary directory is created using the builtin
+        mkdtemp.
+
+    segment_size
+        The size at which a segment file is closed and a new segment is
+        started, defaults to 64MB.
+
+    compact_ratio
+        The fraction of a closed segment that must be occupied by
+        deleted blocks before it is compacted, defaults to 0.5.
+
+    compact_interval
+        If not None, the number of seconds between compactions by a
+        background thread.  Defaults to None, see :py:meth:`compact`.
+
+    Blocks are appended to the current segment file, each prefixed by
+    its binary hash key and length.  The location of each block is
+    recorded in an on-disk, open-addressing hash table (the index) that
+    is accessed through a memory map.  Compared with
+    :py:class:`FileBlockStore` this avoids creating a file (and a
+    directory entry) for each block.  Closed segments are memory
+    mapped and :py:meth:`retrieve_view` returns blocks stored in them
+    without copying, the segment currently being written is read
+    through its open file.
+
+    Deleting a block only marks it as deleted in the index, the space
+    is recovered when the segment containing it is compacted.  The
+    store may be shared by threads but not by processes, call
+    :py:meth:`close` when you have finished with it."""
+
+    #: index file header: magic, version, digest size, slots, used slots
+    IndexHeader = struct.Struct('>8sIIQQ')
+
+    #: size of the index file header
+    INDEX_HEADER_SIZE = 64
+
+    #: the initial number of slots in a new index (must be a power of 2)
+    INDEX_SLOTS = 1024
+
+    EMPTY = 0
+    LIVE = 1
+    DELETED = 2
+
+    def __init__(self, dpath=None, segment_size=0x4000000,
+                 compact_ratio=0.5, compact_interval=None, **kwargs):
+        super(PackedBlockStore, self).__init__(**kwargs)
+        if dpath is None:
+            # create a temporary directory
+            self.dpath = FilePath.mkdtemp('.d', 'pyslet_blockstore-')
+        else:
+            self.dpath = dpath
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self._dir = str(self.dpath)
+        self._dsize = self.hash_class().digest_size
+        #: record header: binary hash key and data length
+        self._record = struct.Struct('>%isI' % self._dsize)
+        #: index slot: binary hash key, state, segment, offset, length
+        self._slot = struct.Struct('>%isBIQI' % self._dsize)
+        self._maps = {}
+        self._seg_live = {}
+        self._seg_total = {}
+        self._open_index()
+        self._active = None
+        self._open_segments()
+        self._stop = threading.Event()
+        self._compactor = None
+        if compact_interval is not None:
+            self._compactor = threading.Thread(
+                target=self._run_compactor, args=(compact_interval, ))
+            self._compactor.daemon = True
+            self._compactor.start()
+
+    def _segment_path(self, seg):
+        return os.path.join(self._dir, "seg%08i.dat" % seg)
+
+    def _open_index(self):
+        path = os.path.join(self._dir, "index.dat")
+        if not os.path.exists(path):
+            self._create_index(path, self.INDEX_SLOTS)
+        self._index_file = open(path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        magic, version, dsize, self._nslots, self._used = \
+            self.IndexHeader.unpack_from(self._index, 0)
+        if magic != b'PYSLETIX' or version != 1 or dsize != self._dsize:
+            raise ValueError("Bad block store index: %s" % path)
+
+    def _create_index(self, path, nslots):
+        with open(path, 'wb') as f:
+            f.write(self.IndexHeader.pack(b'PYSLETIX', 1, self._dsize,
+                                          nslots, 0))
+            f.truncate(self.INDEX_HEADER_SIZE + nslots * self._slot.size)
+
+    def _open_segments(self):
+        segs = []
+        for name in os.listdir(self._dir):
+            if name.startswith("seg") and name.endswith(".dat"):
+                seg = int(name[3:-4])
+                segs.append(seg)
+                self._seg_total[seg] = os.path.getsize(
+                    self._segment_path(seg))
+                self._seg_live[seg] = 0
+        for i in range3(self._nslots):
+            key, state, seg, offset, length = self._slot.unpack_from(
+                self._index, self.INDEX_HEADER_SIZE + i * self._slot.size)
+            if state == self.LIVE:
+                self._seg_live[seg] = (self._seg_live.get(seg, 0) +
+                                       self._record.size + length)
+        if segs:
+            seg = max(segs)
+            if self._seg_total[seg] >= self.segment_size:
+                seg += 1
+        else:
+            seg = 0
+        self._start_segment(seg)
+
+    def _start_segment(self, seg):
+        if self._active is not None:
+            # the closed segment may hold blocks copied by compaction
+            self._sync_active()
+            self._active.close()
+        self._active_seg = seg
+        # opened in append mode so that writes always go to the end of
+        # the file but we can still seek and read blocks back
+        self._active = open(self._segment_path(seg), 'a+b')
+        self._active.seek(0, io.SEEK_END)
+        self._active_size = self._active.tell()
+        self._seg_total.setdefault(seg, self._active_size)
+        self._seg_live.setdefault(seg, 0)
+
+    def _find(self, digest):
+        # returns (slot, found); if not found, slot is where digest
+        # should be inserted
+        mask = self._nslots - 1
+        i = struct.unpack('>Q', digest[:8])[0] & mask
+        free = None
+        while True:
+            key, state, seg, offset, length = self._slot.unpack_from(
+                self._index, self.INDEX_HEADER_SIZE + i * self._slot.size)
+            if state == self.EMPTY:
+                return (i if free is None else free), False
+            elif state == self.DELETED:
+                if free is None:
+                    free = i
+            elif key == digest:
+                return i, True
+            i = (i + 1) & mask
+
+    def _get_slot(self, i):
+        return self._slot.unpack_from(
+            self._index, self.INDEX_HEADER_SIZE + i * self._slot.size)
+
+    def _set_slot(self, i, digest, state, seg, offset, length):
+        self._slot.pack_into(
+            self._index, self.INDEX_HEADER_SIZE + i * self._slot.size,
+            digest, state, seg, offset, length)
+
+    def _add_slot(self, i, digest, seg, offset, length):
+        if self._get_slot(i)[1] == self.EMPTY:
+            self._used += 1
+            self.IndexHeader.pack_into(self._index, 0, b'PYSLETIX', 1,
+                                       self._dsize, self._nslots, self._used)
+        self._set_slot(i, digest, self.LIVE, seg, offset, length)
+        if self._used * 2 > self._nslots:
+            self._resize()
+
+    def _resize(self):
+        entries = []
+        for i in range3(self._nslots):
+            slot = self._get_slot(i)
+            if slot[1] == self.LIVE:
+                entries.append(slot)
+        nslots = self.INDEX_SLOTS
+        while nslots < len(entries) * 4:
+            nslots *= 2
+        path = os.path.join(self._dir, "index.dat")
+        tmp_path = os.path.join(self._dir, "index.tmp")
+        self._create_index(tmp_path, nslots)
+        self._index.close()
+        self._index_file.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+        self._open_index()
+        for digest, state, seg, offset, length in entries:
+            i, found = self._find(digest)
+            self._set_slot(i, digest, self.LIVE, seg, offset, length)
+        self._used = len(entries)
+        self.IndexHeader.pack_into(self._index, 0, b'PYSLETIX', 1,
+                                   self._dsize, self._nslots, self._used)
+
+    def _append(self, digest, data):
+        # appends a record to the active segment, returns the offset
+        if self._active_size >= self.segment_size:
+            self._start_segment(self._active_seg + 1)
+        offset = self._active_size
+        # the file position may have been moved by a read
+        self._active.seek(0, io.SEEK_END)
+        self._active.write(self._record.pack(digest, len(data)))
+        self._active.write(data)
+        self._active.flush()
+        size = self._record.size + len(data)
+        self._active_size += size
+        self._seg_total[self._active_seg] = self._active_size
+        self._seg_live[self._active_seg] += size
+        return offset
+
+    def _sync_active(self):
+        # makes the active segment durable
+        self._active.flush()
+        os.fsync(self._active.fileno())
+
+    def _get_map(self, seg):
+        # only closed segments are mapped, they never grow so each one
+        # is mapped just once
+        m = self._maps.get(seg, None)
+        if m is None:
+            with open(self._segment_path(seg), 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[seg] = m
+        return m
+
+    def _read(self, key, view):
+        digest = binascii.unhexlify(key)
+        with self.lock:
+            i, found = self._find(digest)
+            if not found:
+                raise BlockMissing(key)
+            digest, state, seg, offset, length = self._get_slot(i)
+            start = offset + self._record.size
+            if seg == self._active_seg:
+                self._active.seek(start)
+                return self._active.read(length)
+            m = self._get_map(seg)
+            if view:
+                try:
+                    return memoryview(m)[start:start + length]
+                except TypeError:
+                    # Python 2 mmap objects don't support memoryview
+                    pass
+            return m[start:start + length]
+
+    def store(self, data):
+        key = self.key(data)
+        digest = binascii.unhexlify(key)
+        with self.lock:
+            i, found = self._find(digest)
+            if found:
+                return key
+            elif len(data) > self.max_block_size:
+                raise BlockSize
+            offset = self._append(digest, data)
+            self._add_slot(i, digest, self._active_seg, offset, len(data))
+        return key
+
+    def retrieve(self, key):
+        return self._read(key, False)
+
+    def retrieve_view(self, key):
+        """Returns a memoryview of the block of data referenced by key
+
+        For blocks in closed segments the memoryview refers directly to
+        the memory-mapped segment file so no copy of the data is made.
+        Holding on to the view keeps the mapping alive even if the
+        segment is later compacted and its file removed."""
+        return self._read(key, True)
+
+    def delete(self, key):
+        digest = binascii.unhexlify(key)
+        with self.lock:
+            i, found = self._find(digest)
+            if found:
+                digest, state, seg, offset, length = self._get_slot(i)
+                self._set_slot(i, digest, self.DELETED, seg, offset, length)
+                self._seg_live[seg] -= self._record.size + length
+
+    def compact(self, ratio=None):
+        """Compacts segments containing deleted blocks
+
+        ratio
+            The fraction of a segment's size that must be occupied by
+            deleted blocks before it is compacted, defaults to the
+            *compact_ratio* used to construct the store.
+
+        The remaining blocks in each segment that qualifies are copied
+        to the current segment and the old segment file is removed once
+        the copies and the index have been written to disk.
+        The current segment is never compacted.  Blocks can be stored,
+        retrieved and deleted by other threads while compaction is in
+        progress.  Returns the number of segments removed."""
+        if ratio is None:
+            ratio = self.compact_ratio
+        with self.lock:
+            segs = []
+            for seg, total in dict_items(self._seg_total):
+                if seg == self._active_seg:
+                    continue
+                if total - self._seg_live[seg] >= ratio * total:
+                    segs.append(seg)
+        removed = 0
+        for seg in sorted(segs):
+            self._compact_segment(seg)
+            removed += 1
+        return removed
+
+    def _compact_segment(self, seg):
+        with self.lock:
+            total = self._seg_total[seg]
+            m = self._get_map(seg) if total else None
+        offset = 0
+        while offset < total:
+            # the segment is no longer written so we can read it
+            # without holding the lock
+            if offset + self._record.size > total:
+                break
+            digest, length = self._record.unpack_from(m, offset)
+            start = offset + self._record.size
+            if start + length > total:
+                # an incomplete record
+                break
+            with self.lock:
+                i, found = self._find(digest)
+                if found:
+                    slot = self._get_slot(i)
+                    if slot[2] == seg and slot[3] == offset:
+                        new_offset = self._append(digest,
+                                                  m[start:start + length])
+                        self._set_slot(i, digest, self.LIVE,
+                                       self._active_seg, new_offset, length)
+            offset = start + length
+        with self.lock:
+            # the copied blocks must be durable before the originals go
+            self._sync_active()
+            self._index.flush()
+            del self._seg_total[seg]
+            del self._seg_live[seg]
+            self._maps.pop(seg, None)
+        m = None
+        try:
+            os.remove(self._segment_path(seg))
+        except OSError:
+            # the file may still be open on some platforms
+            logging.warning("PackedBlockStore: failed to remove segment %i",
+                            seg)
+
+    def _run_compactor(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+            except Exception as err:
+                logging.error("PackedBlockStore compaction failed: %s",
+                              str(err))
+
+    def close(self):
+        """Closes the store's segment and index files"""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self.lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+            self._index.flush()
+            self._index.close()
+            self._index_file.close()
+            self._maps = {}
+
+
 class EDMBlockStore(BlockStore):
 
     """Class for storing blocks of data in an EDM-backed data service.
@@ -400,6 +799,73 @@ class LockStore(object):
                                 "on busy hash %s", hash_key)
 
 
+class WorkerJob(object):
+
+    """A job submitted to a :py:class:`WorkerPool`"""
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except Exception as err:
+            self.error = err
+        finally:
+            self.done.set()
+
+    def result(self):
+        """Waits for the job to finish and returns its result
+
+        If the job raised an exception it is raised again."""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class WorkerPool(object):
+
+    """A simple pool of daemon threads
+
+    max_workers
+        The maximum number of threads, defaults to 4.  Threads are
+        started as jobs are submitted until this number is reached, they
+        then run until the process exits.
+
+    Used by :py:class:`BlockStream` to fetch and store blocks in the
+    background."""
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """Submits a job to the pool
+
+        Returns a :py:class:`WorkerJob` instance that will call *func*
+        with *args* on one of the pool's threads."""
+        job = WorkerJob(func, args)
+        with self.lock:
+            if len(self.threads) < self.max_workers:
+                t = threading.Thread(target=self._run)
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+        self.jobs.put(job)
+        return job
+
+    def _run(self):
+        while True:
+            self.jobs.get().run()
+
+
 class StreamStore(object):
 
     """Class for storing stream objects
@@ -469,13 +935,70 @@ class StreamStore(object):
             A block sequence integer
 
         hash
-            The hash key of the block in the block store"""
-
-    def __init__(self, bs, ls, entity_set):
+            The hash key of the block in the block store
+
+    ref_set
+        An optional :py:class:`~pyslet.odata2.csdl.EntitySet` used to
+        hold reference counts for the blocks in the block store.  The
+        entity set must have a string key property named *hash* (as for
+        the block list) and an Edm.Int64 property named *refs*.
+
+        Without reference counts the block lists must be searched for
+        other references to a block each time a block is removed from a
+        stream, with them the count is simply decremented and the block
+        is removed from the block store when it reaches zero.  Blocks
+        that are already in the block store are not stored again.
+        Counts are only updated while holding the lock on the block's
+        hash key.  See :py:meth:`rebuild_refs` for adding reference
+        counts to an existing store.
+
+        The counts are *not* maintained in the same transaction as the
+        block lists.  The stream store works with any data source
+        through the EDM collection API which has no transactions that
+        span more than one collection and no atomic increment, so each
+        count is a keyed read followed by an update, insert or delete.
+        Counts are incremented before block list entities are inserted
+        and decremented after they are deleted, so an interrupted
+        operation leaves counts that are too high: orphaned blocks
+        stay in the block store but a block that is still referenced is
+        never removed.  Use :py:meth:`rebuild_refs` to correct the
+        counts and sweep away the orphans.
+
+    read_ahead
+        The default number of blocks a stream opened for reading fetches
+        in advance, defaults to 0 (no read ahead).  See
+        :py:meth:`open_stream`.
+
+    write_behind
+        The default number of completed blocks a stream opened for
+        writing stores in the background, defaults to 0 (blocks are
+        stored synchronously).  See :py:meth:`open_stream`.
+
+    max_workers
+        The maximum number of threads in the :py:class:`WorkerPool` used
+        for read ahead and write behind, defaults to 4.  The pool is
+        only created when it is first needed."""
+
+    def __init__(self, bs, ls, entity_set, ref_set=None, read_ahead=0,
+                 write_behind=0, max_workers=4):
         self.bs = bs
         self.ls = ls
         self.stream_set = entity_set
         self.block_set = entity_set.get_target('Blocks')
+        self.ref_set = ref_set
+        self.read_ahead = read_ahead
+        self.write_behind = write_behind
+        self.max_workers = max_workers
+        self._workers = None
+        self._workers_lock = threading.Lock()
+
+    def get_workers(self):
+        """Returns the :py:class:`WorkerPool` shared by this store's
+        streams"""
+        with self._workers_lock:
+            if self._workers is None:
+                self._workers = WorkerPool(self.max_workers)
+            return self._workers
 
     def new_stream(self,
                    mimetype=params.MediaType('application', 'octet-stream'),
@@ -518,7 +1041,8 @@ class StreamStore(object):
             stream = streams[stream_id]
         return stream
 
-    def open_stream(self, stream, mode="r"):
+    def open_stream(self, stream, mode="r", read_ahead=None,
+                    write_behind=None):
         """Returns a file-like object for a stream.
 
         Returns an object derived from io.RawIOBase.
@@ -530,12 +1054,27 @@ class StreamStore(object):
             Files are always opened in binary mode.  The characters "r",
             "w" and "+" and "a" are honoured.
 
+        read_ahead
+            The number of blocks to fetch in advance when the stream is
+            opened for reading only.  Defaults to the store's
+            *read_ahead* value.
+
+        write_behind
+            The maximum number of completed blocks that may be waiting
+            to be stored when the stream is opened for writing.
+            Defaults to the store's *write_behind* value.
+
         Warning: read and write methods of the resulting objects do not
         always return all requested bytes.  In particular, read or write
         operations never cross block boundaries in a single call."""
         if stream is None:
             raise ValueError
-        return BlockStream(self, stream, mode)
+        if read_ahead is None:
+            read_ahead = self.read_ahead
+        if write_behind is None:
+            write_behind = self.write_behind
+        return BlockStream(self, stream, mode, read_ahead=read_ahead,
+                           write_behind=write_behind)
 
     def delete_stream(self, stream):
         """Deletes a stream from the store.
@@ -548,39 +1087,62 @@ class StreamStore(object):
             stream.exists = False
 
     def store_block(self, stream, block_num, data):
-        hash_key = self.bs.key(data)
-        with stream['Blocks'].open() as blocks:
-            block = blocks.new_entity()
-            block['num'].set_from_value(block_num)
-            block['hash'].set_from_value(hash_key)
-            blocks.insert_entity(block)
-            # now ensure that the data is stored
-            with self.ls.lock(hash_key):
-                self.bs.store(data)
-            return block
+        """Stores a single block of data in a stream
+
+        Returns the new block list entity, see :py:meth:`store_blocks`."""
+        return self.store_blocks(stream, [(block_num, data)])[0]
+
+    def store_blocks(self, stream, block_data):
+        """Stores blocks of data in a stream
+
+        stream
+            A stream entity
+
+        block_data
+            A list of (block number, data) tuples
+
+        Returns a list of the new block list entities.  The data for
+        each distinct block is stored (and its reference count updated)
+        once, the block list entities are then inserted using a single
+        collection."""
+        hash_keys = []
+        refs = {}
+        for block_num, data in block_data:
+            hash_key = self.bs.key(data)
+            hash_keys.append(hash_key)
+            if hash_key in refs:
+                refs[hash_key][0] += 1
+            else:
+                refs[hash_key] = [1, data]
+        self._add_refs(refs)
+        new_blocks = []
+        try:
+            with stream['Blocks'].open() as blocks:
+                for (block_num, data), hash_key in zip(block_data, hash_keys):
+                    block = blocks.new_entity()
+                    block['num'].set_from_value(block_num)
+                    block['hash'].set_from_value(hash_key)
+                    blocks.insert_entity(block)
+                    new_blocks.append(block)
+        except:
+            # release the references we failed to insert
+            counts = {}
+            for hash_key in hash_keys[len(new_blocks):]:
+                counts[hash_key] = counts.get(hash_key, 0) + 1
+            self._release_refs(counts)
+            raise
+        return new_blocks
 
     def update_block(self, block, data):
         hash_key = block['hash'].value
         new_hash = self.bs.key(data)
         if new_hash == hash_key:
             return
-        filter = core.BinaryExpression(core.Operator.eq)
-        filter.add_operand(core.PropertyExpression('hash'))
-        hash_value = edm.EDMValue.from_type(edm.SimpleType.String)
-        filter.add_operand(core.LiteralExpression(hash_value))
-        # filter is: hash eq <hash_value>
+        self._add_refs({new_hash: [1, data]})
         with self.block_set.open() as base_coll:
-            with self.ls.lock(hash_key):
-                with self.ls.lock(new_hash):
-                    self.bs.store(data)
-                    block['hash'].set_from_value(new_hash)
-                    base_coll.update_entity(block)
-                    # is the old hash key used anywhere?
-                    hash_value.set_from_value(hash_key)
-                    base_coll.set_filter(filter)
-                    if len(base_coll) == 0:
-                        # remove orphan block from block store
-                        self.bs.delete(hash_key)
+            block['hash'].set_from_value(new_hash)
+            base_coll.update_entity(block)
+        self._release_refs({hash_key: 1})
 
     def retrieve_blocklist(self, stream):
         with stream['Blocks'].open() as blocks:
@@ -592,25 +1154,152 @@ class StreamStore(object):
     def retrieve_block(self, block):
         return self.bs.retrieve(block['hash'].value)
 
+    def retrieve_block_view(self, block):
+        """Returns a block's data without copying
+
+        See :py:meth:`BlockStore.retrieve_view` for details."""
+        return self.bs.retrieve_view(block['hash'].value)
+
     def delete_blocks(self, stream, from_num=0):
-        blocks = list(self.retrieve_blocklist(stream))
-        filter = core.BinaryExpression(core.Operator.eq)
-        filter.add_operand(core.PropertyExpression('hash'))
-        hash_value = edm.EDMValue.from_type(edm.SimpleType.String)
-        filter.add_operand(core.LiteralExpression(hash_value))
-        # filter is: hash eq <hash_value>
+        """Deletes blocks from a stream
+
+        stream
+            A stream entity
+
+        from_num
+            The number of the first block to delete, defaults to 0 (all
+            blocks).
+
+        The hashes of the blocks to be deleted are read with a single
+        query, the block list entities are then deleted with a single
+        call to delete_filtered (one DELETE statement for SQL data
+        sources) and the references to each distinct block are released
+        together, removing any blocks orphaned by the deletion from the
+        block store."""
+        counts = {}
+        with stream['Blocks'].open() as blocks:
+            if from_num:
+                filter = core.BinaryExpression(core.Operator.ge)
+                filter.add_operand(core.PropertyExpression('num'))
+                num_value = edm.EDMValue.from_type(edm.SimpleType.Int32)
+                num_value.set_from_value(from_num)
+                filter.add_operand(core.LiteralExpression(num_value))
+                # filter is: num ge <from_num>
+                blocks.set_filter(filter)
+            blocks.set_expand(None, {'hash': None})
+            for block in blocks.itervalues():
+                hash_key = block['hash'].value
+                counts[hash_key] = counts.get(hash_key, 0) + 1
+            if counts:
+                blocks.delete_filtered()
+        self._release_refs(counts)
+
+    def rebuild_refs(self):
+        """Rebuilds the block reference counts from the block lists
+
+        The references to each block are counted in a single pass over
+        the block lists and the stored counts are corrected.  Blocks
+        that are no longer referenced by any stream are removed from the
+        block store.  Use this method to add reference counts to a store
+        created without them or to sweep away blocks orphaned by an
+        interrupted operation.  It should not be used while streams are
+        being written.
+
+        Returns the number of blocks removed."""
+        if self.ref_set is None:
+            raise ValueError("StreamStore has no reference counts")
+        counts = {}
         with self.block_set.open() as base_coll:
-            for block in blocks:
-                if from_num and block['num'].value < from_num:
-                    continue
+            for block in base_coll.itervalues():
                 hash_key = block['hash'].value
+                counts[hash_key] = counts.get(hash_key, 0) + 1
+        removed = 0
+        with self.ref_set.open() as ref_coll:
+            old_counts = {}
+            for ref in ref_coll.itervalues():
+                old_counts[ref['hash'].value] = ref['refs'].value
+            for hash_key in set(old_counts).union(counts):
+                n = counts.get(hash_key, 0)
+                if old_counts.get(hash_key, None) == n:
+                    continue
                 with self.ls.lock(hash_key):
-                    del base_coll[block.key()]
-                    # is this hash key used anywhere?
-                    hash_value.set_from_value(hash_key)
-                    base_coll.set_filter(filter)
-                    if len(base_coll) == 0:
-                        # remove orphan block from block store
+                    if hash_key not in old_counts:
+                        ref = ref_coll.new_entity()
+                        ref['hash'].set_from_value(hash_key)
+                        ref['refs'].set_from_value(n)
+                        ref_coll.insert_entity(ref)
+                    elif n:
+                        ref = ref_coll[hash_key]
+                        ref['refs'].set_from_value(n)
+                        ref_coll.update_entity(ref)
+                    else:
+                        del ref_coll[hash_key]
+                        self.bs.delete(hash_key)
+                        removed += 1
+        return removed
+
+    def _add_refs(self, refs):
+        # refs is a dictionary mapping hash keys on to [count, data];
+        # not transactional with the block list inserts that follow,
+        # see the description of ref_set in the class docstring
+        if self.ref_set is None:
+            for hash_key, ref_info in dict_items(refs):
+                with self.ls.lock(hash_key):
+                    self.bs.store(ref_info[1])
+            return
+        with self.ref_set.open() as ref_coll:
+            for hash_key, ref_info in dict_items(refs):
+                with self.ls.lock(hash_key):
+                    try:
+                        ref = ref_coll[hash_key]
+                    except KeyError:
+                        ref = None
+                    if ref is None:
+                        # a new block, store the data first
+                        self.bs.store(ref_info[1])
+                        ref = ref_coll.new_entity()
+                        ref['hash'].set_from_value(hash_key)
+                        ref['refs'].set_from_value(ref_info[0])
+                        ref_coll.insert_entity(ref)
+                    else:
+                        ref['refs'].set_from_value(
+                            ref['refs'].value + ref_info[0])
+                        ref_coll.update_entity(ref)
+
+    def _release_refs(self, counts):
+        # counts is a dictionary mapping hash keys on to counts; called
+        # after the block list entities have been deleted
+        if self.ref_set is None:
+            filter = core.BinaryExpression(core.Operator.eq)
+            filter.add_operand(core.PropertyExpression('hash'))
+            hash_value = edm.EDMValue.from_type(edm.SimpleType.String)
+            filter.add_operand(core.LiteralExpression(hash_value))
+            # filter is: hash eq <hash_value>
+            with self.block_set.open() as base_coll:
+                for hash_key in counts:
+                    with self.ls.lock(hash_key):
+                        # is this hash key used anywhere?
+                        hash_value.set_from_value(hash_key)
+                        base_coll.set_filter(filter)
+                        if len(base_coll) == 0:
+                            # remove orphan block from block store
+                            self.bs.delete(hash_key)
+            return
+        with self.ref_set.open() as ref_coll:
+            for hash_key, n in dict_items(counts):
+                with self.ls.lock(hash_key):
+                    try:
+                        ref = ref_coll[hash_key]
+                    except KeyError:
+                        logging.warning("StreamStore: missing reference "
+                                        "count for block %s", hash_key)
+                        continue
+                    n = ref['refs'].value - n
+                    if n > 0:
+                        ref['refs'].set_from_value(n)
+                        ref_coll.update_entity(ref)
+                    else:
+                        del ref_coll[hash_key]
                         self.bs.delete(hash_key)
 
 
@@ -622,21 +1311,45 @@ class BlockStream(io.RawIOBase):
     binary mode.  They are seekable but lack efficiency if random access
     is used across block boundaries.  The main design criteria is to
     ensure that no more than one block is kept in memory at any one
-    time."""
+    time.
+
+    read_ahead
+        If the stream is opened for reading only, the number of
+        following blocks to fetch in advance using the stream store's
+        :py:class:`WorkerPool`.  Defaults to 0.
 
-    def __init__(self, ss, stream, mode="r"):
+    write_behind
+        If the stream is opened for writing, the number of completed new
+        blocks that may be hashed and stored in the background using the
+        stream store's :py:class:`WorkerPool`.  Defaults to 0.  The
+        stream entity itself is only updated when the stream is flushed
+        (or closed) and any error storing a block is raised at that
+        point.
+
+    With these options at most 1 + *read_ahead* or 1 + *write_behind*
+    blocks are held in memory by the stream."""
+
+    def __init__(self, ss, stream, mode="r", read_ahead=0, write_behind=0):
         self.ss = ss
         self.stream = stream
         self.r = "r" in mode or "+" in mode
         self.w = "w" in mode or "+" in mode
         self.size = stream['size'].value
         self.block_size = self.ss.bs.max_block_size
+        self.read_ahead = 0 if self.w else read_ahead
+        self.write_behind = write_behind if self.w else 0
         self._bdata = None
         self._bnum = 0
         self._bpos = 0
         self._btop = 0
         self._bdirty = False
+        self._sdirty = False
         self._md5 = None
+        self._md5_event = None
+        # block fetches in progress, keyed on block number
+        self._prefetch = {}
+        # (block number, job) for blocks being stored
+        self._pending = []
         if "a" in mode:
             self.seek(self.size)
             self.blocks = list(self.ss.retrieve_blocklist(self.stream))
@@ -653,6 +1366,7 @@ class BlockStream(io.RawIOBase):
     def close(self):
         super(BlockStream, self).close()
         self.blocks = None
+        self._prefetch = {}
         self.r = self.w = False
 
     def readable(self):
@@ -675,9 +1389,14 @@ class BlockStream(io.RawIOBase):
             raise IOError("bad value for whence in seek")
         new_bnum = self.pos // self.block_size
         if new_bnum != self._bnum:
-            self.flush()
+            self._flush_block()
             self._bdata = None
             self._bnum = new_bnum
+            for bnum, job in self._pending:
+                if bnum == new_bnum:
+                    # we need the stored block back
+                    self._drain()
+                    break
         self._bpos = self.pos % self.block_size
         self._set_btop()
 
@@ -689,31 +1408,105 @@ class BlockStream(io.RawIOBase):
             self._btop = self.block_size
 
     def flush(self):
-        if self._bdirty:
-            # the current block is dirty, write it out
-            data = self._bdata[:self._btop]
-            if data:
-                block = self.blocks[self._bnum]
-                if block.exists:
-                    self.ss.update_block(block, bytes(data))
-                else:
-                    self.blocks[self._bnum] = self.ss.store_block(
-                        self.stream, self._bnum, data)
-                if self._md5 is not None and self._bnum == self._md5num:
-                    self._md5.update(bytes(data))
-                    self._md5num += 1
-                else:
-                    self._md5 = None
-            if self.size != self.stream['size'].value:
-                self.stream['size'].set_from_value(self.size)
-            now = TimePoint.from_now_utc()
-            self.stream['modified'].set_from_value(now)
-            if self._md5 is not None:
-                self.stream['md5'].set_from_value(self._md5.digest())
+        self._flush_block()
+        self._drain()
+        if self._sdirty:
+            self._commit_stream()
+
+    def _flush_block(self):
+        if not self._bdirty:
+            return
+        data = self._bdata[:self._btop]
+        if data and self.write_behind and not self.blocks[self._bnum].exists:
+            # store this new block in the background
+            while len(self._pending) >= self.write_behind:
+                self._resolve(*self._pending.pop(0))
+            if self._md5 is not None and self._bnum == self._md5num:
+                md5_wait = self._md5_event
+                self._md5_event = threading.Event()
+                job = self.ss.get_workers().submit(
+                    self._store_block, self._bnum, bytes(data), self._md5,
+                    md5_wait, self._md5_event)
+                self._md5num += 1
             else:
-                self.stream['md5'].set_null()
-            self.stream.commit()
+                self._md5 = None
+                job = self.ss.get_workers().submit(
+                    self._store_block, self._bnum, bytes(data))
+            self._pending.append((self._bnum, job))
             self._bdirty = False
+            self._sdirty = True
+            return
+        # a synchronous write
+        self._drain()
+        if data:
+            block = self.blocks[self._bnum]
+            if block.exists:
+                self.ss.update_block(block, bytes(data))
+            else:
+                self.blocks[self._bnum] = self.ss.store_block(
+                    self.stream, self._bnum, data)
+            if self._md5 is not None and self._bnum == self._md5num:
+                self._md5.update(bytes(data))
+                self._md5num += 1
+            else:
+                self._md5 = None
+        self._bdirty = False
+        self._commit_stream()
+
+    def _store_block(self, block_num, data, md5=None, md5_wait=None,
+                     md5_done=None):
+        # called on a worker thread
+        if md5 is not None:
+            try:
+                # the md5 must be updated in block order
+                if md5_wait is not None:
+                    md5_wait.wait()
+                md5.update(data)
+            finally:
+                md5_done.set()
+        return self.ss.store_block(self.stream, block_num, data)
+
+    def _resolve(self, bnum, job):
+        try:
+            self.blocks[bnum] = job.result()
+        except Exception:
+            # the stream is missing this block, the md5 is invalid
+            self._md5 = None
+            raise
+
+    def _drain(self):
+        while self._pending:
+            self._resolve(*self._pending.pop(0))
+
+    def _commit_stream(self):
+        if self.size != self.stream['size'].value:
+            self.stream['size'].set_from_value(self.size)
+        now = TimePoint.from_now_utc()
+        self.stream['modified'].set_from_value(now)
+        if self._md5 is not None:
+            self.stream['md5'].set_from_value(self._md5.digest())
+        else:
+            self.stream['md5'].set_null()
+        self.stream.commit()
+        self._sdirty = False
+
+    def _get_block(self, bnum):
+        job = self._prefetch.pop(bnum, None)
+        if self.read_ahead:
+            # forget fetches outside the read ahead window
+            for n in list(self._prefetch):
+                if n < bnum or n > bnum + self.read_ahead:
+                    del self._prefetch[n]
+            workers = self.ss.get_workers()
+            for n in range3(bnum + 1, min(bnum + 1 + self.read_ahead,
+                                          len(self.blocks))):
+                if n not in self._prefetch:
+                    self._prefetch[n] = workers.submit(
+                        self.ss.retrieve_block_view, self.blocks[n])
+        if job is None:
+            return self.ss.retrieve_block_view(self.blocks[bnum])
+        else:
+            return job.result()
 
     def tell(self):
         return self.pos
@@ -730,10 +1523,10 @@ class BlockStream(io.RawIOBase):
             if self.w:
                 # create a full size block in case we also write
                 self._bdata = bytearray(self.block_size)
-                data = self.ss.retrieve_block(self.blocks[self._bnum])
+                data = self.ss.retrieve_block_view(self.blocks[self._bnum])
                 self._bdata[:len(data)] = data
             else:
-                self._bdata = self.ss.retrieve_block(self.blocks[self._bnum])
+                self._bdata = self._get_block(self._bnum)
         if nbytes > len(b):
             nbytes = len(b)
         b[:nbytes] = self._bdata[self._bpos:self._bpos + nbytes]
@@ -749,27 +1542,27 @@ class BlockStream(io.RawIOBase):
             if self._btop <= 0:
                 # add a new empty blocks first
                 last_block = len(self.blocks)
-                while last_block < self._bnum:
-                    self.blocks.append(self.ss.store_block(
-                        self.stream, last_block, bytearray(self.block_size)))
-                    last_block += 1
-                    self.size = last_block * self.block_size
-                # force the new size to be written
+                if last_block < self._bnum:
+                    zero = bytearray(self.block_size)
+                    self.blocks += self.ss.store_blocks(
+                        self.stream,
+                        [(n, zero) for n in range3(last_block, self._bnum)])
+                    self.size = self._bnum * self.block_size
+                # finally add the last block, but don't store it yet;
+                # any blocks still being stored in the background are
+                # left to finish and the new size is written when the
+                # stream is flushed
                 self._bdata = bytearray(self.block_size)
-                self._bdirty = True
-                self.flush()
-                # finally add the last block, but don't store it yet
                 with self.stream['Blocks'].open() as blist:
                     new_block = blist.new_entity()
                     new_block['num'].set_from_value(self._bnum)
                     self.blocks.append(new_block)
                 self.size = self.pos
                 self._set_btop()
-                if self._bpos:
-                    self._bdirty = True
+                self._sdirty = True
             else:
                 self._bdata = bytearray(self.block_size)
-                data = self.ss.retrieve_block(self.blocks[self._bnum])
+                data = self.ss.retrieve_block_view(self.blocks[self._bnum])
                 self._bdata[:len(data)] = data
         if nbytes > len(b):
             nbytes = len(b)
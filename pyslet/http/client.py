@@ -12,6 +12,8 @@ import threading
 import time
 import traceback
 
+from collections import OrderedDict
+
 try:
     import OpenSSL
     from OpenSSL import SSL, crypto
@@ -140,6 +142,12 @@ class Connection(SortableMixin):
         self.protocol = None
         #: the thread we're currently bound to
         self.thread_id = None
+        #: the slot we occupy amongst the thread's connections to our
+        #: target, see :attr:`Client.max_target_connections`
+        self.slot = 0
+        #: the :class:`ClientTargetStats` for our target, shared with
+        #: other connections to the same target
+        self.target_stats = manager.get_target_stats(self.target_key())
         #: time at which this connection was last active
         self.last_active = 0
         #: timeout (seconds) for our connection
@@ -181,7 +189,11 @@ class Connection(SortableMixin):
         self.recv_buffer_size = 0
 
     def thread_target_key(self):
-        return (self.thread_id, self.scheme, self.host, self.port)
+        if self.slot:
+            return (self.thread_id, self.scheme, self.host, self.port,
+                    self.slot)
+        else:
+            return (self.thread_id, self.scheme, self.host, self.port)
 
     def target_key(self):
         return (self.scheme, self.host, self.port)
@@ -195,6 +207,14 @@ class Connection(SortableMixin):
     def queue_request(self, request):
         self.request_queue.append(request)
 
+    def pipeline_load(self):
+        """Returns the number of requests queued or awaiting a response
+
+        Used by the :class:`Client` to choose between connections to the
+        same target."""
+        return (len(self.request_queue) + len(self.response_queue) +
+                (1 if self.response else 0))
+
     def connection_task(self):
         """Processes the requests and responses for this connection.
 
@@ -214,6 +234,8 @@ class Connection(SortableMixin):
             for it.  For idempotent requests (in practice, everything
             except POST) we take advantage of HTTP pipelining to send
             the request without waiting for the previous response(s).
+            The number of responses we wait for at any one time is
+            limited by the pipeline depth of :attr:`target_stats`.
 
             The only exception is when the request has an Expect:
             100-continue header.  In this case the pipeline stalls until
@@ -238,9 +260,19 @@ class Connection(SortableMixin):
             self.last_active = time.time()
             if self.request_queue and self.request_mode == self.REQ_READY:
                 request = self.request_queue[0]
-                if (request.is_idempotent() or
-                    (self.response is None and
-                     not self.send_buffer)):
+                if self.response is None:
+                    ready = not self.send_buffer or request.is_idempotent()
+                else:
+                    ready = (request.is_idempotent() and
+                             len(self.response_queue) + 1 <
+                             self.target_stats.pipeline_depth)
+                if (ready and not request.is_safe() and
+                        self.manager is not None and
+                        self.manager._target_busy(self)):
+                    # wait for our thread's other connections to this
+                    # target to finish too
+                    ready = False
+                if ready:
                     # only pipeline idempotent methods, our pipelining
                     # is strict for POST requests, wait for the
                     # response, request and buffer to be finished.
@@ -356,6 +388,9 @@ class Connection(SortableMixin):
                             if self.response:
                                 self.protocol = self.response.protocol
                                 close_connection = not self.response.keep_alive
+                                if self.manager is not None:
+                                    self.manager._record_response(
+                                        self, self.response)
                             if self.response_queue:
                                 self.response = self.response_queue[0]
                                 self.response_queue = self.response_queue[1:]
@@ -367,6 +402,12 @@ class Connection(SortableMixin):
                                     # connection
                                     close_connection = True
                             if close_connection:
+                                if (self.response is not None and
+                                        not self.response_queue and
+                                        self.manager is not None):
+                                    # a pipelined request will have to
+                                    # be resent (close checks for more)
+                                    self.manager._record_drop(self)
                                 self.close()
                         else:
                             # not waiting for the source, we might be
@@ -634,6 +675,9 @@ class Connection(SortableMixin):
             logging.debug(traceback.format_exc())
         else:
             logging.debug("%s: closing connection", self.host)
+        if self.response_queue and self.manager is not None:
+            # pipelined requests will have to be resent
+            self.manager._record_drop(self)
         if self.request:
             self.request.disconnect(self.sent_bytes)
             self.request = None
@@ -705,11 +749,40 @@ class Connection(SortableMixin):
                     pass
                 self.closed = True
 
+    def probe(self):
+        """Returns True if the connection's socket appears to be open
+
+        Used by :meth:`Client.idle_cleanup` to check idle connections
+        before keeping them, it must not be called while a request is
+        in progress.  The socket is tested without blocking, False is
+        returned if the server has hung up (or has sent unexpected
+        data) or if there is no socket."""
+        with self.lock:
+            s = self.socket
+            if self.closed or s is None:
+                return False
+            try:
+                r, w, e = select.select([s], [], [], 0)
+                if not r:
+                    return True
+                # the server has hung up or, with TLS, sent us protocol
+                # data such as a session ticket
+                s.recv(2)
+            except ssl.SSLError as err:
+                return err.args[0] in (ssl.SSL_ERROR_WANT_READ,
+                                       ssl.SSL_ERROR_WANT_WRITE)
+            except IOError as err:
+                return io_blocked(err)
+            except select.error:
+                pass
+            return False
+
     def _start_request(self, request):
         # Starts processing the request.  Returns True if the request
         # has been accepted for processing, False otherwise.
         self.request = request
         self.request.connect(self, self.buffered_bytes)
+        request.send_time = time.time()
         self.request.start_sending(self.protocol)
         headers = self.request.send_start() + self.request.send_header()
         logging.debug("Sending to %s: \n%s", self.host, headers)
@@ -850,16 +923,17 @@ class Connection(SortableMixin):
             # make it safe to call _recv_task in this mode
             return (True, False, False)
         err = None
+        blocked = None
         try:
             data = self.socket.recv(io.DEFAULT_BUFFER_SIZE)
             self.last_rw = time.time()
         except ssl.SSLError as err:
             if err.args[0] == ssl.SSL_ERROR_WANT_READ:
                 # we're blocked on recv
-                return (False, True, False)
+                blocked = (False, True, False)
             elif err.args[0] == ssl.SSL_ERROR_WANT_WRITE:
                 # we're blocked on send, really this can happen!
-                return (False, False, True)
+                blocked = (False, False, True)
             else:
                 # we're going to swallow this error, log it
                 logging.error("socket.recv raised %s", str(err))
@@ -867,18 +941,27 @@ class Connection(SortableMixin):
         except IOError as err:
             if io_blocked(err):
                 # we're blocked on recv
-                return (False, True, False)
-            # We can't truly tell if the server hung-up except by
-            # getting an error here so this error could be fairly benign.
-            logging.warning("socket.recv raised %s", str(err))
-            data = None
-        logging.debug("Reading from %s: \n%s", self.host, repr(data))
-        if data:
+                blocked = (False, True, False)
+            else:
+                # We can't truly tell if the server hung-up except by
+                # getting an error here so this error could be fairly
+                # benign.
+                logging.warning("socket.recv raised %s", str(err))
+                data = None
+        if blocked is not None:
+            if not self.recv_buffer:
+                return blocked
+            # when pipelining, the next response may already be in
+            # the buffer so we must process it before we wait
+            err = None
+        elif data:
+            logging.debug("Reading from %s: \n%s", self.host, repr(data))
             nbytes = len(data)
             self.recv_buffer.append(data)
             self.recv_buffer_size += nbytes
             logging.debug("Read buffer size: %i" % self.recv_buffer_size)
         else:
+            logging.debug("Reading from %s: \n%s", self.host, repr(data))
             logging.debug("%s: closing connection after recv returned no "
                           "data on ready to read socket", self.host)
             if not self.recv_buffer:
@@ -994,6 +1077,8 @@ class Connection(SortableMixin):
             else:
                 raise RuntimeError("Unexpected recv mode: %s" %
                                    repr(recv_needs))
+        if blocked is not None:
+            return blocked
         return (False, False, False)
 
     def new_socket(self):
@@ -1020,7 +1105,7 @@ class Connection(SortableMixin):
         except socket.gaierror as e:
             snew = None
             raise messages.HTTPException(
-                "failed to connect to %s (%s)" % (self.host, e[1]))
+                "failed to connect to %s (%s)" % (self.host, e.args[-1]))
         if not snew:
             raise messages.HTTPException("failed to connect to %s" % self.host)
         else:
@@ -1061,12 +1146,12 @@ class SecureConnection(Connection):
             with self.lock:
                 if self.socket is not None:
                     self.socket.setblocking(True)
-                    socket_ssl = ssl.wrap_socket(
-                        self.socket, ca_certs=self.ca_certs,
-                        cert_reqs=ssl.CERT_REQUIRED if
-                        self.ca_certs is not None else ssl.CERT_NONE)
+                    socket_ssl = self.manager.wrap_socket(
+                        self.socket, self.host, self.port, self.ca_certs)
+                    self.last_rw = time.time()
+                    # in Python 3 the transport socket is detached by
+                    # the wrap, the SSL socket now owns the descriptor
                     self.socketTransport = self.socket
-                    self.socket.setblocking(False)
                     self.socket = socket_ssl
                     # turn off blocking mode from SSLSocket
                     self.socket.setblocking(False)
@@ -1078,6 +1163,254 @@ class SecureConnection(Connection):
             raise messages.HTTPException(
                 "failed to build secure connection to %s" % self.host)
 
+    def _close_socket(self, s):
+        # keep the session, with TLS 1.3 the session ticket is only
+        # available once we have read from the socket
+        self.manager.save_tls_session(self.host, self.port, s,
+                                      self.ca_certs)
+        super(SecureConnection, self)._close_socket(s)
+
+
+class ClientPoolStats(object):
+
+    """Statistics for the connection pool of a :class:`Client`
+
+    Instances are updated by the client while holding its manager lock,
+    use :meth:`Client.pool_stats` to read them safely."""
+
+    def __init__(self):
+        #: the number of requests queued
+        self.requests = 0
+        #: requests queued on a connection already bound to the thread
+        self.active_hits = 0
+        #: requests that reused an idle connection
+        self.idle_hits = 0
+        #: the number of new connections created
+        self.new_connections = 0
+        #: idle connections closed to make room for a new connection
+        self.evictions = 0
+        #: idle connections closed by :meth:`Client.idle_cleanup`
+        self.expired = 0
+        #: the number of requests that had to wait for a connection
+        self.waits = 0
+        #: the number of requests that timed out waiting
+        self.timeouts = 0
+        #: the total and maximum time spent waiting for a connection
+        self.total_wait = self.max_wait = 0.0
+        #: DNS lookups answered from the cache
+        self.dns_hits = 0
+        #: DNS lookups that had to call getaddrinfo
+        self.dns_misses = 0
+        #: DNS lookups answered with a cached failure
+        self.dns_negative_hits = 0
+        #: background refreshes of cached DNS results
+        self.dns_refreshes = 0
+        #: getaddrinfo calls (including refreshes) that failed
+        self.dns_failures = 0
+        #: the number of TLS handshakes
+        self.tls_handshakes = 0
+        #: TLS handshakes that resumed an earlier session
+        self.tls_resumed = 0
+        #: connections opened by :meth:`Client.prewarm`
+        self.prewarmed = 0
+        #: expired idle connections kept open by :meth:`Client.keep_warm`
+        self.kept_warm = 0
+        #: idle connections that failed a :meth:`Connection.probe`
+        self.probe_failures = 0
+
+    def record_wait(self, elapsed):
+        """Records the time a request waited for a connection"""
+        self.waits += 1
+        self.total_wait += elapsed
+        if elapsed > self.max_wait:
+            self.max_wait = elapsed
+
+    def snapshot(self):
+        """Returns a dictionary of the current values
+
+        The result is suitable for serialising as JSON."""
+        return {
+            'requests': self.requests,
+            'active_hits': self.active_hits,
+            'idle_hits': self.idle_hits,
+            'new_connections': self.new_connections,
+            'evictions': self.evictions,
+            'expired': self.expired,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'total_wait': self.total_wait,
+            'max_wait': self.max_wait,
+            'dns_hits': self.dns_hits,
+            'dns_misses': self.dns_misses,
+            'dns_negative_hits': self.dns_negative_hits,
+            'dns_refreshes': self.dns_refreshes,
+            'dns_failures': self.dns_failures,
+            'tls_handshakes': self.tls_handshakes,
+            'tls_resumed': self.tls_resumed,
+            'prewarmed': self.prewarmed,
+            'kept_warm': self.kept_warm,
+            'probe_failures': self.probe_failures}
+
+
+class ClientTargetStats(object):
+
+    """Statistics and pipelining state for a target host+port
+
+    One instance is shared by all of a :class:`Client`'s connections to
+    the same target, use :meth:`Client.target_stats` to read them
+    safely.
+
+    max_pipeline
+        The maximum number of responses that a connection waits for at
+        any one time.
+
+    adaptive
+        True if the pipeline depth should also respond to latency, the
+        :class:`Client` sets this when it may open more than one
+        connection per thread to a target.
+
+    The pipeline depth starts at *max_pipeline*.  If a connection is
+    closed while pipelined responses are outstanding (for example, a
+    server that does not support pipelining properly or that closes
+    the connection after each response) then the depth drops to 1,
+    turning pipelining off.  It is increased by one after each run of
+    :attr:`INCREASE_AFTER` responses without a drop.  In adaptive mode
+    the depth is also reduced by one for each response received while
+    the average latency is more than :attr:`SLOW_FACTOR` times the
+    lowest average seen recently, so that the Client spreads requests
+    over more connections rather than queuing them behind slow
+    responses.  The lowest average is taken over the last
+    :attr:`MIN_WINDOW` to 2 * :attr:`MIN_WINDOW` responses so that a
+    target that becomes slower for good is eventually treated as
+    normal again."""
+
+    #: the number of responses between increases in pipeline depth
+    INCREASE_AFTER = 16
+
+    #: the weight given to each new latency in the average
+    ALPHA = 0.2
+
+    #: the ratio of average to lowest average latency considered slow
+    SLOW_FACTOR = 2.0
+
+    #: the number of responses in each window used to find the lowest
+    #: average latency
+    MIN_WINDOW = 64
+
+    def __init__(self, max_pipeline=8, adaptive=False):
+        self.max_pipeline = max_pipeline
+        self.adaptive = adaptive
+        #: the maximum number of responses to wait for on a connection
+        self.pipeline_depth = max_pipeline
+        #: the number of requests queued
+        self.requests = 0
+        #: the number of responses received
+        self.responses = 0
+        #: the number of connections closed with pipelined requests
+        #: outstanding
+        self.drops = 0
+        #: the total and maximum response latency, measured from the
+        #: time the request started sending to the end of the response
+        self.total_latency = self.max_latency = 0.0
+        #: the moving average of the latency (None until the first
+        #: response) and the lowest recent average
+        self.latency = self.min_latency = None
+        #: the time of the first request and of the last response
+        self.first_request = self.last_response = None
+        self._run = 0
+        # the lowest average in the current and previous windows
+        self._min_current = self._min_previous = None
+        self._min_count = 0
+
+    def record_request(self, now):
+        """Records a request queued at time *now*"""
+        self.requests += 1
+        if self.first_request is None:
+            self.first_request = now
+
+    def record_response(self, latency, now):
+        """Records a response received at time *now*"""
+        self.responses += 1
+        self.last_response = now
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.ALPHA * (latency - self.latency)
+        if self._min_current is None or self.latency < self._min_current:
+            self._min_current = self.latency
+        if (self._min_previous is None or
+                self._min_current < self._min_previous):
+            self.min_latency = self._min_current
+        else:
+            self.min_latency = self._min_previous
+        self._min_count += 1
+        if self._min_count >= self.MIN_WINDOW:
+            self._min_previous = self._min_current
+            self._min_current = None
+            self._min_count = 0
+        if (self.adaptive and
+                self.latency > self.SLOW_FACTOR * self.min_latency):
+            self._run = 0
+            if self.pipeline_depth > 1:
+                self.pipeline_depth -= 1
+            return
+        self._run += 1
+        if self._run >= self.INCREASE_AFTER:
+            self._run = 0
+            if self.pipeline_depth < self.max_pipeline:
+                self.pipeline_depth += 1
+
+    def record_drop(self):
+        """Records a connection closed with pipelined requests"""
+        self.drops += 1
+        self._run = 0
+        self.pipeline_depth = 1
+
+    def snapshot(self):
+        """Returns a dictionary of the current values
+
+        The result is suitable for serialising as JSON.  It includes
+        the mean latency and the throughput in responses per second
+        since the first request (None if not yet known)."""
+        if self.responses:
+            mean_latency = self.total_latency / self.responses
+        else:
+            mean_latency = None
+        if (self.responses and self.first_request is not None and
+                self.last_response > self.first_request):
+            throughput = self.responses / (self.last_response -
+                                           self.first_request)
+        else:
+            throughput = None
+        return {
+            'pipeline_depth': self.pipeline_depth,
+            'requests': self.requests,
+            'responses': self.responses,
+            'drops': self.drops,
+            'mean_latency': mean_latency,
+            'max_latency': self.max_latency,
+            'latency': self.latency,
+            'min_latency': self.min_latency,
+            'throughput': throughput}
+
+
+class _DNSEntry(object):
+
+    # a cached result from socket.getaddrinfo, error is the args of the
+    # gaierror raised for a negative entry, expires and refresh are
+    # times or None for never
+    __slots__ = ('result', 'error', 'expires', 'refresh', 'refreshing')
+
+    def __init__(self, result, error, expires, refresh=None):
+        self.result = result
+        self.error = error
+        self.expires = expires
+        self.refresh = refresh
+        self.refreshing = False
+
 
 class Client(PEP8Compatibility, object):
 
@@ -1119,6 +1452,24 @@ class Client(PEP8Compatibility, object):
         that calls the :meth:`idle_cleanup` method periodically passing
         this setting value as its argument.
 
+    max_target_connections (1)
+        The maximum number of connections each thread may use to the
+        same host+port, see below.
+
+    max_pipeline (8)
+        The maximum number of responses to wait for on a connection,
+        see :class:`ClientTargetStats` for details of how this limit is
+        lowered (and raised again) for each host+port.
+
+    dns_ttl (300)
+        The number of seconds that the result of a DNS lookup is cached
+        for, None means cache results forever (the behaviour of earlier
+        versions).  See :meth:`dnslookup` for details.
+
+    dns_negative_ttl (5)
+        The number of seconds that a failed DNS lookup is cached for, 0
+        or None means that failures are not cached.
+
     ca_certs
         The file name of a certificate file to use when checking SSL
         connections.  For more information see
@@ -1156,13 +1507,47 @@ class Client(PEP8Compatibility, object):
     for the GET request to finish fetching the resource before queuing a
     PUT request that overwrites it.
 
-    In summary, to take advantage of multiple simultaneous connections
-    to the same host+port you must use multiple threads."""
+    In summary, by default, to take advantage of multiple simultaneous
+    connections to the same host+port you must use multiple threads.
+
+    If max_target_connections is greater than 1 then a thread may use
+    up to that many connections to each host+port.  A safe request
+    (GET, HEAD, OPTIONS or TRACE) is queued on the thread's connection
+    with the fewest outstanding requests unless they all have a full
+    pipeline in which case another connection is used if the pool has
+    room for it.  Any other request, such as a PUT or POST, is never
+    sent until all of the thread's connections to the host+port are
+    idle, and requests queued after it wait behind it, so a thread's
+    requests are not reordered around requests that change the
+    resources on the server.  Latency and throughput for each host+port are
+    returned by :meth:`target_stats`.
+
+    The number of responses waited for on a connection is limited to
+    max_pipeline, even with a single connection per host+port (earlier
+    versions pipelined without limit).  If a connection is closed with
+    pipelined requests outstanding then pipelining to that host+port is
+    turned off and only restored gradually, see
+    :class:`ClientTargetStats`.
+
+    Idle connections are kept in least-recently-used order, both for
+    each host+port and across the whole pool, so reusing the most
+    recently idle connection to a host+port and closing the least
+    recently used connection when the pool is full do not depend on the
+    number of connections in the pool.  Counts of connection reuse and
+    the time spent waiting for connections are returned by
+    :meth:`pool_stats`.
+
+    Connections can be opened ahead of demand with :meth:`prewarm` and
+    kept open by :meth:`idle_cleanup` with :meth:`keep_warm`.  TLS
+    sessions are saved for each host+port and offered to the server
+    when a new connection is made so that it can skip the full
+    handshake, see :meth:`wrap_socket`."""
     ConnectionClass = Connection
     SecureConnectionClass = SecureConnection
 
     def __init__(self, max_connections=100, ca_certs=None, timeout=None,
-                 max_inactive=None):
+                 max_inactive=None, max_target_connections=1,
+                 max_pipeline=8, dns_ttl=300, dns_negative_ttl=5):
         PEP8Compatibility.__init__(self)
         self.managerLock = threading.Condition()
         # the id of the next connection object we'll create
@@ -1174,18 +1559,42 @@ class Client(PEP8Compatibility, object):
         # A dict of dicts of active connections keyed on thread id then
         # connection id
         self.cIdleTargets = {}
-        # A dict of dicts of idle connections keyed on target and then
-        # connection id
-        self.cIdleList = {}
-        # A dict of idle connections keyed on connection id (for keeping count)
+        # A dict of OrderedDicts of idle connections keyed on target and
+        # then connection id, least recently used first
+        self.cIdleList = OrderedDict()
+        # An OrderedDict of idle connections keyed on connection id,
+        # least recently used first
+        self.cpool_stats = ClientPoolStats()
         self.closing = threading.Event()    # set if we are closing
         # maximum number of connections to manage (set only on construction)
         self.max_connections = max_connections
+        # maximum connections per thread and target
+        self.max_target_connections = max_target_connections
+        self.max_pipeline = max_pipeline
+        # An OrderedDict of ClientTargetStats keyed on target, least
+        # recently used first
+        self.cTargetStats = OrderedDict()
         # maximum wait time on connections
         self.timeout = timeout
         # cached results from socket.getaddrinfo keyed on (hostname,port)
         self.dnsCache = {}
+        self.dns_ttl = dns_ttl
+        self.dns_negative_ttl = dns_negative_ttl
+        self.dns_refresh = 0.75
+        """The fraction of :attr:`dns_ttl` after which a cached DNS
+        result is refreshed in the background.
+
+        The refresh is started by the first lookup that uses the cached
+        value after this time, the cached value is returned immediately.
+        Set to None to disable background refreshes."""
         self.ca_certs = ca_certs
+        # SSLContext objects keyed on ca_certs
+        self._ssl_contexts = {}
+        # the last TLS session keyed on (hostname, port, ca_certs), a
+        # session can only be resumed with the context that created it
+        self.tls_sessions = {}
+        # the number of idle connections to keep keyed on target
+        self.warm_targets = {}
         self.credentials = []
         self.cookie_store = None
         self.socketSelect = select.select
@@ -1194,6 +1603,13 @@ class Client(PEP8Compatibility, object):
         derived from the installed version of Pyslet, e.g.::
 
             pyslet 0.5.20140727 (http.client.Client)"""
+        self.accept_encoding = "gzip, deflate"
+        """The default Accept-Encoding header to add to requests.
+
+        When a request is queued without an Accept-Encoding header this
+        value is added and the response is decoded transparently as it
+        is received, see :class:`ClientResponse` for details.  Set to
+        None to disable automatic content decoding."""
         # start the connection cleaner thread if required
         if max_inactive is not None:
             t = threading.Thread(
@@ -1289,48 +1705,64 @@ class Client(PEP8Compatibility, object):
             None means wait forever, 0 means don't block.
 
         The default implementation adds a User-Agent header from
-        :py:attr:`httpUserAgent` if none has been specified already.
+        :py:attr:`httpUserAgent` and an Accept-Encoding header from
+        :py:attr:`accept_encoding` if none have been specified already.
         You can override this method to add other headers appropriate
         for a specific context but you must pass this call on to this
         implementation for proper processing."""
         if self.httpUserAgent and not request.has_header('User-Agent'):
             request.set_header('User-Agent', self.httpUserAgent)
+        if (self.accept_encoding and
+                not request.has_header('Accept-Encoding')):
+            request.set_header('Accept-Encoding', self.accept_encoding)
+            request.auto_decode = True
         # assign this request to a connection straight away
         start = time.time()
         thread_id = threading.current_thread().ident
         thread_target = (
             thread_id, request.scheme, request.hostname, request.port)
         target = (request.scheme, request.hostname, request.port)
+        waited = False
         with self.managerLock:
             if self.closing.is_set():
                 raise ConnectionClosed
+            stats = self.cpool_stats
+            stats.requests += 1
+            self.get_target_stats(target).record_request(start)
             while True:
                 # Step 1: search for an active connection to the same
                 # target already bound to our thread
-                if thread_target in self.cActiveThreadTargets:
+                if self.max_target_connections > 1:
+                    connection, slot = self._schedule_request(
+                        thread_target, target, request)
+                elif thread_target in self.cActiveThreadTargets:
                     connection = self.cActiveThreadTargets[thread_target]
+                else:
+                    connection, slot = None, 0
+                if connection is not None:
+                    stats.active_hits += 1
                     break
                 # Step 2: search for an idle connection to the same
                 # target and bind it to our thread
                 elif target in self.cIdleTargets:
-                    cidle = list(dict_values(self.cIdleTargets[target]))
-                    cidle.sort()
+                    cidle = self.cIdleTargets[target]
                     # take the youngest connection
-                    connection = cidle[-1]
-                    self._activate_connection(connection, thread_id)
+                    connection = cidle[next(reversed(cidle))]
+                    self._activate_connection(connection, thread_id, slot)
+                    stats.idle_hits += 1
                     break
                 # Step 3: create a new connection
                 elif (len(self.cActiveThreadTargets) + len(self.cIdleList) <
                       self.max_connections):
                     connection = self._new_connection(target)
-                    self._activate_connection(connection, thread_id)
+                    self._activate_connection(connection, thread_id, slot)
+                    stats.new_connections += 1
                     break
                 # Step 4: delete the oldest idle connection and go round again
                 elif len(self.cIdleList):
-                    cidle = list(dict_values(self.cIdleList))
-                    cidle.sort()
-                    connection = cidle[0]
+                    connection = self.cIdleList[next(iter(self.cIdleList))]
                     self._delete_idle_connection(connection)
+                    stats.evictions += 1
                 # Step 5: wait for something to change
                 else:
                     now = time.time()
@@ -1338,21 +1770,151 @@ class Client(PEP8Compatibility, object):
                         logging.warning(
                             "non-blocking call to queue_request failed to "
                             "obtain an HTTP connection")
+                        stats.timeouts += 1
                         raise RequestManagerBusy
                     elif timeout is not None and now > start + timeout:
                         logging.warning(
                             "queue_request timed out while waiting for "
                             "an HTTP connection")
+                        stats.timeouts += 1
+                        stats.record_wait(now - start)
                         raise RequestManagerBusy
                     logging.debug(
                         "queue_request forced to wait for an HTTP connection")
+                    waited = True
                     self.managerLock.wait(timeout)
                     logging.debug(
                         "queue_request resuming search for an HTTP connection")
+            if waited:
+                stats.record_wait(time.time() - start)
             # add this request to the queue on the connection
             connection.queue_request(request)
             request.set_client(self)
 
+    def _schedule_request(self, thread_target, target, request):
+        # Returns a (connection, slot) pair, called with managerLock
+        # held when a thread may have several connections to target.
+        # If connection is None slot is the free slot to use for a new
+        # (or idle) connection.
+        best = free = None
+        best_load = 0
+        for slot in range3(self.max_target_connections):
+            if slot:
+                key = thread_target + (slot, )
+            else:
+                key = thread_target
+            connection = self.cActiveThreadTargets.get(key, None)
+            if connection is None:
+                if free is None:
+                    free = slot
+                continue
+            for r in connection.request_queue:
+                if not r.is_safe():
+                    # an unsafe request is waiting for the thread's
+                    # other connections, queue behind it
+                    return connection, None
+            load = connection.pipeline_load()
+            if best is None or load < best_load:
+                best = connection
+                best_load = load
+        if best is None:
+            return None, free
+        if free is not None and best_load and request.is_safe():
+            # only open another connection if we don't have to close
+            # an idle connection to make room for it
+            if (best_load >= self.get_target_stats(target).pipeline_depth and
+                    (target in self.cIdleTargets or
+                     len(self.cActiveThreadTargets) +
+                     len(self.cIdleList) < self.max_connections)):
+                return None, free
+        # unsafe requests are never sent on a new connection while
+        # others are outstanding, the connection holds them until the
+        # thread's other connections to the target are idle
+        return best, None
+
+    def _target_busy(self, connection):
+        # Returns True if the thread that owns connection has other
+        # connections to the same target with outstanding requests
+        if self.max_target_connections <= 1:
+            return False
+        thread_target = (connection.thread_id, ) + connection.target_key()
+        with self.managerLock:
+            for slot in range3(self.max_target_connections):
+                if slot:
+                    key = thread_target + (slot, )
+                else:
+                    key = thread_target
+                c = self.cActiveThreadTargets.get(key, None)
+                if (c is not None and c is not connection and
+                        c.pipeline_load()):
+                    return True
+        return False
+
+    def get_target_stats(self, target):
+        """Returns the :class:`ClientTargetStats` for *target*
+
+        target
+            A (scheme, hostname, port) tuple.
+
+        The statistics object is created when first required.  The
+        statistics are kept in least recently used order and, to stop
+        them growing with every host contacted, those for targets with
+        no open connections are discarded once there are more than
+        twice *max_connections* of them."""
+        with self.managerLock:
+            result = self.cTargetStats.pop(target, None)
+            if result is None:
+                result = ClientTargetStats(
+                    self.max_pipeline, self.max_target_connections > 1)
+                self.cTargetStats[target] = result
+                if len(self.cTargetStats) > 2 * self.max_connections:
+                    self._prune_target_stats()
+            else:
+                # move it to the most recently used end
+                self.cTargetStats[target] = result
+            return result
+
+    def _prune_target_stats(self):
+        # called with managerLock held, discards the least recently
+        # used statistics for targets with no connections until no more
+        # than max_connections remain
+        in_use = set(self.cIdleTargets)
+        for connection in dict_values(self.cActiveThreadTargets):
+            in_use.add(connection.target_key())
+        for target in list(self.cTargetStats):
+            if len(self.cTargetStats) <= self.max_connections:
+                break
+            if target not in in_use:
+                del self.cTargetStats[target]
+
+    def target_stats(self):
+        """Returns information about each target host+port
+
+        The result is a dictionary suitable for serialising as JSON.
+        The keys are strings of the form scheme://hostname:port and the
+        values are the dictionaries returned by
+        :meth:`ClientTargetStats.snapshot`."""
+        with self.managerLock:
+            return dict(("%s://%s:%i" % target, tstats.snapshot())
+                        for target, tstats in self.cTargetStats.items())
+
+    def _record_response(self, connection, response):
+        # called by connection when a response has been received
+        request = response.request
+        if request is None or request.send_time is None:
+            return
+        now = time.time()
+        with self.managerLock:
+            connection.target_stats.record_response(
+                now - request.send_time, now)
+
+    def _record_drop(self, connection):
+        # called by connection when it closes with pipelined requests
+        logging.info("%s: pipelined requests dropped, depth reduced to 1",
+                     connection.host)
+        with self.managerLock:
+            connection.target_stats.record_drop()
+
     def active_count(self):
         """Returns the total number of active connections."""
         with self.managerLock:
@@ -1365,9 +1927,35 @@ class Client(PEP8Compatibility, object):
         with self.managerLock:
             return len(self.cActiveThreads.get(thread_id, {}))
 
-    def _activate_connection(self, connection, thread_id):
+    def pool_stats(self):
+        """Returns information about the connection pool
+
+        The result is a dictionary suitable for serialising as JSON.  It
+        contains the values from :meth:`ClientPoolStats.snapshot` with
+        the following additional keys.
+
+        active, idle, max_connections
+            The number of active and idle connections and the maximum
+
+        idle_targets
+            The number of distinct host+port targets with idle
+            connections
+
+        dns_entries
+            The number of entries in the DNS cache"""
+        with self.managerLock:
+            result = self.cpool_stats.snapshot()
+            result['active'] = len(self.cActiveThreadTargets)
+            result['idle'] = len(self.cIdleList)
+            result['max_connections'] = self.max_connections
+            result['idle_targets'] = len(self.cIdleTargets)
+            result['dns_entries'] = len(self.dnsCache)
+        return result
+
+    def _activate_connection(self, connection, thread_id, slot=0):
         # safe if connection is new and not in the idle list
         connection.thread_id = thread_id
+        connection.slot = slot
         target = connection.target_key()
         thread_target = connection.thread_target_key()
         with self.managerLock:
@@ -1377,10 +1965,7 @@ class Client(PEP8Compatibility, object):
             else:
                 self.cActiveThreads[thread_id] = {connection.id: connection}
             if connection.id in self.cIdleList:
-                del self.cIdleList[connection.id]
-                del self.cIdleTargets[target][connection.id]
-                if not self.cIdleTargets[target]:
-                    del self.cIdleTargets[target]
+                self._remove_idle_connection(connection)
 
     def _deactivate_connection(self, connection):
         # called when connection goes idle, it is possible that this
@@ -1392,11 +1977,7 @@ class Client(PEP8Compatibility, object):
         with self.managerLock:
             if thread_target in self.cActiveThreadTargets:
                 del self.cActiveThreadTargets[thread_target]
-                self.cIdleList[connection.id] = connection
-                if target in self.cIdleTargets:
-                    self.cIdleTargets[target][connection.id] = connection
-                else:
-                    self.cIdleTargets[target] = {connection.id: connection}
+                self._add_idle_connection(connection)
                 # tell any threads waiting for a connection
                 self.managerLock.notify()
             if connection.thread_id in self.cActiveThreads:
@@ -1425,13 +2006,27 @@ class Client(PEP8Compatibility, object):
                     del self.cActiveThreads[connection.thread_id]
             connection.thread_id = None
 
+    def _add_idle_connection(self, connection):
+        # called with managerLock held
+        target = connection.target_key()
+        self.cIdleList[connection.id] = connection
+        if target in self.cIdleTargets:
+            self.cIdleTargets[target][connection.id] = connection
+        else:
+            cidle = self.cIdleTargets[target] = OrderedDict()
+            cidle[connection.id] = connection
+
+    def _remove_idle_connection(self, connection):
+        # called with managerLock held
+        target = connection.target_key()
+        del self.cIdleList[connection.id]
+        del self.cIdleTargets[target][connection.id]
+        if not self.cIdleTargets[target]:
+            del self.cIdleTargets[target]
+
     def _delete_idle_connection(self, connection):
         if connection.id in self.cIdleList:
-            target = connection.target_key()
-            del self.cIdleList[connection.id]
-            del self.cIdleTargets[target][connection.id]
-            if not self.cIdleTargets[target]:
-                del self.cIdleTargets[target]
+            self._remove_idle_connection(connection)
             connection.close()
 
     def _nextid(self):
@@ -1533,19 +2128,48 @@ class Client(PEP8Compatibility, object):
 
     def idle_cleanup(self, max_inactive=15):
         """Cleans up any idle connections that have been inactive for
-        more than *max_inactive* seconds."""
+        more than *max_inactive* seconds.
+
+        For targets set with :meth:`keep_warm` the most recently used
+        idle connections are kept open, provided that they pass
+        :meth:`Connection.probe`."""
         clist = []
+        plist = []
         now = time.time()
         with self.managerLock:
-            for connection in list(dict_values(self.cIdleList)):
+            keep = {}
+            if not self.closing.is_set():
+                keep.update(self.warm_targets)
+            # youngest first, so the youngest are kept warm
+            for connection in reversed(list(dict_values(self.cIdleList))):
+                target = connection.target_key()
+                nkeep = keep.get(target, 0)
+                if nkeep:
+                    keep[target] = nkeep - 1
                 if connection.last_active < now - max_inactive:
-                    clist.append(connection)
-                    del self.cIdleList[connection.id]
-                    target = connection.target_key()
-                    if target in self.cIdleTargets:
-                        del self.cIdleTargets[target][connection.id]
-                        if not self.cIdleTargets[target]:
-                            del self.cIdleTargets[target]
+                    # take it out of the pool, even if we'll keep it,
+                    # so that it can't be activated while we probe it
+                    self._remove_idle_connection(connection)
+                    if nkeep:
+                        plist.append(connection)
+                    else:
+                        clist.append(connection)
+                        self.cpool_stats.expired += 1
+        if plist:
+            # probe without holding the manager lock
+            for connection in plist:
+                alive = connection.probe()
+                with self.managerLock:
+                    if alive and not self.closing.is_set():
+                        self._add_idle_connection(connection)
+                        self.cpool_stats.kept_warm += 1
+                        # return it to waiting threads
+                        self.managerLock.notify()
+                        continue
+                    if not alive:
+                        self.cpool_stats.probe_failures += 1
+                    self.cpool_stats.expired += 1
+                clist.append(connection)
         # now we can clean up these connections in a more leisurely fashion
         if clist:
             logging.debug("idle_cleanup closing connections...")
@@ -1636,21 +2260,286 @@ class Client(PEP8Compatibility, object):
         added to an internal dns cache so that subsequent calls for the same
         host name and port do not use the network unnecessarily.
 
+        Results are cached for :attr:`dns_ttl` seconds.  Failed lookups
+        are cached for :attr:`dns_negative_ttl` seconds, during which
+        time the same socket.gaierror is raised without using the
+        network.  Once a fraction :attr:`dns_refresh` of the TTL has
+        passed the next lookup returns the cached result and starts a
+        thread that refreshes it, so busy targets see changes of address
+        without waiting for a lookup.  If the refresh fails the cached
+        result is kept until it expires.
+
         If you want to flush the cache you must do so manually using
         :py:meth:`flush_dns`."""
+        key = (host, port)
+        refresh = False
         with self.managerLock:
-            result = self.dnsCache.get((host, port), None)
-        if result is None:
-            # do not hold the lock while we do the DNS lookup, this may
-            # result in multiple overlapping DNS requests but this is
-            # better than a complete block.
-            logging.debug("Looking up %s", host)
+            stats = self.cpool_stats
+            entry = self.dnsCache.get(key, None)
+            if entry is not None:
+                now = time.time()
+                if entry.expires is not None and entry.expires <= now:
+                    del self.dnsCache[key]
+                    entry = None
+                elif entry.error is not None:
+                    stats.dns_negative_hits += 1
+                    raise socket.gaierror(*entry.error)
+                else:
+                    stats.dns_hits += 1
+                    if (entry.refresh is not None and entry.refresh <= now and
+                            not entry.refreshing and
+                            not self.closing.is_set()):
+                        entry.refreshing = refresh = True
+            if entry is None:
+                stats.dns_misses += 1
+        if entry is not None:
+            if refresh:
+                t = threading.Thread(target=self._dns_refresh,
+                                     args=(host, port))
+                t.daemon = True
+                t.start()
+            return entry.result
+        # do not hold the lock while we do the DNS lookup, this may
+        # result in multiple overlapping DNS requests but this is
+        # better than a complete block.
+        logging.debug("Looking up %s", host)
+        try:
             result = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as err:
             with self.managerLock:
-                # blindly populate the cache
-                self.dnsCache[(host, port)] = result
+                self.cpool_stats.dns_failures += 1
+                if self.dns_negative_ttl:
+                    self.dnsCache[key] = _DNSEntry(
+                        None, err.args, time.time() + self.dns_negative_ttl)
+            raise
+        with self.managerLock:
+            # blindly populate the cache
+            self.dnsCache[key] = self._new_dns_entry(result)
         return result
 
+    def _new_dns_entry(self, result):
+        if self.dns_ttl is None:
+            return _DNSEntry(result, None, None)
+        now = time.time()
+        if self.dns_refresh is None:
+            refresh = None
+        else:
+            refresh = now + self.dns_ttl * self.dns_refresh
+        return _DNSEntry(result, None, now + self.dns_ttl, refresh)
+
+    def _dns_refresh(self, host, port):
+        # runs in its own thread, replaces a cached result
+        key = (host, port)
+        logging.debug("Refreshing DNS for %s", host)
+        try:
+            result = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as err:
+            logging.warning("DNS refresh failed for %s: %s", host, str(err))
+            result = None
+        with self.managerLock:
+            self.cpool_stats.dns_refreshes += 1
+            entry = self.dnsCache.get(key, None)
+            if result is not None:
+                self.dnsCache[key] = self._new_dns_entry(result)
+            else:
+                self.cpool_stats.dns_failures += 1
+                if entry is not None:
+                    # keep the old result until it expires
+                    entry.refresh = None
+
+    def _url_target(self, url):
+        # returns the target key for a URL
+        if is_string(url):
+            url = uri.URI.from_octets(url)
+        if not isinstance(url, params.HTTPURL):
+            raise ValueError("Scheme not supported: %s" % str(url))
+        elif isinstance(url, params.HTTPSURL):
+            scheme = 'https'
+        else:
+            scheme = 'http'
+        hostname, port = url.get_addr()
+        return (scheme, hostname, port)
+
+    def prewarm(self, url, n=1, wait=True):
+        """Opens connections ahead of demand
+
+        url
+            A :class:`~pyslet.rfc2396.URI` instance or string, only the
+            scheme, host and port are used.
+
+        n
+            The number of idle connections wanted for this host+port,
+            idle connections that are already open count towards this
+            number.
+
+        wait
+            If True (the default) the method returns once the new
+            connections have been made (or have failed).
+
+        Each connection is made in its own thread, including the DNS
+        lookup and the TLS handshake for https URLs.  The connections
+        are then added to the pool of idle connections so that the next
+        requests to the host+port can start sending at once.  No more
+        connections are opened than the pool has room for.
+
+        Returns the number of connections being opened."""
+        target = self._url_target(url)
+        with self.managerLock:
+            if self.closing.is_set():
+                raise ConnectionClosed
+            n = min(n - len(self.cIdleTargets.get(target, ())),
+                    self.max_connections - len(self.cActiveThreadTargets) -
+                    len(self.cIdleList))
+        threads = []
+        for i in range3(n):
+            t = threading.Thread(target=self._prewarm_connection,
+                                 args=(target, ))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        if wait:
+            for t in threads:
+                t.join()
+        return len(threads)
+
+    def _prewarm_connection(self, target):
+        # runs in its own thread, so our thread target is unique
+        thread_id = threading.current_thread().ident
+        with self.managerLock:
+            if (self.closing.is_set() or
+                    len(self.cActiveThreadTargets) + len(self.cIdleList) >=
+                    self.max_connections):
+                return
+            connection = self._new_connection(target)
+            self._activate_connection(connection, thread_id)
+            self.cpool_stats.new_connections += 1
+        try:
+            connection.new_socket()
+        except (messages.HTTPException, IOError) as err:
+            logging.warning("prewarm failed for %s: %s",
+                            connection.host, str(err))
+            self._upgrade_connection(connection)
+            connection.close()
+            with self.managerLock:
+                # there is room for another connection
+                self.managerLock.notify()
+            return
+        with self.managerLock:
+            self.cpool_stats.prewarmed += 1
+        connection.last_active = time.time()
+        self._deactivate_connection(connection)
+
+    def keep_warm(self, url, n=1):
+        """Keeps idle connections open for a host+port
+
+        url
+            A :class:`~pyslet.rfc2396.URI` instance or string, only the
+            scheme, host and port are used.
+
+        n
+            The number of idle connections to keep, 0 removes the
+            setting.
+
+        :meth:`idle_cleanup` closes idle connections that have been
+        inactive for too long.  After calling this method up to *n* of
+        the most recently used idle connections to this host+port are
+        not closed, instead they are checked with
+        :meth:`Connection.probe` and closed only if the server has hung
+        up.  Use with :meth:`prewarm` to avoid connecting (and
+        handshaking) again for intermittent bursts of requests."""
+        target = self._url_target(url)
+        with self.managerLock:
+            if n > 0:
+                self.warm_targets[target] = n
+            else:
+                self.warm_targets.pop(target, None)
+
+    def get_ssl_context(self, ca_certs=None):
+        """Returns an ssl.SSLContext for secure connections
+
+        ca_certs
+            The certificate file used to verify the server, None
+            means the server's certificate is not checked.
+
+        One context is created for each value of *ca_certs* and then
+        reused.  Returns None if the ssl module does not support
+        contexts (Python 2.7.8 and earlier)."""
+        if not hasattr(ssl, 'SSLContext'):
+            return None
+        with self.managerLock:
+            context = self._ssl_contexts.get(ca_certs, None)
+            if context is None:
+                protocol = getattr(ssl, 'PROTOCOL_TLS_CLIENT', None)
+                if protocol is None:
+                    protocol = ssl.PROTOCOL_SSLv23
+                context = ssl.SSLContext(protocol)
+                # the host name was not checked by earlier versions
+                context.check_hostname = False
+                if ca_certs is None:
+                    context.verify_mode = ssl.CERT_NONE
+                else:
+                    context.verify_mode = ssl.CERT_REQUIRED
+                    context.load_verify_locations(ca_certs)
+                self._ssl_contexts[ca_certs] = context
+        return context
+
+    def wrap_socket(self, sock, hostname, port, ca_certs=None):
+        """Returns a new SSL socket for a connected socket
+
+        sock
+            A connected socket in blocking mode.
+
+        hostname, port
+            The server's host name and port.
+
+        ca_certs
+            As for :meth:`get_ssl_context`
+
+        Called by :class:`SecureConnection` to perform the TLS
+        handshake.  Where the ssl module supports it (Python 3.6 and
+        later) the last session saved for this *hostname*, *port* and
+        *ca_certs* with :meth:`save_tls_session` is offered to the
+        server which may then resume it with an abbreviated
+        handshake."""
+        context = self.get_ssl_context(ca_certs)
+        if context is None:
+            return ssl.wrap_socket(
+                sock, ca_certs=ca_certs,
+                cert_reqs=ssl.CERT_REQUIRED if
+                ca_certs is not None else ssl.CERT_NONE)
+        kwargs = {}
+        if getattr(ssl, 'HAS_SNI', False):
+            kwargs['server_hostname'] = hostname
+        session = None
+        if hasattr(ssl, 'SSLSession'):
+            with self.managerLock:
+                session = self.tls_sessions.get((hostname, port, ca_certs),
+                                                None)
+            if session is not None:
+                kwargs['session'] = session
+        socket_ssl = context.wrap_socket(sock, **kwargs)
+        with self.managerLock:
+            self.cpool_stats.tls_handshakes += 1
+            if session is not None and socket_ssl.session_reused:
+                self.cpool_stats.tls_resumed += 1
+        self.save_tls_session(hostname, port, socket_ssl, ca_certs)
+        return socket_ssl
+
+    def save_tls_session(self, hostname, port, sock, ca_certs=None):
+        """Saves the TLS session of *sock* for reuse
+
+        ca_certs
+            The value used to create the socket's context, see
+            :meth:`get_ssl_context`.  Sessions are only offered again
+            to connections that use the same context.
+
+        Called after the handshake and again when a secure connection's
+        socket is closed, sockets that have no session are ignored."""
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            with self.managerLock:
+                self.tls_sessions[(hostname, port, ca_certs)] = session
+
     def flush_dns(self):
         """Flushes the DNS cache."""
         with self.managerLock:
@@ -1781,6 +2670,11 @@ class ClientRequest(messages.Request):
         self.send_pipe = None
         #: the recv pipe to use on upgraded connections
         self.recv_pipe = None
+        #: True if the response should be decoded automatically, set
+        #: when the Accept-Encoding header was added by the client
+        self.auto_decode = False
+        #: the time at which the connection last started sending us
+        self.send_time = None
 
     def _init_retries(self):
         self.nretries = 0
@@ -2086,9 +2980,21 @@ class ClientRequest(messages.Request):
 
 class ClientResponse(messages.Response):
 
+    """Represents an HTTP response
+
+    If the Accept-Encoding header of the associated request was added
+    automatically by the :py:class:`Client` then gzip and deflate
+    content-codings are removed from the entity body as it is received,
+    without buffering the whole response.  In this case the
+    Content-Encoding header is removed from the response once the
+    decoders are in place and the list of codings that were removed is
+    recorded in :py:attr:`decoded_codings`."""
+
     def __init__(self, request, **kwargs):
         super(ClientResponse, self).__init__(
             request=request, entity_body=request.res_bodystream, **kwargs)
+        #: the list of content-codings removed from the entity body
+        self.decoded_codings = []
 
     def handle_headers(self):
         """Hook for response header processing.
@@ -2113,6 +3019,31 @@ class ClientResponse(messages.Response):
             self.reason)
         logging.debug("Response headers: %s", repr(self.headers))
         super(ClientResponse, self).handle_headers()
+        self.decoded_codings = []
+        if self.request.auto_decode:
+            self._decode_content()
+
+    def _decode_content(self):
+        if (self.status < 200 or self.status in (204, 206, 304) or
+                self.request.method.upper() == "HEAD"):
+            return
+        codings = self.get_content_encoding()
+        if not codings:
+            return
+        for coding in codings:
+            if (coding != "identity" and
+                    coding not in messages.CONTENT_DECODERS):
+                # we can't remove this coding, leave the data alone
+                logging.warning("Unsupported content coding: %s", coding)
+                return
+        # the last coding applied is the first one we remove, the
+        # decoders write through to the next one in the chain
+        for coding in codings:
+            if coding != "identity":
+                self.transferbody = messages.CONTENT_DECODERS[coding](
+                    self.transferbody)
+        self.decoded_codings = codings
+        self.set_content_encoding(None)
 
     def handle_message(self):
         """Hook for normal completion of response"""
@@ -1,5 +1,7 @@
 #! /usr/bin/env python
 
+import re
+
 from ..py2 import (
     byte,
     byte_to_bstr,
@@ -122,6 +124,24 @@ def is_separator(b):
     return b in SEPARATORS
 
 
+# Compiled expressions used by the parsers to match the most common
+# productions in a single step.  They match exactly the same strings as
+# the byte-by-byte methods they short-cut, anything unusual (escapes,
+# comments, folded LWS in quoted strings) takes the slow path.
+
+# a run of bytes that are neither CTLs nor separators
+_TOKEN_RE = re.compile(b'[^\x00-\x20\x7f()<>@,;:\\\\"/\\[\\]?={}]+')
+
+# a single instance of LWS
+_LWS_RE = re.compile(b'(?:\r\n)?[ \t]+')
+
+# a run of LWS
+_LWS_RUN_RE = re.compile(b'(?:(?:\r\n)?[ \t]+)+')
+
+# a quoted string with no quoted-pairs and no folding LWS
+_SIMPLE_QS_RE = re.compile(b'"[^"\\\\\x00-\x08\x0a-\x1f\x7f]*"')
+
+
 def check_token(t):
     """Raises ValueError if *t* is *not* a valid token
 
@@ -235,22 +255,11 @@ class OctetParser(BasicParser):
 
         The return value is the LWS string parsed or None if there is no
         LWS."""
-        savepos = self.pos
-        lws = []
-        if self.parse(CRLF):
-            lws += [CR, LF]
-        splen = 0
-        while True:
-            b = self.parse_one((SP, HT))
-            if b is None:
-                break
-            else:
-                lws.append(b)
-                splen += 1
-        if lws and splen:
-            return join_bytes(lws)
-        self.setpos(savepos)
-        return None
+        match = _LWS_RE.match(self.src, self.pos)
+        if match is None:
+            return None
+        self.setpos(match.end())
+        return match.group()
 
     def parse_onetext(self, unfold=False):
         """Parses a single TEXT instance.
@@ -316,17 +325,11 @@ class OctetParser(BasicParser):
         Parses a single instance of the production token.  The return
         value is the matching token as a binary string or None if no
         token was found."""
-        token = []
-        while self.the_char is not None:
-            if is_ctl(self.the_char) or is_separator(self.the_char):
-                break
-            else:
-                token.append(self.the_char)
-                self.next_char()
-        if token:
-            return join_bytes(token)
-        else:
+        match = _TOKEN_RE.match(self.src, self.pos)
+        if match is None:
             return None
+        self.setpos(match.end())
+        return match.group()
 
     def parse_comment(self, unfold=False):
         """Parses a comment.
@@ -414,6 +417,11 @@ class OctetParser(BasicParser):
         Parses a single instance of the production quoted-string.  The
         return value is the entire matching string (including the quotes
         and any quoted pairs) or None if no quoted-string was found."""
+        if self.the_char == DQUOTE:
+            match = _SIMPLE_QS_RE.match(self.src, self.pos)
+            if match is not None:
+                self.setpos(match.end())
+                return match.group()
         if not self.parse(b'"'):
             return None
         qs = [b'"']
@@ -575,32 +583,59 @@ class WordParser(ParserMixin):
         self._init_parser(source, ignore_sp)
 
     def _init_parser(self, source, ignore_sp=True):
-        p = OctetParser(source)
-        while p.the_char is not None:
-            sp = False
-            src_pos = p.pos
-            while p.parse_lws():
+        if is_unicode(source):
+            source = source.encode('ascii')
+        # The common productions are matched directly with compiled
+        # expressions, an OctetParser is only created for comments,
+        # quoted strings that contain quoted-pairs or folding LWS and
+        # to raise errors
+        p = None
+        pos = 0
+        end = len(source)
+        while pos < end:
+            src_pos = pos
+            match = _LWS_RUN_RE.match(source, pos)
+            if match is not None:
+                pos = match.end()
                 if not ignore_sp:
-                    sp = True
-            if sp:
-                self.words.append(SP)
-                self.src_pos.append(src_pos)
-                src_pos = p.pos
-            if is_separator(p.the_char):
-                if p.the_char == LEFT_PARENTHESIS:
+                    self.words.append(SP)
+                    self.src_pos.append(src_pos)
+                    src_pos = pos
+                if pos >= end:
+                    break
+            match = _TOKEN_RE.match(source, pos)
+            if match is not None:
+                self.words.append(match.group())
+                pos = match.end()
+            else:
+                b = source[pos]
+                if b == DQUOTE:
+                    match = _SIMPLE_QS_RE.match(source, pos)
+                    if match is not None:
+                        self.words.append(match.group())
+                        pos = match.end()
+                    else:
+                        if p is None:
+                            p = OctetParser(source)
+                        p.setpos(pos)
+                        self.words.append(p.parse_quoted_string(True))
+                        pos = p.pos
+                elif b == LEFT_PARENTHESIS:
+                    if p is None:
+                        p = OctetParser(source)
+                    p.setpos(pos)
                     self.words.append(p.parse_comment(True))
-                elif p.the_char == DQUOTE:
-                    self.words.append(p.parse_quoted_string(True))
+                    pos = p.pos
+                elif is_separator(b):
+                    self.words.append(b)
+                    pos += 1
                 else:
-                    self.words.append(p.the_char)
-                    p.next_char()
-                self.src_pos.append(src_pos)
-            elif p.the_char is None:
-                break
-            else:
-                self.words.append(p.require_production(p.parse_token(),
-                                                       "TEXT"))
-                self.src_pos.append(src_pos)
+                    # not TEXT, raise the error from the OctetParser
+                    if p is None:
+                        p = OctetParser(source)
+                    p.setpos(pos)
+                    p.require_production(p.parse_token(), "TEXT")
+            self.src_pos.append(src_pos)
         self.pos = 0
         if self.words:
             self.the_word = self.words[0]
@@ -25,13 +25,20 @@ class GzipEncoder(RawIOBase):
     src
         A readable file-like object
 
+    level (6)
+        The compression level to pass to zlib, 1 is fastest and 9 is
+        slowest but gives the best compression.
+
     Instances act as readable streams that pull data from src, adding
     the gzip encoding to the data returned by read."""
 
-    def __init__(self, src):
+    #: the window bits value passed to zlib, 31 selects the gzip format
+    WBITS = 31
+
+    def __init__(self, src, level=6):
         self.src = src
         self.buffstr = None
-        self.encoder = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self.encoder = zlib.compressobj(level, zlib.DEFLATED, self.WBITS)
 
     def readable(self):
         return True
@@ -45,12 +52,12 @@ class GzipEncoder(RawIOBase):
             if self.buffstr:
                 # we have some buffered data left over
                 if len(self.buffstr) > nbytes:
-                    self.buffstr = data[nbytes:]
-                    b[:] = data[:nbytes]
+                    b[:nbytes] = self.buffstr[:nbytes]
+                    self.buffstr = self.buffstr[nbytes:]
                 else:
                     nbytes = len(self.buffstr)
                     b[:nbytes] = self.buffstr
-                self.buffstr = None
+                    self.buffstr = None
                 return nbytes
             elif self.src is not None:
                 data = self.src.read(nbytes)
@@ -67,6 +74,17 @@ class GzipEncoder(RawIOBase):
                 return 0
 
 
+class DeflateEncoder(GzipEncoder):
+
+    """Wrapper to provide deflate encoding of streams
+
+    Identical to :class:`GzipEncoder` except that the data is encoded
+    using the zlib format (RFC1950) as required by the HTTP "deflate"
+    content-coding."""
+
+    WBITS = 15
+
+
 class GzipDecoder(RawIOBase):
 
     """Wrapper to provide Gzip decoding of streams
@@ -77,10 +95,13 @@ class GzipDecoder(RawIOBase):
     Instances act as writable streams that push data into src, removing
     the gzip encoding from the data written to them."""
 
+    #: the window bits value passed to zlib, 31 selects the gzip format
+    WBITS = 31
+
     def __init__(self, dst):
         self.dst = dst
         self.buffstr = None
-        self.decoder = zlib.decompressobj(31)
+        self.decoder = zlib.decompressobj(self.WBITS)
 
     def readable(self):
         return False
@@ -109,6 +130,8 @@ class GzipDecoder(RawIOBase):
                 self.buffstr = self.buffstr[n:]
             else:
                 self.buffstr = None
+        if hasattr(self.dst, 'flush'):
+            self.dst.flush()
 
     def write(self, zdata):
         wbytes = None
@@ -131,7 +154,7 @@ class GzipDecoder(RawIOBase):
                     self.buffstr = None
             elif zdata:
                 # decompress the data
-                self.buffstr = self.decoder.decompress(zdata)
+                self.buffstr = self.decompress(zdata)
                 wbytes = len(zdata)
                 zdata = None
             else:
@@ -139,6 +162,46 @@ class GzipDecoder(RawIOBase):
                 break
         return wbytes
 
+    def decompress(self, zdata):
+        try:
+            return self.decoder.decompress(zdata)
+        except zlib.error as err:
+            raise ProtocolError("content decoding error: %s" % str(err))
+
+
+class DeflateDecoder(GzipDecoder):
+
+    """Wrapper to provide deflate decoding of streams
+
+    The HTTP "deflate" content-coding is defined as the zlib format
+    (RFC1950) but some servers send raw deflate data (RFC1951) instead.
+    Instances detect the raw form from the first bytes written and
+    switch decoders accordingly."""
+
+    WBITS = 15
+
+    def __init__(self, dst):
+        super(DeflateDecoder, self).__init__(dst)
+        self._started = False
+
+    def decompress(self, zdata):
+        if not self._started:
+            self._started = True
+            try:
+                return self.decoder.decompress(zdata)
+            except zlib.error:
+                # raw deflate, no zlib header
+                self.decoder = zlib.decompressobj(-15)
+        return super(DeflateDecoder, self).decompress(zdata)
+
+
+#: a mapping from content-coding token to the class of stream wrapper
+#: that removes it
+CONTENT_DECODERS = {
+    "gzip": GzipDecoder,
+    "x-gzip": GzipDecoder,
+    "deflate": DeflateDecoder}
+
 
 class ChunkedReader(RawIOBase):
 
@@ -393,6 +456,24 @@ class WSGIInputWrapper(io.RawIOBase):
                 yield line
 
 
+def _parse_token_set(field_value):
+    hp = HeaderParser(field_value)
+    return frozenset(t.lower() for t in hp.parse_tokenlist())
+
+
+def _parse_token_tuple(field_value):
+    hp = HeaderParser(field_value)
+    return tuple(t.lower() for t in hp.parse_tokenlist())
+
+
+def _parse_int(field_value):
+    return int(field_value.strip())
+
+
+def _parse_uri(field_value):
+    return uri.URI.from_octets(field_value.strip())
+
+
 class Message(PEP8Compatibility, object):
 
     """An abstract class to represent an HTTP message.
@@ -450,6 +531,9 @@ class Message(PEP8Compatibility, object):
         self.lock = threading.RLock()
         self.protocol = protocol
         self.headers = {}
+        # a cache of parsed header values keyed on lower-cased header
+        # name, see _get_parsed_header
+        self._parsed_headers = {}
         #: boolean indicating that all headers have been received
         self.got_headers = False
         if isinstance(entity_body, bytes):
@@ -746,6 +830,7 @@ class Message(PEP8Compatibility, object):
             self.transfermode = self.START_MODE
             self.protcolVersion = None
             self.headers = {}
+            self._parsed_headers = {}
             self.got_headers = False
             self._curr_header = None
             if self.body_started:
@@ -1196,6 +1281,7 @@ class Message(PEP8Compatibility, object):
         field_value = force_bytes(field_value)
         with self.lock:
             fieldname_key = field_name.lower()
+            self._parsed_headers.pop(fieldname_key, None)
             if field_value is None:
                 if fieldname_key in self.headers:
                     del self.headers[fieldname_key]
@@ -1208,14 +1294,35 @@ class Message(PEP8Compatibility, object):
                     field_value = field_value.strip()
                     self.headers[fieldname_key] = [field_name, field_value]
 
+    def _get_parsed_header(self, field_name, parser):
+        """Returns the parsed value of header *field_name*
+
+        parser
+            A callable that takes the binary string value of the header
+            and returns the parsed value.  It is not called if the
+            header is missing, in which case None is returned.
+
+        The result is cached until the header is next changed with
+        :meth:`set_header` so parser must return immutable values.
+        The cache is read without acquiring the message lock as
+        getting an item from a dictionary is atomic."""
+        key = force_bytes(field_name).lower()
+        cached = self._parsed_headers.get(key, None)
+        if cached is not None and cached[0] == parser:
+            return cached[1]
+        with self.lock:
+            field_value = self.get_header(field_name)
+            if field_value is None:
+                result = None
+            else:
+                result = parser(field_value)
+            self._parsed_headers[key] = (parser, result)
+            return result
+
     def get_allow(self):
         """Returns an :py:class:`Allow` instance or None if no "Allow"
         header is present."""
-        field_value = self.get_header("Allow")
-        if field_value is not None:
-            return Allow.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Allow", Allow.from_str)
 
     def set_allow(self, allowed):
         """Sets the "Allow" header, replacing any existing value.
@@ -1255,11 +1362,7 @@ class Message(PEP8Compatibility, object):
     def get_cache_control(self):
         """Returns an :py:class:`CacheControl` instance or None if no
         "Cache-Control" header is present."""
-        field_value = self.get_header("Cache-Control")
-        if field_value is not None:
-            return CacheControl.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Cache-Control", CacheControl.from_str)
 
     def set_cache_control(self, cc):
         """Sets the "Cache-Control" header, replacing any existing value.
@@ -1283,10 +1386,9 @@ class Message(PEP8Compatibility, object):
 
         If no Connection header was present an empty set is returned.
         All tokens are returned as lower case."""
-        field_value = self.get_header("Connection")
-        if field_value:
-            hp = HeaderParser(field_value)
-            return set(t.lower() for t in hp.parse_tokenlist())
+        tokens = self._get_parsed_header("Connection", _parse_token_set)
+        if tokens:
+            return set(tokens)
         else:
             return set()
 
@@ -1310,10 +1412,10 @@ class Message(PEP8Compatibility, object):
 
         Content-codings are always listed in the order they have been
         applied."""
-        field_value = self.get_header("Content-Encoding")
-        if field_value:
-            hp = HeaderParser(field_value)
-            return list(t.lower() for t in hp.parse_tokenlist())
+        tokens = self._get_parsed_header("Content-Encoding",
+                                         _parse_token_tuple)
+        if tokens:
+            return list(tokens)
         else:
             return []
 
@@ -1353,11 +1455,7 @@ class Message(PEP8Compatibility, object):
         Content-Length header
 
         If no Content-Length header was present None is returned."""
-        field_value = self.get_header("Content-Length")
-        if field_value is not None:
-            return int(field_value.strip())
-        else:
-            return None
+        return self._get_parsed_header("Content-Length", _parse_int)
 
     def set_content_length(self, length):
         """Sets the Content-Length header from an integer or removes it
@@ -1372,11 +1470,7 @@ class Message(PEP8Compatibility, object):
         the Content-Location header.
 
         If no Content-Location header was present None is returned."""
-        field_value = self.get_header("Content-Location")
-        if field_value is not None:
-            return uri.URI.from_octets(field_value.strip())
-        else:
-            return None
+        return self._get_parsed_header("Content-Location", _parse_uri)
 
     def set_content_location(self, location):
         """Sets the Content-Location header from location, a
@@ -1413,11 +1507,7 @@ class Message(PEP8Compatibility, object):
         Content-Range header.
 
         If no Content-Range header was present None is returned."""
-        field_value = self.get_header("Content-Range")
-        if field_value is not None:
-            return ContentRange.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Content-Range", ContentRange.from_str)
 
     def set_content_range(self, range):
         """Sets the Content-Range header from range, a
@@ -1433,12 +1523,8 @@ class Message(PEP8Compatibility, object):
         Content-Type header.
 
         If no Content-Type header was present None is returned."""
-        field_value = self.get_header("Content-Type")
-        if field_value is not None:
-            mtype = params.MediaType.from_str(field_value)
-            return mtype
-        else:
-            return None
+        return self._get_parsed_header("Content-Type",
+                                       params.MediaType.from_str)
 
     def set_content_type(self, mtype=None):
         """Sets the Content-Type header from mtype, a
@@ -1454,11 +1540,7 @@ class Message(PEP8Compatibility, object):
 
         The return value is a :py:class:`params.FullDate` instance. If
         no Date header was present None is returned."""
-        field_value = self.get_header("Date")
-        if field_value is not None:
-            return params.FullDate.from_http_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Date", params.FullDate.from_http_str)
 
     def set_date(self, date=None):
         """Sets the value of the Date header
@@ -1493,11 +1575,8 @@ class Message(PEP8Compatibility, object):
 
         The result is a :py:class:`params.FullDate` instance.  If no
         Last-Modified header was present None is returned."""
-        field_value = self.get_header("Last-Modified")
-        if field_value is not None:
-            return params.FullDate.from_http_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Last-Modified",
+                                       params.FullDate.from_http_str)
 
     def set_last_modified(self, date=None):
         """Sets the value of the Last-Modified header field
@@ -1531,12 +1610,12 @@ class Message(PEP8Compatibility, object):
         """Returns a list of :py:class:`params.TransferEncoding`
 
         If no TransferEncoding header is present None is returned."""
-        field_value = self.get_header("Transfer-Encoding")
-        if field_value is not None:
-            telist = params.TransferEncoding.list_from_str(field_value)
+        telist = self._get_parsed_header(
+            "Transfer-Encoding", params.TransferEncoding.list_from_str)
+        if telist is not None:
             # validate the list at this point
             self._check_transfer_encoding(telist)
-            return telist
+            return list(telist)
         else:
             return None
 
@@ -1853,6 +1932,10 @@ class Request(Message):
                   "OPTIONS": True, "TRACE": True, "CONNECT": False,
                   "POST": False}
 
+    # a mapping from upper case method name to True/False with True
+    # indicating the method is safe, i.e., has no side effects
+    SAFE = {"GET": True, "HEAD": True, "OPTIONS": True, "TRACE": True}
+
     def __init__(self, **kwargs):
         super(Request, self).__init__(**kwargs)
         #: the http method, always upper case, e.g., 'POST'
@@ -1940,6 +2023,10 @@ class Request(Message):
         """Returns True if this is an idempotent request"""
         return self.method and self.IDEMPOTENT.get(self.method, False)
 
+    def is_safe(self):
+        """Returns True if this is a safe request"""
+        return self.method and self.SAFE.get(self.method, False)
+
     def set_method(self, method):
         with self.lock:
             self.method = method.upper()
@@ -1994,11 +2081,7 @@ class Request(Message):
     def get_accept(self):
         """Returns an :py:class:`AcceptList` instance or None if no
         "Accept" header is present."""
-        field_value = self.get_header("Accept")
-        if field_value is not None:
-            return AcceptList.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Accept", AcceptList.from_str)
 
     def set_accept(self, accept_value):
         """Sets the "Accept" header, replacing any existing value.
@@ -2015,11 +2098,8 @@ class Request(Message):
     def get_accept_charset(self):
         """Returns an :py:class:`AcceptCharsetList` instance or None if
         no "Accept-Charset" header is present."""
-        field_value = self.get_header("Accept-Charset")
-        if field_value is not None:
-            return AcceptCharsetList.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header(
+            "Accept-Charset", AcceptCharsetList.from_str)
 
     def set_accept_charset(self, accept_value):
         """Sets the "Accept-Charset" header, replacing any existing value.
@@ -2036,11 +2116,8 @@ class Request(Message):
     def get_accept_encoding(self):
         """Returns an :py:class:`AcceptEncodingList` instance or None if
         no "Accept-Encoding" header is present."""
-        field_value = self.get_header("Accept-Encoding")
-        if field_value is not None:
-            return AcceptEncodingList.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header(
+            "Accept-Encoding", AcceptEncodingList.from_str)
 
     def set_accept_encoding(self, accept_value):
         """Sets the "Accept-Encoding" header, replacing any existing value.
@@ -2240,11 +2317,7 @@ class Response(Message):
     def get_accept_ranges(self):
         """Returns an :py:class:`AcceptRanges` instance or None if no
         "Accept-Ranges" header is present."""
-        field_value = self.get_header("Accept-Ranges")
-        if field_value is not None:
-            return AcceptRanges.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Accept-Ranges", AcceptRanges.from_str)
 
     def set_accept_ranges(self, accept_value):
         """Sets the "Accept-Ranges" header, replacing any existing value.
@@ -2280,11 +2353,7 @@ class Response(Message):
     def get_etag(self):
         """Returns a :py:class:`EntityTag` instance parsed from the ETag
         header or None if no "ETag" header is present."""
-        field_value = self.get_header("ETag")
-        if field_value is not None:
-            return params.EntityTag.from_str(field_value)
-        else:
-            return None
+        return self._get_parsed_header("ETag", params.EntityTag.from_str)
 
     def set_etag(self, etag):
         """Sets the "ETag" header, replacing any existing value.
@@ -2302,11 +2371,7 @@ class Response(Message):
         the Location header.
 
         If no Location header was present None is returned."""
-        field_value = self.get_header("Location")
-        if field_value is not None:
-            return uri.URI.from_octets(field_value)
-        else:
-            return None
+        return self._get_parsed_header("Location", uri.URI.from_octets)
 
     def set_location(self, location):
         """Sets the Location header
@@ -2679,7 +2744,7 @@ class AcceptTokenList(params.Parameter):
         return al
 
     def to_bytes(self):
-        return b', '.join(str(i) for i in self._items)
+        return b', '.join(i.to_bytes() for i in self._items)
 
     def __len__(self):
         return len(self._items)
@@ -2946,7 +3011,7 @@ class CacheControl(params.Parameter):
     def from_str(cls, source):
         """Create a Cache-Control value from a *source* string."""
         p = HeaderParser(source)
-        cc = p.ParseCacheControl()
+        cc = p.require_cache_control()
         p.require_end("Cache-Control header")
         return cc
 
@@ -3192,6 +3257,42 @@ class HeaderParser(params.ParameterParser):
                 break
         return cls(*items)
 
+    #: directives whose quoted values are lists of field names
+    CACHE_LIST_DIRECTIVES = frozenset((b"private", b"no-cache"))
+
+    def require_cache_control(self):
+        """Parses a :py:class:`CacheControl` instance.
+
+        Raises BadSyntax if no directives were found."""
+        directives = []
+        self.parse_sp()
+        while self.the_word:
+            self.parse_sp()
+            if self.parse_separator(COMMA):
+                # empty list items are allowed
+                continue
+            d = self.require_token("cache-directive")
+            self.parse_sp()
+            if self.parse_separator(EQUALS_SIGN):
+                self.parse_sp()
+                if self.is_quoted_string():
+                    v = self.parse_quoted_string().decode('iso-8859-1')
+                    if d.lower() in self.CACHE_LIST_DIRECTIVES:
+                        v = tuple(f.strip() for f in v.split(',')
+                                  if f.strip())
+                else:
+                    v = self.require_token(
+                        "cache-directive value").decode('ascii')
+                directives.append((d, v))
+            else:
+                directives.append(d)
+            self.parse_sp()
+            if not self.parse_separator(COMMA):
+                break
+        if not directives:
+            raise grammar.BadSyntax("Expected cache-directive")
+        return CacheControl(*directives)
+
     def require_contentrange(self):
         """Parses a :py:class:`ContentRange` instance."""
         self.parse_sp()
@@ -8,6 +8,7 @@ releases.  Use with caution.
 import logging
 import os
 import random
+import threading
 import time
 
 from hashlib import sha256
@@ -366,6 +367,9 @@ class ToolConsumer(object):
         Navigation property to the associated users that have launched
         the tool."""
 
+    _update_lock = threading.Lock()
+    _updates = {}
+
     def __init__(self, entity, cipher):
         #: the entity that persists this consumer
         self.entity = entity
@@ -433,6 +437,21 @@ class ToolConsumer(object):
         # that it doesn't cache information about consumer secrets and
         # just update the value directly.
         self.secret = secret
+        with self._update_lock:
+            ToolConsumer._updates[self.key] = \
+                ToolConsumer._updates.get(self.key, 0) + 1
+
+    @classmethod
+    def update_count(cls, key):
+        """Returns the number of updates to a consumer
+
+        key
+            A consumer key
+
+        Returns the number of times :meth:`update_from_values` has been
+        called for consumers with this key by this process, used to
+        invalidate cached consumer objects."""
+        return cls._updates.get(key, 0)
 
     def nonce_key(self, nonce):
         """Returns a key into the nonce table
@@ -646,7 +665,26 @@ class ToolProvider(oauth.RequestValidator, MigratedClass):
         the consumer secret from the database.
 
     Implements the RequestValidator object required by the oauthlib
-    package. Internally creates an instance of SignatureOnlyEndpoint"""
+    package. Internally creates an instance of SignatureOnlyEndpoint
+
+    Consumers returned by :meth:`lookup_consumer` are cached for
+    :attr:`CONSUMER_TTL` seconds.  A cached consumer is discarded early
+    if :meth:`ToolConsumer.update_from_values` is called for the same
+    key in this process; changes made by other processes are picked up
+    when the cached value expires.
+
+    Nonces are only needed for the duration of :attr:`NONCE_WINDOW` so
+    expired nonces are deleted, at most once every
+    :attr:`NONCE_PRUNE_INTERVAL` seconds, during launch validation."""
+
+    #: the number of seconds a consumer is cached
+    CONSUMER_TTL = 60
+
+    #: the number of seconds for which a nonce may not be reused
+    NONCE_WINDOW = 5400.0
+
+    #: the minimum number of seconds between nonce pruning operations
+    NONCE_PRUNE_INTERVAL = 300
 
     def __init__(self, consumers, nonces, cipher):
         #: The entity set containing Silos
@@ -656,6 +694,13 @@ class ToolProvider(oauth.RequestValidator, MigratedClass):
         #: The cipher object used for encrypting consumer secrets
         self.cipher = cipher
         self.endpoint = oauth.SignatureOnlyEndpoint(self)
+        self.lock = threading.RLock()
+        self._consumer_cache = {}
+        self._next_prune = 0
+        #: the number of consumers found in the cache
+        self.consumer_hits = 0
+        #: the number of consumers loaded from :attr:`consumers`
+        self.consumer_misses = 0
 
     enforce_ssl = False
 
@@ -678,12 +723,23 @@ class ToolProvider(oauth.RequestValidator, MigratedClass):
                                      request, request_token=None,
                                      access_token=None):
         key = sha256((client_key + nonce).encode('utf-8')).hexdigest()
+        now = time.time()
+        with self.lock:
+            # test and advance together so that only one thread prunes
+            prune = now >= self._next_prune
+            if prune:
+                self._next_prune = now + self.NONCE_PRUNE_INTERVAL
+        if prune:
+            try:
+                self._delete_nonces(now)
+            except Exception:
+                # a failed prune must not fail a valid launch
+                logging.exception("Failed to prune expired nonces")
         with self.nonces.open() as collection:
-            now = time.time()
             try:
                 e = collection[key]
                 last_seen = e['LastSeen'].value.with_zone(0).get_unixtime()
-                if last_seen + 5400.0 < now:
+                if last_seen + self.NONCE_WINDOW < now:
                     # last seen more than 90 mins ago, update last_seen
                     e['LastSeen'].set_from_value(now)
                     collection.update_entity(e)
@@ -704,6 +760,31 @@ class ToolProvider(oauth.RequestValidator, MigratedClass):
 
     dummy_secret = ul('secret')
 
+    def prune_nonces(self, now=None):
+        """Deletes expired nonces
+
+        now (None)
+            The current time, as returned by time.time(), defaults to
+            the actual current time.
+
+        Nonces last seen more than :attr:`NONCE_WINDOW` seconds ago are
+        removed from :attr:`nonces` using a single set-based delete
+        (where the data source supports it).  Returns the number of
+        nonces deleted."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self._next_prune = now + self.NONCE_PRUNE_INTERVAL
+        return self._delete_nonces(now)
+
+    def _delete_nonces(self, now):
+        t = edm.EDMValue.from_type(edm.SimpleType.DateTime)
+        t.set_from_value(now - self.NONCE_WINDOW)
+        with self.nonces.open() as collection:
+            collection.set_filter(odata.CommonExpression.from_str(
+                "LastSeen lt :t", {'t': t}))
+            return collection.delete_filtered()
+
     def get_client_secret(self, client_key, request):
         try:
             return self.lookup_consumer(client_key).secret
@@ -716,9 +797,36 @@ class ToolProvider(oauth.RequestValidator, MigratedClass):
 
         Returns a :class:`ToolConsumer` instance or raises a KeyError if
         key is not the key of any known consumer."""
+        now = time.time()
+        updates = ToolConsumer.update_count(key)
+        with self.lock:
+            entry = self._consumer_cache.get(key, None)
+            if entry is not None:
+                expires, count, consumer = entry
+                if expires > now and count == updates:
+                    self.consumer_hits += 1
+                    return consumer
+                del self._consumer_cache[key]
+            self.consumer_misses += 1
         with self.consumers.open() as collection:
-            return ToolConsumer(collection[wsgi.key60(force_bytes(key))],
-                                self.cipher)
+            consumer = ToolConsumer(collection[wsgi.key60(force_bytes(key))],
+                                    self.cipher)
+        with self.lock:
+            self._consumer_cache[key] = (
+                now + self.CONSUMER_TTL, updates, consumer)
+        return consumer
+
+    def invalidate_consumer(self, key=None):
+        """Removes a consumer from the cache
+
+        key (None)
+            The consumer key to remove, if None all consumers are
+            removed."""
+        with self.lock:
+            if key is None:
+                self._consumer_cache = {}
+            else:
+                self._consumer_cache.pop(key, None)
 
     @old_method('Launch')
     def launch(self, command, url, headers, body_string):
@@ -94,7 +94,8 @@ class ManifestDocument(xmlns.XMLNSDocument):
                 (xsi.XMLSCHEMA_NAMESPACE, 'schemaLocation'),
                 ' '.join(schema_location))
 
-    def get_element_class(self, name):
+    @classmethod
+    def get_element_class(cls, name):
         eclass = ManifestDocument.classMap.get(
             name, ManifestDocument.classMap.get((name[0], None),
                                                 xmlns.XMLNSElement))
@@ -383,7 +383,8 @@ class ManifestDocument(xmlns.XMLNSDocument):
                 (xsi.XMLSCHEMA_NAMESPACE, 'schemaLocation'),
                 ' '.join(schema_location))
 
-    def get_element_class(self, name):
+    @classmethod
+    def get_element_class(cls, name):
         """Overrides
         :py:meth:`pyslet.xml.namespace.XMLNSDocument.get_element_class` to look
         up name.
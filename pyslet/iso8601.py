@@ -30,6 +30,7 @@ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE."""
 
 import decimal
+import re
 import time as pytime
 import warnings
 
@@ -2413,6 +2414,58 @@ class Time(PEP8Compatibility, UnicodeMixin, SortableMixin):
         return overflow
 
 
+# Regular expressions used to parse the most common, complete forms of
+# calendar time point without the overhead of ISO8601Parser.  Anything
+# else, including trailing data other than spaces, goes to the parser.
+_TIME_POINT_EXTENDED = re.compile(
+    r"([0-9]{2})([0-9]{2})-([0-9]{2})-([0-9]{2})(.)"
+    r"([0-9]{2}):([0-9]{2}):([0-9]{2})(?:[.,]([0-9]+))?"
+    r"(?:(Z)|([+-])([0-9]{2})(?::([0-9]{2}))?)? *$")
+
+_TIME_POINT_BASIC = re.compile(
+    r"([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{2})(.)"
+    r"([0-9]{2})([0-9]{2})([0-9]{2})(?:[.,]([0-9]+))?"
+    r"(?:(Z)|([+-])([0-9]{2})([0-9]{2})?)? *$")
+
+
+def _calendar_string(century, year, month, day, hour, minute, second,
+                     zdirection, zoffset, basic, ndp, zone_precision, dp,
+                     tdesignator):
+    # formats a complete, non-expanded calendar time point in one go,
+    # the output is the same as Date.get_calendar_string followed by
+    # Time.get_string
+    if isinstance(second, float):
+        fraction, second = modf(second)
+        second = int(second)
+    else:
+        fraction = 0
+    if basic:
+        stem = "%02i%02i%02i%02i%s%02i%02i%02i" % (
+            century, year, month, day, tdesignator, hour, minute, second)
+    else:
+        stem = "%02i%02i-%02i-%02i%s%02i:%02i:%02i" % (
+            century, year, month, day, tdesignator, hour, minute, second)
+    if ndp:
+        # same rounding as Time.get_string
+        fraction += 2e-13
+        fraction = int(floor(fraction * float(10 ** ndp)))
+        stem = "%s%s%0*i" % (stem, dp, ndp, fraction)
+    if zdirection is None:
+        return stem
+    elif zdirection == 0:
+        return stem + "Z"
+    zhour, zminute = divmod(zoffset, 60)
+    if zone_precision == Precision.Complete or zminute > 0:
+        if basic:
+            zformat = "%s%s%02i%02i"
+        else:
+            zformat = "%s%s%02i:%02i"
+        return zformat % (stem, "+" if zdirection > 0 else "-", zhour,
+                          zminute)
+    else:
+        return "%s%s%02i" % (stem, "+" if zdirection > 0 else "-", zhour)
+
+
 class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
 
     """A class for representing ISO timepoints
@@ -2442,6 +2495,8 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
     using the default, extended calendar format.  Other formats are
     supported through format specific methods."""
 
+    __slots__ = ('date', 'time')
+
     def __init__(self, src=None, date=None, time=None):
         PEP8Compatibility.__init__(self)
         if src is None:
@@ -2461,6 +2516,15 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
         else:
             raise TypeError("Can't construct TimePoint from %s" % repr(src))
 
+    def __getstate__(self):
+        return (self.date, self.time)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # pickled before TimePoint used __slots__
+            state = (state['date'], state['time'])
+        self.date, self.time = state
+
     def get_calendar_time_point(self):
         """Returns a tuple representing the calendar time point
 
@@ -2543,6 +2607,14 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
             TimePoint(date=self.date.expand(xdigits), time=self.time)"""
         return self.__class__(date=self.date.expand(xdigits), time=self.time)
 
+    def compact(self):
+        """Returns an equivalent :py:class:`CompactTimePoint`
+
+        If this TimePoint can't be represented compactly, because it
+        has reduced precision or an expanded date, it is returned
+        unchanged."""
+        return CompactTimePoint(self)
+
     def with_zone(self, zdirection, zhour=None, zminute=None, **kwargs):
         """Constructs a :py:class:`TimePoint` instance from an existing
         TimePoint but with the time zone specified.  The time zone of
@@ -2594,8 +2666,16 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
     @classmethod
     def from_str(cls, src, base=None, tdesignators="T", xdigits=None):
         """Constructs a TimePoint from a string representation.
-        Truncated forms are parsed with reference to *base*."""
+        Truncated forms are parsed with reference to *base*.
+
+        Complete calendar forms such as 1969-07-20T20:17:40.5+01:00 (in
+        basic or extended format) are parsed directly, other forms
+        are passed to :py:class:`ISO8601Parser`."""
         if is_text(src):
+            if base is None and xdigits is None:
+                tp = cls._from_calendar_str(src, tdesignators)
+                if tp is not None:
+                    return tp
             p = ISO8601Parser(src)
             if xdigits is None:
                 tp, f = p.parse_time_point_format(base, tdesignators)
@@ -2605,6 +2685,38 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
         else:
             raise TypeError
 
+    @staticmethod
+    def _from_calendar_str(src, tdesignators):
+        # returns None if src is not in one of the common forms
+        m = _TIME_POINT_EXTENDED.match(src)
+        if m is None:
+            m = _TIME_POINT_BASIC.match(src)
+            if m is None:
+                return None
+        (century, year, month, day, tdesignator, hour, minute, second,
+         fraction, zulu, zsign, zhour, zminute) = m.groups()
+        if tdesignator not in tdesignators:
+            return None
+        second = int(second)
+        if fraction is not None:
+            # matches the arithmetic used by ISO8601Parser.parse_fraction
+            second = float(second) + (float(int(fraction)) /
+                                      float(10 ** len(fraction)))
+        if zulu:
+            zdirection, zhour, zminute = 0, 0, 0
+        elif zsign:
+            zdirection = 1 if zsign == "+" else -1
+            zhour = int(zhour)
+            if zminute is not None:
+                zminute = int(zminute)
+        else:
+            zdirection = None
+        return TimePoint(
+            date=Date(century=int(century), year=int(year),
+                      month=int(month), day=int(day)),
+            time=Time(hour=int(hour), minute=int(minute), second=second,
+                      zdirection=zdirection, zhour=zhour, zminute=zminute))
+
     @classmethod
     def from_string_format(cls, src, base=None, tdesignators="T", xdigits=None,
                            **kwargs):
@@ -2661,9 +2773,18 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
         basic format is not allowed."""
         zone_precision = kwargs.get('zonePrecision', zone_precision)
         tdesignator = kwargs.get('tDesignator', tdesignator)
-        return (self.date.get_calendar_string(basic, truncation) +
-                tdesignator + self.time.get_string(basic, NoTruncation,
-                                                   ndp, zone_precision, dp))
+        d = self.date
+        t = self.time
+        if (truncation == NoTruncation and ndp >= 0 and d.xdigits is None and
+                d.day is not None and t.second is not None):
+            # the common case, a complete date and time: format in one go
+            return _calendar_string(
+                d.century, d.year, d.month, d.day, t.hour, t.minute,
+                t.second, t.zdirection, t.zoffset, basic, ndp,
+                zone_precision, dp, tdesignator)
+        return (d.get_calendar_string(basic, truncation) +
+                tdesignator + t.get_string(basic, NoTruncation,
+                                           ndp, zone_precision, dp))
 
     def get_ordinal_string(self, basic=0, truncation=0, ndp=0,
                            zone_precision=Precision.Complete, dp=",",
@@ -2955,6 +3076,211 @@ class TimePoint(PEP8Compatibility, UnicodeMixin, SortableMixin):
         return self.set_from_time_point(t)
 
 
+class CompactTimePoint(TimePoint):
+
+    """A compact, immutable representation of a TimePoint
+
+    CompactTimePoint instances behave like :py:class:`TimePoint` but
+    store the fields of the date and time directly in slots rather than
+    in separate :py:class:`Date` and :py:class:`Time` objects.  The
+    :py:attr:`date` and :py:attr:`time` attributes are created on
+    demand.  The key used for comparisons and hashing is calculated
+    once and cached, making them much cheaper to sort and to use as
+    dictionary keys.  CompactTimePoint instances compare and hash equal
+    to the equivalent TimePoint instances.
+
+    The constructor takes the same arguments as TimePoint but only
+    complete time points with non-expanded dates can be represented
+    compactly.  In other cases the constructor returns a plain
+    TimePoint instead.  Instances are immutable: the :py:attr:`date`
+    and :py:attr:`time` attributes can't be assigned and the deprecated
+    methods that modify a TimePoint in place (the set\_\* methods,
+    now, now_utc and change_zone) raise TypeError."""
+
+    __slots__ = ('_century', '_year', '_month', '_day', '_hour', '_minute',
+                 '_second', '_zdirection', '_zoffset', '_key')
+
+    # the Date and Time, once created, are cached in the slots inherited
+    # from TimePoint, accessed through these aliases as the names date
+    # and time are taken by the properties defined below
+    _date = TimePoint.date
+    _time = TimePoint.time
+
+    def __new__(cls, src=None, date=None, time=None):
+        if src is not None:
+            if isinstance(src, CompactTimePoint):
+                return src
+            elif isinstance(src, TimePoint):
+                date, time = src.date, src.time
+            else:
+                raise TypeError(
+                    "Can't construct TimePoint from %s" % repr(src))
+        if ((date is not None and (date.xdigits is not None or
+                                   date.day is None)) or
+                (time is not None and time.second is None)):
+            return TimePoint(date=date, time=time)
+        return object.__new__(cls)
+
+    def __init__(self, src=None, date=None, time=None):
+        if isinstance(src, CompactTimePoint):
+            # __new__ returned src itself
+            return
+        elif src is not None:
+            date, time = src.date, src.time
+        if date is None:
+            date = Date()
+        if time is None:
+            time = Time()
+        self._century = date.century
+        self._year = date.year
+        self._month = date.month
+        self._day = date.day
+        self._hour = time.hour
+        self._minute = time.minute
+        self._second = time.second
+        self._zdirection = time.zdirection
+        self._zoffset = time.zoffset
+        self._key = None
+        self._date = None
+        self._time = None
+
+    def __getstate__(self):
+        return (self._century, self._year, self._month, self._day,
+                self._hour, self._minute, self._second, self._zdirection,
+                self._zoffset)
+
+    def __setstate__(self, state):
+        (self._century, self._year, self._month, self._day, self._hour,
+         self._minute, self._second, self._zdirection,
+         self._zoffset) = state
+        self._key = self._date = self._time = None
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("CompactTimePoint instances are immutable")
+
+    @property
+    def date(self):
+        """The :py:class:`Date`, created on demand"""
+        if self._date is None:
+            self._date = Date(century=self._century, year=self._year,
+                              month=self._month, day=self._day)
+        return self._date
+
+    @date.setter
+    def date(self, value):
+        self._immutable()
+
+    @property
+    def time(self):
+        """The :py:class:`Time`, created on demand"""
+        if self._time is None:
+            if self._zdirection:
+                zhour, zminute = divmod(self._zoffset, 60)
+            else:
+                zhour = zminute = None
+            self._time = Time(hour=self._hour, minute=self._minute,
+                              second=self._second,
+                              zdirection=self._zdirection, zhour=zhour,
+                              zminute=zminute)
+        return self._time
+
+    @time.setter
+    def time(self, value):
+        self._immutable()
+
+    # the deprecated methods that modify TimePoints in place
+    set_origin = set_from_time_point = set_calendar_time_point = \
+        set_ordinal_time_point = set_week_time_point = set_from_string = \
+        set_zone = set_time_tuple = set_unix_time = now = now_utc = \
+        set_precision = change_zone = _immutable
+
+    def compact(self):
+        return self
+
+    @classmethod
+    def from_str(cls, src, base=None, tdesignators="T", xdigits=None):
+        """Constructs a CompactTimePoint from a string representation
+
+        As for :py:meth:`TimePoint.from_str` except that a plain
+        TimePoint is returned if the result can't be represented
+        compactly."""
+        return TimePoint.from_str(src, base, tdesignators, xdigits).compact()
+
+    def expand(self, xdigits):
+        return TimePoint(date=self.date.expand(xdigits), time=self.time)
+
+    def get_calendar_time_point(self):
+        return (self._century, self._year, self._month, self._day,
+                self._hour, self._minute, self._second)
+
+    def get_zone(self):
+        return self._zdirection, self._zoffset
+
+    def complete(self):
+        return True
+
+    def get_precision(self):
+        return Precision.Complete
+
+    def get_calendar_string(self, basic=False, truncation=NoTruncation, ndp=0,
+                            zone_precision=Precision.Complete, dp=",",
+                            tdesignator="T", **kwargs):
+        if truncation != NoTruncation or ndp < 0 or kwargs:
+            return super(CompactTimePoint, self).get_calendar_string(
+                basic, truncation, ndp, zone_precision, dp, tdesignator,
+                **kwargs)
+        return _calendar_string(
+            self._century, self._year, self._month, self._day, self._hour,
+            self._minute, self._second, self._zdirection, self._zoffset,
+            basic, ndp, zone_precision, dp, tdesignator)
+
+    def sortkey(self):
+        key = self._key
+        if key is None:
+            if self._zdirection and self._zoffset:
+                # force UTC for comparisons and hashing
+                key = self.shift_zone(zdirection=0).sortkey()
+            else:
+                # the same key that TimePoint calculates
+                key = (True, self._century, self._year, self._month, None,
+                       self._day, self._hour, self._minute, self._second)
+                if self._zdirection is not None:
+                    key = key + (0, )
+            self._key = key
+        return key
+
+    def otherkey(self, other):
+        if is_string(other):
+            other = TimePoint.from_str(other)
+        if isinstance(other, CompactTimePoint):
+            if (self._zdirection is None) ^ (other._zdirection is None):
+                return NotImplemented
+            return other.sortkey()
+        elif isinstance(other, TimePoint):
+            if other.get_precision() == Precision.Complete:
+                if ((self._zdirection is None) ^
+                        (other.time.get_zone_offset() is None)):
+                    return NotImplemented
+                return other.sortkey()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.sortkey())
+
+    def __eq__(self, other):
+        # fast path for the comparisons used by sorting and hashing
+        if (isinstance(other, CompactTimePoint) and
+                (self._zdirection is None) == (other._zdirection is None)):
+            return self.sortkey() == other.sortkey()
+        return super(CompactTimePoint, self).__eq__(other)
+
+    def __lt__(self, other):
+        if (isinstance(other, CompactTimePoint) and
+                (self._zdirection is None) == (other._zdirection is None)):
+            return self.sortkey() < other.sortkey()
+        return super(CompactTimePoint, self).__lt__(other)
+
+
 class Duration(UnicodeMixin, PEP8Compatibility):
 
     """A class for representing ISO durations"""
@@ -63,6 +63,8 @@ class MySQLEntityContainer(sqlds.SQLEntityContainer):
         self.user = user
         self.passwd = passwd
         self.mysql_options = mysql_options
+        # set from the server version when the first connection is opened
+        self.window_functions = None
 
 #     def get_collection_class(self):
 #         """Overridden to return :py:class:`MySQLEntityCollection`"""
@@ -86,8 +88,37 @@ class MySQLEntityContainer(sqlds.SQLEntityContainer):
             db=self.dbname, host=self.host, user=self.user,
             passwd=self.passwd, use_unicode=True, charset='utf8',
             **self.mysql_options)
+        if self.window_functions is None:
+            self.window_functions = self.server_has_window_functions(
+                dbc.get_server_info())
         return dbc
 
+    @staticmethod
+    def server_has_window_functions(server_info):
+        """Returns True if server_info is a version with window functions
+
+        Window functions were added in MySQL 8.0 and MariaDB 10.2."""
+        parts = server_info.split('-')
+        mariadb = 'mariadb' in server_info.lower()
+        if mariadb and parts[0] == '5.5.5' and len(parts) > 1:
+            # MariaDB may report a fake MySQL version prefix
+            parts = parts[1:]
+        try:
+            version = tuple(int(v) for v in parts[0].split('.')[:2])
+        except ValueError:
+            return False
+        if mariadb:
+            return version >= (10, 2)
+        else:
+            return version >= (8, 0)
+
+    def window_count_column(self):
+        """Overridden to use a window function if supported"""
+        if self.window_functions:
+            return 'COUNT(*) OVER()'
+        else:
+            return None
+
     def mangle_name(self, source_path):
         """Incorporates the table name prefix"""
         if len(source_path) == 1 and self.prefix:
@@ -256,7 +287,8 @@ class MySQLStreamStore(blockstore.StreamStore):
         :py:class:`pyslet.blockstore.BlockStore`,
         :py:class:`pyslet.blockstore.LockStore` and
         :py:class:`pyslet.blockstore.StreamStore`
-        respectively."""
+        respectively.  The 'BlockRefs' EntitySet holds the block
+        reference counts."""
         doc = edmx.Document()
         with open(os.path.join(os.path.dirname(__file__),
                                'odata2', 'streamstore.xml'), 'r') as f:
@@ -269,6 +301,14 @@ class MySQLStreamStore(blockstore.StreamStore):
         self.container = MySQLEntityContainer(db=db,
                                               container=self.container_def,
                                               **kwargs)
+        # stores created by earlier versions have no reference counts
+        rebuild = False
+        with self.container_def['BlockRefs'].open() as refs:
+            try:
+                len(refs)
+            except sqlds.SQLError:
+                refs.create_table()
+                rebuild = True
         if dpath is None:
             bs = blockstore.FileBlockStore(dpath)
         else:
@@ -276,4 +316,7 @@ class MySQLStreamStore(blockstore.StreamStore):
                 entity_set=self.container_def['Blocks'])
         ls = blockstore.LockStore(entity_set=self.container_def['Locks'])
         blockstore.StreamStore.__init__(
-            self, bs, ls, self.container_def['Streams'])
+            self, bs, ls, self.container_def['Streams'],
+            ref_set=self.container_def['BlockRefs'])
+        if rebuild:
+            self.rebuild_refs()
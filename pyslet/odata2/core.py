@@ -1643,33 +1643,27 @@ class Parser(edm.Parser):
         Although this expression appears complex this is basically a '.'
         separated list of name components, each of which must start with
         a letter and continue with a letter, number or underscore."""
-        if self.SimpleIdentifierStartClass is None:
+        if self.SimpleIdentifierClass is None:
             load_class = CharClass(CharClass.ucd_category("L"))
             load_class.add_class(CharClass.ucd_category("Nl"))
-            self.__class__.SimpleIdentifierStartClass = load_class
-        if self.SimpleIdentifierClass is None:
-            load_class = CharClass(self.SimpleIdentifierStartClass)
+            start_class = CharClass(load_class).freeze()
             for c in ['Nd', 'Mn', 'Mc', 'Pc', 'Cf']:
                 load_class.add_class(CharClass.ucd_category(c))
-            self.__class__.SimpleIdentifierClass = load_class
+            self.__class__.SimpleIdentifierStartClass = start_class
+            self.__class__.SimpleIdentifierClass = load_class.freeze()
         savepos = self.pos
-        result = []
         while True:
             # each segment must start with a start character
             if self.the_char is None or \
                     not self.SimpleIdentifierStartClass.test(self.the_char):
                 self.setpos(savepos)
                 return None
-            result.append(self.the_char)
-            self.next_char()
-            while self.the_char is not None and \
-                    self.SimpleIdentifierClass.test(self.the_char):
-                result.append(self.the_char)
-                self.next_char()
+            # the rest of the segment is matched in one go
+            self.setpos(self.SimpleIdentifierClass.scan(self.src,
+                                                        self.pos + 1))
             if not self.parse('.'):
                 break
-            result.append('.')
-        return ''.join(result)
+        return self.src[savepos:self.pos]
 
     def parse_string_uri_literal(self):
         if self.parse("'"):
@@ -61,10 +61,12 @@ NAMESPACE_ALIASES = {
 
 
 SIMPLE_IDENTIFIER_RE = xsi.RegularExpression(
-    r"[\p{L}\p{Nl}][\p{L}\p{Nl}\p{Nd}\p{Mn}\p{Mc}\p{Pc}\p{Cf}]{0,}")
+    r"[\p{L}\p{Nl}][\p{L}\p{Nl}\p{Nd}\p{Mn}\p{Mc}\p{Pc}\p{Cf}]{0,}",
+    defer=True)
 
 SIMPLE_IDENTIFIER_COMPATIBILITY_RE = xsi.RegularExpression(
-    r"[\p{L}\p{Nl}][\p{L}\p{Nl}\p{Nd}\p{Mn}\p{Mc}\p{Pc}\p{Pd}\p{Cf}]{0,}")
+    r"[\p{L}\p{Nl}][\p{L}\p{Nl}\p{Nd}\p{Mn}\p{Mc}\p{Pc}\p{Pd}\p{Cf}]{0,}",
+    defer=True)
 
 _simple_identifier_re = SIMPLE_IDENTIFIER_RE
 
@@ -1321,19 +1323,20 @@ class DateTimeValue(SimpleValue):
     def set_from_literal(self, value):
         p = Parser(value)
         self.value = p.require_production_end(
-            p.parse_datetime_literal(), "DateTime")
+            p.parse_datetime_literal(), "DateTime").compact()
 
     def set_from_value(self, new_value):
         if new_value is None:
             self.value = None
         elif isinstance(new_value, iso8601.TimePoint):
-            self.value = new_value.with_zone(zdirection=None)
+            self.value = iso8601.CompactTimePoint(new_value).with_zone(
+                zdirection=None)
         elif isinstance(new_value, (int, long2, float, decimal.Decimal)) and \
                 new_value >= 0:
-            self.value = iso8601.TimePoint.from_unix_time(
+            self.value = iso8601.CompactTimePoint.from_unix_time(
                 float(new_value)).with_zone(None)
         elif isinstance(new_value, datetime.datetime):
-            self.value = iso8601.TimePoint(
+            self.value = iso8601.CompactTimePoint(
                 date=iso8601.Date(
                     century=new_value.year // 100,
                     year=new_value.year % 100,
@@ -1346,7 +1349,7 @@ class DateTimeValue(SimpleValue):
                     (new_value.microsecond / 1000000.0),
                     zdirection=None))
         elif isinstance(new_value, datetime.date):
-            self.value = iso8601.TimePoint(
+            self.value = iso8601.CompactTimePoint(
                 date=iso8601.Date(
                     century=new_value.year // 100,
                     year=new_value.year % 100,
@@ -1424,10 +1427,11 @@ class DateTimeOffsetValue(SimpleValue):
                 raise ValueError(
                     "DateTimeOffset requires a complete representation: %s" %
                     str(new_value))
-            self.value = new_value
+            self.value = new_value.compact()
         elif isinstance(new_value, (int, long2, float, decimal.Decimal)) and \
                 new_value >= 0:
-            self.value = iso8601.TimePoint.from_unix_time(float(new_value))
+            self.value = iso8601.CompactTimePoint.from_unix_time(
+                float(new_value))
         else:
             raise TypeError(
                 "Can't set DateTimeOffset from %s" % str(new_value))
@@ -3246,6 +3250,27 @@ class EntityCollection(DictionaryLike, PEP8Compatibility):
     def __delitem__(self, key):
         raise NotImplementedError
 
+    def delete_filtered(self):
+        """Deletes all entities that pass the current filter
+
+        Returns the number of entities deleted.  If no filter has been
+        set then all entities in the collection are deleted.
+
+        The default implementation selects the keys of the matching
+        entities and deletes them one at a time.  Data providers should
+        override this method with a more efficient implementation if
+        possible."""
+        self.select_keys()
+        keys = [e.key() for e in self.itervalues()]
+        count = 0
+        for k in keys:
+            try:
+                del self[k]
+                count += 1
+            except KeyError:
+                pass
+        return count
+
     def set_page(self, top, skip=0, skiptoken=None):
         """Sets the page parameters that determine the next page
         returned by :py:meth:`iterpage`.
@@ -3492,6 +3517,28 @@ class NavigationCollection(EntityCollection):
         self.clear()
         self[entity.key()] = entity
 
+    def delete_filtered(self):
+        """Deletes all entities that pass the current filter
+
+        Unlike the del operator this method deletes the matching
+        entities themselves from the target entity set, not just the
+        links to them.  Returns the number of entities deleted.
+
+        The default implementation selects the keys of the matching
+        entities and deletes them one at a time from the base
+        collection."""
+        self.select_keys()
+        keys = [e.key() for e in self.itervalues()]
+        count = 0
+        with self.entity_set.open() as base_collection:
+            for k in keys:
+                try:
+                    del base_collection[k]
+                    count += 1
+                except KeyError:
+                    pass
+        return count
+
 
 class ExpandedEntityCollection(NavigationCollection):
 
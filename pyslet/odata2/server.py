@@ -3,10 +3,13 @@
 
 import base64
 import codecs
+import hashlib
 import json
 import logging
 import sys
+import time
 import traceback
+import zlib
 
 from . import metadata as edmx
 from . import core as core
@@ -48,6 +51,42 @@ class WSGIWrapper(object):
         return self.start_response(status, response_headers, exc_info)
 
 
+class CachedResponse(object):
+
+    """A precomputed response body
+
+    data
+        The response body, a binary string
+
+    gzip_level (0)
+        If non-zero, a gzip encoded copy of the data is also kept,
+        compressed at this level.
+
+    Used by :class:`Server` for responses that only change when the
+    model changes, such as the metadata document.  Each copy of the
+    data has its own strong entity tag."""
+
+    def __init__(self, data, gzip_level=0):
+        #: the response body
+        self.data = data
+        digest = hashlib.sha1(data).hexdigest()
+        #: a strong :class:`pyslet.http.params.EntityTag` for data
+        self.etag = params.EntityTag(digest, weak=False)
+        #: a :class:`pyslet.http.params.FullDate`, the time the
+        #: response was created
+        self.last_modified = params.FullDate.from_unix_time(
+            int(time.time()))
+        if gzip_level:
+            zobj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            #: the gzip encoded response body or None
+            self.gzip_data = zobj.compress(data) + zobj.flush()
+            #: a strong entity tag for gzip_data or None
+            self.gzip_etag = params.EntityTag(digest + "-gzip", weak=False)
+        else:
+            self.gzip_data = None
+            self.gzip_etag = None
+
+
 class Server(app.Server):
 
     """Extends py:class:`pyselt.rfc5023.Server` to provide an OData
@@ -170,6 +209,14 @@ class Server(app.Server):
         self.model = None
         #: the maximum number of entities to return per request
         self.topmax = 100
+        #: the minimum size of each chunk of data yielded by streamed
+        #: responses, set to 0 to disable streaming and buffer all
+        #: entity and feed responses
+        self.stream_chunk = 0x10000
+        #: the compression level used for the gzip encoded copies of
+        #: the metadata and service documents, set to 0 to disable
+        self.gzip_level = 6
+        self._cached_responses = {}
 
     @old_method('SetModel')
     def set_model(self, model):
@@ -207,6 +254,92 @@ class Server(app.Server):
                     # update the locations following SetBase above
                     es.set_location()
         self.model = model
+        self.refresh_cached_responses()
+
+    def refresh_cached_responses(self):
+        """Recalculates the cached metadata and service documents
+
+        The serialised documents are calculated once, when the model is
+        set, and are then served from memory.  If you modify the model
+        or the service document after calling :meth:`set_model` you
+        must call this method to update the cached responses."""
+        cache = {}
+        if self.model is not None:
+            cache['metadata'] = CachedResponse(
+                str(self.model.get_document()).encode('utf-8'),
+                self.gzip_level)
+        cache['service'] = CachedResponse(
+            to_text(self.serviceDoc).encode('utf-8'), self.gzip_level)
+        data = str('{"d":%s}' % json.dumps(
+            {'EntitySets': [x.href for x in self.ws.Collection]}))
+        cache['json_root'] = CachedResponse(
+            data.encode('utf-8'), self.gzip_level)
+        self._cached_responses = cache
+
+    def get_cached_response(self, name):
+        """Returns a :class:`CachedResponse` instance
+
+        name
+            One of 'metadata', 'service' or 'json_root'"""
+        cache = self._cached_responses
+        if name not in cache:
+            self.refresh_cached_responses()
+            cache = self._cached_responses
+        return cache[name]
+
+    def return_cached(self, cached, response_type, environ, start_response,
+                      response_headers):
+        """Returns a :class:`CachedResponse`
+
+        The gzip encoded copy of the data is returned if there is one
+        and the client accepts it.  Conditional requests are answered
+        with 304 when the If-None-Match (or, in its absence, the
+        If-Modified-Since) header matches the cached data."""
+        data = cached.data
+        etag = cached.etag
+        if cached.gzip_data is not None:
+            response_headers.append(("Vary", "Accept-Encoding"))
+            accept = environ.get('HTTP_ACCEPT_ENCODING', None)
+            if accept:
+                try:
+                    accept = messages.AcceptEncodingList.from_str(accept)
+                    if accept.select_token(("gzip", "identity")) == "gzip":
+                        data = cached.gzip_data
+                        etag = cached.gzip_etag
+                except grammar.BadSyntax:
+                    pass
+        response_headers.append(("ETag", str(etag)))
+        response_headers.append(
+            ("Last-Modified", str(cached.last_modified)))
+        if self._not_modified(environ, etag, cached.last_modified):
+            start_response("%i %s" % (304, "Not Modified"), response_headers)
+            return []
+        response_headers.append(("Content-Type", str(response_type)))
+        if data is cached.gzip_data:
+            response_headers.append(("Content-Encoding", "gzip"))
+        response_headers.append(("Content-Length", str(len(data))))
+        start_response("%i %s" % (200, "Success"), response_headers)
+        return [data]
+
+    def _not_modified(self, environ, etag, last_modified):
+        value = environ.get('HTTP_IF_NONE_MATCH', None)
+        if value is not None:
+            if value.strip() == "*":
+                return True
+            for item in value.split(','):
+                try:
+                    if params.EntityTag.from_str(item).tag == etag.tag:
+                        return True
+                except grammar.BadSyntax:
+                    continue
+            return False
+        value = environ.get('HTTP_IF_MODIFIED_SINCE', None)
+        if value is not None:
+            try:
+                return last_modified <= params.FullDate.from_http_str(value)
+            except (grammar.BadSyntax, ValueError):
+                pass
+        return False
 
     @classmethod
     def encode_pathinfo(cls, pathinfo):
@@ -866,12 +999,9 @@ class Server(app.Server):
                 else:
                     # override the default handling of service root to improve
                     # content negotiation
-                    data = to_text(self.serviceDoc).encode('utf-8')
-                    response_headers.append(
-                        ("Content-Type", str(response_type)))
-                    response_headers.append(("Content-Length", str(len(data))))
-                    start_response("200 Ok", response_headers)
-                    return [data]
+                    return self.return_cached(
+                        self.get_cached_response('service'), response_type,
+                        environ, start_response, response_headers)
         except core.MissingURISegment as e:
             return self.odata_error(
                 request, environ, start_response, "Resource not found",
@@ -912,28 +1042,21 @@ class Server(app.Server):
 
     def return_json_root(self, request, environ, start_response,
                          response_headers):
-        data = str('{"d":%s}' % json.dumps(
-            {'EntitySets': [x.href for x in self.ws.Collection]}))
-        data = data.encode('utf-8')
-        response_headers.append(("Content-Type", "application/json"))
-        response_headers.append(("Content-Length", str(len(data))))
-        start_response("%i %s" % (200, "Success"), response_headers)
-        return [data]
+        return self.return_cached(
+            self.get_cached_response('json_root'), "application/json",
+            environ, start_response, response_headers)
 
     def return_metadata(self, request, environ, start_response,
                         response_headers):
-        doc = self.model.get_document()
         response_type = self.content_negotiation(
             request, environ, self.MetadataTypes)
         if response_type is None:
             return self.odata_error(
                 request, environ, start_response, "Not Acceptable",
                 'xml or plain text formats supported', 406)
-        data = str(doc).encode('utf-8')
-        response_headers.append(("Content-Type", str(response_type)))
-        response_headers.append(("Content-Length", str(len(data))))
-        start_response("%i %s" % (200, "Success"), response_headers)
-        return [data]
+        return self.return_cached(
+            self.get_cached_response('metadata'), response_type, environ,
+            start_response, response_headers)
 
     def return_links(self, entities, request, environ, start_response,
                      response_headers):
@@ -999,9 +1122,72 @@ class Server(app.Server):
         start_response("%i %s" % (200, "Success"), response_headers)
         return [data]
 
+    def stream_response(self, environ):
+        """Returns True if a response should be streamed
+
+        Entity and feed responses are streamed unless
+        :attr:`stream_chunk` is 0 or the request was made with
+        HTTP/1.0.  Streamed responses have no Content-Length, leaving
+        the WSGI server to use chunked transfer encoding (or to close
+        the connection) to delimit the response.  You may override this
+        method to force buffering for clients that need a
+        Content-Length."""
+        if not self.stream_chunk:
+            return False
+        return environ.get('SERVER_PROTOCOL', '').upper() != "HTTP/1.0"
+
+    def generate_chunks(self, data, close=None):
+        """Joins character strings into sizeable chunks of bytes
+
+        data
+            An iterable yielding character strings
+
+        close (None)
+            An optional callable that is called when data is exhausted
+            or the returned generator is closed
+
+        Yields UTF-8 encoded binary strings of at least
+        :attr:`stream_chunk` bytes, except for the last one.
+
+        The first chunk is generated before this method returns so that
+        errors that occur when a query is first executed are raised
+        before the response has been started."""
+        chunks = self._generate_chunks(data, close)
+        first = next(chunks, None)
+        return self._resume_chunks(first, chunks)
+
+    def _resume_chunks(self, first, chunks):
+        if first is not None:
+            yield first
+            for chunk in chunks:
+                yield chunk
+
+    def _generate_chunks(self, data, close):
+        try:
+            buffer = []
+            size = 0
+            for s in data:
+                s = s.encode('utf-8')
+                buffer.append(s)
+                size += len(s)
+                if size >= self.stream_chunk:
+                    yield b''.join(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield b''.join(buffer)
+        finally:
+            if close is not None:
+                close()
+
     def return_entity_collection(self, entities, request, environ,
                                  start_response, response_headers):
-        """Returns an iterable of Entities."""
+        """Returns an iterable of Entities.
+
+        The response is streamed, pulling entities from *entities* as
+        the data is consumed, unless :meth:`stream_response` returns
+        False.  In both cases *entities* is closed once the response
+        data has been generated."""
         response_type = self.content_negotiation(
             request, environ, self.FeedTypes)
         if response_type is None:
@@ -1010,22 +1196,32 @@ class Server(app.Server):
                 'xml, json or plain text formats supported', 406)
         entities.set_topmax(self.topmax)
         if response_type == "application/json":
-            data = str('{"d":%s}' % ''.join(
-                entities.generate_entity_set_in_json(request.version)))
+            data = self._generate_json_feed(entities, request.version)
         else:
-            # Here's a challenge, we want to pull data through the feed
-            # by yielding strings just load in to memory at the moment
             f = core.Feed(None, entities)
             doc = core.Document(root=f)
             f.collection = entities
             f.set_base(str(self.service_root))
-            data = str(doc)
-        data = data.encode('utf-8')
+            data = doc.generate_xml(xml.escape_char_data)
         response_headers.append(("Content-Type", str(response_type)))
+        if self.stream_response(environ):
+            data = self.generate_chunks(data, entities.close)
+            start_response("%i %s" % (200, "Success"), response_headers)
+            return data
+        try:
+            data = ''.join(data).encode('utf-8')
+        finally:
+            entities.close()
         response_headers.append(("Content-Length", str(len(data))))
         start_response("%i %s" % (200, "Success"), response_headers)
         return [data]
 
+    def _generate_json_feed(self, entities, version):
+        yield '{"d":'
+        for s in entities.generate_entity_set_in_json(version):
+            yield s
+        yield '}'
+
     def read_xml_or_json(self, environ):
         """Reads either an XML document or a JSON object from environ."""
         atom_flag = None
@@ -1108,24 +1304,31 @@ class Server(app.Server):
             return self.odata_error(
                 request, environ, start_response, "Not Acceptable",
                 'xml, json or plain text formats supported', 406)
-        # Here's a challenge, we want to pull data through the feed by
-        # yielding strings just load in to memory at the moment
         if response_type == "application/json":
-            data = str('{"d":%s}' %
-                       ''.join(entity.generate_entity_type_in_json()))
+            data = self._generate_json_entity(entity)
         else:
             doc = core.Document(root=core.Entry)
             e = doc.root
             e.set_base(str(self.service_root))
             e.set_value(entity)
-            data = str(doc)
-        data = data.encode('utf-8')
+            data = doc.generate_xml(xml.escape_char_data)
         response_headers.append(("Content-Type", str(response_type)))
-        response_headers.append(("Content-Length", str(len(data))))
         self.set_etag(entity, response_headers)
+        if self.stream_response(environ):
+            data = self.generate_chunks(data)
+            start_response("%i %s" % (status, status_msg), response_headers)
+            return data
+        data = ''.join(data).encode('utf-8')
+        response_headers.append(("Content-Length", str(len(data))))
         start_response("%i %s" % (status, status_msg), response_headers)
         return [data]
 
+    def _generate_json_entity(self, entity):
+        yield '{"d":'
+        for s in entity.generate_entity_type_in_json():
+            yield s
+        yield '}'
+
     def return_stream(self, entity, request, environ, start_response,
                       response_headers, method):
         """Returns a media stream."""
@@ -17,6 +17,8 @@ import time
 import traceback
 import warnings
 
+from collections import deque
+
 from .. import blockstore
 from .. import iso8601 as iso
 from ..http import params
@@ -288,6 +290,7 @@ class SQLTransaction(object):
         self.cursor = None
         self.no_commit = 0      #: used to manage nested transactions
         self.query_count = 0    #: records the number of successful commands
+        self.write_count = 0    #: the number of commands other than SELECT
 
     @retry_decorator
     def begin(self):
@@ -297,6 +300,11 @@ class SQLTransaction(object):
         started which has no affect on the database connection itself."""
         if self.cursor is None:
             self.cursor = self.connection.dbc.cursor()
+            try:
+                self.container.begin_transaction(self)
+            except:
+                self.cursor = None
+                raise
         else:
             self.no_commit += 1
 
@@ -313,14 +321,18 @@ class SQLTransaction(object):
         self.cursor.execute(sqlcmd,
                             params.params if params is not None else None)
         self.query_count += 1
+        if sqlcmd[:6].upper() != "SELECT":
+            self.write_count += 1
 
     def commit(self):
         """Ends this transaction with a commit
 
-        Nested transactions do nothing."""
+        Nested transactions do nothing.  The commit itself is delegated
+        to the container's :py:meth:`SQLEntityContainer.commit_transaction`
+        method."""
         if self.no_commit:
             return
-        self.connection.dbc.commit()
+        self.container.commit_transaction(self)
 
     def rollback(self, err=None, swallow=False):
         """Calls the underlying database connection rollback method.
@@ -344,7 +356,7 @@ class SQLTransaction(object):
             swallowed, rather than re-raised."""
         if not self.no_commit:
             try:
-                self.connection.dbc.rollback()
+                self.container.rollback_transaction(self)
                 if err is not None:
                     logging.info(
                         "rollback invoked for transaction following error %s",
@@ -382,6 +394,7 @@ class SQLTransaction(object):
             self.cursor.close()
             self.cursor = None
             self.query_count = 0
+            self.write_count = 0
 
 
 class SQLCollectionBase(core.EntityCollection):
@@ -428,6 +441,10 @@ class SQLCollectionBase(core.EntityCollection):
         self.connection = None
         self._sqlLen = None
         self._sqlGen = None
+        # the count obtained with a window function, if any
+        self._window_count = None
+        # a page of rows read in advance by __len__
+        self._page_rows = None
         try:
             self.connection = self.container.acquire_connection(SQL_TIMEOUT)
             if self.connection is None:
@@ -440,10 +457,16 @@ class SQLCollectionBase(core.EntityCollection):
     def close(self):
         """Closes the cursor and database connection if they are open."""
         if self.connection is not None:
-            self.container.release_connection(self.connection)
-            self.connection = None
+            # release_connection may raise (e.g., a failed group commit)
+            # so forget the connection first to prevent a double release
+            connection, self.connection = self.connection, None
+            self.container.release_connection(connection)
 
     def __len__(self):
+        if self.inlinecount:
+            count = self.inline_count()
+            if count is not None:
+                return count
         if self._sqlLen is None:
             query = ["SELECT COUNT(*) FROM %s" % self.table_name]
             params = self.container.ParamsClass()
@@ -588,10 +611,54 @@ class SQLCollectionBase(core.EntityCollection):
         else:
             return None
 
-    def page_generator(self, set_next=False):
-        if self.top == 0:
-            # end of paging
-            return
+    def inline_count(self):
+        """Returns the count for the $inlinecount option or None
+
+        If the container supports a window count (see
+        :meth:`SQLEntityContainer.window_count_column`) the count is
+        calculated by the same query that returns the current page of
+        entities, saving a separate SELECT COUNT(*).  The rows are read
+        in advance and returned by the next call to
+        :meth:`page_generator`.
+
+        The result is remembered and is reused for subsequent pages of
+        the same collection until the filter is changed, it is therefore
+        a snapshot taken with the first page.
+
+        Returns None if the count can't be calculated in this way, for
+        example, because a skiptoken is in effect, in which case the
+        caller should fall back to a separate count query."""
+        if self._window_count is not None:
+            return self._window_count
+        if (self.skiptoken is not None or self.top == 0 or
+                (self.top is None and self.topmax is None)):
+            # we can't count all pages, or we'd read an unbounded page
+            return None
+        count_column = self.container.window_count_column()
+        if count_column is None:
+            return None
+        query, params, skip, count_index = self._page_query(count_column)
+        transaction = SQLTransaction(self.container, self.connection)
+        try:
+            transaction.begin()
+            logging.info("%s; %s", query, to_text(params.params))
+            transaction.execute(query, params)
+            rows = transaction.cursor.fetchall()
+            transaction.commit()
+        except Exception as e:
+            transaction.rollback(e)
+        finally:
+            transaction.close()
+        self._page_rows = (query, params.params, rows)
+        if rows:
+            self._window_count = rows[0][count_index]
+        elif not self.skip:
+            self._window_count = 0
+        return self._window_count
+
+    def _page_query(self, count_column=None):
+        # returns a tuple of query, params, skip and the index of
+        # count_column in the result (or None)
         skip = self.skip
         top = self.top
         topmax = self.topmax
@@ -610,6 +677,13 @@ class SQLCollectionBase(core.EntityCollection):
         params = self.container.ParamsClass()
         column_names, values = zip(*list(self.select_fields(entity)))
         column_names = list(column_names)
+        if count_column is None:
+            count_index = None
+        else:
+            # the count goes before the orderby columns, which must be
+            # last
+            count_index = len(column_names)
+            column_names.append(count_column)
         self.orderby_cols(column_names, params, True)
         query.append(", ".join(column_names))
         query.append(' FROM ')
@@ -622,69 +696,32 @@ class SQLCollectionBase(core.EntityCollection):
         skip, limit_clause = self.container.limit_clause(skip, limit)
         if limit_clause:
             query.append(limit_clause)
-        query = ''.join(query)
+        return ''.join(query), params, skip, count_index
+
+    def page_generator(self, set_next=False):
+        if self.top == 0:
+            # end of paging
+            return
+        if self._page_rows is not None:
+            # rows read in advance by inline_count, check that the
+            # query hasn't changed in the meantime
+            page_query, page_params, rows = self._page_rows
+            self._page_rows = None
+            query, params, skip, count_index = self._page_query(
+                self.container.window_count_column())
+            if query == page_query and params.params == page_params:
+                for entity in self._page_entities(rows, skip, set_next):
+                    yield entity
+                return
+        query, params, skip, count_index = self._page_query()
         transaction = SQLTransaction(self.container, self.connection)
         try:
             transaction.begin()
             logging.info("%s; %s", query, to_text(params.params))
             transaction.execute(query, params)
-            while True:
-                row = transaction.cursor.fetchone()
-                if row is None:
-                    # no more pages
-                    if set_next:
-                        self.top = self.skip = 0
-                        self.skipToken = None
-                    break
-                if skip:
-                    skip = skip - 1
-                    continue
-                if entity is None:
-                    entity = self.new_entity()
-                    values = next(
-                        itertools.islice(
-                            zip(*list(self.select_fields(entity))), 1, None))
-                row_values = list(row)
-                for value, new_value in zip(values, row_values):
-                    self.container.read_sql_value(value, new_value)
-                entity.exists = True
+            for entity in self._page_entities(
+                    iter(transaction.cursor.fetchone, None), skip, set_next):
                 yield entity
-                if topmax is not None:
-                    topmax = topmax - 1
-                    if topmax < 1:
-                        # this is the last entity, set the nextSkiptoken
-                        order_values = row_values[-len(self.orderNames):]
-                        self.nextSkiptoken = []
-                        for v in order_values:
-                            self.nextSkiptoken.append(
-                                self.container.new_from_sql_value(v))
-                        tokenlen = 0
-                        for v in self.nextSkiptoken:
-                            if v and isinstance(v, (edm.StringValue,
-                                                    edm.BinaryValue)):
-                                tokenlen += len(v.value)
-                        # a really large skiptoken is no use to anyone
-                        if tokenlen > 512:
-                            # ditch this one, copy the previous one and add a
-                            # skip
-                            self.nextSkiptoken = list(self.skiptoken)
-                            v = edm.Int32Value()
-                            v.set_from_value(self.topmax)
-                            self.nextSkiptoken.append(v)
-                        if set_next:
-                            self.skiptoken = self.nextSkiptoken
-                            self.skip = 0
-                        break
-                if top is not None:
-                    top = top - 1
-                    if top < 1:
-                        if set_next:
-                            if self.skip is not None:
-                                self.skip = self.skip + self.top
-                            else:
-                                self.skip = self.top
-                        break
-                entity = None
             # we haven't changed the database, but we don't want to
             # leave the connection idle in transaction
             transaction.commit()
@@ -693,6 +730,62 @@ class SQLCollectionBase(core.EntityCollection):
         finally:
             transaction.close()
 
+    def _page_entities(self, rows, skip, set_next):
+        top = self.top
+        topmax = self.topmax
+        for row in rows:
+            if skip:
+                skip = skip - 1
+                continue
+            entity = self.new_entity()
+            values = next(
+                itertools.islice(
+                    zip(*list(self.select_fields(entity))), 1, None))
+            row_values = list(row)
+            for value, new_value in zip(values, row_values):
+                self.container.read_sql_value(value, new_value)
+            entity.exists = True
+            yield entity
+            if topmax is not None:
+                topmax = topmax - 1
+                if topmax < 1:
+                    # this is the last entity, set the nextSkiptoken
+                    order_values = row_values[-len(self.orderNames):]
+                    self.nextSkiptoken = []
+                    for v in order_values:
+                        self.nextSkiptoken.append(
+                            self.container.new_from_sql_value(v))
+                    tokenlen = 0
+                    for v in self.nextSkiptoken:
+                        if v and isinstance(v, (edm.StringValue,
+                                                edm.BinaryValue)):
+                            tokenlen += len(v.value)
+                    # a really large skiptoken is no use to anyone
+                    if tokenlen > 512:
+                        # ditch this one, copy the previous one and add a
+                        # skip
+                        self.nextSkiptoken = list(self.skiptoken)
+                        v = edm.Int32Value()
+                        v.set_from_value(self.topmax)
+                        self.nextSkiptoken.append(v)
+                    if set_next:
+                        self.skiptoken = self.nextSkiptoken
+                        self.skip = 0
+                    return
+            if top is not None:
+                top = top - 1
+                if top < 1:
+                    if set_next:
+                        if self.skip is not None:
+                            self.skip = self.skip + self.top
+                        else:
+                            self.skip = self.top
+                    return
+        # no more pages
+        if set_next:
+            self.top = self.skip = 0
+            self.skipToken = None
+
     def iterpage(self, set_next=False):
         return self.expand_entities(
             self.page_generator(set_next))
@@ -1057,6 +1150,38 @@ class SQLCollectionBase(core.EntityCollection):
                 self._joins[name] = (alias, join + join2)
         return alias
 
+    def delete_filtered_sql(self):
+        """Deletes the entities that pass the filter with one statement
+
+        Used by the implementations of delete_filtered.  The entities
+        are deleted with a single DELETE statement using the WHERE
+        clause of this collection provided that no cascade actions are
+        required, that is, this entity set holds the foreign keys for
+        all of its associations, and the filter can be expressed without
+        joining other tables.  Returns the number of entities deleted
+        or None if a single statement cannot be used."""
+        fk_mapping = self.container.fk_table[self.entity_set.name]
+        for link_end in self.entity_set.linkEnds:
+            if link_end not in fk_mapping:
+                return None
+        params = self.container.ParamsClass()
+        where = self.where_clause(None, params)
+        if self.join_clause():
+            return None
+        query = "DELETE FROM %s%s" % (self.table_name, where)
+        transaction = SQLTransaction(self.container, self.connection)
+        try:
+            transaction.begin()
+            logging.info("%s; %s", query, to_text(params.params))
+            transaction.execute(query, params)
+            rowcount = transaction.cursor.rowcount
+            transaction.commit()
+        except Exception as e:
+            transaction.rollback(e)
+        finally:
+            transaction.close()
+        return rowcount
+
     def join_clause(self):
         """A utility method to return the JOIN clause.
 
@@ -1071,6 +1196,7 @@ class SQLCollectionBase(core.EntityCollection):
         self.set_page(None)
         self._sqlLen = None
         self._sqlGen = None
+        self._window_count = None
 
     def where_clause(
             self,
@@ -2746,6 +2872,19 @@ class SQLEntityCollection(SQLCollectionBase):
             # entity = base[key]
         self.delete_entity(entity)
 
+    def delete_filtered(self):
+        """Deletes all entities that pass the current filter
+
+        Overridden to use a single DELETE statement when no cascade
+        actions are required, that is, when this entity set holds the
+        foreign keys for all of its associations and the filter can be
+        expressed without joining other tables.  Otherwise the base
+        class implementation is used."""
+        rowcount = self.delete_filtered_sql()
+        if rowcount is None:
+            return super(SQLEntityCollection, self).delete_filtered()
+        return rowcount
+
     def delete_entity(self, entity, from_end=None, transaction=None):
         """Deletes an entity
 
@@ -3480,6 +3619,18 @@ class SQLReverseKeyCollection(SQLNavigationCollection):
         self.keyCollection.clear_links(
             self.from_end.otherEnd, self.from_entity, transaction)
 
+    def delete_filtered(self):
+        """Deletes all entities that pass the current filter
+
+        Overridden to use a single DELETE statement constrained by the
+        foreign key that links the target entities to *from_entity*,
+        subject to the same conditions as
+        :py:meth:`SQLEntityCollection.delete_filtered`."""
+        rowcount = self.delete_filtered_sql()
+        if rowcount is None:
+            return super(SQLReverseKeyCollection, self).delete_filtered()
+        return rowcount
+
     def close(self):
         self.keyCollection.close()
         super(SQLReverseKeyCollection, self).close()
@@ -4061,6 +4212,97 @@ class SQLConnection(object):
         self.locked = 0
         self.last_seen = 0
         self.dbc = None
+        # the time at which the connection was (first) locked
+        self.acquired = 0
+        # the stack of the acquiring thread, if leaks are being tracked
+        self.stack = None
+        self.leak_reported = False
+
+
+class ConnectionPoolStats(object):
+
+    """Statistics for a connection pool
+
+    Instances are updated by :class:`SQLEntityContainer` while holding
+    the lock on its connection pool, use
+    :meth:`SQLEntityContainer.pool_stats` to read them safely.  Only the
+    outermost acquisition of a connection by a thread is counted, nested
+    calls to :meth:`SQLEntityContainer.acquire_connection` are not."""
+
+    #: the upper bounds (in seconds) of the wait time and hold time
+    #: histogram buckets, times greater than the last bound are counted
+    #: in an additional overflow bucket
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+    def __init__(self):
+        #: the number of connections acquired
+        self.acquired = 0
+        #: the number of acquisitions that had to wait in the queue
+        self.waits = 0
+        #: the number of acquisitions that timed out
+        self.timeouts = 0
+        #: the number of connections validated before reuse
+        self.pings = 0
+        #: the number of validations that failed
+        self.ping_failures = 0
+        #: the total and maximum time spent waiting for a connection
+        self.total_wait = self.max_wait = 0.0
+        #: the total and maximum time connections were held
+        self.total_hold = self.max_hold = 0.0
+        #: the number of releases (the count for the hold histogram)
+        self.released = 0
+        #: a list of wait counts, one per bucket in :attr:`BUCKETS`
+        #: plus one for the overflow
+        self.wait_histogram = [0] * (len(self.BUCKETS) + 1)
+        #: as for :attr:`wait_histogram` but for hold times
+        self.hold_histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def _bucket(self, elapsed):
+        i = 0
+        for bound in self.BUCKETS:
+            if elapsed <= bound:
+                break
+            i += 1
+        return i
+
+    def record_wait(self, elapsed):
+        """Records the time taken to acquire a connection"""
+        self.acquired += 1
+        self.total_wait += elapsed
+        if elapsed > self.max_wait:
+            self.max_wait = elapsed
+        self.wait_histogram[self._bucket(elapsed)] += 1
+
+    def record_hold(self, elapsed):
+        """Records the time a connection was held before release"""
+        self.released += 1
+        self.total_hold += elapsed
+        if elapsed > self.max_hold:
+            self.max_hold = elapsed
+        self.hold_histogram[self._bucket(elapsed)] += 1
+
+    def snapshot(self):
+        """Returns a dictionary of the current values
+
+        The result is suitable for serialising as JSON, the histograms
+        are lists of [bound, count] pairs with a bound of None for the
+        overflow bucket."""
+        bounds = list(self.BUCKETS) + [None]
+        return {
+            'acquired': self.acquired,
+            'released': self.released,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'pings': self.pings,
+            'ping_failures': self.ping_failures,
+            'total_wait': self.total_wait,
+            'max_wait': self.max_wait,
+            'total_hold': self.total_hold,
+            'max_hold': self.max_hold,
+            'wait_histogram': [list(x) for x in
+                               zip(bounds, self.wait_histogram)],
+            'hold_histogram': [list(x) for x in
+                               zip(bounds, self.hold_histogram)]}
 
 
 class SQLEntityContainer(object):
@@ -4121,6 +4363,25 @@ class SQLEntityContainer(object):
         of 3600 (1 hour) will result in a pool cleaner call every 12
         minutes.
 
+    leak_threshold (optional)
+        The number of seconds after which a connection that has not been
+        released is considered to have leaked.  The default is None,
+        which disables leak detection.  If set, the stack of the thread
+        that acquired each connection is saved so that it can be
+        reported, see :meth:`leaked_connections`.
+
+    ping_idle (optional)
+        The number of seconds a connection may be idle before it is
+        validated with :meth:`ping_connection` when it is next acquired.
+        The default is None, connections are never validated.
+        Connections that fail validation are closed and replaced with a
+        new connection.
+
+    Threads that have to wait for a connection are served in the order
+    in which they started waiting.  Statistics about the pool, including
+    histograms of the time spent waiting for and holding connections,
+    are available from :meth:`pool_stats`.
+
     This class is designed to work with diamond inheritance and super.
     All derived classes must call __init__ through super and pass all
     unused keyword arguments.  For example::
@@ -4131,7 +4392,8 @@ class SQLEntityContainer(object):
                         # do something with myDBConfig...."""
 
     def __init__(self, container, dbapi, streamstore=None, max_connections=10,
-                 field_name_joiner="_", max_idle=None, **kwargs):
+                 field_name_joiner="_", max_idle=None, leak_threshold=None,
+                 ping_idle=None, **kwargs):
         if kwargs:
             logging.debug(
                 "Unabsorbed kwargs in SQLEntityContainer constructor")
@@ -4153,11 +4415,20 @@ class SQLEntityContainer(object):
             self.module_lock = DummyLock()
             self.clocker = threading.RLock
             self.cpool_max = max_connections
-        self.cpool_lock = threading.Condition()
+        self.cpool_mutex = threading.RLock()
+        self.cpool_lock = threading.Condition(self.cpool_mutex)
         self.cpool_locked = {}
         self.cpool_unlocked = {}
         self.cpool_idle = []
         self.cpool_size = 0
+        # a FIFO queue of Conditions, one per waiting thread
+        self.cpool_waiters = deque()
+        #: a :class:`ConnectionPoolStats` instance
+        self.cpool_stats = ConnectionPoolStats()
+        #: see *leak_threshold* above
+        self.leak_threshold = leak_threshold
+        #: see *ping_idle* above
+        self.ping_idle = ping_idle
         self.closing = threading.Event()
         # set up the parameter style
         if self.dbapi.paramstyle == "qmark":
@@ -4625,6 +4896,7 @@ class SQLEntityContainer(object):
         now = start = time.time()
         cpool_item = None
         close_flag = False
+        ping_flag = False
         with self.cpool_lock:
             if self.closing.is_set():
                 # don't open connections when we are trying to close them
@@ -4643,60 +4915,44 @@ class SQLEntityContainer(object):
                 # our thread_id is in the locked table
                 cpool_item.locked += 1
                 cpool_item.last_seen = now
-            while cpool_item is None:
-                if thread_id in self.cpool_unlocked:
-                    # take the connection that last belonged to us
-                    cpool_item = self.cpool_unlocked[thread_id]
-                    del self.cpool_unlocked[thread_id]
-                    logging.debug("Thread[%i] re-acquiring connection",
-                                  thread_id)
-                elif (self.cpool_idle):
-                    # take a connection from an expired thread
-                    cpool_item = self.cpool_idle.pop()
-                elif self.cpool_size < self.cpool_max:
-                    # Add a new connection
-                    cpool_item = SQLConnection()
-                    # do the actual open outside of the cpool lock
-                    self.cpool_size += 1
-                elif self.cpool_unlocked:
-                    # take a connection that doesn't belong to us, popped at
-                    # random
-                    old_thread_id, cpool_item = self.cpool_unlocked.popitem()
-                    if self.dbapi.threadsafety > 1:
-                        logging.debug(
-                            "Thread[%i] recycled database connection from "
-                            "Thread[%i]", thread_id, old_thread_id)
-                    else:
-                        logging.debug(
-                            "Thread[%i] closed an unused database connection "
-                            "(max connections reached)", old_thread_id)
-                        # is it ok to close a connection from a different
-                        # thread?  Yes: we require it!
-                        close_flag = True
-                else:
+            else:
+                cpool_item, close_flag = self._wait_for_connection(
+                    thread_id, start, timeout)
+                if cpool_item is not None:
+                    idle_since = cpool_item.last_seen
                     now = time.time()
-                    if timeout is not None and now > start + timeout:
-                        logging.warning(
-                            "Thread[%i] timed out waiting for a database "
-                            "connection", thread_id)
-                        break
-                    logging.debug(
-                        "Thread[%i] forced to wait for a database connection",
-                        thread_id)
-                    self.cpool_lock.wait(timeout)
-                    logging.debug(
-                        "Thread[%i] resuming search for database connection",
-                        thread_id)
-                    continue
-                cpool_item.locked += 1
-                cpool_item.thread = thread
-                cpool_item.thread_id = thread_id
-                cpool_item.last_seen = time.time()
-                self.cpool_locked[thread_id] = cpool_item
+                    cpool_item.locked += 1
+                    cpool_item.thread = thread
+                    cpool_item.thread_id = thread_id
+                    cpool_item.last_seen = now
+                    cpool_item.acquired = now
+                    if self.leak_threshold is not None:
+                        cpool_item.stack = traceback.extract_stack()
+                    cpool_item.leak_reported = False
+                    self.cpool_locked[thread_id] = cpool_item
+                    self.cpool_stats.record_wait(now - start)
+                    if (self.ping_idle is not None and not close_flag and
+                            cpool_item.dbc is not None and
+                            now - idle_since > self.ping_idle):
+                        ping_flag = True
+                        self.cpool_stats.pings += 1
+                elif not self.closing.is_set():
+                    self.cpool_stats.timeouts += 1
         if cpool_item:
             if close_flag:
                 self.close_connection(cpool_item.dbc)
                 cpool_item.dbc = None
+            elif ping_flag and not self.ping_connection(cpool_item.dbc):
+                logging.warning(
+                    "Thread[%i] replacing database connection that failed "
+                    "validation", thread_id)
+                with self.cpool_lock:
+                    self.cpool_stats.ping_failures += 1
+                try:
+                    self.close_connection(cpool_item.dbc)
+                except Exception as err:
+                    logging.warning("Ignoring: %s", str(err))
+                cpool_item.dbc = None
             if cpool_item.dbc is None:
                 cpool_item.dbc = self.open()
             return cpool_item
@@ -4705,6 +4961,107 @@ class SQLEntityContainer(object):
         self.module_lock.release()
         return None
 
+    def _wait_for_connection(self, thread_id, start, timeout):
+        # called with cpool_lock held, returns a tuple of an unlocked
+        # SQLConnection (or None on timeout) and a flag indicating if
+        # the connection must be closed before use.  Waiting threads
+        # join a FIFO queue and only the thread at the head of the queue
+        # may take a connection.
+        waiter = None
+        try:
+            while not self.closing.is_set():
+                if waiter is None and self.cpool_waiters:
+                    # other threads are already waiting
+                    pass
+                elif waiter is None or self.cpool_waiters[0] is waiter:
+                    cpool_item, close_flag = self._take_connection(thread_id)
+                    if cpool_item is not None:
+                        return cpool_item, close_flag
+                now = time.time()
+                if timeout is not None and now > start + timeout:
+                    logging.warning(
+                        "Thread[%i] timed out waiting for a database "
+                        "connection", thread_id)
+                    break
+                if waiter is None:
+                    logging.debug(
+                        "Thread[%i] forced to wait for a database connection",
+                        thread_id)
+                    waiter = threading.Condition(self.cpool_mutex)
+                    self.cpool_waiters.append(waiter)
+                    self.cpool_stats.waits += 1
+                if timeout is None:
+                    waiter.wait()
+                else:
+                    waiter.wait(start + timeout - now)
+            return None, False
+        finally:
+            if waiter is not None:
+                head = self.cpool_waiters[0] is waiter
+                self.cpool_waiters.remove(waiter)
+                if head:
+                    # pass the baton to the next thread in the queue
+                    self._notify_waiter()
+
+    def _notify_waiter(self):
+        # called with cpool_lock held, wakes the thread at the head of
+        # the queue
+        if self.cpool_waiters:
+            self.cpool_waiters[0].notify()
+
+    def _take_connection(self, thread_id):
+        # called with cpool_lock held
+        if thread_id in self.cpool_unlocked:
+            # take the connection that last belonged to us
+            cpool_item = self.cpool_unlocked[thread_id]
+            del self.cpool_unlocked[thread_id]
+            logging.debug("Thread[%i] re-acquiring connection", thread_id)
+            return cpool_item, False
+        elif self.cpool_idle:
+            # take a connection from an expired thread
+            return self.cpool_idle.pop(), False
+        elif self.cpool_size < self.cpool_max:
+            # Add a new connection, the actual open is done outside of
+            # the cpool lock
+            self.cpool_size += 1
+            return SQLConnection(), False
+        elif self.cpool_unlocked:
+            # take a connection that doesn't belong to us, popped at
+            # random
+            old_thread_id, cpool_item = self.cpool_unlocked.popitem()
+            if self.dbapi.threadsafety > 1:
+                logging.debug(
+                    "Thread[%i] recycled database connection from "
+                    "Thread[%i]", thread_id, old_thread_id)
+                return cpool_item, False
+            else:
+                logging.debug(
+                    "Thread[%i] closed an unused database connection "
+                    "(max connections reached)", old_thread_id)
+                # is it ok to close a connection from a different
+                # thread?  Yes: we require it!
+                return cpool_item, True
+        return None, False
+
+    def ping_connection(self, connection):
+        """Returns True if *connection* is usable
+
+        Called when acquiring a connection that has been idle for longer
+        than *ping_idle* seconds (see constructor).  The default
+        implementation executes the query "SELECT 1", returning False if
+        it raises an exception."""
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            return True
+        except Exception as err:
+            logging.warning("Database connection failed validation: %s",
+                            str(err))
+            return False
+
     def release_connection(self, release_item):
         thread_id = threading.current_thread().ident
         close_flag = False
@@ -4718,8 +5075,10 @@ class SQLEntityContainer(object):
                     cpool_item.last_seen = time.time()
                     if not cpool_item.locked:
                         del self.cpool_locked[thread_id]
+                        self._unlock_item(cpool_item)
                         self.cpool_unlocked[thread_id] = cpool_item
                         self.cpool_lock.notify()
+                        self._notify_waiter()
                     return
             # it seems likely that some other thread is going to leave a
             # locked connection now, let's try and find it to correct
@@ -4736,8 +5095,10 @@ class SQLEntityContainer(object):
                 bad_item.last_seen = time.time()
                 if not bad_item.locked:
                     del self.cpool_locked[bad_thread]
+                    self._unlock_item(bad_item)
                     self.cpool_unlocked[bad_item.thread_id] = bad_item
                     self.cpool_lock.notify()
+                    self._notify_waiter()
                     logging.error(
                         "Thread[%i] released database connection originally "
                         "acquired by Thread[%i]", thread_id, bad_thread)
@@ -4766,6 +5127,12 @@ class SQLEntityContainer(object):
         if close_flag:
             self.close_connection(release_item.dbc)
 
+    def _unlock_item(self, cpool_item):
+        # called with cpool_lock held when cpool_item is fully released
+        self.cpool_stats.record_hold(
+            cpool_item.last_seen - cpool_item.acquired)
+        cpool_item.stack = None
+
     def connection_stats(self):
         """Return information about the connection pool
 
@@ -4788,6 +5155,70 @@ class SQLEntityContainer(object):
             return (len(self.cpool_locked), len(self.cpool_unlocked),
                     len(self.cpool_idle))
 
+    def pool_stats(self):
+        """Returns information about the connection pool
+
+        The result is a dictionary suitable for serialising as JSON.  It
+        contains the values from :meth:`ConnectionPoolStats.snapshot`
+        with the following additional keys.
+
+        size, max_size
+            The number of connections in the pool and the maximum
+
+        locked, unlocked, idle
+            As returned by :meth:`connection_stats`
+
+        waiting
+            The number of threads waiting for a connection
+
+        leaks
+            The result of :meth:`leaked_connections`"""
+        with self.cpool_lock:
+            result = self.cpool_stats.snapshot()
+            result['size'] = self.cpool_size
+            result['max_size'] = self.cpool_max
+            result['locked'] = len(self.cpool_locked)
+            result['unlocked'] = len(self.cpool_unlocked)
+            result['idle'] = len(self.cpool_idle)
+            result['waiting'] = len(self.cpool_waiters)
+        result['leaks'] = self.leaked_connections()
+        return result
+
+    def leaked_connections(self, threshold=None):
+        """Returns a list of connections that may have leaked
+
+        threshold (None)
+            The number of seconds a connection must have been held for
+            to be included, defaults to the *leak_threshold* passed on
+            construction.  If both are None an empty list is returned.
+
+        Each item in the list is a dictionary with keys thread_id,
+        thread (the thread's name), held (the number of seconds since
+        the connection was acquired) and stack, a string containing the
+        stack of the thread when it acquired the connection or None if
+        the stack was not saved."""
+        if threshold is None:
+            threshold = self.leak_threshold
+            if threshold is None:
+                return []
+        result = []
+        now = time.time()
+        with self.cpool_lock:
+            for cpool_item in dict_values(self.cpool_locked):
+                held = now - cpool_item.acquired
+                if held < threshold:
+                    continue
+                if cpool_item.stack is None:
+                    stack = None
+                else:
+                    stack = ''.join(traceback.format_list(cpool_item.stack))
+                result.append({
+                    'thread_id': cpool_item.thread_id,
+                    'thread': cpool_item.thread.name,
+                    'held': held,
+                    'stack': stack})
+        return result
+
     def _run_pool_cleaner(self, max_idle=SQL_TIMEOUT * 10.0):
         run_time = max_idle / 5.0
         if run_time < 60.0:
@@ -4809,15 +5240,30 @@ class SQLEntityContainer(object):
         with self.cpool_lock:
             locked_list = list(dict_values(self.cpool_locked))
             for cpool_item in locked_list:
-                if not cpool_item.thread.isAlive():
+                if not cpool_item.thread.is_alive():
                     logging.error(
                         "Thread[%i] failed to release database connection "
                         "before terminating", cpool_item.thread_id)
                     del self.cpool_locked[cpool_item.thread_id]
+                    # the connection can't be reused
+                    self.cpool_size -= 1
                     to_close.append(cpool_item.dbc)
+                elif (self.leak_threshold is not None and
+                        not cpool_item.leak_reported and
+                        now - cpool_item.acquired > self.leak_threshold):
+                    cpool_item.leak_reported = True
+                    if cpool_item.stack is None:
+                        stack = ''
+                    else:
+                        stack = ''.join(
+                            traceback.format_list(cpool_item.stack))
+                    logging.warning(
+                        "Thread[%i] has held a database connection for "
+                        "%.1fs, acquired at:\n%s", cpool_item.thread_id,
+                        now - cpool_item.acquired, stack)
             unlocked_list = list(dict_values(self.cpool_unlocked))
             for cpool_item in unlocked_list:
-                if not cpool_item.thread.isAlive():
+                if not cpool_item.thread.is_alive():
                     logging.debug(
                         "pool_cleaner moving database connection to idle "
                         "after Thread[%i] terminated",
@@ -4844,6 +5290,8 @@ class SQLEntityContainer(object):
                     to_close.append(cpool_item.dbc)
                     del self.cpool_idle[i]
                     self.cpool_size -= 1
+            # connections may have become available
+            self._notify_waiter()
         for dbc in to_close:
             if dbc is not None:
                 self.close_connection(dbc)
@@ -4860,6 +5308,30 @@ class SQLEntityContainer(object):
         """Calls the underlying close method."""
         connection.close()
 
+    def begin_transaction(self, transaction):
+        """Called when an outermost :py:class:`SQLTransaction` begins
+
+        transaction
+            The transaction object, its cursor has just been created.
+
+        The default implementation does nothing, relying on the DB API's
+        implicit transaction handling."""
+        pass
+
+    def commit_transaction(self, transaction):
+        """Called to commit an outermost :py:class:`SQLTransaction`
+
+        The default implementation calls the commit method of the
+        underlying connection object."""
+        transaction.connection.dbc.commit()
+
+    def rollback_transaction(self, transaction):
+        """Called to roll back an outermost :py:class:`SQLTransaction`
+
+        The default implementation calls the rollback method of the
+        underlying connection object."""
+        transaction.connection.dbc.rollback()
+
     def break_connection(self, connection):
         """Called when closing or cleaning up locked connections.
 
@@ -4904,6 +5376,10 @@ class SQLEntityContainer(object):
         to_close = []
         self.closing.set()
         with self.cpool_lock:
+            # wake any threads waiting for a connection, they will
+            # return None
+            for waiter in self.cpool_waiters:
+                waiter.notify()
             nlocked = None
             while True:
                 while self.cpool_idle:
@@ -4923,7 +5399,7 @@ class SQLEntityContainer(object):
                             "before closing container", cpool_item.thread_id)
                         del self.cpool_locked[cpool_item.thread_id]
                         to_close.append(cpool_item.dbc)
-                    elif not cpool_item.thread.isAlive():
+                    elif not cpool_item.thread.is_alive():
                         logging.error(
                             "Thread[%i] failed to release database connection "
                             "before terminating", cpool_item.thread_id)
@@ -5328,6 +5804,22 @@ class SQLEntityContainer(object):
         implementation, the default implementation remains blank."""
         return (skip, '')
 
+    def window_count_column(self):
+        """Returns a column expression that counts a query's results
+
+        The expression must evaluate to the number of rows matched by
+        the query before any limit or offset is applied, allowing the
+        count required by the $inlinecount option to be returned with
+        the page of entities itself.  For example, if your database
+        supports window functions you would return::
+
+            'COUNT(*) OVER()'
+
+        The default implementation returns None, indicating that window
+        functions are not supported and a separate query will be used to
+        count the entities."""
+        return None
+
 
 class SQLiteEntityContainer(SQLEntityContainer):
 
@@ -5348,15 +5840,93 @@ class SQLiteEntityContainer(SQLEntityContainer):
         so that we can close a connection in a different thread from the
         one that opened it when cleaning up.
 
+        Two additional keys are recognised and removed before the
+        remaining options are passed to connect: 'journal_mode' and
+        'synchronous' are applied as PRAGMAs to each new connection.
+        For example, {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+        allows readers to proceed while a write is in progress and
+        avoids a sync of the log file on every commit.
+
         For more information see sqlite3_
 
+    group_commit
+        An optional interval, in seconds, used to enable group commit
+        mode.  Defaults to None, meaning that each transaction is
+        committed as soon as it finishes.  In group commit mode all
+        threads share a single connection (max_connections is forced to
+        1) and writes are coalesced into a single database transaction
+        that is committed when *group_commit_size* transactions have
+        been added to it or when *group_commit* seconds have passed
+        since the first of them, whichever is sooner.  Each transaction
+        runs within a SAVEPOINT so a rollback only undoes its own
+        changes.  A thread that commits changes blocks when it releases
+        its connection until the batch containing those changes has
+        been committed.
+
+        Group commit weakens the isolation and durability of
+        transactions.  As all threads share one connection a thread can
+        read changes made by other threads that are still waiting in an
+        uncommitted batch.  If the batch later fails to commit those
+        changes are rolled back and the reader will have acted on data
+        that never existed.  A successful commit_transaction only means
+        that the changes have joined a batch, if the batch fails then
+        every transaction in it fails: :py:class:`SQLError` is raised
+        to each of the threads concerned when it releases its
+        connection, typically when the collection used to make the
+        changes is closed.  Do not use group commit where readers must
+        only ever see committed data.
+
+    group_commit_size
+        The maximum number of transactions in a group commit batch,
+        defaults to 64.
+
     ..  _sqlite3:   https://docs.python.org/2/library/sqlite3.html
 
     All other keyword arguments required to initialise the base class
     must be passed on construction except *dbapi* which is automatically
     set to the Python sqlite3 module."""
 
-    def __init__(self, file_path, sqlite_options={}, **kwargs):
+    JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+
+    SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA', '0', '1', '2', '3')
+
+    def __init__(self, file_path, sqlite_options={}, group_commit=None,
+                 group_commit_size=64, **kwargs):
+        sqlite_options = dict(sqlite_options)
+        self.sqlite_pragmas = []
+        journal_mode = sqlite_options.pop('journal_mode', None)
+        if journal_mode is not None:
+            journal_mode = str(journal_mode).upper()
+            if journal_mode not in self.JOURNAL_MODES:
+                raise ValueError("journal_mode: %s" % journal_mode)
+            self.sqlite_pragmas.append("PRAGMA journal_mode = " +
+                                       journal_mode)
+        synchronous = sqlite_options.pop('synchronous', None)
+        if synchronous is not None:
+            synchronous = str(synchronous).upper()
+            if synchronous not in self.SYNCHRONOUS:
+                raise ValueError("synchronous: %s" % synchronous)
+            self.sqlite_pragmas.append("PRAGMA synchronous = " + synchronous)
+        self.group_commit = group_commit
+        self.group_commit_size = group_commit_size
+        if group_commit:
+            # we manage transactions ourselves
+            sqlite_options['isolation_level'] = None
+        # the number of the batch currently being built
+        self._group_batch = 1
+        # the number of the last batch committed
+        self._group_committed = 0
+        # True if a BEGIN has been issued for the current batch
+        self._group_open = False
+        # number of transactions in the current batch
+        self._group_ops = 0
+        # time the first transaction was added to the current batch
+        self._group_start = None
+        # error messages of failed batches, keyed on batch number
+        self._group_errors = {}
+        self._group_lock = threading.Condition()
+        self._group_local = threading.local()
+        self.sqlite_shared_dbc = None
         if is_text(file_path) and file_path == ":memory:":
             if (('max_connections' in kwargs and
                     kwargs['max_connections'] != 1) or
@@ -5368,6 +5938,11 @@ class SQLiteEntityContainer(SQLEntityContainer):
                 ":memory:", check_same_thread=False, **sqlite_options)
         else:
             self.sqlite_memdbc = None
+            if group_commit:
+                if kwargs.get('max_connections', 1) != 1:
+                    logging.warning("Forcing max_connections=1 for SQLite "
+                                    "database in group commit mode")
+                kwargs['max_connections'] = 1
         super(SQLiteEntityContainer, self).__init__(dbapi=sqlite3, **kwargs)
         if (not isinstance(file_path, OSFilePath) and not is_text(file_path)):
             raise TypeError("SQLiteDB requires an OS file path")
@@ -5378,6 +5953,15 @@ class SQLiteEntityContainer(SQLEntityContainer):
         """Overridden to return :py:class:`SQLiteEntityCollection`"""
         return SQLiteEntityCollection
 
+    def window_count_column(self):
+        """Overridden to use a window function if supported
+
+        Window functions were added in SQLite 3.25.0."""
+        if sqlite3.sqlite_version_info >= (3, 25, 0):
+            return 'COUNT(*) OVER()'
+        else:
+            return None
+
     def get_symmetric_navigation_class(self):
         """Overridden to return :py:class:`SQLiteAssociationCollection`"""
         return SQLiteAssociationCollection
@@ -5399,14 +5983,23 @@ class SQLiteEntityContainer(SQLEntityContainer):
 
         Other connection arguments are not currently supported, you can
         derive a more complex implementation by overriding this method
-        and (optionally) the __init__ method to pass in values for ."""
+        and (optionally) the __init__ method to pass in values for .
+
+        In group commit mode the same connection is returned each time
+        it is called."""
         if self.sqlite_memdbc is not None:
             return self.sqlite_memdbc
+        if self.sqlite_shared_dbc is not None:
+            return self.sqlite_shared_dbc
         dbc = self.dbapi.connect(str(self.file_path), check_same_thread=False,
                                  **self.sqlite_options)
         c = dbc.cursor()
         c.execute("PRAGMA foreign_keys = ON")
+        for pragma in self.sqlite_pragmas:
+            c.execute(pragma)
         c.close()
+        if self.group_commit:
+            self.sqlite_shared_dbc = dbc
         return dbc
 
     def break_connection(self, connection):
@@ -5415,14 +6008,191 @@ class SQLiteEntityContainer(SQLEntityContainer):
 
     def close_connection(self, connection):
         """Calls the underlying close method."""
-        if self.sqlite_memdbc is None:
+        if (self.sqlite_memdbc is None and
+                connection is not self.sqlite_shared_dbc):
             connection.close()
 
     def close(self):
+        if self.group_commit:
+            self.flush()
         super(SQLiteEntityContainer, self).close()
         # close any in-memory database
         if self.sqlite_memdbc is not None:
             self.sqlite_memdbc.close()
+        if self.sqlite_shared_dbc is not None:
+            self.sqlite_shared_dbc.close()
+            self.sqlite_shared_dbc = None
+
+    def begin_transaction(self, transaction):
+        """Overridden to start a SAVEPOINT in group commit mode"""
+        if not self.group_commit:
+            return
+        if not self._group_open:
+            transaction.cursor.execute("BEGIN")
+            self._group_open = True
+        transaction.cursor.execute("SAVEPOINT pyslet_group")
+
+    def commit_transaction(self, transaction):
+        """Overridden to add the transaction to a batch
+
+        In group commit mode the SAVEPOINT is released and the
+        transaction joins the current batch.  The batch is committed
+        immediately if it is full.  In either case the current thread
+        waits for the batch when it releases its connection, which is
+        when any failure of the batch is reported."""
+        if not self.group_commit:
+            return super(SQLiteEntityContainer, self).commit_transaction(
+                transaction)
+        transaction.cursor.execute("RELEASE pyslet_group")
+        with self._group_lock:
+            if transaction.write_count:
+                if not self._group_ops:
+                    self._group_start = time.time()
+                self._group_ops += 1
+                flush = self._group_ops >= self.group_commit_size
+                batches = getattr(self._group_local, 'batches', None)
+                if batches is None:
+                    batches = self._group_local.batches = set()
+                batches.add(self._group_batch)
+            else:
+                # don't leave a read-only transaction open
+                flush = not self._group_ops
+        if flush:
+            self._commit_group(transaction.cursor)
+
+    def rollback_transaction(self, transaction):
+        """Overridden to roll back to the SAVEPOINT in group commit mode
+
+        If the SAVEPOINT cannot be rolled back the entire batch is
+        rolled back and the transactions in it fail."""
+        if not self.group_commit:
+            return super(SQLiteEntityContainer, self).rollback_transaction(
+                transaction)
+        if transaction.cursor is None:
+            # begin failed, there is no SAVEPOINT
+            return
+        try:
+            transaction.cursor.execute("ROLLBACK TO pyslet_group")
+            transaction.cursor.execute("RELEASE pyslet_group")
+        except self.dbapi.Error as err:
+            logging.error("Group commit batch rolled back: %s", str(err))
+            with self._group_lock:
+                try:
+                    transaction.cursor.execute("ROLLBACK")
+                except self.dbapi.Error:
+                    pass
+                self._end_group("group rollback: %s" % str(err))
+            return
+        with self._group_lock:
+            flush = not self._group_ops
+        if flush:
+            self._commit_group(transaction.cursor)
+
+    def _commit_group(self, cursor):
+        # commits the current batch, the caller holds the connection;
+        # a failure is recorded against the batch and reported to each
+        # of its transactions by wait_for_batch, not to the caller
+        with self._group_lock:
+            if not self._group_open:
+                return
+            error = None
+            try:
+                cursor.execute("COMMIT")
+            except self.dbapi.Error as err:
+                error = str(err)
+                logging.error("Group commit batch %i failed: %s",
+                              self._group_batch, error)
+                try:
+                    cursor.execute("ROLLBACK")
+                except self.dbapi.Error:
+                    pass
+            self._end_group(error)
+
+    def _end_group(self, error):
+        # called with the group lock held
+        batch = self._group_batch
+        if self._group_ops:
+            if error is not None:
+                self._group_errors[batch] = error
+                # don't hold on to old errors indefinitely
+                for old_batch in list(self._group_errors):
+                    if old_batch < batch - 1024:
+                        del self._group_errors[old_batch]
+            self._group_committed = batch
+            self._group_batch += 1
+        self._group_open = False
+        self._group_ops = 0
+        self._group_start = None
+        self._group_lock.notify_all()
+
+    def release_connection(self, release_item):
+        """Overridden to wait for group commits
+
+        If the calling thread has added transactions to batches that
+        have not yet been committed it waits for the batches to be
+        committed (or commits them itself) after the connection has
+        been released.  Raises :py:class:`SQLError` if any of those
+        batches failed to commit."""
+        super(SQLiteEntityContainer, self).release_connection(release_item)
+        batches = getattr(self._group_local, 'batches', None)
+        if batches and not release_item.locked:
+            self._group_local.batches = None
+            for batch in sorted(batches):
+                self.wait_for_batch(batch)
+
+    def wait_for_batch(self, batch):
+        """Waits for a group commit batch to be committed
+
+        batch
+            The number of the batch to wait for.
+
+        If the group commit interval has passed since the first
+        transaction was added to the batch then the batch is committed
+        by the calling thread.  Raises :py:class:`SQLError` if the batch
+        failed to commit, every thread that waits for a failed batch
+        receives the error, not just the one that committed it."""
+        while True:
+            with self._group_lock:
+                while self._group_committed < batch:
+                    wait = (self._group_start + self.group_commit -
+                            time.time())
+                    if wait <= 0:
+                        break
+                    self._group_lock.wait(wait)
+                else:
+                    error = self._group_errors.get(batch, None)
+                    if error is not None:
+                        raise SQLError(error)
+                    return
+            # the interval has expired, commit the batch ourselves
+            self.flush(batch)
+
+    def flush(self, batch=None):
+        """Commits the current group commit batch
+
+        batch
+            If given, the batch is only committed if it has not been
+            committed already.
+
+        You don't normally need to call this method directly, it is
+        called automatically when the container is closed.  A failure
+        to commit the batch is logged but not raised, it is reported
+        to the transactions in the batch by :py:meth:`wait_for_batch`."""
+        if not self.group_commit:
+            return
+        connection = self.acquire_connection(SQL_TIMEOUT)
+        if connection is None:
+            raise DatabaseBusy(
+                "Failed to acquire connection after %is" % SQL_TIMEOUT)
+        try:
+            if batch is None or self._group_committed < batch:
+                cursor = connection.dbc.cursor()
+                try:
+                    self._commit_group(cursor)
+                finally:
+                    cursor.close()
+        finally:
+            super(SQLiteEntityContainer, self).release_connection(connection)
 
     def prepare_sql_type(self, simple_value, params, nullable=None):
         """Performs SQLite custom mappings
@@ -5721,7 +6491,8 @@ class SQLiteStreamStore(blockstore.StreamStore):
         :py:class:`pyslet.blockstore.BlockStore`,
         :py:class:`pyslet.blockstore.LockStore` and
         :py:class:`pyslet.blockstore.StreamStore`
-        respectively."""
+        respectively.  The 'BlockRefs' EntitySet holds the block
+        reference counts."""
         doc = edmx.Document()
         with io.open(os.path.join(os.path.dirname(__file__),
                                   'streamstore.xml'), 'rb') as f:
@@ -5735,8 +6506,17 @@ class SQLiteStreamStore(blockstore.StreamStore):
         create = not os.path.exists(file_path)
         self.container = SQLiteEntityContainer(file_path=file_path,
                                                container=self.container_def)
+        rebuild = False
         if create:
             self.container.create_all_tables()
+        else:
+            # stores created by earlier versions have no reference counts
+            with self.container_def['BlockRefs'].open() as refs:
+                try:
+                    len(refs)
+                except SQLError:
+                    refs.create_table()
+                    rebuild = True
         if dpath is None:
             bs = blockstore.FileBlockStore(dpath)
         else:
@@ -5744,4 +6524,7 @@ class SQLiteStreamStore(blockstore.StreamStore):
                 entity_set=self.container_def['Blocks'])
         ls = blockstore.LockStore(entity_set=self.container_def['Locks'])
         blockstore.StreamStore.__init__(
-            self, bs, ls, self.container_def['Streams'])
+            self, bs, ls, self.container_def['Streams'],
+            ref_set=self.container_def['BlockRefs'])
+        if rebuild:
+            self.rebuild_refs()
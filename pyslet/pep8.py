@@ -5,6 +5,7 @@ import inspect
 import logging
 import types
 import warnings
+import weakref
 
 from .py2 import dict_values, py2
 from .py26 import get_method_function
@@ -85,6 +86,30 @@ def make_attr_name(name):
     return result
 
 
+_renamed_methods = weakref.WeakKeyDictionary()
+
+
+def _get_renamed_methods(base):
+    # Returns a list of (m, im) tuples for the renamed methods defined
+    # in base.  The result is cached as the same base classes are
+    # searched every time a derived class is created.
+    try:
+        return _renamed_methods[base]
+    except KeyError:
+        pass
+    result = []
+    for m in dict_values(base.__dict__):
+        im = get_method_function(m)
+        if hasattr(im, 'old_method'):
+            result.append((m, im))
+    try:
+        _renamed_methods[base] = result
+    except TypeError:
+        # not weakly referenceable, don't cache
+        pass
+    return result
+
+
 class MigratedMetaclass(type):
 
     def __new__(cls, name, bases, dct):
@@ -98,48 +123,46 @@ class MigratedMetaclass(type):
         # bases in, we have to deal with any overrides.  This means we
         # don't have to worry about merging the results of getmro.
         for base in all_bases:
-            for m in dict_values(base.__dict__):
-                im = get_method_function(m)
-                if hasattr(im, 'old_method'):
-                    # have we provided an updated definition?
-                    if im.old_method.__name__ in dct:
-                        override = dct[im.old_method.__name__]
-                        if type(m) != type(override):
-                            raise TypeError(
-                                "%s.%s incorrect method type for override "
-                                "%s.%s" % (name, im.__name__, base.__name__,
-                                           im.old_method.__name__))
-                        # check the new name too
-                        if im.__name__ in dct:
-                            raise TypeError(
-                                "%s.%s collides with renamed %s.%s" % (
-                                    name, im.__name__, base.__name__,
-                                    im.old_method.__name__))
-                        # rename the method
-                        dct[im.__name__] = override
-                        # remove the old definition
-                        del dct[im.old_method.__name__]
-                        # Manually patch in something as-if @old_method
-                        # had been used here too, that needs a name
-                        # change, which will make debugging a little
-                        # easier too
-                        sm = get_method_function(override)
-                        sm.__name__ = im.__name__
-                        # This is a bit opaque, but the effect is to
-                        # adorn sm with a newly created old_method, we
-                        # already have something assigned to the new
-                        # name.  The rest of the puzzle will be put in
-                        # place below...
-                        old_method(im.old_method.__name__, doc=False)(sm)
-                    elif im.__name__ in dct:
-                        # new code, provides an override, manually
-                        # provide an old method wrapper, this reduces
-                        # the burden on derived classes and allows us to
-                        # rely on a base class to indicate if such
-                        # mappings are required.
-                        override = dct[im.__name__]
-                        sm = get_method_function(override)
-                        old_method(im.old_method.__name__, doc=False)(sm)
+            for m, im in _get_renamed_methods(base):
+                # have we provided an updated definition?
+                if im.old_method.__name__ in dct:
+                    override = dct[im.old_method.__name__]
+                    if type(m) != type(override):
+                        raise TypeError(
+                            "%s.%s incorrect method type for override "
+                            "%s.%s" % (name, im.__name__, base.__name__,
+                                       im.old_method.__name__))
+                    # check the new name too
+                    if im.__name__ in dct:
+                        raise TypeError(
+                            "%s.%s collides with renamed %s.%s" % (
+                                name, im.__name__, base.__name__,
+                                im.old_method.__name__))
+                    # rename the method
+                    dct[im.__name__] = override
+                    # remove the old definition
+                    del dct[im.old_method.__name__]
+                    # Manually patch in something as-if @old_method
+                    # had been used here too, that needs a name
+                    # change, which will make debugging a little
+                    # easier too
+                    sm = get_method_function(override)
+                    sm.__name__ = im.__name__
+                    # This is a bit opaque, but the effect is to
+                    # adorn sm with a newly created old_method, we
+                    # already have something assigned to the new
+                    # name.  The rest of the puzzle will be put in
+                    # place below...
+                    old_method(im.old_method.__name__, doc=False)(sm)
+                elif im.__name__ in dct:
+                    # new code, provides an override, manually
+                    # provide an old method wrapper, this reduces
+                    # the burden on derived classes and allows us to
+                    # rely on a base class to indicate if such
+                    # mappings are required.
+                    override = dct[im.__name__]
+                    sm = get_method_function(override)
+                    old_method(im.old_method.__name__, doc=False)(sm)
         # the second part of the metaclass is for class authors who were
         # expecting us (and overrides patched above)... search our
         # dictionary for renamed methods and add the old names pointing
@@ -167,9 +190,11 @@ class MigratedMetaclass(type):
 if py2:
     class MigratedClass(object):
         __metaclass__ = MigratedMetaclass
+        __slots__ = ()
 else:
-    MigratedClass = types.new_class("MigratedClass", (object, ),
-                                    {'metaclass': MigratedMetaclass})
+    MigratedClass = types.new_class(
+        "MigratedClass", (object, ), {'metaclass': MigratedMetaclass},
+        lambda ns: ns.update({'__slots__': ()}))
 
 
 class DeprecatedMethod(object):
@@ -302,6 +327,8 @@ def check_class(cls):
 
 class PEP8Compatibility(MigratedClass):
 
+    __slots__ = ()
+
     _pep8_dict = {}
 
     def __init__(self):
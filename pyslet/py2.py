@@ -289,7 +289,12 @@ else:
 
     input3 = input
 
-    from urllib.request import urlopen      # noqa : unused import
+    def urlopen(*args, **kwargs):
+        # urllib.request is slow to import (it pulls in http.client and
+        # the email package) and is rarely used so we import on demand
+        from urllib.request import urlopen as _urlopen
+        return _urlopen(*args, **kwargs)
+
     from urllib.parse import (              # noqa : unused import
         parse_qs,
         quote as urlquote,
@@ -313,6 +318,8 @@ class UnicodeMixin(object):
     cases where the *str* function has been used instead of
     :py:func:`to_text`."""
 
+    __slots__ = ()
+
     if py2:
         def __str__(self):      # noqa
             if hasattr(self, '__bytes__'):
@@ -339,6 +346,8 @@ class SortableMixin(object):
     This mixin then adds implementations for all of the comparison
     methods: __eq__, __ne__, __lt__, __le__, __gt__, __ge__."""
 
+    __slots__ = ()
+
     def sortkey(self):
         """Returns a value to use as a key for sorting.
 
@@ -6,8 +6,6 @@ import logging
 import sys
 import zipfile
 
-from wsgiref.simple_server import ServerHandler
-
 from .py2 import is_text, builtins
 
 
@@ -71,6 +69,9 @@ if py26:
         def __init__(self):
             raise TypeError("memoryview object not available in py26")
 
+    # wsgiref.simple_server is slow to import so we only import it
+    # when it needs patching
+    from wsgiref.simple_server import ServerHandler
     logging.info("Patching wsgiref.simple_server.ServerHandler for HEAD bug")
     ServerHandler.finish_content = finish_content
 
@@ -860,7 +860,8 @@ class QMLDocument(xml.Document):
     """classMap is a mapping from element names to the class object that
     will be used to represent them."""
 
-    def get_element_class(self, name):
+    @classmethod
+    def get_element_class(cls, name):
         """Returns the class to use to represent an element with the
         given name.
 
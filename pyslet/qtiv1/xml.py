@@ -118,7 +118,8 @@ class QTIDocument(xml.Document):
 
     classMap = {}
 
-    def get_element_class(self, name):
+    @classmethod
+    def get_element_class(cls, name):
         """Returns the class to use to represent an element with the given name.
 
         This method is used by the XML parser.  The class object is looked up
@@ -1,7 +1,8 @@
 #! /usr/bin/env python
 
-import random
 import math
+import operator
+import random
 
 from . import core
 from . import variables
@@ -91,6 +92,60 @@ class Expression(core.QTIElement):
         else:
             return value
 
+    def compile(self, state):
+        """Compiles this expression in the context of *state*
+
+        Returns a triple of (base type, cardinality, function).  The
+        base type and cardinality are those of the value that
+        :py:meth:`evaluate` would return.  The function takes a single
+        argument, a dictionary mapping variable names onto their python
+        values (see :py:attr:`variables.Value.value`), and returns the
+        python value of the expression, None representing NULL.
+
+        The values of declared defaults and correct responses are taken
+        from *state* but the function does not refer to *state* itself.
+
+        Expressions that do not support compilation raise
+        NotImplementedError, expressions that would always fail to
+        evaluate raise :py:class:`core.ProcessingError`."""
+        raise NotImplementedError(
+            "Compilation of %s" % self.__class__.__name__)
+
+
+def _compile_lookup(value, name):
+    # compiles a look-up of the variable *name* which currently has
+    # *value* in the session state
+    if value.cardinality() == variables.Cardinality.record:
+        raise NotImplementedError("Compilation of record values")
+    return value.baseType, value.cardinality(), operator.itemgetter(name)
+
+
+def _compile_source(value, name):
+    # compiles a function that returns the list of values that a
+    # mapping is applied to, or None if the variable is NULL
+    get = operator.itemgetter(name)
+    cardinality = value.cardinality()
+    if cardinality == variables.Cardinality.single:
+        def source(values):
+            v = get(values)
+            return None if v is None else [v]
+    elif cardinality == variables.Cardinality.ordered:
+        source = get
+    elif cardinality == variables.Cardinality.multiple:
+        def source(values):
+            v = get(values)
+            return None if v is None else list(dict_keys(v))
+    else:
+        raise NotImplementedError("Compilation of record values")
+    return source
+
+
+def _check_integer(value):
+    # integer results are range checked by IntegerValue when evaluated
+    if value < -2147483648 or value > 2147483647:
+        raise ValueError("Integer range: %s" % repr(value))
+    return value
+
 
 class BaseValue(Expression):
 
@@ -125,6 +180,12 @@ class BaseValue(Expression):
     def evaluate(self, state):
         return variables.SingleValue.NewValue(self.baseType, self.get_value())
 
+    def compile(self, state):
+        value = variables.SingleValue.new_value(
+            self.baseType, self.get_value()).value
+        return (self.baseType, variables.Cardinality.single,
+                lambda values: value)
+
 
 class Variable(Expression):
 
@@ -156,6 +217,14 @@ class Variable(Expression):
             raise core.ProcessingError(
                 "%s has not been declared" % self.identifier)
 
+    def compile(self, state):
+        try:
+            v = state[self.identifier]
+        except KeyError:
+            raise core.ProcessingError(
+                "%s has not been declared" % self.identifier)
+        return _compile_lookup(v, self.identifier)
+
 
 class Default(Expression):
 
@@ -182,6 +251,15 @@ class Default(Expression):
             raise core.ProcessingError(
                 "%s has not been declared" % self.identifier)
 
+    def compile(self, state):
+        try:
+            state.get_declaration(self.identifier)
+            name = self.identifier + ".DEFAULT"
+            return _compile_lookup(state[name], name)
+        except KeyError:
+            raise core.ProcessingError(
+                "%s has not been declared" % self.identifier)
+
 
 class Correct(Expression):
 
@@ -217,6 +295,23 @@ class Correct(Expression):
             raise core.ProcessingError(
                 "%s has not been declared" % self.identifier)
 
+    def compile(self, state):
+        try:
+            d = state.get_declaration(self.identifier)
+            if isinstance(d, variables.ResponseDeclaration):
+                name = self.identifier + ".CORRECT"
+                return _compile_lookup(state[name], name)
+            elif state.is_response(self.identifier):
+                raise core.ProcessingError(
+                    "Can't get the correct value of a built-in response %s" %
+                    self.identifier)
+            else:
+                raise core.ProcessingError(
+                    "%s is not a response variable" % self.identifier)
+        except KeyError:
+            raise core.ProcessingError(
+                "%s has not been declared" % self.identifier)
+
 
 class MapResponse(Expression):
 
@@ -254,6 +349,34 @@ class MapResponse(Expression):
             raise core.ProcessingError(
                 "%s has not been declared" % self.identifier)
 
+    def compile(self, state):
+        try:
+            d = state.get_declaration(self.identifier)
+            if isinstance(d, variables.ResponseDeclaration):
+                if d.Mapping is None:
+                    raise core.ProcessingError(
+                        "%s has no mapping" % self.identifier)
+                mapping = d.Mapping
+                source = _compile_source(state[self.identifier],
+                                         self.identifier)
+
+                def map_response(values):
+                    src_values = source(values)
+                    if src_values is None:
+                        return 0.0
+                    return mapping.map_values(src_values)
+                return (variables.BaseType.float,
+                        variables.Cardinality.single, map_response)
+            elif state.is_response(self.identifier):
+                raise core.ProcessingError(
+                    "Can't map built-in response %s" % self.identifier)
+            else:
+                raise core.ProcessingError(
+                    "%s is not a response variable" % self.identifier)
+        except KeyError:
+            raise core.ProcessingError(
+                "%s has not been declared" % self.identifier)
+
 
 class MapResponsePoint(Expression):
 
@@ -298,6 +421,38 @@ class MapResponsePoint(Expression):
             raise core.ProcessingError(
                 "%s has not been declared" % self.identifier)
 
+    def compile(self, state):
+        try:
+            d = state.get_declaration(self.identifier)
+            if isinstance(d, variables.ResponseDeclaration):
+                if d.baseType is not variables.BaseType.point:
+                    raise core.ProcessingError(
+                        "%s does not have point type" % self.identifier)
+                elif d.AreaMapping is None:
+                    raise core.ProcessingError(
+                        "%s has no areaMapping" % self.identifier)
+                mapping = d.AreaMapping
+                width, height = d.get_stage_dimensions()
+                source = _compile_source(state[self.identifier],
+                                         self.identifier)
+
+                def map_response_point(values):
+                    src_values = source(values)
+                    if src_values is None:
+                        return 0.0
+                    return mapping.map_points(src_values, width, height)
+                return (variables.BaseType.float,
+                        variables.Cardinality.single, map_response_point)
+            elif state.is_response(self.identifier):
+                raise core.ProcessingError(
+                    "Can't map built-in response %s" % self.identifier)
+            else:
+                raise core.ProcessingError(
+                    "%s is not a response variable" % self.identifier)
+        except KeyError:
+            raise core.ProcessingError(
+                "%s has not been declared" % self.identifier)
+
 
 class Null(Expression):
 
@@ -312,6 +467,9 @@ class Null(Expression):
     def evaluate(self, state):
         return variables.Value()
 
+    def compile(self, state):
+        return None, None, lambda values: None
+
 
 class RandomInteger(Expression):
 
@@ -401,6 +559,35 @@ class NOperator(Expression):
         for e in self.Expression:
             yield e.evaluate(state)
 
+    def compile_children(self, state):
+        """Compiles all child expressions, returning a list of triples
+        as described in :py:meth:`Expression.compile`."""
+        return [e.compile(state) for e in self.Expression]
+
+    def compile_comparison(self, state, op):
+        """Compiles a numerical comparison of two sub-expressions
+
+        *op* is a function that compares two floats, such as
+        operator.lt.  Returns a triple as described in
+        :py:meth:`Expression.compile`."""
+        children = self.compile_children(state)
+        if len(children) != 2:
+            raise core.ProcessingError(
+                "%s requires two sub-expressions, found %i" %
+                (self.xmlname, len(children)))
+        (b1, c1, f1), (b2, c2, f2) = children
+        variables.check_numerical_types(b1, b2)
+        variables.check_cardinalities(c1, c2, variables.Cardinality.single)
+
+        def compare(values):
+            v1 = f1(values)
+            v2 = f2(values)
+            if v1 is None or v2 is None:
+                return None
+            return op(float(v1), float(v2))
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                compare)
+
 
 class UnaryOperator(Expression):
 
@@ -415,6 +602,14 @@ class UnaryOperator(Expression):
         if self.Expression:
             yield self.Expression
 
+    def compile_child(self, state):
+        """Compiles the child expression, returning a triple as
+        described in :py:meth:`Expression.compile`."""
+        if self.Expression is None:
+            raise core.ProcessingError(
+                "%s requires a sub-expression" % self.__class__.__name__)
+        return self.Expression.compile(state)
+
 
 class Multiple(NOperator):
 
@@ -463,6 +658,42 @@ class Multiple(NOperator):
         result.set_value(vinput)
         return result
 
+    def compile(self, state):
+        base_type = None
+        parts = []
+        for b, c, f in self.compile_children(state):
+            if b is None:
+                continue
+            if base_type is None:
+                base_type = b
+            elif base_type != b:
+                raise core.ProcessingError(
+                    "Mixed containers are not allowed: expected %s, found %s" %
+                    (variables.BaseType.to_str(base_type),
+                     variables.BaseType.to_str(b)))
+            if c == variables.Cardinality.single:
+                parts.append((True, f))
+            elif c == variables.Cardinality.multiple:
+                parts.append((False, f))
+            else:
+                raise core.ProcessingError(
+                    "Ordered or Record values not allowed in Mutiple")
+
+        def multiple(values):
+            result = {}
+            for single, f in parts:
+                v = f(values)
+                if v is None:
+                    continue
+                if single:
+                    result[v] = result.get(v, 0) + 1
+                else:
+                    # same order as MultipleContainer.get_values
+                    for k in sorted(dict_keys(v)):
+                        result[k] = result.get(k, 0) + v[k]
+            return result or None
+        return base_type, variables.Cardinality.multiple, multiple
+
 
 class Ordered(NOperator):
 
@@ -509,6 +740,40 @@ class Ordered(NOperator):
         result.set_value(vinput)
         return result
 
+    def compile(self, state):
+        base_type = None
+        parts = []
+        for b, c, f in self.compile_children(state):
+            if b is None:
+                continue
+            if base_type is None:
+                base_type = b
+            elif base_type != b:
+                raise core.ProcessingError(
+                    "Mixed containers are not allowed: expected %s, found %s" %
+                    (variables.BaseType.to_str(base_type),
+                     variables.BaseType.to_str(b)))
+            if c == variables.Cardinality.single:
+                parts.append((True, f))
+            elif c == variables.Cardinality.ordered:
+                parts.append((False, f))
+            else:
+                raise core.ProcessingError(
+                    "Multiple or Record values not allowed in Ordered")
+
+        def ordered(values):
+            result = []
+            for single, f in parts:
+                v = f(values)
+                if v is None:
+                    continue
+                if single:
+                    result.append(v)
+                else:
+                    result.extend(v)
+            return result or None
+        return base_type, variables.Cardinality.ordered, ordered
+
 
 class ContainerSize(UnaryOperator):
 
@@ -544,6 +809,22 @@ class ContainerSize(UnaryOperator):
             raise core.ProcessingError(
                 "Ordered or Multiple value required for containerSize")
 
+    def compile(self, state):
+        b, c, f = self.compile_child(state)
+        if c == variables.Cardinality.ordered:
+            def container_size(values):
+                v = f(values)
+                return 0 if v is None else len(v)
+        elif c == variables.Cardinality.multiple:
+            def container_size(values):
+                v = f(values)
+                return 0 if v is None else sum(dict_values(v))
+        else:
+            raise core.ProcessingError(
+                "Ordered or Multiple value required for containerSize")
+        return (variables.BaseType.integer, variables.Cardinality.single,
+                container_size)
+
 
 class IsNull(UnaryOperator):
 
@@ -566,6 +847,11 @@ class IsNull(UnaryOperator):
         else:
             return variables.BooleanValue(True)
 
+    def compile(self, state):
+        b, c, f = self.compile_child(state)
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                lambda values: f(values) is None)
+
 
 class Index(UnaryOperator):
 
@@ -738,6 +1024,37 @@ class Member(NOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) != 2:
+            raise core.ProcessingError(
+                "Member requires two sub-expressions, found %i" %
+                len(children))
+        (b1, c1, f1), (b2, c2, f2) = children
+        if b1 is None or b2 is None:
+            return (variables.BaseType.boolean, variables.Cardinality.single,
+                    lambda values: None)
+        if b1 != b2:
+            raise core.ProcessingError(
+                "Mismatched base types for member operator")
+        if b1 == variables.BaseType.duration:
+            raise core.ProcessingError(
+                "Member operator must not be used on duration values")
+        if c1 != variables.Cardinality.single or c2 not in (
+                variables.Cardinality.ordered, variables.Cardinality.multiple):
+            # the interpreter only detects these errors when both
+            # values are non-NULL, leave them to it
+            raise NotImplementedError("Member with mismatched cardinality")
+
+        def member(values):
+            v1 = f1(values)
+            v2 = f2(values)
+            if v1 is None or v2 is None:
+                return None
+            return v1 in v2
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                member)
+
 
 class Delete(NOperator):
 
@@ -938,6 +1255,17 @@ class Not(UnaryOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        b, c, f = self.compile_child(state)
+        variables.check_base_types(b, variables.BaseType.boolean)
+        variables.check_cardinalities(c, variables.Cardinality.single)
+
+        def not_operator(values):
+            v = f(values)
+            return None if v is None else not v
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                not_operator)
+
 
 class And(NOperator):
 
@@ -969,6 +1297,26 @@ class And(NOperator):
                 result = None
         return variables.BooleanValue(result)
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        variables.check_cardinalities(variables.Cardinality.single,
+                                      *[c for b, c, f in children])
+        variables.check_base_types(variables.BaseType.boolean,
+                                   *[b for b, c, f in children])
+        funcs = [f for b, c, f in children]
+
+        def and_operator(values):
+            # all sub-expressions are evaluated, as in evaluate
+            result = True
+            for v in [f(values) for f in funcs]:
+                if v is False:
+                    return False
+                elif v is None:
+                    result = None
+            return result
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                and_operator)
+
 
 class Or(NOperator):
 
@@ -1001,6 +1349,25 @@ class Or(NOperator):
                 result = None
         return variables.BooleanValue(result)
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        variables.check_cardinalities(variables.Cardinality.single,
+                                      *[c for b, c, f in children])
+        variables.check_base_types(variables.BaseType.boolean,
+                                   *[b for b, c, f in children])
+        funcs = [f for b, c, f in children]
+
+        def or_operator(values):
+            result = False
+            for v in [f(values) for f in funcs]:
+                if v:
+                    return True
+                elif v is None:
+                    result = None
+            return result
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                or_operator)
+
 
 class AnyN(NOperator):
 
@@ -1092,6 +1459,29 @@ class Match(NOperator):
         except variables.NullResult as null:
             return null.value
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) != 2:
+            raise core.ProcessingError(
+                "Match requires two sub-expressions, found %i" %
+                len(children))
+        (b1, c1, f1), (b2, c2, f2) = children
+        variables.check_cardinalities(c1, c2)
+        if (variables.check_base_types(b1, b2) ==
+                variables.BaseType.duration):
+            raise core.ProcessingError("Can't match duration values")
+        if variables.Cardinality.record in (c1, c2):
+            raise NotImplementedError("Match of record values")
+
+        def match(values):
+            v1 = f1(values)
+            v2 = f2(values)
+            if v1 is None or v2 is None:
+                return None
+            return v1 == v2
+        return (variables.BaseType.boolean, variables.Cardinality.single,
+                match)
+
 
 class StringMatch(NOperator):
 
@@ -1507,6 +1897,9 @@ class LT(NOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        return self.compile_comparison(state, operator.lt)
+
 
 class GT(NOperator):
 
@@ -1540,6 +1933,9 @@ class GT(NOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        return self.compile_comparison(state, operator.gt)
+
 
 class LTE(NOperator):
 
@@ -1573,6 +1969,9 @@ class LTE(NOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        return self.compile_comparison(state, operator.le)
+
 
 class GTE(NOperator):
 
@@ -1606,6 +2005,9 @@ class GTE(NOperator):
         else:
             return variables.BooleanValue()
 
+    def compile(self, state):
+        return self.compile_comparison(state, operator.ge)
+
 
 class DurationLT(NOperator):
 
@@ -1719,6 +2121,32 @@ class Sum(NOperator):
             # sum will still be of type integer at this point
             return variables.IntegerValue(sum)
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) < 1:
+            raise core.ProcessingError(
+                "sum requires at least one sub-expression, found %i" %
+                len(children))
+        variables.check_cardinalities(variables.Cardinality.single,
+                                      *[c for b, c, f in children])
+        base_type = variables.check_numerical_types(
+            *[b for b, c, f in children])
+        if base_type is None:
+            return None, variables.Cardinality.single, lambda values: None
+        funcs = [f for b, c, f in children]
+
+        def sum_operator(values):
+            total = 0
+            for v in [f(values) for f in funcs]:
+                if v is None:
+                    return None
+                total = total + v
+            if base_type == variables.BaseType.float:
+                return float(total)
+            else:
+                return _check_integer(total)
+        return base_type, variables.Cardinality.single, sum_operator
+
 
 class Product(NOperator):
 
@@ -1763,6 +2191,32 @@ class Product(NOperator):
             # sum will still be of type integer at this point
             return variables.IntegerValue(product)
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) < 1:
+            raise core.ProcessingError(
+                "product requires at least one sub-expression, found %i" %
+                len(children))
+        variables.check_cardinalities(variables.Cardinality.single,
+                                      *[c for b, c, f in children])
+        base_type = variables.check_numerical_types(
+            *[b for b, c, f in children])
+        if base_type is None:
+            return None, variables.Cardinality.single, lambda values: None
+        funcs = [f for b, c, f in children]
+
+        def product_operator(values):
+            product = 1
+            for v in [f(values) for f in funcs]:
+                if v is None:
+                    return None
+                product = product * v
+            if base_type == variables.BaseType.float:
+                return float(product)
+            else:
+                return _check_integer(product)
+        return base_type, variables.Cardinality.single, product_operator
+
 
 class Subtract(NOperator):
 
@@ -1806,6 +2260,29 @@ class Subtract(NOperator):
             else:
                 return variables.IntegerValue()
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) != 2:
+            raise core.ProcessingError(
+                "subtract requires two sub-expressions, found %i" %
+                len(children))
+        (b1, c1, f1), (b2, c2, f2) = children
+        base_type = variables.check_numerical_types(b1, b2)
+        variables.check_cardinalities(c1, c2, variables.Cardinality.single)
+        if base_type is None:
+            return None, variables.Cardinality.single, lambda values: None
+
+        def subtract(values):
+            v1 = f1(values)
+            v2 = f2(values)
+            if v1 is None or v2 is None:
+                return None
+            elif base_type == variables.BaseType.float:
+                return float(v1) - float(v2)
+            else:
+                return _check_integer(v1 - v2)
+        return base_type, variables.Cardinality.single, subtract
+
 
 class Divide(NOperator):
 
@@ -1844,6 +2321,27 @@ class Divide(NOperator):
         else:
             return variables.FloatValue()
 
+    def compile(self, state):
+        children = self.compile_children(state)
+        if len(children) != 2:
+            raise core.ProcessingError(
+                "divide requires two sub-expressions, found %i" %
+                len(children))
+        (b1, c1, f1), (b2, c2, f2) = children
+        variables.check_numerical_types(b1, b2)
+        variables.check_cardinalities(c1, c2, variables.Cardinality.single)
+
+        def divide(values):
+            v1 = f1(values)
+            v2 = f2(values)
+            if v1 is None or v2 is None:
+                return None
+            try:
+                return float(v1) / float(v2)
+            except ZeroDivisionError:
+                return None
+        return variables.BaseType.float, variables.Cardinality.single, divide
+
 
 class Power(NOperator):
 
@@ -2029,6 +2527,17 @@ class IntegerToFloat(UnaryOperator):
         else:
             return variables.FloatValue()
 
+    def compile(self, state):
+        b, c, f = self.compile_child(state)
+        variables.check_base_types(b, variables.BaseType.integer)
+        variables.check_cardinalities(c, variables.Cardinality.single)
+
+        def integer_to_float(values):
+            v = f(values)
+            return None if v is None else float(v)
+        return (variables.BaseType.float, variables.Cardinality.single,
+                integer_to_float)
+
 
 class CustomOperator(NOperator):
 
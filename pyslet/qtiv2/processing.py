@@ -6,6 +6,7 @@ import logging
 from . import core
 from . import variables
 from ..pep8 import old_method
+from ..py2 import ul
 from ..xml import structures as xml
 
 
@@ -43,6 +44,30 @@ class ResponseProcessing(core.QTIElement):
             self.ResponseRule,
             core.QTIElement.get_children(self))
 
+    def get_rules(self):
+        """Returns the list of response rules to run
+
+        If this element has no rules of its own but refers to one of the
+        standard response processing templates (match_correct,
+        map_response or map_response_point) the rules are taken from the
+        template.  Other templates are not loaded and result in an empty
+        list."""
+        if self.ResponseRule or not self.template:
+            return self.ResponseRule
+        name = self.template.split('/')[-1]
+        if not self.template.startswith(RP_TEMPLATE_PREFIXES) or \
+                name not in RP_TEMPLATES:
+            return self.ResponseRule
+        rules = _template_rules.get(name, None)
+        if rules is None:
+            # imported here as the xml module depends on this one
+            from .xml import QTIDocument
+            doc = QTIDocument()
+            doc.read(src=RP_TEMPLATES[name])
+            rules = doc.root.ResponseRule
+            _template_rules[name] = rules
+        return rules
+
     @old_method('Run')
     def run(self, state):
         """Runs response processing using the values in *state*.
@@ -50,13 +75,171 @@ class ResponseProcessing(core.QTIElement):
         *	*state* is an :py:class:`~pyslet.qtiv2.variables.ItemSessionState`
                 instance."""
         try:
-            for r in self.ResponseRule:
+            for r in self.get_rules():
                 if r.Run(state):
                     break
         except StopProcessing:
             # raised by exitResponse
             pass
 
+    def compile(self, state):
+        """Compiles response processing into a python function
+
+        *state* is an
+        :py:class:`~pyslet.qtiv2.variables.ItemSessionState` instance
+        that provides the variable declarations, default values and
+        correct responses (and template variables, if the clone has
+        already been selected).  The result is a
+        :py:class:`CompiledResponseProcessing` instance.
+
+        Raises NotImplementedError if the rules use an expression that
+        can't be compiled and :py:class:`core.ProcessingError` if the
+        rules are invalid.  In either case the rules can still be run
+        with :py:meth:`run`."""
+        return CompiledResponseProcessing(self.get_rules(), state)
+
+
+#: the prefixes of the standard response processing template URIs
+RP_TEMPLATE_PREFIXES = (
+    "http://www.imsglobal.org/question/qti_v2p0/rptemplates/",
+    "http://www.imsglobal.org/question/qti_v2p1/rptemplates/")
+
+#: the standard response processing templates, keyed on name
+RP_TEMPLATES = {
+    'match_correct': b"""<?xml version="1.0" encoding="UTF-8"?>
+<responseProcessing xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1">
+    <responseCondition>
+        <responseIf>
+            <match>
+                <variable identifier="RESPONSE"/>
+                <correct identifier="RESPONSE"/>
+            </match>
+            <setOutcomeValue identifier="SCORE">
+                <baseValue baseType="float">1</baseValue>
+            </setOutcomeValue>
+        </responseIf>
+        <responseElse>
+            <setOutcomeValue identifier="SCORE">
+                <baseValue baseType="float">0</baseValue>
+            </setOutcomeValue>
+        </responseElse>
+    </responseCondition>
+</responseProcessing>""",
+    'map_response': b"""<?xml version="1.0" encoding="UTF-8"?>
+<responseProcessing xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1">
+    <responseCondition>
+        <responseIf>
+            <isNull>
+                <variable identifier="RESPONSE"/>
+            </isNull>
+            <setOutcomeValue identifier="SCORE">
+                <baseValue baseType="float">0.0</baseValue>
+            </setOutcomeValue>
+        </responseIf>
+        <responseElse>
+            <setOutcomeValue identifier="SCORE">
+                <mapResponse identifier="RESPONSE"/>
+            </setOutcomeValue>
+        </responseElse>
+    </responseCondition>
+</responseProcessing>""",
+    'map_response_point': b"""<?xml version="1.0" encoding="UTF-8"?>
+<responseProcessing xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1">
+    <responseCondition>
+        <responseIf>
+            <isNull>
+                <variable identifier="RESPONSE"/>
+            </isNull>
+            <setOutcomeValue identifier="SCORE">
+                <baseValue baseType="float">0.0</baseValue>
+            </setOutcomeValue>
+        </responseIf>
+        <responseElse>
+            <setOutcomeValue identifier="SCORE">
+                <mapResponsePoint identifier="RESPONSE"/>
+            </setOutcomeValue>
+        </responseElse>
+    </responseCondition>
+</responseProcessing>"""}
+
+_template_rules = {}
+
+
+class CompiledResponseProcessing(object):
+
+    """Response processing compiled into python functions
+
+    Created by :py:meth:`ResponseProcessing.compile`, instances are
+    callable and are designed for scoring large numbers of independent
+    response sets::
+
+        outcomes = compiled({'RESPONSE': 'ChoiceA'})
+
+    The argument is a dictionary that maps response identifiers onto
+    python values in any form accepted by the corresponding
+    :py:class:`~pyslet.qtiv2.variables.Value`'s set_value method.
+    Responses that are not in the dictionary take their default values.
+    The result is a dictionary that maps the declared outcome
+    identifiers onto their values in the native representation
+    described in :py:attr:`~pyslet.qtiv2.variables.Value.value`.
+
+    Each call behaves like the first attempt of a new item session:
+    outcomes start from their defaults, numAttempts is 1, duration is
+    0.0 and completionStatus is 'unknown'.  The outcomes are identical
+    to those obtained by the interpreter, see
+    :py:meth:`~pyslet.qtiv2.variables.ItemSessionState.score`."""
+
+    def __init__(self, rules, state):
+        self.rules = [r.compile(state) for r in rules]
+        self.values = {}
+        for name in state:
+            self.values[name] = state[name].value
+        self.values['numAttempts'] = 1
+        self.values['duration'] = 0.0
+        self.values['completionStatus'] = ul('unknown')
+        self.responses = []
+        for rd in state.item.ResponseDeclaration:
+            self.responses.append(
+                (rd.identifier, rd.cardinality, rd.baseType))
+            self.values[rd.identifier] = variables.Value.copy_value(
+                state[rd.identifier + ".DEFAULT"]).value
+        self.outcomes = []
+        for od in state.item.OutcomeDeclaration:
+            v = variables.Value.copy_value(state[od.identifier + ".DEFAULT"])
+            if not v and od.cardinality == variables.Cardinality.single:
+                # as per ItemSessionState.set_outcome_defaults
+                if od.baseType == variables.BaseType.integer:
+                    v.set_value(0)
+                elif od.baseType == variables.BaseType.float:
+                    v.set_value(0.0)
+            self.values[od.identifier] = v.value
+            self.outcomes.append((od.identifier, od.cardinality))
+
+    def __call__(self, responses):
+        values = self.values.copy()
+        for name, cardinality, base_type in self.responses:
+            if name in responses:
+                v = variables.Value.new_value(cardinality, base_type)
+                v.set_value(responses[name])
+                values[name] = v.value
+        try:
+            for r in self.rules:
+                r(values)
+        except StopProcessing:
+            pass
+        result = {}
+        for name, cardinality in self.outcomes:
+            v = values[name]
+            if v is None or cardinality == variables.Cardinality.single:
+                pass
+            elif cardinality == variables.Cardinality.ordered:
+                # don't share containers with the default values
+                v = list(v)
+            else:
+                v = dict(v)
+            result[name] = v
+        return result
+
 
 class ResponseRule(core.QTIElement):
 
@@ -68,6 +251,17 @@ class ResponseRule(core.QTIElement):
         raise NotImplementedError(
             "Unsupported response rule: <%s>" % repr(self.xmlname))
 
+    def compile(self, state):
+        """Abstract method to compile this rule in the context of *state*
+
+        Returns a function that takes a single argument, a dictionary of
+        python values as described in
+        :py:meth:`~pyslet.qtiv2.expressions.Expression.compile`, and
+        runs the rule by updating the values of outcome variables in
+        it."""
+        raise NotImplementedError(
+            "Unsupported response rule: <%s>" % repr(self.xmlname))
+
 
 class ResponseCondition(ResponseRule):
 
@@ -112,6 +306,19 @@ class ResponseCondition(ResponseRule):
         if self.ResponseElse:
             self.ResponseElse.Run(state)
 
+    def compile(self, state):
+        parts = [self.ResponseIf.compile(state)]
+        for c in self.ResponseElseIf:
+            parts.append(c.compile(state))
+        if self.ResponseElse:
+            parts.append(self.ResponseElse.compile(state))
+
+        def response_condition(values):
+            for p in parts:
+                if p(values):
+                    break
+        return response_condition
+
 
 class ResponseIf(core.QTIElement):
 
@@ -160,6 +367,28 @@ class ResponseIf(core.QTIElement):
         else:
             return False
 
+    def compile(self, state):
+        """Compiles this test and any resulting rules
+
+        Returns a function that returns *True* if the condition
+        evaluated to *True*."""
+        if self.Expression is None:
+            raise core.ProcessingError("responseIf with missing condition")
+        base_type, cardinality, test = self.Expression.compile(state)
+        variables.check_base_types(base_type, variables.BaseType.boolean)
+        variables.check_cardinalities(
+            cardinality, variables.Cardinality.single)
+        rules = [r.compile(state) for r in self.ResponseRule]
+
+        def response_if(values):
+            if test(values):
+                for r in rules:
+                    r(values)
+                return True
+            else:
+                return False
+        return response_if
+
 
 class ResponseElse(core.QTIElement):
 
@@ -188,6 +417,16 @@ class ResponseElse(core.QTIElement):
         for r in self.ResponseRule:
             r.Run(state)
 
+    def compile(self, state):
+        """Compiles the sub-rules."""
+        rules = [r.compile(state) for r in self.ResponseRule]
+
+        def response_else(values):
+            for r in rules:
+                r(values)
+            return True
+        return response_else
+
 
 class ResponseElseIf(ResponseIf):
 
@@ -245,6 +484,40 @@ class SetOutcomeValue(ResponseRule):
             raise core.ProcessingError(
                 "Outcome variable required: %s" % self.identifier)
 
+    def compile(self, state):
+        if self.Expression is None:
+            raise core.ProcessingError(
+                "setOutcomeValue with missing expression")
+        base_type, cardinality, evaluate = self.Expression.compile(state)
+        try:
+            outcome = state.is_outcome(self.identifier)
+        except KeyError:
+            outcome = False
+        if not outcome:
+            raise core.ProcessingError(
+                "Outcome variable required: %s" % self.identifier)
+        target = state[self.identifier]
+        if cardinality is not None and cardinality != target.cardinality():
+            raise core.ProcessingError(
+                "Expected %s value, found %s" %
+                (variables.Cardinality.to_str(target.cardinality()),
+                 variables.Cardinality.to_str(cardinality)))
+        if base_type is not None and base_type != target.baseType:
+            raise core.ProcessingError(
+                "Expected %s value, found %s" %
+                (variables.BaseType.to_str(target.baseType),
+                 variables.BaseType.to_str(base_type)))
+        identifier = self.identifier
+        cardinality = target.cardinality()
+        base_type = target.baseType
+
+        def set_outcome_value(values):
+            # normalise the value exactly as the session state does
+            v = variables.Value.new_value(cardinality, base_type)
+            v.set_value(evaluate(values))
+            values[identifier] = v.value
+        return set_outcome_value
+
 
 class StopProcessing(core.QTIError):
 
@@ -264,6 +537,11 @@ class ExitResponse(ResponseRule):
     def run(self, state):
         raise StopProcessing
 
+    def compile(self, state):
+        def exit_response(values):
+            raise StopProcessing
+        return exit_response
+
 
 class TemplateProcessing(core.QTIElement):
 
@@ -579,26 +579,35 @@ class TestForm(MigratedClass):
             [ "", "PartI", "SectionA", "Q1", "Q2", "-SectionA", "-PartI" ]
 
     Notice that index 0 is always an empty string corresponding to the test
-    itself."""
+    itself.
 
-    def __init__(self, test):
+    If *components* is given it is used as the sequence of identifiers
+    instead of running the selection and ordering rules, this is used to
+    recreate a form that was selected previously, for example, when
+    restoring a :py:class:`~pyslet.qtiv2.variables.TestSessionState`
+    from a snapshot."""
+
+    def __init__(self, test, components=None):
         self.test = test		#: the test from which this form was created
         self.components = []  # : the ordered list of identifiers
         #: a mapping from component identifiers to (lists of) indexes into the
         # component list
         self.map = {}
-        # Index 0 represents the test itself!
-        self.components.append("")
-        for part in self.test.TestPart:
-            self.components.append(part.identifier)
-            # A part always contains all child sections
-            for s in part.AssessmentSection:
-                self.components.append(s.identifier)
-                # no shuffling in test parts, just add a hidden section as a
-                # block
-                self.components.extend(self.Select(s))
-                self.components.append("-" + s.identifier)
-            self.components.append("-" + part.identifier)
+        if components is not None:
+            self.components = list(components)
+        else:
+            # Index 0 represents the test itself!
+            self.components.append("")
+            for part in self.test.TestPart:
+                self.components.append(part.identifier)
+                # A part always contains all child sections
+                for s in part.AssessmentSection:
+                    self.components.append(s.identifier)
+                    # no shuffling in test parts, just add a hidden section as
+                    # a block
+                    self.components.extend(self.Select(s))
+                    self.components.append("-" + s.identifier)
+                self.components.append("-" + part.identifier)
         for i in range3(len(self.components)):
             id = self.components[i]
             if id in self.map:
@@ -1,12 +1,18 @@
 #! /usr/bin/env python
 
+import binascii
 import hashlib
 import itertools
+import json
 import logging
+import multiprocessing
 import os
 import random
+import threading
 import time
+import zlib
 
+from collections import OrderedDict
 from io import BytesIO
 
 from . import core
@@ -17,6 +23,7 @@ from ..pep8 import MigratedClass, old_method
 from ..py2 import (
     BoolMixin,
     byte,
+    dict_items,
     dict_keys,
     force_text,
     is_text,
@@ -24,6 +31,7 @@ from ..py2 import (
     long2,
     range3,
     SortableMixin,
+    to_text,
     uempty,
     ul)
 from ..rfc2396 import URI
@@ -1264,33 +1272,44 @@ class Mapping(core.QTIElement):
             src_values = list(dict_keys(value.value))
         else:
             raise ValueError("Can't map %s" % repr(value))
-        result = 0.0
-        been_there = {}
         dst_value = FloatValue(0.0)
         if value.baseType is None:
             # a value of unknown type results in NULL
             null_flag = True
-        for v in src_values:
-            if v in been_there:
-                # If a container contains multiple instances of the same value
-                # then that value is counted once only
-                continue
-            else:
-                been_there[v] = True
-            result = result + self.map.get(v, self.defaultValue)
+        result = self.map_values(src_values)
         if null_flag:
             # We save the NULL return up to the end to ensure that we generate
             # errors in the case where a container contains mixed or
             # mismatching values.
             return dst_value
         else:
-            if self.lowerBound is not None and result < self.lowerBound:
-                result = self.lowerBound
-            elif self.upperBound is not None and result > self.upperBound:
-                result = self.upperBound
             dst_value.set_value(result)
             return dst_value
 
+    def map_values(self, src_values):
+        """Maps an iterable of python values onto a float
+
+        The values must already be in the native representation used
+        by :py:attr:`Value.value` for the mapping's base type.  This is
+        the calculation behind :py:meth:`map_value`, it is used directly
+        by compiled response processing.  The result is a python float
+        clipped to the mapping's bounds."""
+        result = 0.0
+        been_there = {}
+        for v in src_values:
+            if v in been_there:
+                # If a container contains multiple instances of the same value
+                # then that value is counted once only
+                continue
+            else:
+                been_there[v] = True
+            result = result + self.map.get(v, self.defaultValue)
+        if self.lowerBound is not None and result < self.lowerBound:
+            result = self.lowerBound
+        elif self.upperBound is not None and result > self.upperBound:
+            result = self.upperBound
+        return result
+
 
 class MapEntry(core.QTIElement):
 
@@ -1445,14 +1464,31 @@ class AreaMapping(core.QTIElement):
             src_values = list(dict_keys(value.value))
         else:
             raise ValueError("Can't map %s" % repr(value))
-        result = 0.0
-        been_there = [False] * len(self.AreaMapEntry)
         dst_value = FloatValue(0.0)
         if value.baseType is None:
             # a value of unknown type results in NULL
             null_flag = True
         elif value.baseType != BaseType.point:
             raise ValueError("Can't map %s" % repr(value))
+        result = self.map_points(src_values, width, height)
+        if null_flag:
+            # We save the NULL return up to the end to ensure that we generate
+            # errors in the case where a container contains mixed or
+            # mismatching values.
+            return dst_value
+        else:
+            dst_value.set_value(result)
+            return dst_value
+
+    def map_points(self, src_values, width, height):
+        """Maps an iterable of points onto a float
+
+        Each point is a tuple of integers, as used by
+        :py:attr:`Value.value`.  *width* and *height* are as for
+        :py:meth:`map_value`.  The result is a python float clipped to
+        the mapping's bounds."""
+        result = 0.0
+        been_there = [False] * len(self.AreaMapEntry)
         for v in src_values:
             hit_point = False
             for i in range3(len(self.AreaMapEntry)):
@@ -1467,18 +1503,11 @@ class AreaMapping(core.QTIElement):
             if not hit_point:
                 # This point is not in any of the areas
                 result = result + self.defaultValue
-        if null_flag:
-            # We save the NULL return up to the end to ensure that we generate
-            # errors in the case where a container contains mixed or
-            # mismatching values.
-            return dst_value
-        else:
-            if self.lowerBound is not None and result < self.lowerBound:
-                result = self.lowerBound
-            elif self.upperBound is not None and result > self.upperBound:
-                result = self.upperBound
-            dst_value.set_value(result)
-            return dst_value
+        if self.lowerBound is not None and result < self.lowerBound:
+            result = self.lowerBound
+        elif self.upperBound is not None and result > self.upperBound:
+            result = self.upperBound
+        return result
 
 
 class AreaMapEntry(core.QTIElement, core.ShapeElementMixin):
@@ -1807,6 +1836,73 @@ class TemplateDeclaration(VariableDeclaration):
         self.mathVariable = None
 
 
+def _encode_single(base_type, value):
+    # returns a JSON-compatible representation of a single python value
+    if value is None:
+        return None
+    elif base_type in (BaseType.pair, BaseType.directedPair,
+                       BaseType.point):
+        return list(value)
+    elif base_type == BaseType.uri:
+        return to_text(value)
+    elif base_type == BaseType.file:
+        raise ValueError("Can't snapshot a value of type file")
+    else:
+        return value
+
+
+def _encode_value(v):
+    # returns a JSON-compatible representation of Value instance v
+    if v.value is None:
+        return None
+    cardinality = v.cardinality()
+    if cardinality == Cardinality.single:
+        return _encode_single(v.baseType, v.value)
+    elif cardinality == Cardinality.ordered:
+        return [_encode_single(v.baseType, x) for x in v.value]
+    elif cardinality == Cardinality.multiple:
+        return [[_encode_single(v.baseType, x), n]
+                for x, n in dict_items(v.value)]
+    else:
+        result = {}
+        for f, fv in dict_items(v.value):
+            result[f] = [BaseType.to_str(fv.baseType),
+                         _encode_single(fv.baseType, fv.value)]
+        return result
+
+
+def _decode_value(cardinality, base_type, data):
+    # the inverse of _encode_value: returns a new Value instance
+    v = Value.new_value(cardinality, base_type)
+    if data is None:
+        return v
+    if cardinality == Cardinality.single:
+        v.set_value(data)
+    elif cardinality == Cardinality.ordered:
+        v.set_value(data)
+    elif cardinality == Cardinality.multiple:
+        v.set_value([x for x, n in data for i in range3(n)])
+    else:
+        fields = {}
+        for f, fdata in dict_items(data):
+            fields[f] = SingleValue.new_value(
+                BaseType.from_str(fdata[0]), fdata[1])
+        v.set_value(fields)
+    return v
+
+
+def _restore_values(ns, data, declaration=None):
+    # restores the values in dictionary ns from the snapshot data, the
+    # types are taken from the existing values in ns or, for names
+    # that are not in ns, from the function declaration
+    for name, vdata in dict_items(data):
+        v = ns.get(name, None)
+        if v is None:
+            d = declaration(name)
+            v = Value.new_value(d.cardinality, d.baseType)
+        ns[name] = _decode_value(v.cardinality(), v.baseType, vdata)
+
+
 class SessionState(MigratedClass):
 
     """Abstract class used as the base class for namespace-like objects used to
@@ -2104,6 +2200,145 @@ class ItemSessionState(SessionState):
         if self.item.ResponseProcessing:
             self.item.ResponseProcessing.Run(self)
 
+    def score(self, responses):
+        """Runs response processing for a single set of *responses*
+
+        *responses* is a dictionary mapping response identifiers onto
+        python values in any form accepted by the corresponding
+        :py:meth:`Value.set_value` method.  Declared responses that are
+        not in the dictionary take their default values.
+
+        The session is reset as if for the first attempt of a new
+        session, the responses are set and the attempt is ended.  The
+        result is a dictionary mapping the declared outcome identifiers
+        onto the resulting values in the representation described in
+        :py:attr:`Value.value`.  Template variables, default values and
+        correct responses are not changed."""
+        self.begin_session()
+        self.map['numAttempts'].set_value(1)
+        for rd in self.item.ResponseDeclaration:
+            v = Value.copy_value(self.map[rd.identifier + ".DEFAULT"])
+            if rd.identifier in responses:
+                v.set_value(responses[rd.identifier])
+            self.map[rd.identifier] = v
+        self.map['completionStatus'] = IdentifierValue('unknown')
+        self.end_attempt()
+        result = {}
+        for od in self.item.OutcomeDeclaration:
+            result[od.identifier] = self.map[od.identifier].value
+        return result
+
+    def get_scorer(self, compiled=True):
+        """Returns a function that scores a single set of responses
+
+        The function takes and returns dictionaries as described in
+        :py:meth:`score` but it never changes this session.
+
+        If *compiled* is True the item's response processing is compiled
+        with
+        :py:meth:`~pyslet.qtiv2.processing.ResponseProcessing.compile`,
+        falling back to the interpreter if the rules can't be
+        compiled.  The interpreter runs in a new session that shares
+        this session's template variables, default values and correct
+        responses."""
+        if compiled and self.item.ResponseProcessing:
+            try:
+                return self.item.ResponseProcessing.compile(self)
+            except (NotImplementedError, core.ProcessingError) as err:
+                logging.info("Response processing for %s not compiled: %s",
+                             self.item.identifier, str(err))
+        state = ItemSessionState(self.item)
+        state.set_constants(self.get_constants())
+        return state.score
+
+    def get_constants(self):
+        """Returns the values that are constant during response processing
+
+        The result is a dictionary mapping the names of template
+        variables and the meta-variables used for default values and
+        correct responses onto their python values."""
+        constants = {}
+        for name, value in dict_items(self.map):
+            if (name.endswith(".DEFAULT") or name.endswith(".CORRECT") or
+                    self.is_template(name)):
+                constants[name] = value.value
+        return constants
+
+    def set_constants(self, constants):
+        """Sets the values of template variables and meta-variables
+
+        *constants* is a dictionary returned by :py:meth:`get_constants`,
+        typically from another session of the same item."""
+        for name, value in dict_items(constants):
+            self.map[name].value = value
+
+    def score_responses(self, responses, processes=None, compiled=True,
+                        chunksize=64):
+        """Scores an iterable of response sets
+
+        *responses* is an iterable of dictionaries, each is scored as
+        described in :py:meth:`score`.  Returns a generator that yields
+        a dictionary of outcomes for each set of responses, in order.
+        Scoring uses the function returned by :py:meth:`get_scorer`,
+        *compiled* is passed to that method, so this session is never
+        changed.
+
+        If *processes* is a positive integer the response sets are
+        scored by a pool of that many worker processes, *chunksize*
+        response sets at a time.  Each worker has its own copy of the
+        item (and the document that contains it) so the item, the
+        response values and the outcome values must all be
+        picklable."""
+        if not processes:
+            scorer = self.get_scorer(compiled)
+            for r in responses:
+                yield scorer(r)
+            return
+        pool = multiprocessing.Pool(
+            processes, _init_scorer,
+            (self.item, self.get_constants(), compiled))
+        try:
+            for outcomes in pool.imap(_score, responses, chunksize):
+                yield outcomes
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def get_snapshot(self):
+        """Returns a snapshot of this session's variable values
+
+        The result is a dictionary mapping the variable names (including
+        the meta-variables used for default values, correct responses
+        and saved responses) onto representations of their values that
+        can be serialised using the json module.  The item itself is not
+        included in the snapshot.
+
+        Sessions that contain values of type file can't be snapshot,
+        ValueError is raised."""
+        snapshot = {}
+        for name, v in dict_items(self.map):
+            snapshot[name] = _encode_value(v)
+        return snapshot
+
+    def set_snapshot(self, snapshot):
+        """Restores variable values from a snapshot
+
+        *snapshot* is a dictionary returned by :py:meth:`get_snapshot`
+        from a session of the same item.  Variables that are not in the
+        snapshot are left unchanged."""
+        for name in list(dict_keys(self.map)):
+            if name.endswith(".SAVED") and name not in snapshot:
+                del self.map[name]
+        _restore_values(self.map, snapshot, self._saved_declaration)
+
+    def _saved_declaration(self, var_name):
+        if var_name.endswith(".SAVED"):
+            d = self.item.get_declaration(var_name[:-6])
+            if d is not None:
+                return d
+        raise KeyError(var_name)
+
     def get_declaration(self, var_name):
         if var_name in self.map:
             return self.item.get_declaration(var_name)
@@ -2155,6 +2390,21 @@ class ItemSessionState(SessionState):
         return var_name in self.map
 
 
+_scorer = None
+
+
+def _init_scorer(item, constants, compiled):
+    # initialises a worker process for ItemSessionState.score_responses
+    global _scorer
+    state = ItemSessionState(item)
+    state.set_constants(constants)
+    _scorer = state.get_scorer(compiled)
+
+
+def _score(responses):
+    return _scorer(responses)
+
+
 class TestSessionState(SessionState):
 
     """Represents the state of a test session.  The keys are the names of the
@@ -2163,9 +2413,13 @@ class TestSessionState(SessionState):
     form from which the session should be created.
 
     On construction, all declared variables (included built-in variables) are
-    added to the session with NULL values."""
+    added to the session with NULL values.
+
+    *max_keys* limits the number of expired keys remembered in
+    :py:attr:`keyMap`, by default all keys are remembered for the life
+    of the session."""
 
-    def __init__(self, form):
+    def __init__(self, form, max_keys=None):
         super(TestSessionState, self).__init__()
         # : the :py:class:`tests.TestForm` used to initialise this session
         self.form = form
@@ -2214,13 +2468,19 @@ class TestSessionState(SessionState):
         """The key representing the previous state.  This can be used to follow
         session state transitions back through a chain of states back to the
         beginning of the session (i.e., for auditing)."""
-        self.keyMap = {}
+        self.keyMap = OrderedDict()
         """A mapping of keys previously used by this session.  A caller
         presenting an expired key when triggering an event generates a
         :py:class:`SessionKeyExpired` exception. This condition might indicate
         that a session response was not received (e.g., due to a connection
         failure) and that the session should be re-started with the previous
-        response."""
+        response.
+
+        If :py:attr:`max_keys` is not None only the most recent keys are
+        kept, older keys generate :py:class:`SessionKeyMismatch`
+        instead."""
+        #: the maximum number of keys kept in :py:attr:`keyMap`
+        self.max_keys = max_keys
         self.event_update(self.key)
         self.cQuestion = 0
 
@@ -2232,6 +2492,9 @@ class TestSessionState(SessionState):
                 raise SessionKeyMismatch(key_check)
         if self.key:
             self.keyMap[self.key] = True
+            if self.max_keys is not None:
+                while len(self.keyMap) > self.max_keys:
+                    self.keyMap.popitem(last=False)
             self.prevKey = self.key
             dt = self.t
             self.t = time.time()
@@ -2248,6 +2511,83 @@ class TestSessionState(SessionState):
         self.key = force_text(hash.hexdigest())
         return dt
 
+    def get_snapshot(self):
+        """Returns a snapshot of this session
+
+        The snapshot contains the values of the variables in all
+        namespaces, the key chain and the timing information needed to
+        continue the session.  The result is a dictionary that can be
+        serialised using the json module.  The test itself is not
+        included, the snapshot refers to the test's components by
+        identifier in the order given by :py:attr:`form`."""
+        namespaces = []
+        for ns in self.namespace:
+            if ns is None:
+                namespaces.append(None)
+            elif isinstance(ns, ItemSessionState):
+                namespaces.append(ns.get_snapshot())
+            else:
+                nsdata = {}
+                for name, v in dict_items(ns):
+                    nsdata[name] = _encode_value(v)
+                namespaces.append(nsdata)
+        return {
+            'form': list(self.form.components),
+            'salt': binascii.hexlify(self.salt).decode('ascii'),
+            'key': self.key,
+            'prevKey': self.prevKey,
+            'keys': list(self.keyMap),
+            't': self.t,
+            'cQuestion': self.cQuestion,
+            'namespace': namespaces}
+
+    def set_snapshot(self, snapshot):
+        """Restores this session from a snapshot
+
+        *snapshot* is a dictionary returned by :py:meth:`get_snapshot`
+        from a session with the same :py:attr:`form`, see
+        :py:meth:`from_snapshot` for a way of recreating a session from
+        a snapshot alone."""
+        if list(snapshot['form']) != list(self.form.components):
+            raise ValueError("Snapshot taken from a different test form")
+        self.salt = binascii.unhexlify(snapshot['salt'].encode('ascii'))
+        self.key = snapshot['key']
+        self.prevKey = snapshot['prevKey']
+        self.keyMap = OrderedDict()
+        for key in snapshot['keys']:
+            self.keyMap[key] = True
+        if self.max_keys is not None:
+            while len(self.keyMap) > self.max_keys:
+                self.keyMap.popitem(last=False)
+        self.t = snapshot['t']
+        self.cQuestion = snapshot['cQuestion']
+        for ns, nsdata in zip(self.namespace, snapshot['namespace']):
+            if ns is None:
+                continue
+            elif isinstance(ns, ItemSessionState):
+                ns.set_snapshot(nsdata)
+            else:
+                _restore_values(ns, nsdata, self._test_declaration)
+
+    def _test_declaration(self, var_name):
+        d = self.test.get_declaration(var_name)
+        if d is None:
+            raise KeyError(var_name)
+        return d
+
+    @classmethod
+    def from_snapshot(cls, test, snapshot, max_keys=None):
+        """Creates a new session from a snapshot
+
+        *test* is the :py:class:`tests.AssessmentTest` the snapshot was
+        taken from and *snapshot* is a dictionary returned by
+        :py:meth:`get_snapshot`.  The test form is recreated from the
+        snapshot so no selection or ordering rules are run.  *max_keys*
+        is passed to the constructor."""
+        session = cls(tests.TestForm(test, snapshot['form']), max_keys)
+        session.set_snapshot(snapshot)
+        return session
+
     def get_current_test_part(self):
         """Returns the current test part or None if the test is finished."""
         q = self.get_current_question()
@@ -2616,3 +2956,195 @@ class TestSessionState(SessionState):
             return True
         except KeyError:
             return False
+
+
+class SessionStore(object):
+
+    """Abstract class for a store of test sessions
+
+    *test* is the :py:class:`tests.AssessmentTest` that all sessions in
+    the store are instances of.  Sessions are identified by text
+    strings (session ids) chosen by the caller.
+
+    The store keeps up to *max_live* recently used sessions in memory as
+    :py:class:`TestSessionState` instances.  When this limit is exceeded
+    the least recently used sessions are evicted, a snapshot is saved
+    and the session is restored from the snapshot on demand by
+    :py:meth:`get`.  Restored sessions are created with *max_keys*, see
+    :py:class:`TestSessionState` for details.
+
+    Derived classes must implement :py:meth:`save_snapshot`,
+    :py:meth:`load_snapshot` and :py:meth:`delete_snapshot`.  Snapshots
+    are passed to these methods as compressed binary strings.
+
+    Instances may be shared between threads but a session should only be
+    used by one thread at a time."""
+
+    #: if True, snapshots are saved each time a session is put into the
+    #: store, not just on eviction
+    write_through = False
+
+    def __init__(self, test, max_live=1000, max_keys=None):
+        self.test = test
+        self.max_live = max_live
+        self.max_keys = max_keys
+        self._lock = threading.RLock()
+        self._live = OrderedDict()
+
+    def new_session(self, sid):
+        """Creates a new session with session id *sid*
+
+        A new test form is created from the test (running any selection
+        and ordering rules) and the resulting session is put into the
+        store and returned."""
+        session = TestSessionState(tests.TestForm(self.test), self.max_keys)
+        self.put(sid, session)
+        return session
+
+    def get(self, sid):
+        """Returns the session with session id *sid*
+
+        Raises KeyError if there is no session with this id."""
+        with self._lock:
+            session = self._live.pop(sid, None)
+            if session is None:
+                session = TestSessionState.from_snapshot(
+                    self.test, self.decode(self.load_snapshot(sid)),
+                    self.max_keys)
+            self._live[sid] = session
+            self._evict()
+        return session
+
+    def put(self, sid, session):
+        """Puts *session* into the store with session id *sid*
+
+        Call this method after each change to a session that has been
+        retrieved with :py:meth:`get` if :py:attr:`write_through` is
+        True, otherwise the call just marks the session as recently
+        used."""
+        with self._lock:
+            self._live.pop(sid, None)
+            self._live[sid] = session
+            if self.write_through:
+                self.save_snapshot(sid, self.encode(session))
+            self._evict()
+
+    def delete(self, sid):
+        """Removes the session with session id *sid* from the store
+
+        Raises KeyError if there is no session with this id."""
+        with self._lock:
+            session = self._live.pop(sid, None)
+            try:
+                self.delete_snapshot(sid)
+            except KeyError:
+                if session is None:
+                    raise
+
+    def flush(self):
+        """Saves snapshots of all the sessions in memory
+
+        The sessions remain in memory, call this method before the
+        store is discarded."""
+        with self._lock:
+            for sid, session in dict_items(self._live):
+                self.save_snapshot(sid, self.encode(session))
+
+    def __len__(self):
+        """The number of sessions currently held in memory"""
+        return len(self._live)
+
+    def _evict(self):
+        while len(self._live) > self.max_live:
+            sid, session = self._live.popitem(last=False)
+            self.save_snapshot(sid, self.encode(session))
+
+    def encode(self, session):
+        """Returns the compressed snapshot of *session*
+
+        The snapshot is serialised as compact JSON, encoded with UTF-8
+        and compressed with zlib."""
+        return zlib.compress(json.dumps(
+            session.get_snapshot(), separators=(',', ':'),
+            sort_keys=True).encode('utf-8'))
+
+    def decode(self, data):
+        """Returns the snapshot dictionary from compressed *data*"""
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def save_snapshot(self, sid, data):
+        """Abstract method to save the snapshot *data* of session *sid*
+
+        *data* is a binary string that replaces any existing snapshot
+        for this session."""
+        raise NotImplementedError
+
+    def load_snapshot(self, sid):
+        """Abstract method that returns the snapshot data of session *sid*
+
+        Raises KeyError if there is no snapshot for this session."""
+        raise NotImplementedError
+
+    def delete_snapshot(self, sid):
+        """Abstract method to delete the snapshot of session *sid*
+
+        Raises KeyError if there is no snapshot for this session."""
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+
+    """A session store that keeps snapshots in memory
+
+    Evicted sessions are kept as compressed snapshots which are
+    typically much smaller than the live session objects."""
+
+    def __init__(self, test, max_live=1000, max_keys=None):
+        super(MemorySessionStore, self).__init__(test, max_live, max_keys)
+        self._snapshots = {}
+
+    def save_snapshot(self, sid, data):
+        self._snapshots[sid] = data
+
+    def load_snapshot(self, sid):
+        return self._snapshots[sid]
+
+    def delete_snapshot(self, sid):
+        del self._snapshots[sid]
+
+
+class EntitySessionStore(SessionStore):
+
+    """A session store that keeps snapshots in an OData entity set
+
+    *entity_set* is an entity set with a string key property (the
+    session id) and a binary property called *data* that is used to
+    store the snapshot.  The store is write-through so sessions survive
+    a restart of the application provided :py:meth:`SessionStore.put`
+    is called after each change."""
+
+    write_through = True
+
+    def __init__(self, test, entity_set, max_live=1000, max_keys=None):
+        super(EntitySessionStore, self).__init__(test, max_live, max_keys)
+        self.entity_set = entity_set
+
+    def save_snapshot(self, sid, data):
+        with self.entity_set.open() as coll:
+            try:
+                e = coll[sid]
+                e['data'].set_from_value(data)
+                coll.update_entity(e)
+            except KeyError:
+                e = coll.new_entity()
+                e.set_key(sid)
+                e['data'].set_from_value(data)
+                coll.insert_entity(e)
+
+    def load_snapshot(self, sid):
+        with self.entity_set.open() as coll:
+            return coll[sid]['data'].value
+
+    def delete_snapshot(self, sid):
+        with self.entity_set.open() as coll:
+            del coll[sid]
@@ -49,7 +49,8 @@ class QTIDocument(xmlns.XMLNSDocument):
                 (xsi.XMLSCHEMA_NAMESPACE, 'schemaLocation'),
                 core.IMSQTI_NAMESPACE + ' ' + core.IMSQTI_SCHEMALOCATION)
 
-    def get_element_class(self, name):
+    @classmethod
+    def get_element_class(cls, name):
         return QTIDocument.classMap.get(
             name, QTIDocument.classMap.get(
                 (name[0], None), xmlns.XMLNSElement))
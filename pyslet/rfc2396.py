@@ -1,8 +1,12 @@
 #! /usr/bin/env python
 """This module implements the URI specification defined in RFC 2396"""
 
+import re
+import threading
 import warnings
 
+from collections import OrderedDict
+
 from . import vfs
 
 from .pep8 import old_function, PEP8Compatibility
@@ -329,19 +333,71 @@ def escape_data(source, reserved_test=is_reserved, allowed_test=is_allowed):
             >>> print uri.escape_data(
                     "[file].txt", reserved_test=uri.is_path_segment_reserved,
                     allowed_test=uri.is_allowed_2396)
-            %5Bfile%5D.txt"""
+            %5Bfile%5D.txt
+
+    If both tests are test methods of
+    :class:`~pyslet.unicode5.CharClass` instances, such as the test
+    functions defined in this module, the result is calculated from a
+    table built on first use, you should not modify a character class
+    after you have used its test method for escaping.  Other test
+    functions are called for each character."""
     # force a unicode encoding error if necessary
     if is_unicode(source):
         source = source.encode('ascii')
-    result = []
-    for b in source:
-        # b is a byte value but our tests are character tests
-        c = character(b)
-        if reserved_test(c) or not allowed_test(c):
-            result.append("%%%02X" % ord(c))
-        else:
-            result.append(c)
-    return ''.join(result)
+    tables = _escape_tables(reserved_test, allowed_test)
+    if tables is None:
+        result = []
+        for b in bytearray(source):
+            # b is a byte value but our tests are character tests
+            c = character(b)
+            if reserved_test(c) or not allowed_test(c):
+                result.append("%%%02X" % b)
+            else:
+                result.append(c)
+        return ''.join(result)
+    table, escaped = tables
+    if source and len(source.translate(None, escaped)) == len(source):
+        # nothing to escape
+        return source.decode('ascii')
+    return ''.join([table[b] for b in bytearray(source)])
+
+
+_escape_table_cache = {}
+
+
+def _escape_tables(reserved_test, allowed_test):
+    # Returns a tuple of (table, escaped) for a pair of test functions
+    # or None if they can't be tabulated.  table maps byte values onto
+    # the output strings and escaped contains the bytes that must be
+    # escaped.  Only the tests of CharClass instances are tabulated as
+    # arbitrary functions may have side effects or be created on the
+    # fly for a single call.
+    key = (reserved_test, allowed_test)
+    result = _escape_table_cache.get(key, None)
+    if result is None:
+        for test in key:
+            if not isinstance(getattr(test, '__self__', None), CharClass):
+                return None
+        table = []
+        escaped = []
+        for b in range3(256):
+            c = character(b)
+            if reserved_test(c) or not allowed_test(c):
+                table.append("%%%02X" % b)
+                escaped.append(b)
+            else:
+                table.append(c)
+        result = (table, bytes(bytearray(escaped)))
+        if len(_escape_table_cache) < 64:
+            _escape_table_cache[key] = result
+    return result
+
+
+_bad_escape = re.compile('%(?![0-9A-Fa-f]{2})')
+
+_hex_octets = dict(
+    ((h + l).encode('ascii'), bytes(bytearray((int(h + l, 16), ))))
+    for h in '0123456789abcdefABCDEF' for l in '0123456789abcdefABCDEF')
 
 
 @old_function('UnescapeData')
@@ -358,6 +414,16 @@ def unescape_data(source):
     The character encoding that applies may depend on the context and it
     cannot always be assumed to be UTF-8 (though in most cases that will
     be the correct way to interpret the result)."""
+    if '%' not in source:
+        return source.encode('ascii')
+    if _bad_escape.search(source) is None:
+        # all escapes are well formed, look up each one
+        parts = source.encode('ascii').split(b'%')
+        data = [parts[0]]
+        for part in parts[1:]:
+            data.append(_hex_octets[part[:2]])
+            data.append(part[2:])
+        return b''.join(data)
     data = []
     mode = None
     pos = 0
@@ -634,6 +700,39 @@ def encode_unicode_uri(usrc):
     return uempty.join(octets)
 
 
+class _LRUCache(object):
+
+    # A thread-safe cache that discards the least recently used entries
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        with self._lock:
+            result = self._cache.pop(key, None)
+            if result is not None:
+                self._cache[key] = result
+            return result
+
+    def set(self, key, value, size):
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_uri_cache = _LRUCache()
+_resolve_cache = _LRUCache()
+
+
 class URI(CmpMixin, PEP8Compatibility):
 
     r"""Class to represent URI References
@@ -720,7 +819,32 @@ class URI(CmpMixin, PEP8Compatibility):
         Pyslet manages the importing and registering of the following
         URI schemes using it's own classes: http, https, file and urn.
         Additional modules are loaded and schemes registered 'on demand'
-        when instances of the corresponding URI are first created."""
+        when instances of the corresponding URI are first created.
+
+        As URI are immutable, recently created instances are kept in a
+        cache of up to :attr:`cache_size` entries and returned again if
+        the same string is passed.  You should not rely on the identity
+        of the result, use equality tests to compare URI."""
+        key = (cls, strict, octets)
+        try:
+            result = _uri_cache.get(key)
+        except TypeError:
+            # unhashable input, e.g., a bytearray
+            key = None
+            result = None
+        if result is None:
+            result = cls._from_octets(octets, strict)
+            if key is not None:
+                _uri_cache.set(key, result, cls.cache_size)
+        return result
+
+    #: The maximum number of instances cached by :meth:`from_octets`
+    #: and the maximum number of results cached by :meth:`resolve` and
+    #: :meth:`relative`.  Set to 0 to disable caching.
+    cache_size = 1024
+
+    @classmethod
+    def _from_octets(cls, octets, strict):
         if is_unicode(octets):
             if not strict:
                 octets = encode_unicode_uri(octets)
@@ -757,6 +881,9 @@ class URI(CmpMixin, PEP8Compatibility):
         replaced.  The mapping is kept in the :attr:`scheme_class`
         dictionary."""
         cls.scheme_class[scheme.lower()] = uri_class
+        # cached instances may have been created with the old class
+        _uri_cache.clear()
+        _resolve_cache.clear()
 
     @classmethod
     def from_virtual_path(cls, path):
@@ -1182,7 +1309,19 @@ class URI(CmpMixin, PEP8Compatibility):
 
         For this to work it must be possible to use the resolve operator
         to combine two relative URI to make a third, which is what we
-        allow here."""
+        allow here.
+
+        Results are cached, resolving the same pair of URI again will
+        typically return the same instance."""
+        key = ('*', type(self), str(self), type(base), str(base),
+               None if current_doc_ref is None else current_doc_ref.octets)
+        result = _resolve_cache.get(key)
+        if result is None:
+            result = self._resolve(base, current_doc_ref)
+            _resolve_cache.set(key, result, self.cache_size)
+        return result
+
+    def _resolve(self, base, current_doc_ref):
         if is_text(base):
             base = URI.from_octets(base)
         if current_doc_ref is None:
@@ -1296,7 +1435,17 @@ class URI(CmpMixin, PEP8Compatibility):
             B = User/folder/file.txt
 
             User/setting.txt [\] User/folder/file.txt = ../setting.txt
-            User/setting.txt = User/folder/file.txt [*] ../setting.txt"""
+            User/setting.txt = User/folder/file.txt [*] ../setting.txt
+
+        As with :meth:`resolve`, results are cached."""
+        key = ('/', type(self), str(self), type(base), str(base))
+        result = _resolve_cache.get(key)
+        if result is None:
+            result = self._relative(base)
+            _resolve_cache.set(key, result, self.cache_size)
+        return result
+
+    def _relative(self, base):
         if self.opaque_part is not None:
             # This is not a hierarchical URI so we can ignore base
             return URI.from_octets(str(self))
@@ -4,6 +4,7 @@
 import base64
 import binascii
 import cgi
+import copy
 import io
 import json
 import logging
@@ -12,17 +13,21 @@ import optparse
 import os
 import quopri
 import random
+import stat
 import sys
 import threading
 import time
 import traceback
+import zlib
 
+from collections import OrderedDict
 from hashlib import sha256
 from wsgiref.simple_server import make_server
 
 from . import iso8601 as iso
 from .http import (
     cookie,
+    grammar,
     messages,
     params)
 from .odata2 import (
@@ -496,10 +501,137 @@ class DispatchNode(object):
 
     def __init__(self):
         self._handler = None
+        self._route = None
         self._wildcard = None
+        self._wildcard_route = None
         self._nodes = {}
 
 
+class RouteMetrics(object):
+
+    """Request statistics for a single dispatcher route
+
+    route
+        The path pattern used to register the route with
+        :meth:`WSGIApp.set_method`.
+
+    Instances are updated by :class:`WSGIApp` as requests are handled
+    and are safe to read from other threads.  The latency of a request
+    is measured from the point the handler is called until its response
+    iterable is exhausted or closed, so it includes the time taken to
+    generate streamed responses."""
+
+    #: the upper bounds (in seconds) of the latency histogram buckets,
+    #: requests that take longer than the last bound are counted in an
+    #: additional overflow bucket
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, route):
+        self.lock = threading.Lock()
+        #: the route pattern
+        self.route = route
+        #: the number of requests dispatched to this route
+        self.count = 0
+        #: the number of requests that raised an exception
+        self.errors = 0
+        #: the total time spent handling requests, in seconds
+        self.total_time = 0.0
+        #: the longest time spent handling a single request
+        self.max_time = 0.0
+        #: a list of request counts, one per bucket in :attr:`BUCKETS`
+        #: plus one for the overflow
+        self.histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def record(self, elapsed, error=False):
+        """Records a completed request
+
+        elapsed
+            The time taken, in seconds
+
+        error
+            True if the request ended with an exception"""
+        i = 0
+        for bound in self.BUCKETS:
+            if elapsed <= bound:
+                break
+            i += 1
+        with self.lock:
+            self.count += 1
+            if error:
+                self.errors += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            self.histogram[i] += 1
+
+    def mean_time(self):
+        """Returns the mean time per request (or None if no requests)"""
+        with self.lock:
+            if self.count:
+                return self.total_time / self.count
+            else:
+                return None
+
+    def snapshot(self):
+        """Returns a dictionary of the current values
+
+        The result is suitable for serialising as JSON and contains the
+        keys route, count, errors, total_time, max_time and histogram;
+        the histogram is a list of [bound, count] pairs with a bound of
+        None for the overflow bucket."""
+        with self.lock:
+            return {
+                'route': self.route,
+                'count': self.count,
+                'errors': self.errors,
+                'total_time': self.total_time,
+                'max_time': self.max_time,
+                'histogram': [
+                    [b, n] for b, n in
+                    zip(list(self.BUCKETS) + [None], self.histogram)]}
+
+
+class _MeteredIterable(object):
+
+    # wraps a response iterable, recording the request in a
+    # RouteMetrics instance when it is exhausted or closed
+
+    def __init__(self, result, metrics, start):
+        self.result = result
+        self.metrics = metrics
+        self.start = start
+        self.it = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.it is None:
+            self.it = iter(self.result)
+        try:
+            return next(self.it)
+        except StopIteration:
+            self._done()
+            raise
+        except Exception:
+            self._done(True)
+            raise
+
+    next = __next__
+
+    def close(self):
+        try:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+        finally:
+            self._done()
+
+    def _done(self, error=False):
+        if self.metrics is not None:
+            self.metrics.record(time.time() - self.start, error)
+            self.metrics = None
+
+
 class WSGIApp(DispatchNode):
 
     """An object to help support WSGI-based applications.
@@ -618,6 +750,14 @@ class WSGIApp(DispatchNode):
     #: (static) file.  Defaults to 64K.
     MAX_CHUNK = 0x10000
 
+    #: the maximum number of request paths for which the outcome of
+    #: wildcard route matching is remembered
+    ROUTE_CACHE_SIZE = 1024
+
+    #: the maximum number of static file lookups that are remembered
+    #: by :meth:`static_page`
+    STATIC_CACHE_SIZE = 1024
+
     #: the integer millisecond time (since the epoch) corresponding to
     #: 01 January 1970 00:00:00 UTC the JavaScript time origin.
     js_origin = int(
@@ -805,6 +945,12 @@ class WSGIApp(DispatchNode):
         DispatchNode.__init__(self)
         #: flag: set to True to request :meth:`run_server` to exit
         self.stop = False
+        #: a dictionary of :class:`RouteMetrics` instances keyed on the
+        #: path patterns passed to :meth:`set_method`
+        self.route_metrics = {}
+        self._routes = None
+        self._route_cache = {}
+        self._static_cache = {}
         with self.clslock:
             #: a unique ID for this instance
             self.id = WSGIApp._nextid
@@ -858,7 +1004,12 @@ class WSGIApp(DispatchNode):
         path will be routed to its preferred handler.  Similarly you can
         register "/*/background.png" and "/home/background.png" but
         remember the '*' only matches a single path component!  There is
-        no way to match background.png in any directory."""
+        no way to match background.png in any directory.
+
+        The registered patterns are compiled into a lookup table the
+        first time a request is dispatched; registering a new method
+        discards the table and it is rebuilt on the next request."""
+        route = path
         path = path.split('/')
         if not path:
             path = ['']
@@ -871,11 +1022,90 @@ class WSGIApp(DispatchNode):
                 # set a special flag, e.g., if /a/* is declared and we
                 # have an unmatched /a we'll call that handler anyway
                 old_node._wildcard = method
+                old_node._wildcard_route = route
             node = old_node._nodes.get(p, None)
             if not node:
                 node = DispatchNode()
                 old_node._nodes[p] = node
         node._handler = method
+        node._route = route
+        if route not in self.route_metrics:
+            self.route_metrics[route] = RouteMetrics(route)
+        self._routes = None
+        self._route_cache = {}
+
+    def get_route_metrics(self):
+        """Returns a snapshot of the per-route request statistics
+
+        The result is a dictionary mapping each path pattern registered
+        with :meth:`set_method` onto a dictionary returned by
+        :meth:`RouteMetrics.snapshot`.  Derived classes can publish
+        these values in their own way or bind :meth:`metrics_page` to a
+        path in :meth:`init_dispatcher`."""
+        return dict((route, m.snapshot()) for route, m in
+                    list(dict_items(self.route_metrics)))
+
+    def metrics_page(self, context):
+        """Returns the per-route request statistics as JSON
+
+        This method can be bound to any path using :meth:`set_method`,
+        the output is the result of :meth:`get_route_metrics`.  You
+        should restrict access to this page in production systems."""
+        context.set_status(200)
+        return self.json_response(
+            context, json.dumps(self.get_route_metrics(), sort_keys=True))
+
+    def _compile_routes(self):
+        # flatten the literal (wildcard-free) paths into a single
+        # dictionary, these always take precedence when matching
+        routes = {}
+        stack = [([], self)]
+        while stack:
+            prefix, node = stack.pop()
+            for p, child in dict_items(node._nodes):
+                path = prefix + [p]
+                if p == '*':
+                    # wildcard routes are resolved by _match_route
+                    continue
+                if child._handler is not None:
+                    routes['/'.join(path)] = (child._route, child._handler)
+                stack.append((path, child))
+        self._routes = routes
+        return routes
+
+    def _match_route(self, path):
+        # walks the dispatch tree, backtracking to wildcard nodes when a
+        # named node fails to match; returns a (route, method) tuple
+        i = 0
+        node = self
+        wildcard = None
+        stack = []
+        while i < len(path):
+            p = path[i]
+            old_node = node
+            wild_node = old_node._nodes.get('*', None)
+            node = old_node._nodes.get(p, None)
+            if node:
+                if wild_node:
+                    # this is a fall-back node, push it
+                    stack.append((i, wild_node, wildcard))
+            elif wild_node:
+                node = wild_node
+            elif wildcard:
+                # if there is an active wildcard, use it
+                break
+            elif stack:
+                i, node, wildcard = stack.pop()
+            else:
+                break
+            if node._wildcard is not None:
+                wildcard = (node._wildcard_route, node._wildcard)
+            i += 1
+        if node and node._handler is not None:
+            return (node._route, node._handler)
+        if wildcard:
+            return wildcard
+        return (None, None)
 
     def call_wrapper(self, environ, start_response):
         """Alternative entry point for debugging
@@ -933,41 +1163,36 @@ class WSGIApp(DispatchNode):
             environ, start_response,
             self.settings['WSGIApp']['canonical_root'])
         try:
-            path = context.environ['PATH_INFO'].split('/')
-            if not path:
-                # empty path
-                path = ['']
-            i = 0
-            node = self
-            wildcard = None
-            stack = []
-            while i < len(path):
-                p = path[i]
-                old_node = node
-                wild_node = old_node._nodes.get('*', None)
-                node = old_node._nodes.get(p, None)
-                if node:
-                    if wild_node:
-                        # this is a fall-back node, push it
-                        stack.append((i, wild_node, wildcard))
-                elif wild_node:
-                    node = wild_node
-                elif wildcard:
-                    # if there is an active wildcard, use it
-                    break
-                elif stack:
-                    i, node, wildcard = stack.pop()
-                else:
-                    break
-                if node._wildcard is not None:
-                    wildcard = node._wildcard
-                i += 1
-            if node and node._handler is not None:
-                return node._handler(context)
-            if wildcard:
-                return wildcard(context)
-            # we didn't find a handler
-            return self.error_page(context, 404)
+            path = context.environ['PATH_INFO']
+            routes = self._routes
+            if routes is None:
+                routes = self._compile_routes()
+            match = routes.get(path, None)
+            if match is None:
+                cache = self._route_cache
+                match = cache.get(path, None)
+                if match is None:
+                    match = self._match_route(path.split('/'))
+                    if len(cache) >= self.ROUTE_CACHE_SIZE:
+                        cache = self._route_cache = {}
+                    cache[path] = match
+            route, method = match
+            if method is None:
+                # we didn't find a handler
+                return self.error_page(context, 404)
+            metrics = self.route_metrics.get(route, None)
+            if metrics is None:
+                return method(context)
+            start = time.time()
+            try:
+                result = method(context)
+            except Exception:
+                metrics.record(time.time() - start, True)
+                raise
+            if isinstance(result, (list, tuple)):
+                metrics.record(time.time() - start)
+                return result
+            return _MeteredIterable(result, metrics, start)
         except MethodNotAllowed:
             return self.error_page(context, 405)
         except PageNotFound:
@@ -994,11 +1219,50 @@ class WSGIApp(DispatchNode):
         (equivalent to the syntax of domain labels in host names) except
         the last component which must have a single '.' separating two
         valid labels.  This conservative syntax is designed to be safe
-        for passing to file handling functions."""
-        path = context.environ['PATH_INFO'].split('/')
+        for passing to file handling functions.
+
+        The outcome of validating the path and looking up its MIME type
+        is remembered (up to :attr:`STATIC_CACHE_SIZE` paths) so
+        subsequent requests for the same file require a single stat
+        call, which also confirms that the file still exists."""
         file_path = self.static_files
         if file_path is None:
             raise PageNotFound
+        path = context.environ['PATH_INFO']
+        entry = self._static_cache.get(path, None)
+        finfo = None
+        if entry is not None and entry[0] is file_path:
+            try:
+                finfo = entry[1].stat()
+                if not stat.S_ISREG(finfo.st_mode):
+                    finfo = None
+            except (IOError, OSError):
+                finfo = None
+            if finfo is None:
+                self._static_cache.pop(path, None)
+        if finfo is None:
+            entry = [file_path] + list(self._find_static(path)) + [None, None]
+            finfo = entry[1].stat()
+            if len(self._static_cache) >= self.STATIC_CACHE_SIZE:
+                self._static_cache = {}
+            self._static_cache[path] = entry
+        root, file_path, ctype, encoding, mtime, last_modified = entry
+        if mtime != finfo.st_mtime:
+            # the file has changed, update the cached Last-Modified
+            last_modified = str(params.FullDate.from_unix_time(
+                finfo.st_mtime))
+            entry[4:] = [finfo.st_mtime, last_modified]
+        context.set_status(200)
+        if encoding is not None:
+            context.add_header("Content-Encoding", encoding)
+        context.add_header("Content-Type", ctype)
+        return self._file_response(context, file_path, finfo, last_modified)
+
+    def _find_static(self, path):
+        # validates path, returning a tuple of file path, content type
+        # and content encoding (or None)
+        path = path.split('/')
+        file_path = self.static_files
         ext = ''
         pleft = len(path)
         for p in path:
@@ -1033,18 +1297,15 @@ class WSGIApp(DispatchNode):
         if not file_path.isfile():
             raise PageNotFound
         # Now the MIME mapping
+        encoding = None
         ctype = self.content_type.get(ext, None)
         if ctype is None:
             ctype, encoding = mimetypes.guess_type(filename)
             if ctype is not None:
                 ctype = params.MediaType.from_str(ctype)
-            if encoding is not None:
-                context.add_header("Content-Encoding", encoding)
         if ctype is None:
             ctype = params.APPLICATION_OCTETSTREAM
-        context.set_status(200)
-        context.add_header("Content-Type", str(ctype))
-        return self.file_response(context, file_path)
+        return file_path, str(ctype), encoding
 
     def file_response(self, context, file_path):
         """Returns a file from the file system
@@ -1063,11 +1324,17 @@ class WSGIApp(DispatchNode):
         if is_text(file_path):
             file_path = OSFilePath(file_path)
         finfo = file_path.stat()
+        return self._file_response(
+            context, file_path, finfo,
+            str(params.FullDate.from_unix_time(finfo.st_mtime)))
+
+    def _file_response(self, context, file_path, finfo, last_modified):
         context.add_header("Content-Length", str(finfo.st_size))
-        context.add_header("Last-Modified",
-                           str(params.FullDate.from_unix_time(finfo.st_mtime)))
+        context.add_header("Last-Modified", last_modified)
         context.start_response()
-        bleft = finfo.st_size
+        return self._file_chunks(file_path, finfo.st_size)
+
+    def _file_chunks(self, file_path, bleft):
         with file_path.open('rb') as f:
             while bleft:
                 chunk_size = min(bleft, self.MAX_CHUNK)
@@ -1248,6 +1515,253 @@ class WSGIApp(DispatchNode):
             t.join()
 
 
+class ContentEncodingMiddleware(object):
+
+    """WSGI middleware that compresses responses
+
+    app
+        Any WSGI application callable, for example, a :class:`WSGIApp`
+        instance or an OData :class:`pyslet.odata2.server.Server`.
+
+    min_size (1024)
+        The minimum size of response (in bytes) that will be compressed.
+        Responses with a Content-Length smaller than this are passed
+        through unchanged.  If the response has no Content-Length then
+        up to min_size bytes are held back until the decision can be
+        made.
+
+    level (6)
+        The zlib compression level, 1 is fastest, 9 gives the best
+        compression.
+
+    The content-coding to use is negotiated using the Accept-Encoding
+    header of the request, gzip and deflate are supported and the
+    quality values in the header are honoured (see
+    :meth:`pyslet.http.messages.AcceptEncodingList.select_token`).
+
+    Data is compressed as it is generated by the wrapped application,
+    the response body is never buffered in full so streamed responses
+    remain streamed.  The Content-Length header is removed from
+    compressed responses, a strong ETag is modified to make it
+    specific to the encoded representation and a Vary header is added
+    to all responses that might have been compressed.
+
+    Responses that already have a Content-Encoding, partial content
+    responses, responses to HEAD requests and responses with a
+    Cache-Control no-transform directive are never compressed.  The
+    decision about which media types are worth compressing is made by
+    :meth:`compressible`."""
+
+    #: the content-codings we support, in order of preference
+    CODINGS = ("gzip", "deflate")
+
+    #: the window bits values to pass to zlib for each coding
+    WBITS = {"gzip": 31, "deflate": 15}
+
+    def __init__(self, app, min_size=1024, level=6):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+
+    def compressible(self, mtype):
+        """Returns True if the media type is worth compressing
+
+        mtype
+            A :class:`pyslet.http.params.MediaType` instance or None if
+            the response has no Content-Type.
+
+        The default implementation returns True for text types and for
+        the common structured types used for data (xml and json,
+        including any types with the +xml or +json suffix) and
+        javascript."""
+        if mtype is None:
+            return False
+        mtype_type = mtype.type.lower()
+        mtype_subtype = mtype.subtype.lower()
+        if mtype_type == "text":
+            return True
+        elif mtype_type == "application":
+            return (mtype_subtype in ("xml", "json", "javascript") or
+                    mtype_subtype.endswith("+xml") or
+                    mtype_subtype.endswith("+json"))
+        else:
+            return False
+
+    def negotiate(self, environ):
+        """Returns the content-coding to use for this request
+
+        Returns one of the values in :attr:`CODINGS` or None if the
+        response should not be compressed."""
+        if environ.get('REQUEST_METHOD', 'GET').upper() == 'HEAD':
+            return None
+        accept = environ.get('HTTP_ACCEPT_ENCODING', None)
+        if not accept:
+            return None
+        try:
+            accept = messages.AcceptEncodingList.from_str(accept)
+        except grammar.BadSyntax:
+            return None
+        coding = accept.select_token(self.CODINGS + ("identity", ))
+        if coding == "identity":
+            return None
+        return coding
+
+    def __call__(self, environ, start_response):
+        return self._encode(environ, start_response, self.negotiate(environ))
+
+    def _eligible(self, status, headers):
+        # returns True if the response could be compressed
+        code = status.split(None, 1)
+        try:
+            code = int(code[0])
+        except (IndexError, ValueError):
+            return False
+        if code < 200 or code in (204, 206, 304):
+            return False
+        mtype = None
+        for name, value in headers:
+            name = name.lower()
+            if name == "content-encoding":
+                if value.strip().lower() != "identity":
+                    return False
+            elif name == "content-range":
+                return False
+            elif name == "cache-control":
+                if "no-transform" in value.lower():
+                    return False
+            elif name == "content-length":
+                try:
+                    if int(value) < self.min_size:
+                        return False
+                except ValueError:
+                    return False
+            elif name == "content-type":
+                try:
+                    mtype = params.MediaType.from_str(value)
+                except grammar.BadSyntax:
+                    return False
+        return self.compressible(mtype)
+
+    def _add_vary(self, headers):
+        new_headers = []
+        vary = False
+        for name, value in headers:
+            if name.lower() == "vary":
+                tokens = [t.strip().lower() for t in value.split(',')]
+                if "*" not in tokens and "accept-encoding" not in tokens:
+                    value = value + ", Accept-Encoding"
+                vary = True
+            new_headers.append((name, value))
+        if not vary:
+            new_headers.append(("Vary", "Accept-Encoding"))
+        return new_headers
+
+    def _encoded_headers(self, headers, coding):
+        new_headers = []
+        for name, value in headers:
+            lname = name.lower()
+            if lname in ("content-length", "content-encoding"):
+                continue
+            elif lname == "etag":
+                value = value.strip()
+                if not value.startswith("W/") and value.endswith('"'):
+                    value = '%s-%s"' % (value[:-1], coding)
+            new_headers.append((name, value))
+        new_headers.append(("Content-Encoding", coding))
+        return new_headers
+
+    def _encode(self, environ, start_response, coding):
+        # response holds [status, headers, exc_info, started]
+        response = [None, None, None, False]
+
+        def wrapped_start_response(status, headers, exc_info=None):
+            if response[3]:
+                # too late, headers already sent: this will raise
+                return start_response(status, headers, exc_info)
+            response[0:3] = [status, headers, exc_info]
+            return legacy_write
+
+        def legacy_write(data):
+            # an application using the write callable: we have to send
+            # the headers now so don't compress this response
+            if not response[3]:
+                response[3] = True
+                write = start_response(*response[0:3])
+                response.append(write)
+            response[4](data)
+
+        result = self.app(environ, wrapped_start_response)
+        try:
+            buff = []
+            bsize = 0
+            encoder = None
+            for data in result:
+                if response[3]:
+                    if encoder is None:
+                        yield data
+                    else:
+                        data = encoder.compress(data)
+                        if data:
+                            yield data
+                    continue
+                if not data:
+                    continue
+                buff.append(data)
+                bsize += len(data)
+                if response[0] is None:
+                    # the data was generated before start_response
+                    raise RuntimeError("start_response not called")
+                eligible = coding is not None and self._eligible(
+                    response[0], response[1])
+                if eligible:
+                    headers = self._add_vary(response[1])
+                else:
+                    headers = response[1]
+                if not eligible:
+                    data = b''.join(buff)
+                elif bsize >= self.min_size or self._has_length(headers):
+                    # a Content-Length has already been checked
+                    encoder = zlib.compressobj(
+                        self.level, zlib.DEFLATED, self.WBITS[coding])
+                    headers = self._encoded_headers(headers, coding)
+                    data = encoder.compress(b''.join(buff))
+                else:
+                    # keep buffering until we reach min_size
+                    continue
+                buff = []
+                response[3] = True
+                start_response(response[0], headers, response[2])
+                if data:
+                    yield data
+            if not response[3]:
+                # a short response (or no data at all)
+                if response[0] is None:
+                    raise RuntimeError("start_response not called")
+                headers = response[1]
+                if coding is not None and self._eligible(
+                        response[0], headers):
+                    headers = self._add_vary(headers)
+                    if buff and not self._has_length(headers):
+                        headers.append(("Content-Length", str(bsize)))
+                response[3] = True
+                start_response(response[0], headers, response[2])
+                if buff:
+                    yield b''.join(buff)
+            elif encoder is not None:
+                data = encoder.flush()
+                if data:
+                    yield data
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def _has_length(self, headers):
+        for name, value in headers:
+            if name.lower() == "content-length":
+                return True
+        return False
+
+
 class WSGIDataApp(WSGIApp):
 
     """Extends WSGIApp to include a data store
@@ -1274,6 +1788,15 @@ class WSGIDataApp(WSGIApp):
         the private_files directory, though an absolute path may be
         given.
 
+    sqlite_options ({})
+        A dictionary of options passed to the SQLite data source, for
+        example, {"journal_mode": "WAL", "synchronous": "NORMAL"}.  See
+        :class:`~pyslet.odata2.sqlds.SQLiteEntityContainer` for details.
+
+    group_commit (None)
+        For sqlite databases, the group commit interval in seconds.  By
+        default group commit is not used.
+
     dbhost ('localhost')
         For mysql databases, the hostname to connect to.
 
@@ -1286,6 +1809,16 @@ class WSGIDataApp(WSGIApp):
     dbpassword (None)
         The password to use in conjunction with dbuser
 
+    leak_threshold (None)
+        For SQL data sources, the number of seconds after which a
+        database connection that has not been released is reported as
+        a possible leak.  See
+        :class:`~pyslet.odata2.sqlds.SQLEntityContainer` for details.
+
+    ping_idle (None)
+        For SQL data sources, the number of seconds a database
+        connection may be idle before it is validated on reuse.
+
     keynum ('0')
         The identification number of the key to use when storing
         encrypted data in the container.
@@ -1412,16 +1945,22 @@ class WSGIDataApp(WSGIApp):
                 dbname = settings.setdefault('dbname', None)
                 dbuser = settings.setdefault('dbuser', None)
                 dbpassword = settings.setdefault('dbpassword', None)
+        pool_args = {
+            'leak_threshold': settings.setdefault('leak_threshold', None),
+            'ping_idle': settings.setdefault('ping_idle', None)}
         if source_type == 'sqlite':
             from pyslet.odata2.sqlds import SQLiteEntityContainer
             # accepts either the string ":memory:" or an OSFilePath
             cls.data_source = SQLiteEntityContainer(
-                file_path=sqlite_path, container=cls.container)
+                file_path=sqlite_path, container=cls.container,
+                sqlite_options=settings.setdefault('sqlite_options', {}),
+                group_commit=settings.setdefault('group_commit', None),
+                **pool_args)
         elif source_type == 'mysql':
             from pyslet.mysqldbds import MySQLEntityContainer
             cls.data_source = MySQLEntityContainer(
                 host=dbhost, user=dbuser, passwd=dbpassword, db=dbname,
-                container=cls.container)
+                container=cls.container, **pool_args)
         else:
             raise ValueError("Unknown data source type: %s" % source_type)
         if isinstance(cls.data_source, SQLEntityContainer):
@@ -1506,6 +2045,22 @@ class WSGIDataApp(WSGIApp):
         #: the application's cipher, a :class:`AppCipher` instance.
         self.app_cipher = self.new_app_cipher()
 
+    def pool_page(self, context):
+        """Returns the data source's connection pool statistics as JSON
+
+        This method can be bound to any path using :meth:`set_method`,
+        the output is the result of
+        :meth:`~pyslet.odata2.sqlds.SQLEntityContainer.pool_stats` (or
+        an empty object if the data source is not SQL-based).  You
+        should restrict access to this page in production systems."""
+        if isinstance(self.data_source, SQLEntityContainer):
+            stats = self.data_source.pool_stats()
+        else:
+            stats = {}
+        context.set_status(200)
+        return self.json_response(
+            context, json.dumps(stats, sort_keys=True))
+
 
 class PlainTextCipher(object):
 
@@ -1579,15 +2134,33 @@ class AppCipher(object):
     continues until a key encrypted with key_num is found.
 
     The upshot of this process is that you can change the key associated
-    with an application.  See :meth:`change_key` for details."""
+    with an application.  See :meth:`change_key` for details.
+
+    Once an old key has been decrypted its cipher is kept for the
+    lifetime of the object so the key_set is only consulted the first
+    time each old key is used.  Key numbers that can't be found in the
+    key_set are remembered for :attr:`MISSING_KEY_TTL` seconds to
+    prevent repeated look-ups caused by bad (or malicious) input."""
 
     #: the maximum age of a key, which is the number of times the key
     #: can be changed before the original key is considered too old to
     #: be used for decryption.
     MAX_AGE = 100
 
+    #: the number of seconds for which an unknown key number is
+    #: remembered
+    MISSING_KEY_TTL = 60
+
+    #: the maximum number of unknown key numbers that are remembered
+    MAX_MISSING_KEYS = 256
+
     def __init__(self, key_num, key, key_set, when=None):
         self.lock = threading.RLock()
+        #: the number of times a cipher was found in the cache
+        self.cipher_hits = 0
+        #: the number of times the key_set had to be searched
+        self.cipher_misses = 0
+        self._missing_keys = {}
         self.key_set = key_set
         self.key_num = key_num
         self.key = key
@@ -1731,6 +2304,27 @@ class AppCipher(object):
         return self.key_num, self.ciphers[self.key_num]
 
     def _get_cipher(self, num):
+        cipher = self.ciphers.get(num, None)
+        if cipher is not None:
+            self.cipher_hits += 1
+            return cipher
+        with self.lock:
+            self.cipher_misses += 1
+            missing = self._missing_keys.get(num, None)
+            if missing is not None:
+                if time.time() < missing:
+                    raise RuntimeError("AppCipher: key too old")
+                del self._missing_keys[num]
+        try:
+            return self._find_cipher(num)
+        except RuntimeError:
+            with self.lock:
+                if len(self._missing_keys) >= self.MAX_MISSING_KEYS:
+                    self._missing_keys = {}
+                self._missing_keys[num] = time.time() + self.MISSING_KEY_TTL
+            raise
+
+    def _find_cipher(self, num):
         stack = [(num, None, None)]
         while stack:
             key_num, key_data, cipher_num = stack.pop()
@@ -1823,13 +2417,12 @@ class AppCipher(object):
                     message = smessage
             with self.lock:
                 cipher = self._get_cipher(num)
-                if cipher is None:
-                    return ValueError
                 if cipher.hash(salt + message) == hash:
                     return message
                 else:
                     raise ValueError
-        except TypeError:
+        except (TypeError, RuntimeError):
+            # RuntimeError: signed with an unknown key
             raise ValueError
 
     def ascii_sign(self, message):
@@ -2054,9 +2647,18 @@ class SessionApp(WSGIDataApp):
         set the value you use a reasonable lifespan.
 
     csrftoken ('csrftoken')
-        The name of the form field containing the CSRF token"""
+        The name of the form field containing the CSRF token
+
+    refresh (60)
+        The minimum number of seconds between updates to the last seen
+        time of an established session.  Requests that arrive sooner
+        leave the session cookie unchanged, saving the cost of signing
+        a new cookie.  The session timeout is measured from the last
+        update so sessions may expire up to this many seconds early.
+        Set to 0 to update the cookie on every request."""
 
     _session_timeout = None
+    _session_refresh = None
     _session_cookie = None
     _test_cookie = None
 
@@ -2072,6 +2674,7 @@ class SessionApp(WSGIDataApp):
             settings.setdefault('cookie_test', 'ctest'))
         cls.csrf_token = settings.setdefault('crsf_token', 'csrftoken')
         settings.setdefault('cookie_test_age', 8640000)
+        cls._session_refresh = settings.setdefault('refresh', 60)
 
     @classmethod
     def load_default_metadata(cls):
@@ -2091,6 +2694,21 @@ class SessionApp(WSGIDataApp):
     #: The session class to use, must be (derived from) :class:`Session`
     SessionClass = CookieSession
 
+    #: the maximum number of verified session cookies remembered by
+    #: :meth:`read_session_cookie`
+    SESSION_CACHE_SIZE = 1024
+
+    def __init__(self, **kwargs):
+        super(SessionApp, self).__init__(**kwargs)
+        self._session_cache_lock = threading.Lock()
+        self._session_cache = OrderedDict()
+        #: the number of session cookies found in the cache
+        self.session_cache_hits = 0
+        #: the number of session cookies that had to be verified
+        self.session_cache_misses = 0
+        #: the number of requests that left the session cookie unchanged
+        self.session_refresh_skips = 0
+
     def init_dispatcher(self):
         """Adds pre-defined pages for this application
 
@@ -2116,9 +2734,7 @@ class SessionApp(WSGIDataApp):
                 # check the CSRF token
                 if s_signed:
                     try:
-                        s_msg = self.app_cipher.check_signature(s_signed)
-                        csrf_match = self.SessionClass(
-                            s_msg.decode('utf-8')).sid
+                        csrf_match = self.read_session_cookie(s_signed).sid
                     except ValueError:
                         # we'll warn about this in a moment anyway
                         pass
@@ -2143,14 +2759,17 @@ class SessionApp(WSGIDataApp):
         The session is read from the session cookie, established and
         marked as being seen now.  If no cookie is found a new session
         is created.  In both cases a cookie header is set to update the
-        cookie in the browser."""
+        cookie in the browser.
+
+        An established session that was last seen less than the
+        'refresh' setting's number of seconds ago is not marked and
+        no cookie header is set."""
         context.session = None
         cookies = context.get_cookies()
         s_signed = cookies.get(self._session_cookie, b'').decode('ascii')
         if s_signed and self._test_cookie in cookies:
             try:
-                s_msg = self.app_cipher.check_signature(s_signed)
-                context.session = self.SessionClass(s_msg.decode('utf-8'))
+                context.session = self.read_session_cookie(s_signed)
                 if context.session.established:
                     if context.session.age() > self._session_timeout:
                         context.session = None
@@ -2162,6 +2781,10 @@ class SessionApp(WSGIDataApp):
                     # session can now be established
                     if not context.session.established:
                         self.establish_session(context)
+                    elif context.session.age() < self._session_refresh:
+                        with self._session_cache_lock:
+                            self.session_refresh_skips += 1
+                        return
                     context.session.seen_now()
                     self.set_session_cookie(context)
             except ValueError:
@@ -2177,6 +2800,35 @@ class SessionApp(WSGIDataApp):
             context.session = self.SessionClass()
             self.set_session_cookie(context)
 
+    def read_session_cookie(self, s_signed):
+        """Returns a session object read from a session cookie
+
+        s_signed
+            The signed value of the session cookie (a character string)
+
+        The signature is checked using :attr:`app_cipher` and a new
+        instance of :attr:`SessionClass` is returned, ValueError is
+        raised if the signature is not valid.  Verified cookie values
+        are remembered (up to :attr:`SESSION_CACHE_SIZE` values) and
+        subsequent calls with the same value return a (shallow) copy of
+        the session without repeating the check.  Derived session
+        classes with mutable attributes should implement __copy__."""
+        with self._session_cache_lock:
+            session = self._session_cache.pop(s_signed, None)
+            if session is not None:
+                # move to the most recently used end
+                self._session_cache[s_signed] = session
+                self.session_cache_hits += 1
+        if session is None:
+            s_msg = self.app_cipher.check_signature(s_signed)
+            session = self.SessionClass(s_msg.decode('utf-8'))
+            with self._session_cache_lock:
+                self.session_cache_misses += 1
+                self._session_cache[s_signed] = session
+                while len(self._session_cache) > self.SESSION_CACHE_SIZE:
+                    self._session_cache.popitem(last=False)
+        return copy.copy(session)
+
     def set_session_cookie(self, context):
         """Adds the session cookie to the response headers
 
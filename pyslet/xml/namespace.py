@@ -15,14 +15,13 @@ from .parser import (
     XMLFatalError,
     XMLParser)
 from .structures import (
+    clear_element_class_tables,
     Document,
     DuplicateXMLNAME,
     Element,
-    escape_cdsect,
     escape_char_data,
     is_name_char,
     is_name_start_char,
-    is_s,
     Node,
     XMLDTD)
 
@@ -238,6 +237,8 @@ class NSNode(Node):
             prefix_map = self.get_prefix_map()
         else:
             prefix_map = self._prefix_to_ns
+        if not prefix_map:
+            return
         prefix_list = sorted(dict_keys(prefix_map))
         for prefix in prefix_list:
             if prefix:
@@ -250,6 +251,8 @@ class NSNode(Node):
         attributes[0:0] = ns_attrs
 
 
+_attr_format = ul('%s%s=%s')
+
 _xmlns_base = (XML_NAMESPACE, 'base')
 _xmlns_lang = (XML_NAMESPACE, 'lang')
 _xmlns_space = (XML_NAMESPACE, 'space')
@@ -452,30 +455,21 @@ class NSElement(NSNode, Element):
                 prefix = ''
             else:
                 ns, aname = a
-                prefix = self.get_prefix(ns)
+                if ns == NO_NAMESPACE:
+                    prefix = ''
+                else:
+                    prefix = self.get_prefix(ns)
             if prefix is None:
                 prefix = self.make_prefix(ns)
             if prefix:
                 prefix = prefix + ':'
             attributes.append(
-                ul('%s%s=%s') % (prefix, aname, escape_function(attrs[a],
-                                                                True)))
+                _attr_format % (prefix, aname, escape_function(attrs[a],
+                                                               True)))
         self.write_nsattrs(
             attributes, escape_function=escape_char_data, root=root)
 
-    def generate_xml(self, escape_function=escape_char_data, indent='',
-                     tab='\t', root=False, **kws):
-        escape_function = kws.get('escapeFunction', escape_function)
-        if tab:
-            ws = '\n' + indent
-            indent = indent + tab
-        else:
-            ws = ''
-        if not self.can_pretty_print():
-            # inline all children
-            indent = ''
-            tab = ''
-        attributes = []
+    def _xml_start_tag(self, escape_function, root):
         if self.ns:
             # look up the element prefix
             prefix = self.get_prefix(self.ns)
@@ -485,54 +479,10 @@ class NSElement(NSNode, Element):
         else:
             prefix = ''
         if prefix:
-            prefix = prefix + ':'
-        self.write_xml_attributes(attributes, escape_function, root=root)
-        if attributes:
-            attributes[0:0] = ['']
-            attributes = ' '.join(attributes)
+            name = ul('%s:%s') % (prefix, self.xmlname)
         else:
-            attributes = ''
-        children = self.get_canonical_children()
-        try:
-            child = next(children)
-            if is_string(child) and len(child) and is_s(child[0]):
-                # First character is WS, so assume pre-formatted.
-                indent = tab = ''
-            yield ul('%s<%s%s%s>') % (ws, prefix, self.xmlname, attributes)
-            if hasattr(self.__class__, 'SGMLCDATA'):
-                # When expressed in SGML this element would have type
-                # CDATA so put it in a CDSect
-                yield escape_cdsect(self.get_value())
-            else:
-                while True:
-                    if is_string(child):
-                        # We force encoding of carriage return as these
-                        # are subject to removal
-                        yield escape_function(child)
-                        # if we have character data content skip closing
-                        # ws
-                        ws = ''
-                    else:
-                        try:
-                            for s in child.generate_xml(
-                                    escape_function, indent, tab):
-                                yield s
-                        except TypeError:
-                            logging.error(
-                                "Problem with %s: child was %s",
-                                self.__class__.__name__, repr(child))
-                            raise
-                    try:
-                        child = next(children)
-                    except StopIteration:
-                        break
-            if not tab:
-                # if we weren't tabbing children we need to skip closing
-                # white space
-                ws = ''
-            yield ul('%s</%s%s>') % (ws, prefix, self.xmlname)
-        except StopIteration:
-            yield ul('%s<%s%s%s/>') % (ws, prefix, self.xmlname, attributes)
+            name = self.xmlname
+        return name, Element._xml_start_tag(self, escape_function, root)[1]
 
 
 # name provided for backwards compatibility
@@ -768,7 +718,7 @@ class XMLNSParser(XMLParser):
             xname = (doc_class.default_ns, xname[1])
         if self.sgml_omittag:
             if qname:
-                stag_class = self.doc.get_element_class(xname)
+                stag_class = self.get_doc_element_class(xname)
             else:
                 stag_class = str
             element_class = context.get_child_class(stag_class)
@@ -785,7 +735,7 @@ class XMLNSParser(XMLParser):
         else:
             stag_class = context.get_element_class(xname)
             if stag_class is None:
-                stag_class = self.doc.get_element_class(xname)
+                stag_class = self.get_doc_element_class(xname)
             return stag_class, xname, False
             # return
             # self.doc.get_element_class(xname),xname,False
@@ -825,6 +775,7 @@ def map_class_elements(class_map, scope, ns_alias_table=None):
     The scope is searched for classes derived from :py:class:`NSElement`
     that have an XMLNAME attribute defined.  It is an error if a class
     is found with an XMLNAME that has already been mapped."""
+    clear_element_class_tables()
     if not isinstance(scope, dict):
         scope = scope.__dict__
     for name in dict_keys(scope):
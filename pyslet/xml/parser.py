@@ -755,6 +755,8 @@ class XMLParser(PEP8Compatibility):
         self.dataCount = 0
         self.noPERefs = False
         self.gotPERef = False
+        self._ec_doc_class = None
+        self._ec_table = None
 
     def get_context(self):
         """Returns the parser's context
@@ -2476,7 +2478,7 @@ class XMLParser(PEP8Compatibility):
             if name:
                 stag_class = context.get_element_class(name)
                 if stag_class is None:
-                    stag_class = self.doc.get_element_class(name)
+                    stag_class = self.get_doc_element_class(name)
             else:
                 stag_class = str
             element_class = context.get_child_class(stag_class)
@@ -2493,9 +2495,29 @@ class XMLParser(PEP8Compatibility):
         else:
             stag_class = context.get_element_class(name)
             if stag_class is None:
-                stag_class = self.doc.get_element_class(name)
+                stag_class = self.get_doc_element_class(name)
             return stag_class, name, False
 
+    def get_doc_element_class(self, name):
+        """Returns the document's class for representing element *name*
+
+        Equivalent to self.doc.get_element_class(name) but the result
+        is looked up in the element class table of the document's class
+        when it has one, see
+        :func:`~pyslet.xml.structures.get_element_class_table`."""
+        doc_class = self.doc.__class__
+        if doc_class is not self._ec_doc_class:
+            self._ec_doc_class = doc_class
+            self._ec_table = xml.get_element_class_table(doc_class)
+        if self._ec_table is None:
+            return self.doc.get_element_class(name)
+        try:
+            return self._ec_table[name]
+        except KeyError:
+            eclass = self.doc.get_element_class(name)
+            self._ec_table[name] = eclass
+            return eclass
+
     def parse_stag(self):
         """[40] STag, [44] EmptyElemTag
 
@@ -6,13 +6,15 @@ import logging
 import os
 import os.path
 import random
+import re
+import sys
 import warnings
+import weakref
 
 from copy import copy
 from types import MethodType
 
 from .. import rfc2396 as uri
-from ..http import client as http
 from ..pep8 import (
     MigratedClass,
     old_function,
@@ -150,6 +152,9 @@ def is_s(c):
     return c is not None and c in "\x20\x09\x0A\x0D"
 
 
+_s_run = re.compile(ul(r'[\x20\x09\x0A\x0D]+'))
+
+
 def collapse_space(data, smode=True, stest=is_s):
     """Returns data with all spaces collapsed to a single space.
 
@@ -166,6 +171,11 @@ def collapse_space(data, smode=True, stest=is_s):
     Note on degenerate case: this function is intended to be called with
     non-empty strings and will never *return* an empty string.  If there
     is no data then a single space is returned (regardless of smode)."""
+    if stest is is_s:
+        result = _s_run.sub(uspace, data)
+        if smode and result[:1] == uspace:
+            result = result[1:]
+        return result if result else uspace
     result = []
     for c in data:
         if stest(c):
@@ -191,7 +201,7 @@ name_start_char = CharClass(
     (character(0x2c00), character(0x2fef)),
     (character(0x3001), character(0xd7ff)),
     (character(0xf900), character(0xfdcf)),
-    (character(0xfdf0), character(0xfffd)))
+    (character(0xfdf0), character(0xfffd))).freeze()
 
 
 @old_function('IsNameStartChar')
@@ -203,7 +213,7 @@ is_name_start_char = name_start_char.test   # noqa (def used by decorator)
 
 name_char = CharClass(name_start_char, '-', '.', ('0', '9'), character(0xb7),
                       (character(0x0300), character(0x036f)),
-                      (character(0x203f), character(0x2040)))
+                      (character(0x203f), character(0x2040))).freeze()
 
 
 @old_function('IsNameChar')
@@ -219,10 +229,7 @@ def is_valid_name(name):
     if name:
         if not is_name_start_char(name[0]):
             return False
-        for c in name[1:]:
-            if not is_name_char(c):
-                return False
-        return True
+        return name_char.scan(name, 1) == len(name)
     else:
         return False
 
@@ -274,42 +281,58 @@ def escape_char_data(src, quote=False):
 
     We also escape return characters to prevent them being ignored.  If quote
     is True then the string is returned as a quoted attribute value."""
-    data = []
-    apos = 0
-    quot = 0
-    for c in src:
-        if c == '&':
-            data.append('&amp;')
-        elif c == '<':
-            data.append('&lt;')
-        elif c == '>':
-            data.append('&gt;')
-        elif c == '\r':
-            data.append('&#xD;')
-        elif c == '"':
-            quot += 1
-            data.append(c)
-        elif c == "'":
-            apos += 1
-            data.append(c)
-        else:
-            data.append(c)
+    if '&' in src:
+        src = src.replace('&', '&amp;')
+    if '<' in src:
+        src = src.replace('<', '&lt;')
+    if '>' in src:
+        src = src.replace('>', '&gt;')
+    if '\r' in src:
+        src = src.replace('\r', '&#xD;')
     if quote:
+        quot = src.count('"')
+        apos = src.count("'")
         if quot > apos:
             if apos:
-                # escape apos
-                for i in range3(len(data)):
-                    if data[i] == "'":
-                        data[i] = '&apos;'
-            data = ["'"] + data + ["'"]
+                src = src.replace("'", '&apos;')
+            return "'" + src + "'"
         else:
             if quot:
-                # escape quot
-                for i in range3(len(data)):
-                    if data[i] == '"':
-                        data[i] = '&quot;'
-            data = ['"'] + data + ['"']
-    return ''.join(data)
+                src = src.replace('"', '&quot;')
+            return '"' + src + '"'
+    return src
+
+
+# matches the characters that escape_char_data7 may need to replace
+_escape7_re = re.compile(ul(r'[&<>\r"\']|[^\x00-\x7f]'))
+
+_escape7_map = {
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '\r': '&#xD;'}
+
+
+def _escape7(match, q, qstr):
+    c = match.group(0)
+    if c == q:
+        return qstr
+    result = _escape7_map.get(c)
+    if result is not None:
+        return result
+    code = ord(c)
+    if code > 0x7F:
+        if code > 0xFF:
+            if code > 0xFFFF:
+                if code > 0xFFFFFF:
+                    return "&#x%08X;" % code
+                else:
+                    return "&#x%06X;" % code
+            else:
+                return "&#x%04X;" % code
+        else:
+            return "&#x%02X;" % code
+    return c
 
 
 @old_function('EscapeCharData7')
@@ -326,7 +349,6 @@ def escape_char_data7(src, quote=False):
 
     Characters outside the ASCII range are replaced with character
     references."""
-    dst = []
     if quote:
         if "'" in src:
             q = '"'
@@ -337,37 +359,14 @@ def escape_char_data7(src, quote=False):
         else:
             q = '"'
             qstr = '&#x22;'
-        dst.append(q)
     else:
         q = None
         qstr = ''
-    for c in src:
-        if ord(c) > 0x7F:
-            if ord(c) > 0xFF:
-                if ord(c) > 0xFFFF:
-                    if ord(c) > 0xFFFFFF:
-                        dst.append("&#x%08X;" % ord(c))
-                    else:
-                        dst.append("&#x%06X;" % ord(c))
-                else:
-                    dst.append("&#x%04X;" % ord(c))
-            else:
-                dst.append("&#x%02X;" % ord(c))
-        elif c == '<':
-            dst.append("&lt;")
-        elif c == '&':
-            dst.append("&amp;")
-        elif c == '>':
-            dst.append("&gt;")
-        elif c == '\r':
-            dst.append("&#xD;")
-        elif c == q:
-            dst.append(qstr)
-        else:
-            dst.append(c)
+    if _escape7_re.search(src) is not None:
+        src = _escape7_re.sub(lambda m: _escape7(m, q, qstr), src)
     if quote:
-        dst.append(q)
-    return ''.join(dst)
+        return q + src + q
+    return src
 
 
 _xml_base = 'xml:base'
@@ -651,7 +650,15 @@ class Document(Node):
 
         Derived classes overrride this method to enable the XML parser
         to create instances of custom classes based on the document
-        context and element name."""
+        context and element name.
+
+        If this method is a class method the parser caches the result
+        for each name in a table associated with the document class.
+        The tables are reset by :func:`map_class_elements`, if a class
+        map is modified in any other way after parsing has started then
+        :func:`clear_element_class_tables` must be called.  Derived
+        classes that return results that depend on the document
+        instance must override this method with an instance method."""
         return Element
 
     def add_child(self, child_class, name=None):
@@ -1775,89 +1782,44 @@ class Element(Node):
         the same list of children as :py:meth:`get_children` if
         'preserve' is in force.  Otherwise we remove any leading space
         and collapse all others to a single space character."""
-        children = self.get_children()
-        # If there are no children there is nothing to do, so we don't catch
-        # StopIteration.
-        try:
-            first_child = next(children)
-        except StopIteration:
-            return
+        return _canonical_children(self.get_children(),
+                                   self._preserve_space())
+
+    def _preserve_space(self):
+        # True if white space in this element's content is preserved,
+        # see get_canonical_children
         e = self
         while isinstance(e, Element):
             spc = e.get_space()
             if spc is not None:
-                if spc == 'preserve':
-                    yield first_child
-                    try:
-                        while True:
-                            yield next(children)
-                        # will raise StopIteration and terminate method
-                    except StopIteration:
-                        return
-                else:
-                    break
+                return spc == 'preserve'
             if hasattr(e.__class__, 'SGMLCDATA'):
-                yield first_child
-                try:
-                    while True:
-                        yield next(children)
-                except StopIteration:
-                    return
+                return True
             e = e.parent
-        try:
-            ichild = next(children)
-        except StopIteration:
-            # There was only one child
-            if is_text(first_child):
-                first_child = collapse_space(first_child)
-            yield first_child
-            return
-        # Collapse strings to a single string entry and collapse spaces
-        data = []
-        if is_text(first_child):
-            data.append(first_child)
-            smode = True
-        else:
-            smode = False
-            yield first_child
-        while True:
-            if is_text(ichild):
-                data.append(ichild)
-            else:
-                if data:
-                    data_child = collapse_space(''.join(data), smode)
-                    if not smode or data_child != uspace:
-                        # ignore a leading space completely
-                        yield data_child
-                    data = []
-                yield ichild
-                smode = False
-            try:
-                ichild = next(children)
-                continue
-            except StopIteration:
-                if data:
-                    data_child = collapse_space(''.join(data), smode)
-                    if data_child == uspace:
-                        # just white space, return empty string if we're the
-                        # only child for consistency
-                        if smode:
-                            yield uempty
-                        else:
-                            # strip the whole last child
-                            return
-                    elif data_child[-1] == uspace:
-                        # strip the trailing space form the last child
-                        data_child = data_child[:-1]
-                    yield data_child
-                return
+        return False
 
     def _find_factory(self, child_class):
+        # the result depends only on the class of self (the attributes
+        # that make up the content model are set by the constructor) so
+        # it is cached on the class itself, see add_child
+        cache = self.__class__.__dict__.get('_xml_factories')
+        if cache is None:
+            cache = {}
+            setattr(self.__class__, '_xml_factories', cache)
+        try:
+            return cache[child_class]
+        except KeyError:
+            pass
+        fname = self._search_factory(child_class)
+        cache[child_class] = fname
+        return fname
+
+    def _search_factory(self, child_class):
         if hasattr(self, child_class.__name__):
             return child_class.__name__
         else:
             for parent in child_class.__bases__:
-                fname = self._find_factory(parent)
+                fname = self._search_factory(parent)
                 if fname:
                     return fname
             return None
@@ -1915,7 +1877,12 @@ class Element(Node):
         model *unless* the model supports a single element of the given
         child_class and the element already exists (as evidenced by an
         attribute with the name of child_class or one of its bases), in
-        which case the existing instance is returned."""
+        which case the existing instance is returned.
+
+        The name of the attribute found for each child_class is cached
+        on the parent's class, the attributes used to define the content
+        model must therefore be set by the constructor (or be class
+        attributes) and not added to individual instances later."""
         if self.is_empty():
             self.validation_error("Unexpected child element", name)
         child = None
@@ -2796,17 +2763,17 @@ class Element(Node):
             Indicates if this is the root element of the document.  See
             :meth:`write_xml_attributes`.
 
-        Yields character strings."""
+        Yields character strings.  The tree is walked iteratively and
+        the output is collected into strings of several kilobytes, the
+        method is still suitable for streaming large documents as the
+        children of each element are only requested as they are
+        needed."""
         escape_function = kws.get('escapeFunction', escape_function)
-        if tab:
-            ws = '\n' + indent
-            indent = indent + tab
-        else:
-            ws = ''
-        if not self.can_pretty_print():
-            # inline all children
-            indent = ''
-            tab = ''
+        return _generate_xml(self, escape_function, indent, tab, root)
+
+    def _xml_start_tag(self, escape_function, root):
+        # returns the name to use in the element's tags and a string
+        # containing the attributes (with a leading space)
         attributes = []
         self.write_xml_attributes(attributes, escape_function, root=root)
         if attributes:
@@ -2814,40 +2781,7 @@ class Element(Node):
             attributes = uspace.join(attributes)
         else:
             attributes = ''
-        children = self.get_canonical_children()
-        try:
-            child = next(children)
-            if is_text(child) and len(child) > 0 and is_s(child[0]):
-                # First character is WS, so assume pre-formatted
-                indent = tab = ''
-            yield ul('%s<%s%s>') % (ws, self.xmlname, attributes)
-            if hasattr(self.__class__, 'SGMLCDATA'):
-                # When expressed in SGML this element would have type CDATA so
-                # put it in a CDSect
-                yield escape_cdsect(self.get_value())
-            else:
-                while True:
-                    if is_text(child):
-                        # We force encoding of carriage return as these are
-                        # subject to removal
-                        yield escape_function(child)
-                        # if we have character data content skip closing ws
-                        ws = ''
-                    else:
-                        for s in child.generate_xml(escape_function, indent,
-                                                    tab):
-                            yield s
-                    try:
-                        child = next(children)
-                    except StopIteration:
-                        break
-            if not tab:
-                # if we weren't tabbing children we need to skip closing white
-                # space
-                ws = ''
-            yield ul('%s</%s>') % (ws, self.xmlname)
-        except StopIteration:
-            yield ul('%s<%s%s/>') % (ws, self.xmlname, attributes)
+        return self.xmlname, attributes
 
     @old_method('WriteXML')
     def write_xml(self, writer, escape_function=escape_char_data, indent='',
@@ -2865,6 +2799,206 @@ class Element(Node):
             writer.write(s.encode('utf-8'))
 
 
+def _canonical_children(children, preserve):
+    if preserve:
+        return children
+    else:
+        return _collapse_children(children)
+
+
+def _collapse_children(children):
+    # If there are no children there is nothing to do
+    try:
+        first_child = next(children)
+    except StopIteration:
+        return
+    try:
+        ichild = next(children)
+    except StopIteration:
+        # There was only one child
+        if is_text(first_child):
+            first_child = collapse_space(first_child)
+        yield first_child
+        return
+    # Collapse strings to a single string entry and collapse spaces
+    data = []
+    if is_text(first_child):
+        data.append(first_child)
+        smode = True
+    else:
+        smode = False
+        yield first_child
+    while True:
+        if is_text(ichild):
+            data.append(ichild)
+        else:
+            if data:
+                data_child = collapse_space(''.join(data), smode)
+                if not smode or data_child != uspace:
+                    # ignore a leading space completely
+                    yield data_child
+                data = []
+            yield ichild
+            smode = False
+        try:
+            ichild = next(children)
+            continue
+        except StopIteration:
+            if data:
+                data_child = collapse_space(''.join(data), smode)
+                if data_child == uspace:
+                    # just white space, return empty string if we're the
+                    # only child for consistency
+                    if smode:
+                        yield uempty
+                    else:
+                        # strip the whole last child
+                        return
+                elif data_child[-1] == uspace:
+                    # strip the trailing space form the last child
+                    data_child = data_child[:-1]
+                yield data_child
+            return
+
+
+def _method_function(m):
+    return getattr(m, '__func__', m)
+
+
+def _serial_info(cls):
+    # per-class flags used by _generate_xml: whether the class uses the
+    # default generate_xml, can_pretty_print and get_canonical_children
+    # implementations and whether it is an SGML CDATA element
+    info = cls.__dict__.get('_xml_serial_info')
+    if info is None:
+        info = (
+            _method_function(cls.generate_xml) is
+            Element.__dict__['generate_xml'],
+            _method_function(cls.can_pretty_print) is
+            Element.__dict__['can_pretty_print'],
+            _method_function(cls.get_canonical_children) is
+            Element.__dict__['get_canonical_children'],
+            hasattr(cls, 'SGMLCDATA'))
+        setattr(cls, '_xml_serial_info', info)
+    return info
+
+
+_stag_format = ul('%s<%s%s>')
+_etag_format = ul('%s</%s>')
+_empty_tag_format = ul('%s<%s%s/>')
+
+#: the number of strings collected by _generate_xml before yielding
+_xml_chunk_parts = 512
+
+
+def _generate_xml(element, escape_function, indent, tab, root):
+    # Implements Element.generate_xml without recursion.  Elements with
+    # a custom generate_xml method are delegated to.  The stack holds a
+    # list for each open element: [element, children, name, ws, indent,
+    # tab, preserve].  The results of can_pretty_print and the space
+    # handling mode are derived from the parent's when the default
+    # methods are in use.
+    out = []
+    stack = []
+    frame = None
+    e = element
+    no_child = object()
+    while True:
+        # start element e
+        stock, default_cpp, default_gcc, sgmlcdata = _serial_info(type(e))
+        known_parent = frame is not None and e.parent is frame[0]
+        if tab:
+            ws = '\n' + indent
+            indent = indent + tab
+            # tab is only passed to children that can be pretty printed
+            if default_cpp and known_parent:
+                cpp = not (sgmlcdata or
+                           e.XMLCONTENT == ElementType.MIXED or
+                           e.get_space() == 'preserve')
+            else:
+                cpp = e.can_pretty_print()
+            if not cpp:
+                # inline all children
+                indent = ''
+                tab = ''
+        else:
+            ws = ''
+        name, attributes = e._xml_start_tag(escape_function, root)
+        spc = e.get_space()
+        if spc is not None:
+            preserve = spc == 'preserve'
+        elif sgmlcdata:
+            preserve = True
+        elif known_parent:
+            preserve = frame[6]
+        else:
+            preserve = e._preserve_space()
+        if default_gcc:
+            children = _canonical_children(e.get_children(), preserve)
+        else:
+            children = e.get_canonical_children()
+        child = next(children, no_child)
+        if child is no_child:
+            out.append(_empty_tag_format % (ws, name, attributes))
+        else:
+            if is_text(child) and len(child) > 0 and is_s(child[0]):
+                # First character is WS, so assume pre-formatted
+                indent = tab = ''
+            out.append(_stag_format % (ws, name, attributes))
+            if sgmlcdata:
+                # When expressed in SGML this element would have type
+                # CDATA so put it in a CDSect
+                out.append(escape_cdsect(e.get_value()))
+                if not tab:
+                    ws = ''
+                out.append(_etag_format % (ws, name))
+                child = no_child
+            else:
+                frame = [e, children, name, ws, indent, tab, preserve]
+                stack.append(frame)
+        # find the next element to start
+        e = None
+        while stack:
+            if len(out) > _xml_chunk_parts:
+                yield ''.join(out)
+                out = []
+            if child is no_child:
+                child = next(frame[1], no_child)
+            if child is no_child:
+                # end of this element
+                if frame[5]:
+                    ws = frame[3]
+                else:
+                    # if we weren't tabbing children we need to skip
+                    # closing white space
+                    ws = ''
+                out.append(_etag_format % (ws, frame[2]))
+                stack.pop()
+                frame = stack[-1] if stack else None
+            elif is_text(child):
+                # We force encoding of carriage return as these are
+                # subject to removal
+                out.append(escape_function(child))
+                # if we have character data content skip closing ws
+                frame[3] = ''
+                child = no_child
+            elif _serial_info(type(child))[0]:
+                e = child
+                indent = frame[4]
+                tab = frame[5]
+                root = False
+                break
+            else:
+                for data in child.generate_xml(escape_function, frame[4],
+                                               frame[5]):
+                    out.append(data)
+                child = no_child
+        if e is None:
+            break
+    if out:
+        yield ''.join(out)
+
+
 class XMLContentParticle(object):
 
     # : Occurrence constant for particles that must appear exactly once
@@ -3188,6 +3322,14 @@ class XMLAttributeDefinition(object):
         self.defaultValue = None
 
 
+def _is_http_response(src):
+    # pyslet.http.client is only imported when a URI with an http(s)
+    # scheme is opened, if it has not been loaded then src can't be a
+    # response object
+    http = sys.modules.get('pyslet.http.client')
+    return http is not None and isinstance(src, http.ClientResponse)
+
+
 class XMLEntity(MigratedClass):
 
     """Represents an XML entity.
@@ -3260,7 +3402,7 @@ class XMLEntity(MigratedClass):
             self.open_unicode(src)
         elif isinstance(src, uri.URI):
             self.open_uri(src, encoding, req_manager)
-        elif isinstance(src, http.ClientResponse):
+        elif _is_http_response(src):
             self.open_http_response(src, encoding)
         elif isinstance(src, bytes):
             self.open_string(src, encoding)
@@ -3411,6 +3553,7 @@ class XMLEntity(MigratedClass):
                 self.auto_detect_encoding(self.data_source)
             self.open_file(self.data_source, self.encoding)
         elif src.scheme.lower() in ['http', 'https']:
+            from ..http import client as http
             if req_manager is None:
                 req_manager = http.Client()
             req = http.ClientRequest(str(src))
@@ -3873,6 +4016,38 @@ class XMLNotation(object):
         self.external_id = external_id
 
 
+_element_class_tables = weakref.WeakKeyDictionary()
+
+
+def get_element_class_table(doc_class):
+    """Returns the element class table for a document class
+
+    doc_class
+        A class derived from :class:`Document`
+
+    The result is a dictionary used to cache the values returned by
+    doc_class.get_element_class, or None if get_element_class is not a
+    class method and so its results can't be cached.  The parser uses
+    the same dictionary for every document of that class."""
+    try:
+        return _element_class_tables[doc_class]
+    except KeyError:
+        pass
+    if getattr(doc_class.get_element_class, '__self__', None) is doc_class:
+        table = {}
+    else:
+        table = None
+    _element_class_tables[doc_class] = table
+    return table
+
+
+def clear_element_class_tables():
+    """Empties all element class tables
+
+    Called automatically by :func:`map_class_elements`."""
+    _element_class_tables.clear()
+
+
 @old_function('MapClassElements')
 def map_class_elements(class_map, scope):
     """Adds element name -> class mappings to class_map
@@ -3892,6 +4067,7 @@ def map_class_elements(class_map, scope):
     :class:`Element` that has an XMLNAME attribute defined.  It is an
     error if a class is found with an XMLNAME that has already been
     mapped."""
+    clear_element_class_tables()
     if not isinstance(scope, dict):
         scope = scope.__dict__
     for name, obj in dict_items(scope):
@@ -919,15 +919,31 @@ class RegularExpression(UnicodeMixin):
 
     Warning: because the XML schema expression language contains
     concepts not supported by Python the python regular expression may
-    not be very readable."""
+    not be very readable.
 
-    def __init__(self, src):
+    If *defer* is True the expression is not parsed until it is first
+    used.  Expressions defined at module level use this option to
+    reduce the time taken to import the module but any error in the
+    expression will only be raised when it is used."""
+
+    def __init__(self, src, defer=False):
         #: the original source string
         self.src = force_text(src)
-        p = RegularExpressionParser(src)
+        self._p = None
+        if not defer:
+            self._compile()
+
+    def _compile(self):
+        p = RegularExpressionParser(self.src)
         pyre = p.require_reg_exp()
-        #: the compiled python regular expression
-        self.p = compile(pyre)
+        self._p = compile(pyre)
+
+    @property
+    def p(self):
+        """the compiled python regular expression"""
+        if self._p is None:
+            self._compile()
+        return self._p
 
     def __unicode__(self):
         return self.src
@@ -1430,27 +1446,35 @@ class RegularExpressionParser(BasicParser):
         else:
             self.parser_error("IsBlock")
 
-    multi_char_escapes = {
-        's': CharClass("\x20\t\n\r"),
-        'S': CharClass("\x20\t\n\r").negate(),
-        'i': CharClass(letter, '_:'),
-        'I': CharClass(letter, '_:').negate(),
-        'c': name_char,
-        'C': CharClass(name_char).negate(),
-        'd': CharClass.ucd_category('Nd'),
-        'D': CharClass(CharClass.ucd_category('Nd')).negate(),
-        'w': CharClass(CharClass.ucd_category('P'),
-                       CharClass.ucd_category('Z'),
-                       CharClass.ucd_category('C')).negate(),
-        'W': CharClass(CharClass.ucd_category('P'),
-                       CharClass.ucd_category('Z'),
-                       CharClass.ucd_category('C'))
-    }
+    #: a dictionary mapping multi-character escapes onto character
+    #: classes, created when first needed
+    multi_char_escapes = None
+
+    @classmethod
+    def _load_multi_char_escapes(cls):
+        cls.multi_char_escapes = {
+            's': CharClass("\x20\t\n\r"),
+            'S': CharClass("\x20\t\n\r").negate(),
+            'i': CharClass(letter, '_:'),
+            'I': CharClass(letter, '_:').negate(),
+            'c': name_char,
+            'C': CharClass(name_char).negate(),
+            'd': CharClass.ucd_category('Nd'),
+            'D': CharClass(CharClass.ucd_category('Nd')).negate(),
+            'w': CharClass(CharClass.ucd_category('P'),
+                           CharClass.ucd_category('Z'),
+                           CharClass.ucd_category('C')).negate(),
+            'W': CharClass(CharClass.ucd_category('P'),
+                           CharClass.ucd_category('Z'),
+                           CharClass.ucd_category('C'))
+        }
 
     def require_multi_char_esc(self):
         """Parses a MultiCharEsc."""
         if self.the_char == "\\":
             self.next_char()
+            if self.multi_char_escapes is None:
+                self._load_multi_char_escapes()
             try:
                 result = self.multi_char_escapes[self.the_char]
                 self.next_char()
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+"""Benchmark comparing FileBlockStore with PackedBlockStore
+
+Stores a set of random blocks in each type of block store, reads them
+back in a random order and then deletes them.  The test is repeated for
+block sizes from 4KB to 1MB with the total amount of data kept roughly
+constant.  Retrieved blocks are copied so that the cost of faulting in
+memory-mapped pages is included.
+
+Usage: python blockstore.py [total_megabytes]"""
+
+import os
+import random
+import sys
+import time
+
+from pyslet import blockstore
+from pyslet.vfs import OSFilePath as FilePath
+
+
+SIZES = (4096, 65536, 262144, 1048576)
+
+
+def run(bs, blocks):
+    t0 = time.time()
+    keys = [bs.store(data) for data in blocks]
+    t1 = time.time()
+    order = list(keys)
+    random.shuffle(order)
+    for key in order:
+        bytes(bs.retrieve(key))
+    t2 = time.time()
+    for key in keys:
+        bs.delete(key)
+    t3 = time.time()
+    return t1 - t0, t2 - t1, t3 - t2
+
+
+def main(total=64):
+    sys.stdout.write("%-18s %8s %12s %12s %12s\n" %
+                     ("store", "block", "store/s", "retrieve/s",
+                      "delete/s"))
+    for size in SIZES:
+        n = max(1, (total << 20) // size)
+        blocks = [os.urandom(size) for i in range(n)]
+        for name, cls in (("FileBlockStore", blockstore.FileBlockStore),
+                          ("PackedBlockStore", blockstore.PackedBlockStore)):
+            d = FilePath.mkdtemp('.d', 'pyslet-benchmark-')
+            try:
+                bs = cls(dpath=d, max_block_size=size)
+                tstore, tretrieve, tdelete = run(bs, blocks)
+                if isinstance(bs, blockstore.PackedBlockStore):
+                    bs.close()
+            finally:
+                d.rmtree(True)
+            sys.stdout.write("%-18s %7iK %12.0f %12.0f %12.0f\n" %
+                             (name, size // 1024, n / tstore,
+                              n / tretrieve, n / tdelete))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
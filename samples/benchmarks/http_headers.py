@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+"""Micro-benchmark for HTTP header parsing
+
+Receives a set of realistic request headers into a
+pyslet.http.messages.Request and then reads them back using the typed
+getters, in the way the OData server does when handling a request.
+The raw tokenizer (WordParser) is timed separately.
+
+Usage: python http_headers.py [number]"""
+
+import sys
+import timeit
+
+from pyslet.http import grammar, messages
+
+
+REQUEST_LINE = b"GET /service.svc/Products?$top=10 HTTP/1.1\r\n"
+
+HEADERS = [
+    b"Host: www.example.com\r\n",
+    b"User-Agent: Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) "
+    b"AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.113 "
+    b"Safari/537.36\r\n",
+    b"Accept: application/atom+xml;q=0.9, application/json;odata=verbose, "
+    b"application/xml;q=0.8, */*;q=0.1\r\n",
+    b"Accept-Charset: utf-8, iso-8859-1;q=0.5\r\n",
+    b"Accept-Encoding: gzip, deflate, br\r\n",
+    b"Accept-Language: en-GB,en-US;q=0.8,en;q=0.6\r\n",
+    b"Cache-Control: max-age=0, no-transform\r\n",
+    b"Connection: keep-alive\r\n",
+    b"Content-Type: application/json; charset=\"utf-8\"\r\n",
+    b"DataServiceVersion: 2.0; NetFx\r\n",
+    b"MaxDataServiceVersion: 2.0; NetFx\r\n",
+    b"If-None-Match: W/\"X'000000000001'\"\r\n",
+    b"\r\n"]
+
+
+def receive():
+    request = messages.Request()
+    request.start_receiving()
+    request.recv(REQUEST_LINE)
+    request.recv(HEADERS)
+    return request
+
+
+def read_headers(request):
+    # a typical handler reads each header more than once
+    for i in range(3):
+        request.get_accept()
+        request.get_accept_charset()
+        request.get_accept_encoding()
+        request.get_cache_control()
+        request.get_connection()
+        request.get_content_type()
+        request.get_content_length()
+
+
+def handle_request():
+    read_headers(receive())
+
+
+def tokenize():
+    for h in HEADERS[1:-1]:
+        grammar.WordParser(h.split(b':', 1)[1].strip())
+
+
+def main(number=2000):
+    for name, func in (("receive headers", receive),
+                       ("receive and read headers", handle_request),
+                       ("tokenize header values", tokenize)):
+        t = min(timeit.repeat(func, repeat=3, number=number))
+        sys.stdout.write("%-28s %8.1f us/op %10.0f ops/s\n" %
+                         (name, 1e6 * t / number, number / t))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+"""Benchmark for HTTP client pipelining and per-target connections
+
+Starts a local HTTP server that takes a fixed time to handle each
+request and then issues a burst of GET requests to it from a single
+thread, first with one connection (all requests pipelined) and then
+with several connections to the same host.  Reports the throughput and
+the per-target statistics kept by the client.
+
+Usage: python http_pipeline.py [number_of_requests]"""
+
+import socket
+import sys
+import threading
+import time
+
+from pyslet.http import client as http
+
+
+DELAY = 0.005
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+def serve_connection(s):
+    data = b''
+    try:
+        while True:
+            while b'\r\n\r\n' not in data:
+                new_data = s.recv(4096)
+                if not new_data:
+                    return
+                data += new_data
+            data = data.split(b'\r\n\r\n', 1)[1]
+            time.sleep(DELAY)
+            s.sendall(RESPONSE)
+    except IOError:
+        pass
+    finally:
+        s.close()
+
+
+def serve(server):
+    while True:
+        s, addr = server.accept()
+        t = threading.Thread(target=serve_connection, args=(s, ))
+        t.daemon = True
+        t.start()
+
+
+def run(port, n, max_target_connections):
+    client = http.Client(max_target_connections=max_target_connections)
+    client.httpUserAgent = None
+    requests = []
+    t0 = time.time()
+    for i in range(n):
+        request = http.ClientRequest("http://localhost:%i/%i" % (port, i))
+        client.queue_request(request)
+        requests.append(request)
+    client.thread_loop(timeout=5)
+    t1 = time.time()
+    for request in requests:
+        if request.status != 200:
+            raise RuntimeError("request failed: %s" % str(request.status))
+    stats = client.target_stats()["http://localhost:%i" % port]
+    client.close()
+    return t1 - t0, stats
+
+
+def main(n=400):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('localhost', 0))
+    server.listen(16)
+    port = server.getsockname()[1]
+    t = threading.Thread(target=serve, args=(server, ))
+    t.daemon = True
+    t.start()
+    for k in (1, 2, 4, 8):
+        elapsed, stats = run(port, n, k)
+        sys.stdout.write("%-28s %8.0f req/s %8.1f ms latency\n" %
+                         ("%i connection(s)" % k, n / elapsed,
+                          1000 * stats['mean_latency']))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
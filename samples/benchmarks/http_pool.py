@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+"""Benchmark for the HTTP client connection pool
+
+Fills the pool of a pyslet.http.client.Client with idle connections to
+different hosts and then times the selection of a connection for a
+request, both when an idle connection to the host can be reused and
+when the pool is full and the least recently used connection must be
+closed to make room.  No network connections are made.
+
+Usage: python http_pool.py [pool_size]"""
+
+import random
+import sys
+import threading
+import time
+
+from pyslet.http import client as http
+
+
+def request(client, url):
+    # queue a request and return the connection to the pool as if the
+    # request had completed
+    r = http.ClientRequest(url)
+    client.queue_request(r, timeout=0)
+    thread_target = (threading.current_thread().ident, r.scheme,
+                     r.hostname, r.port)
+    connection = client.cActiveThreadTargets[thread_target]
+    connection.request_queue = []
+    client._deactivate_connection(connection)
+
+
+def main(n=1000):
+    client = http.Client(max_connections=n)
+    client.httpUserAgent = None
+    urls = ["http://host%i.example.com/" % i for i in range(n)]
+    for url in urls:
+        request(client, url)
+    number = 20000
+    t0 = time.time()
+    for i in range(number):
+        request(client, random.choice(urls))
+    t1 = time.time()
+    for i in range(number):
+        request(client, "http://new%i.example.com/" % i)
+    t2 = time.time()
+    client.close()
+    for name, t in (("reuse idle connection", t1 - t0),
+                    ("evict and connect", t2 - t1)):
+        sys.stdout.write("%-28s %8.1f us/op %10.0f ops/s\n" %
+                         (name, 1e6 * t / number, number / t))
+    stats = client.pool_stats()
+    sys.stdout.write("%-28s %10i\n" % ("idle hits", stats['idle_hits']))
+    sys.stdout.write("%-28s %10i\n" % ("evictions", stats['evictions']))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
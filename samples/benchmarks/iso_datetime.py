@@ -0,0 +1,119 @@
+#! /usr/bin/env python
+"""Benchmark for ISO 8601 date and time handling
+
+Fills a SQLite table that has several DateTime and DateTimeOffset
+columns and then reads every row back through the OData API, reporting
+rows per second.  The parsing and formatting of individual values is
+also timed, comparing TimePoint.from_str with the general purpose
+ISO8601Parser.
+
+Usage: python iso_datetime.py [number_of_rows]"""
+
+import io
+import sys
+import time
+import timeit
+
+from pyslet import iso8601 as iso
+from pyslet.odata2 import metadata as edmx
+from pyslet.odata2 import sqlds
+
+
+SCHEMA = b"""<?xml version="1.0" encoding="UTF-8"?>
+<edmx:Edmx xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx"
+    Version="1.0">
+    <edmx:DataServices xmlns:m=
+        "http://schemas.microsoft.com/ado/2007/08/dataservices/metadata"
+        m:DataServiceVersion="2.0">
+        <Schema xmlns="http://schemas.microsoft.com/ado/2008/09/edm"
+            Namespace="Benchmark">
+            <EntityContainer Name="Container"
+                m:IsDefaultEntityContainer="true">
+                <EntitySet Name="Events" EntityType="Benchmark.Event"/>
+            </EntityContainer>
+            <EntityType Name="Event">
+                <Key>
+                    <PropertyRef Name="id"/>
+                </Key>
+                <Property Name="id" Type="Edm.Int32" Nullable="false"/>
+                <Property Name="created" Type="Edm.DateTime"/>
+                <Property Name="modified" Type="Edm.DateTime"/>
+                <Property Name="start" Type="Edm.DateTime"/>
+                <Property Name="end" Type="Edm.DateTime"/>
+                <Property Name="published" Type="Edm.DateTimeOffset"/>
+            </EntityType>
+        </Schema>
+    </edmx:DataServices>
+</edmx:Edmx>"""
+
+SAMPLES = ("1969-07-20T20:17:40", "1969-07-20T20:17:40.123456",
+           "2017-08-05 13:45:00.5", "20170805T134500.000000+0100 ")
+
+
+def load(container, rows):
+    now = iso.TimePoint.from_now_utc()
+    with container['Events'].open() as coll:
+        for i in range(rows):
+            e = coll.new_entity()
+            e['id'].set_from_value(i)
+            for name in ('created', 'modified', 'start', 'end'):
+                e[name].set_from_value(now)
+            e['published'].set_from_value(now.shift_zone(1, 1, 0))
+            coll.insert_entity(e)
+
+
+def read(container):
+    n = 0
+    with container['Events'].open() as coll:
+        for e in coll.itervalues():
+            n += 1
+    return n
+
+
+def parse_values():
+    for src in SAMPLES:
+        iso.TimePoint.from_str(src, tdesignators="T ")
+
+
+def parse_values_parser():
+    for src in SAMPLES:
+        iso.ISO8601Parser(src).parse_time_point_format(None, "T ")
+
+
+def format_values(values=[iso.TimePoint.from_str(src, tdesignators="T ")
+                          for src in SAMPLES]):
+    for tp in values:
+        tp.get_calendar_string(ndp=6, dp=".")
+
+
+def main(rows=10000):
+    doc = edmx.Document()
+    doc.read(src=io.BytesIO(SCHEMA))
+    container = doc.root.DataServices['Benchmark.Container']
+    db = sqlds.SQLiteEntityContainer(file_path=':memory:',
+                                     container=container)
+    try:
+        db.create_all_tables()
+        t0 = time.time()
+        load(container, rows)
+        t1 = time.time()
+        n = read(container)
+        t2 = time.time()
+    finally:
+        db.close()
+    sys.stdout.write("%-28s %10.0f rows/s\n" % ("insert", rows / (t1 - t0)))
+    sys.stdout.write("%-28s %10.0f rows/s\n" % ("read", n / (t2 - t1)))
+    number = 2000
+    for name, func in (("TimePoint.from_str", parse_values),
+                       ("ISO8601Parser", parse_values_parser),
+                       ("get_calendar_string", format_values)):
+        t = min(timeit.repeat(func, repeat=3, number=number))
+        sys.stdout.write("%-28s %8.1f us/value\n" %
+                         (name, 1e6 * t / (number * len(SAMPLES))))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+"""Benchmark for building XML trees from QTI v2 documents
+
+Parses each of the QTI v2.1 test documents in unittests/data_imsqtiv2p1
+from memory and reports the number of documents and elements parsed
+per second.
+
+Usage: python qti_parse.py [number]"""
+
+import os
+import sys
+import timeit
+
+from pyslet.qtiv2 import xml as qtixml
+from pyslet.xml import structures as xml
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                    'unittests', 'data_imsqtiv2p1')
+
+
+def load_sources():
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(DATA):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith('.xml'):
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    sources.append(f.read())
+    return sources
+
+
+def parse(sources):
+    for src in sources:
+        doc = qtixml.QTIDocument()
+        doc.read(src=src)
+
+
+def count_elements(sources):
+    n = 0
+    for src in sources:
+        doc = qtixml.QTIDocument()
+        doc.read(src=src)
+        n += len(list(doc.root.find_children_depth_first(xml.Element))) + 1
+    return n
+
+
+def main(number=200):
+    sources = load_sources()
+    nelements = count_elements(sources)
+    t = min(timeit.repeat(lambda: parse(sources), repeat=3, number=number))
+    sys.stdout.write("%-28s %10.0f docs/s\n" %
+                     ("documents", number * len(sources) / t))
+    sys.stdout.write("%-28s %10.0f elements/s\n" %
+                     ("elements", number * nelements / t))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
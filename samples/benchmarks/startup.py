@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+"""Benchmark for the time taken to import pyslet's main entry points
+
+Each module is imported in a fresh interpreter.  On Python 3.7 and
+later the cumulative import time reported by ``python -X importtime``
+is used, on earlier versions the wall-clock time of the whole
+interpreter run is reported instead (and the times will include the
+interpreter's own start up).  The best of several runs is compared with
+a target for each entry point.  Compiled byte code must be writable (or
+cached) for the figures to be meaningful.
+
+Usage: python startup.py [number_of_runs]"""
+
+import subprocess
+import sys
+import time
+
+
+#: target import times in ms for each entry point
+TARGETS = (
+    ("pyslet.xml.structures", 50),
+    ("pyslet.html401", 75),
+    ("pyslet.http.client", 80),
+    ("pyslet.odata2.client", 130),
+    ("pyslet.odata2.server", 130),
+    ("pyslet.odata2.sqlds", 150),
+    ("pyslet.qtiv2.xml", 120),
+    ("pyslet.wsgi", 160))
+
+IMPORTTIME = sys.version_info >= (3, 7)
+
+
+def import_time(module):
+    cmd = [sys.executable]
+    if IMPORTTIME:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", "import %s" % module]
+    t0 = time.time()
+    p = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+    output = p.communicate()[1]
+    t1 = time.time()
+    if p.returncode:
+        raise RuntimeError(output.decode('utf-8', 'replace'))
+    if IMPORTTIME:
+        # the last line is the top-level import, the second column is
+        # the cumulative time in microseconds
+        line = output.decode('utf-8').strip().splitlines()[-1]
+        return int(line.split('|')[1]) / 1000.0
+    else:
+        return 1000.0 * (t1 - t0)
+
+
+def main(n=5):
+    for module, target in TARGETS:
+        t = min(import_time(module) for i in range(n))
+        sys.stdout.write("%-28s %8.1f ms (target %i ms) %s\n" %
+                         (module, t, target,
+                          "ok" if t <= target else "SLOW"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
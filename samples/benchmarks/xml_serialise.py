@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+"""Benchmark for XML serialisation
+
+Builds an Atom feed with a number of entries and the QTI v2.1 test
+documents from unittests/data_imsqtiv2p1 and then times serialising
+them as character strings (str), UTF-8 (write_xml) and as ASCII with
+character references (bytes).  The time taken to parse the feed is
+shown for comparison.
+
+Usage: python xml_serialise.py [number_of_entries]"""
+
+import io
+import os
+import sys
+import time
+
+from pyslet import rfc4287 as atom
+from pyslet.py2 import to_text
+from pyslet.qtiv2 import xml as qtixml
+
+
+ENTRY = u"""<entry>
+    <id>http://www.example.com/entries/%(i)i</id>
+    <title type="text">Entry number %(i)i &amp; friends</title>
+    <updated>2017-08-05T13:45:00Z</updated>
+    <author><name>Café &lt;Writer&gt;</name></author>
+    <link rel="alternate" href="http://www.example.com/entries/%(i)i"/>
+    <link rel="edit" href="entries/%(i)i" type="application/atom+xml"/>
+    <summary>A "quoted" summary with it's own &lt;markup&gt;.</summary>
+    <content type="html">&lt;p&gt;Paragraph %(i)i&lt;/p&gt;</content>
+</entry>
+"""
+
+FEED = u"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<id>http://www.example.com/feed</id>
+<title>Benchmark</title>
+<updated>2017-08-05T13:45:00Z</updated>
+%s</feed>"""
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                    'unittests', 'data_imsqtiv2p1')
+
+
+def load_qti():
+    docs = []
+    for dirpath, dirnames, filenames in os.walk(DATA):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.endswith('.xml'):
+                doc = qtixml.QTIDocument()
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    doc.read(src=f.read())
+                docs.append(doc)
+    return docs
+
+
+def best(func, repeat=3):
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def write_utf8(doc):
+    doc.write_xml(io.BytesIO())
+
+
+def main(entries=2000):
+    src = (FEED % ''.join(ENTRY % {'i': i} for i in range(entries))).encode(
+        'utf-8')
+    doc = atom.AtomDocument()
+    doc.read(src=src)
+    tparse = best(lambda: atom.AtomDocument().read(src=src))
+    size = len(to_text(doc))
+    sys.stdout.write("%-28s %10.1f MB/s\n" %
+                     ("Atom feed: parse", size / tparse / 1e6))
+    for name, func in (("Atom feed: str", to_text),
+                       ("Atom feed: write_xml", write_utf8),
+                       ("Atom feed: bytes", bytes)):
+        t = best(lambda: func(doc))
+        sys.stdout.write("%-28s %10.1f MB/s\n" % (name, size / t / 1e6))
+    docs = load_qti()
+    number = 20
+    for name, func in (("QTI: str", to_text),
+                       ("QTI: bytes", bytes)):
+        t = best(lambda: [func(d) for i in range(number) for d in docs])
+        sys.stdout.write("%-28s %10.0f docs/s\n" %
+                         (name, number * len(docs) / t))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -5,6 +5,7 @@ import io
 import logging
 import os.path
 import random
+import sys
 import threading
 import time
 import unittest
@@ -28,6 +29,7 @@ def suite():
     return unittest.TestSuite((
         loader.loadTestsFromTestCase(CoreTests),
         loader.loadTestsFromTestCase(FileTests),
+        loader.loadTestsFromTestCase(PackedTests),
         loader.loadTestsFromTestCase(ODataTests),
         loader.loadTestsFromTestCase(LockingTests),
         loader.loadTestsFromTestCase(StreamStoreTests),
@@ -182,6 +184,147 @@ class FileTests(BlockStoreCommon):
         self.cafeclosed(bs)
 
 
+class PackedTests(BlockStoreCommon):
+
+    def setUp(self):  # noqa
+        self.d = FilePath.mkdtemp('.d', 'pyslet-test_blockstore-')
+
+    def tearDown(self):  # noqa
+        self.d.rmtree(True)
+
+    def test_init(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d)
+        self.assertTrue(
+            bs.max_block_size == blockstore.MAX_BLOCK_SIZE,
+            "default block size")
+        self.assertTrue(
+            bs.hash_class is hashlib.sha256,
+            "default hash_class SHA256")
+        bs.close()
+
+    def test_store(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d)
+        self.fox_cafe(bs)
+        fox = b"The quick brown fox jumped over the lazy dog"
+        data = bs.retrieve(bs.key(fox))
+        self.assertTrue(isinstance(data, bytes))
+        self.assertTrue(data == fox)
+        self.assertTrue(bytes(bs.retrieve_view(bs.key(fox))) == fox)
+        # one segment file and the index
+        self.assertTrue(len(list(self.d.listdir())) == 2)
+        bs.close()
+        # the segment is closed when the store is reopened
+        bs = blockstore.PackedBlockStore(dpath=self.d, segment_size=16)
+        data = bs.retrieve(bs.key(fox))
+        self.assertTrue(isinstance(data, bytes))
+        self.assertTrue(data == fox)
+        data = bs.retrieve_view(bs.key(fox))
+        if sys.version_info[0] > 2:
+            self.assertTrue(isinstance(data, memoryview))
+        self.assertTrue(bytes(data) == fox)
+        # blocks in the new active segment are read from its file
+        key = bs.store(b"new block")
+        self.assertTrue(bs.retrieve(key) == b"new block")
+        bs.store(b"another block")
+        self.assertTrue(bs.retrieve(key) == b"new block")
+        bs.close()
+
+    def test_maxsize(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d, max_block_size=256)
+        self.maxsize(bs)
+        bs.close()
+
+    def test_hash(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d,
+                                         hash_class=hashlib.md5)
+        self.checkmd5(bs)
+        bs.close()
+
+    def test_delete(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d)
+        self.cafeclosed(bs)
+        bs.close()
+
+    def test_persist(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d)
+        keys = [bs.store(b"%i" % i * 10) for i in range3(2000)]
+        bs.delete(keys[0])
+        bs.close()
+        bs = blockstore.PackedBlockStore(dpath=self.d)
+        try:
+            bs.retrieve(keys[0])
+            self.fail("Deleted block persisted")
+        except blockstore.BlockMissing:
+            pass
+        for i in range3(1, 2000):
+            self.assertTrue(bs.retrieve(keys[i]) == b"%i" % i * 10)
+        self.assertTrue(bs.store(b"1" * 10) == keys[1])
+        bs.close()
+        # a store with a different hash can't use this index
+        try:
+            blockstore.PackedBlockStore(dpath=self.d, hash_class=hashlib.md5)
+            self.fail("Index with wrong digest size")
+        except ValueError:
+            pass
+
+    def test_compact(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d, segment_size=1024)
+        data = [(b"%03i" % i) * 40 for i in range3(30)]
+        keys = [bs.store(d) for d in data]
+        nsegs = len(list(self.d.listdir())) - 1
+        self.assertTrue(nsegs > 3)
+        view = bs.retrieve_view(keys[0])
+        for k in keys[:20]:
+            bs.delete(k)
+        fsync = os.fsync
+        synced = []
+
+        def mock_fsync(fd):
+            synced.append(fd)
+            fsync(fd)
+
+        os.fsync = mock_fsync
+        try:
+            removed = bs.compact()
+        finally:
+            os.fsync = fsync
+        self.assertTrue(removed > 0)
+        # copied blocks were synced before the old segments went
+        self.assertTrue(len(synced) >= removed)
+        # the copied blocks may have started a new segment
+        self.assertTrue(
+            len(list(self.d.listdir())) - 1 <= nsegs - removed + 1)
+        for k, d in zip(keys[20:], data[20:]):
+            self.assertTrue(bs.retrieve(k) == d)
+        for k in keys[:20]:
+            try:
+                bs.retrieve(k)
+                self.fail("Read back deleted block")
+            except blockstore.BlockMissing:
+                pass
+        # views of compacted segments remain valid
+        self.assertTrue(bytes(view) == data[0])
+        bs.close()
+        bs = blockstore.PackedBlockStore(dpath=self.d, segment_size=1024)
+        for k, d in zip(keys[20:], data[20:]):
+            self.assertTrue(bs.retrieve(k) == d)
+        bs.close()
+
+    def test_compactor(self):
+        bs = blockstore.PackedBlockStore(dpath=self.d, segment_size=256,
+                                         compact_interval=0.01)
+        keys = [bs.store((b"%03i" % i) * 40) for i in range3(10)]
+        for k in keys[:5]:
+            bs.delete(k)
+        nfiles = len(list(self.d.listdir()))
+        for i in range3(100):
+            time.sleep(0.01)
+            if len(list(self.d.listdir())) < nfiles:
+                break
+        self.assertTrue(len(list(self.d.listdir())) < nfiles)
+        bs.close()
+
+
 class ODataTests(BlockStoreCommon):
 
     def setUp(self):  # noqa
@@ -378,6 +521,161 @@ class StreamStoreTests(unittest.TestCase):
                 self.assertTrue(len(blocks) == 1)
                 self.assertTrue(ss.retrieve_block(blocks2[0]) == cafe)
 
+    def test_store_refs(self):
+        ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                    entity_set=self.cdef['Streams'],
+                                    ref_set=self.cdef['BlockRefs'])
+        fox = b"The quick brown fox jumped over the lazy dog"
+        cafe = ul("Caf\xe9").encode('utf-8')
+        fox_key = self.bs.key(fox)
+        cafe_key = self.bs.key(cafe)
+        stream1 = ss.new_stream("text/plain")
+        stream2 = ss.new_stream("text/plain")
+        blocks1 = ss.store_blocks(stream1, [(0, cafe), (1, fox), (2, cafe)])
+        self.assertTrue(len(blocks1) == 3)
+        self.assertTrue([b['num'].value for b in blocks1] == [0, 1, 2])
+        ss.store_block(stream2, 0, cafe)
+        with self.cdef['BlockLists'].open() as blocks:
+            self.assertTrue(len(blocks) == 4)
+        with self.cdef['BlockRefs'].open() as refs:
+            self.assertTrue(len(refs) == 2)
+            self.assertTrue(refs[cafe_key]['refs'].value == 3)
+            self.assertTrue(refs[fox_key]['refs'].value == 1)
+        # no locks left behind
+        with self.cdef['BlockLocks'].open() as locks:
+            self.assertTrue(len(locks) == 0)
+        # replacing a block moves the reference
+        ss.update_block(blocks1[2], fox)
+        with self.cdef['BlockRefs'].open() as refs:
+            self.assertTrue(refs[cafe_key]['refs'].value == 2)
+            self.assertTrue(refs[fox_key]['refs'].value == 2)
+        ss.delete_blocks(stream1, 1)
+        with self.cdef['BlockRefs'].open() as refs:
+            self.assertTrue(len(refs) == 1)
+            self.assertTrue(refs[cafe_key]['refs'].value == 2)
+        try:
+            self.bs.retrieve(fox_key)
+            self.fail("Expected missing block")
+        except blockstore.BlockMissing:
+            pass
+        ss.delete_stream(stream1)
+        self.assertTrue(self.bs.retrieve(cafe_key) == cafe)
+        ss.delete_stream(stream2)
+        with self.cdef['BlockRefs'].open() as refs:
+            self.assertTrue(len(refs) == 0)
+        with self.cdef['BlockLists'].open() as blocks:
+            self.assertTrue(len(blocks) == 0)
+        with self.cdef['Blocks'].open() as blocks:
+            self.assertTrue(len(blocks) == 0)
+
+    def test_rebuild_refs(self):
+        # start with a store that has no reference counts
+        ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                    entity_set=self.cdef['Streams'])
+        fox = b"The quick brown fox jumped over the lazy dog"
+        cafe = ul("Caf\xe9").encode('utf-8')
+        stream1 = ss.new_stream("text/plain")
+        ss.store_blocks(stream1, [(0, cafe), (1, fox), (2, cafe)])
+        orphan_key = self.bs.store(b"orphan")
+        ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                    entity_set=self.cdef['Streams'],
+                                    ref_set=self.cdef['BlockRefs'])
+        self.assertTrue(ss.rebuild_refs() == 0)
+        with self.cdef['BlockRefs'].open() as refs:
+            self.assertTrue(len(refs) == 2)
+            self.assertTrue(refs[self.bs.key(cafe)]['refs'].value == 2)
+            # simulate an interrupted delete
+            ref = refs.new_entity()
+            ref['hash'].set_from_value(orphan_key)
+            ref['refs'].set_from_value(1)
+            refs.insert_entity(ref)
+        self.assertTrue(ss.rebuild_refs() == 1)
+        try:
+            self.bs.retrieve(orphan_key)
+            self.fail("Expected orphan to be removed")
+        except blockstore.BlockMissing:
+            pass
+        data = [ss.retrieve_block(b) for b in ss.retrieve_blocklist(stream1)]
+        self.assertTrue(data == [cafe, fox, cafe])
+
+    def test_workers(self):
+        ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                    entity_set=self.cdef['Streams'],
+                                    read_ahead=3, write_behind=2,
+                                    max_workers=2)
+        data = b"".join(
+            (b"%03i" % i) * 20 for i in range3(20))
+        s1 = ss.new_stream("text/plain")
+        with ss.open_stream(s1, 'w') as s:
+            self.assertTrue(s.write_behind == 2)
+            self.assertTrue(s.read_ahead == 0)
+            nbytes = 0
+            while nbytes < len(data):
+                nbytes += s.write(data[nbytes:])
+                self.assertTrue(len(s._pending) <= 2)
+        self.assertTrue(s1['size'].value == len(data))
+        self.assertTrue(s1['md5'].value == hashlib.md5(data).digest())
+        # the stream entity was saved
+        s1 = ss.get_stream(s1.key())
+        self.assertTrue(s1['size'].value == len(data))
+        self.assertTrue(s1['md5'].value == hashlib.md5(data).digest())
+        with self.cdef['BlockLists'].open() as blocks:
+            self.assertTrue(len(blocks) == (len(data) + 63) // 64)
+        self.assertTrue(len(ss.get_workers().threads) <= 2)
+        with ss.open_stream(s1) as s:
+            self.assertTrue(s.read_ahead == 3)
+            rdata = []
+            while True:
+                chunk = s.read(64)
+                if not chunk:
+                    break
+                self.assertTrue(len(s._prefetch) <= 3)
+                rdata.append(chunk)
+            self.assertTrue(b"".join(rdata) == data)
+            # random access still works
+            s.seek(600)
+            self.assertTrue(s.read(3) == b"010")
+            s.seek(60)
+            self.assertTrue(s.read(3) == b"001")
+        # no read ahead or write behind by default
+        with blockstore.StreamStore(
+                bs=self.bs, ls=self.ls,
+                entity_set=self.cdef['Streams']).open_stream(s1) as s:
+            self.assertTrue(s.read_ahead == 0)
+            self.assertTrue(s.read() == data)
+            self.assertTrue(len(s._prefetch) == 0)
+
+    def test_write_behind(self):
+        # with a slow block store, new blocks are stored in parallel
+        store = self.bs.store
+
+        def slow_store(data):
+            time.sleep(0.05)
+            return store(data)
+        self.bs.store = slow_store
+        ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                    entity_set=self.cdef['Streams'],
+                                    write_behind=4, max_workers=4)
+        data = b"".join(
+            (b"%03i" % i) * 20 for i in range3(20))
+        s1 = ss.new_stream("text/plain")
+        max_pending = 0
+        t0 = time.time()
+        with ss.open_stream(s1, 'w') as s:
+            nbytes = 0
+            while nbytes < len(data):
+                nbytes += s.write(data[nbytes:])
+                max_pending = max(max_pending, len(s._pending))
+        elapsed = time.time() - t0
+        self.assertTrue(max_pending == 4, "peak pending %i" % max_pending)
+        # 20 blocks at 0.05s each would take 1s without overlap
+        self.assertTrue(elapsed < 0.8, "write took %.2fs" % elapsed)
+        s1 = ss.get_stream(s1.key())
+        self.assertTrue(s1['size'].value == len(data))
+        self.assertTrue(s1['md5'].value == hashlib.md5(data).digest())
+        with ss.open_stream(s1) as s:
+            self.assertTrue(s.read() == data)
+
     def test_create(self):
         ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
                                     entity_set=self.cdef['Streams'])
@@ -570,6 +868,33 @@ class RandomStreamTests(unittest.TestCase):
                                          entity_set=self.cdef['Streams'])
         self.random_rw()
 
+    def test_mem_packed(self):
+        self.container = InMemoryEntityContainer(self.cdef)
+        self.bs = blockstore.PackedBlockStore(dpath=self.d,
+                                              max_block_size=self.block_size,
+                                              segment_size=1024)
+        self.ls = blockstore.LockStore(entity_set=self.cdef['BlockLocks'])
+        self.ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                         entity_set=self.cdef['Streams'],
+                                         ref_set=self.cdef['BlockRefs'])
+        self.random_rw()
+        self.bs.compact()
+        self.bs.close()
+
+    def test_sql_sql_workers(self):
+        self.container = BlockStoreContainer(
+            container=self.cdef,
+            file_path=str(self.d.join('blockstore.db')))
+        self.container.create_all_tables()
+        self.bs = blockstore.EDMBlockStore(entity_set=self.cdef['Blocks'],
+                                           max_block_size=self.block_size)
+        self.ls = blockstore.LockStore(entity_set=self.cdef['BlockLocks'])
+        self.ss = blockstore.StreamStore(bs=self.bs, ls=self.ls,
+                                         entity_set=self.cdef['Streams'],
+                                         ref_set=self.cdef['BlockRefs'],
+                                         read_ahead=2, write_behind=3)
+        self.random_rw()
+
 
 if __name__ == "__main__":
     logging.basicConfig(
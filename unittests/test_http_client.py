@@ -7,10 +7,12 @@ import os.path
 import select
 import shutil
 import socket
+import ssl
 import threading
 import time
 import random
 import unittest
+import zlib
 
 from tempfile import mkdtemp
 
@@ -20,7 +22,7 @@ import pyslet.http.params as params
 import pyslet.http.server as server
 import pyslet.rfc2396 as uri
 
-from pyslet.py2 import range3
+from pyslet.py2 import dict_values, range3
 from pyslet.streams import Pipe, io_timedout
 
 from test_http_server import MockSocketBase, MockTime
@@ -38,7 +40,10 @@ def suite():
     return unittest.TestSuite((
         unittest.makeSuite(ClientTests, 'test'),
         unittest.makeSuite(LegacyServerTests, 'test'),
+        unittest.makeSuite(LocalPoolTests, 'test'),
+        unittest.makeSuite(PipelineTests, 'test'),
         unittest.makeSuite(ClientRequestTests, 'test'),
+        unittest.makeSuite(ClientPoolTests, 'test'),
         # unittest.makeSuite(SecureTests, 'test')
     ))
 
@@ -263,6 +268,168 @@ class ClientRequestTests(unittest.TestCase):
                             (request.retry_time, i))
 
 
+class ClientPoolTests(unittest.TestCase):
+
+    def setUp(self):        # noqa
+        self.save_time = http.time
+        self.save_getaddrinfo = socket.getaddrinfo
+        http.time = MockTime
+        MockTime.now = 10.0
+        self.lookups = []
+        socket.getaddrinfo = self.mock_getaddrinfo
+        self.client = http.Client(max_connections=3)
+        self.client.httpUserAgent = None
+
+    def tearDown(self):     # noqa
+        self.client.close()
+        socket.getaddrinfo = self.save_getaddrinfo
+        http.time = self.save_time
+        MockTime.now = time.time()
+
+    def mock_getaddrinfo(self, host, port, *args):
+        self.lookups.append(host)
+        if host.startswith('bad'):
+            raise socket.gaierror(socket.EAI_NONAME, "Not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('192.0.2.%i' % len(self.lookups), port))]
+
+    def queue(self, url):
+        # queues a request and then returns the connection to the
+        # idle pool as if the request had completed
+        request = http.ClientRequest(url)
+        self.client.queue_request(request, timeout=0)
+        thread_target = (threading.current_thread().ident, request.scheme,
+                         request.hostname, request.port)
+        connection = self.client.cActiveThreadTargets[thread_target]
+        connection.request_queue = []
+        self.client._deactivate_connection(connection)
+        return connection
+
+    def test_lru(self):
+        c1 = self.queue("http://www.domain1.com/")
+        c2 = self.queue("http://www.domain2.com/")
+        # the idle connection to domain1 is reused
+        self.assertTrue(self.queue("http://www.domain1.com/") is c1)
+        c3 = self.queue("http://www.domain3.com/")
+        self.assertEqual(list(self.client.cIdleList), [c2.id, c1.id, c3.id])
+        # the pool is full, the least recently used connection goes
+        c4 = self.queue("http://www.domain4.com/")
+        self.assertEqual(list(self.client.cIdleList), [c1.id, c3.id, c4.id])
+        self.assertFalse(("http", "www.domain2.com", 80) in
+                         self.client.cIdleTargets)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['idle_hits'], 1)
+        self.assertEqual(stats['new_connections'], 4)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['idle'], 3)
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['idle_targets'], 3)
+        self.assertEqual(stats['max_connections'], 3)
+
+    def test_youngest(self):
+        # two idle connections to the same target, the most recently
+        # used one is taken
+        target = ("http", "www.domain1.com", 80)
+        connections = []
+        for thread_id in (1, 2):
+            connection = self.client._new_connection(target)
+            self.client._activate_connection(connection, thread_id)
+            connections.append(connection)
+        for connection in connections:
+            self.client._deactivate_connection(connection)
+        self.assertTrue(self.queue("http://www.domain1.com/") is
+                        connections[1])
+        self.assertEqual(list(self.client.cIdleTargets[target]),
+                         [connections[0].id, connections[1].id])
+        MockTime.now = 100.0
+        connections[1].last_active = 95.0
+        self.client.idle_cleanup(10)
+        self.assertEqual(list(self.client.cIdleList), [connections[1].id])
+        self.assertEqual(self.client.pool_stats()['expired'], 1)
+
+    def test_busy(self):
+        target = ("http", "www.domain1.com", 80)
+        for thread_id in (1, 2, 3):
+            connection = self.client._new_connection(target)
+            self.client._activate_connection(connection, thread_id)
+        request = http.ClientRequest("http://www.domain2.com/")
+        try:
+            self.client.queue_request(request, timeout=0)
+            self.fail("queue_request with full pool")
+        except http.RequestManagerBusy:
+            pass
+        self.assertEqual(self.client.pool_stats()['timeouts'], 1)
+
+    def test_dns_ttl(self):
+        self.client.dns_ttl = 60
+        self.client.dns_refresh = None
+        result = self.client.dnslookup("www.domain1.com", 80)
+        self.assertEqual(result[0][4], ('192.0.2.1', 80))
+        MockTime.now = 69.0
+        self.assertTrue(self.client.dnslookup("www.domain1.com", 80) is
+                        result)
+        self.assertEqual(len(self.lookups), 1)
+        # expired
+        MockTime.now = 71.0
+        result = self.client.dnslookup("www.domain1.com", 80)
+        self.assertEqual(result[0][4], ('192.0.2.2', 80))
+        self.assertEqual(len(self.lookups), 2)
+        self.client.flush_dns()
+        self.client.dnslookup("www.domain1.com", 80)
+        self.assertEqual(len(self.lookups), 3)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['dns_hits'], 1)
+        self.assertEqual(stats['dns_misses'], 3)
+        self.assertEqual(stats['dns_entries'], 1)
+        # no TTL, cache forever
+        self.client.dns_ttl = None
+        self.client.flush_dns()
+        result = self.client.dnslookup("www.domain1.com", 80)
+        MockTime.now = 1e9
+        self.assertTrue(self.client.dnslookup("www.domain1.com", 80) is
+                        result)
+
+    def test_dns_negative(self):
+        for i in range3(2):
+            try:
+                self.client.dnslookup("bad.domain1.com", 80)
+                self.fail("Expected gaierror")
+            except socket.gaierror as err:
+                self.assertEqual(err.args[0], socket.EAI_NONAME)
+        self.assertEqual(self.lookups, ["bad.domain1.com"])
+        self.assertEqual(self.client.pool_stats()['dns_negative_hits'], 1)
+        MockTime.now = 15.0
+        self.assertRaises(socket.gaierror, self.client.dnslookup,
+                          "bad.domain1.com", 80)
+        self.assertEqual(len(self.lookups), 2)
+        # the failure is reported by the connection
+        self.client.dns_negative_ttl = 0
+        connection = self.client._new_connection(
+            ("http", "bad.domain2.com", 80))
+        self.assertRaises(messages.HTTPException, connection.new_socket)
+        self.assertRaises(messages.HTTPException, connection.new_socket)
+        self.assertEqual(len(self.lookups), 4)
+        connection.close()
+
+    def test_dns_refresh(self):
+        self.client.dns_ttl = 100
+        result = self.client.dnslookup("www.domain1.com", 80)
+        MockTime.now = 86.0
+        # 75% of the TTL has passed, the cached value is returned and
+        # refreshed in the background
+        self.assertTrue(self.client.dnslookup("www.domain1.com", 80) is
+                        result)
+        for i in range3(100):
+            if self.client.pool_stats()['dns_refreshes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.lookups), 2)
+        result = self.client.dnslookup("www.domain1.com", 80)
+        self.assertEqual(result[0][4], ('192.0.2.2', 80))
+        self.assertEqual(len(self.lookups), 2)
+
+
 class ClientTests(unittest.TestCase):
 
     def setUp(self):        # noqa
@@ -438,6 +605,29 @@ class ClientTests(unittest.TestCase):
             sock.mock_shutdown(socket.SHUT_RDWR)
             break
 
+    def run_domain10(self, sock):
+        while True:
+            # simulates a server that compresses content
+            req = sock.recv_request()
+            if req is None:
+                break
+            accept = req.get_accept_encoding()
+            if req.request_uri == "/gzip":
+                coding, wbits = "gzip", 31
+            elif req.request_uri == "/raw":
+                coding, wbits = "deflate", -15
+            else:
+                coding, wbits = "deflate", 15
+            if accept is None or accept.select_token([coding]) is None:
+                response = messages.Response(req, entity_body=TEST_STRING)
+            else:
+                c = zlib.compressobj(6, zlib.DEFLATED, wbits)
+                response = messages.Response(
+                    req, entity_body=c.compress(TEST_STRING) + c.flush())
+                response.set_content_encoding([coding])
+            response.set_status(200)
+            sock.send_response(response)
+
     def run_manager(self, host, port, sock):
         # read some data from sock, and post a response
         logging.debug('run_manager: %s, %i' % (host, port))
@@ -461,6 +651,8 @@ class ClientTests(unittest.TestCase):
             self.run_domain8(sock)
         elif host == "www.domain9.com" and port == 80:
             self.run_domain9(sock)
+        elif host == "www.domain10.com" and port == 80:
+            self.run_domain10(sock)
         else:
             # connection error
             raise ValueError("run_manager: bad host in connect")
@@ -802,6 +994,34 @@ class ClientTests(unittest.TestCase):
             t = threads.pop()
             t.join()
 
+    def test_content_decoding(self):
+        for path in ("/gzip", "/deflate", "/raw"):
+            request = http.ClientRequest("http://www.domain10.com" + path)
+            self.client.process_request(request)
+            self.assertTrue(request.status == 200)
+            self.assertTrue(request.res_body == TEST_STRING, path)
+            self.assertTrue(request.response.get_content_encoding() == [])
+            self.assertTrue(len(request.response.decoded_codings) == 1)
+        # streamed response
+        buff = io.BytesIO()
+        request = http.ClientRequest("http://www.domain10.com/gzip",
+                                     res_body=buff)
+        self.client.process_request(request)
+        self.assertTrue(buff.getvalue() == TEST_STRING)
+        # an explicit Accept-Encoding disables decoding
+        request = http.ClientRequest("http://www.domain10.com/gzip")
+        request.set_accept_encoding("gzip")
+        self.client.process_request(request)
+        self.assertTrue(request.status == 200)
+        self.assertFalse(request.res_body == TEST_STRING)
+        self.assertTrue(request.response.get_content_encoding() == ["gzip"])
+        # and so does setting accept_encoding to None
+        self.client.accept_encoding = None
+        request = http.ClientRequest("http://www.domain10.com/gzip")
+        self.client.process_request(request)
+        self.assertTrue(request.res_body == TEST_STRING)
+        self.assertTrue(request.response.decoded_codings == [])
+
     def upgrade_request(self, request):
         self.client.process_request(request)
 
@@ -926,6 +1146,320 @@ class LegacyServerTests(unittest.TestCase):
         self.assertTrue(request.response.status == 204)
 
 
+class LocalPoolTests(unittest.TestCase):
+
+    def setUp(self):        # noqa
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('localhost', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.server_context = None
+        self.accepted = []
+        self.client = http.Client()
+
+    def tearDown(self):     # noqa
+        self.client.close()
+        self.server.close()
+        for s in self.accepted:
+            s.close()
+
+    def run_server(self, n):
+        for i in range3(n):
+            s, addr = self.server.accept()
+            if self.server_context is not None:
+                s = self.server_context.wrap_socket(s, server_side=True)
+            self.accepted.append(s)
+
+    def prewarm(self, url, n=1):
+        t = threading.Thread(target=self.run_server, args=(n, ))
+        t.start()
+        result = self.client.prewarm(url, n)
+        t.join()
+        return result
+
+    def test_prewarm(self):
+        url = "http://localhost:%i/" % self.port
+        self.assertEqual(self.prewarm(url, 2), 2)
+        self.assertEqual(len(self.accepted), 2)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['prewarmed'], 2)
+        self.assertEqual(stats['idle'], 2)
+        # already warm
+        self.assertEqual(self.client.prewarm(url, 2), 0)
+        # a request uses a warm connection
+        request = http.ClientRequest(url)
+        self.client.queue_request(request, timeout=0)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['idle_hits'], 1)
+        self.assertEqual(stats['new_connections'], 2)
+        self.assertEqual(stats['active'], 1)
+
+    def test_keep_warm(self):
+        url = "http://localhost:%i/" % self.port
+        self.prewarm(url, 2)
+        self.client.keep_warm(url, 1)
+        for connection in dict_values(self.client.cIdleList):
+            connection.last_active = 0
+        self.client.idle_cleanup(10)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['kept_warm'], 1)
+        self.assertEqual(stats['expired'], 1)
+        # now the server hangs up
+        for s in self.accepted:
+            s.close()
+        self.accepted = []
+        connection = list(dict_values(self.client.cIdleList))[0]
+        for i in range3(100):
+            if not connection.probe():
+                break
+            time.sleep(0.01)
+        self.client.idle_cleanup(10)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['idle'], 0)
+        self.assertEqual(stats['probe_failures'], 1)
+        self.client.keep_warm(url, 0)
+        self.assertEqual(self.client.warm_targets, {})
+
+    def test_tls_resume(self):
+        if not hasattr(ssl, 'SSLSession'):
+            logging.warning("Skipping TLS session test (ssl.SSLSession)")
+            return
+        self.server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.server_context.maximum_version = ssl.TLSVersion.TLSv1_2
+        self.server_context.load_cert_chain(
+            os.path.join(TEST_DATA_DIR, 'server.crt'),
+            os.path.join(TEST_DATA_DIR, 'server.key'))
+        url = "https://localhost:%i/" % self.port
+        self.assertEqual(self.prewarm(url), 1)
+        self.assertTrue(
+            ("localhost", self.port, None) in self.client.tls_sessions)
+        self.client.idle_cleanup(0)
+        self.assertEqual(self.prewarm(url), 1)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['tls_handshakes'], 2)
+        self.assertEqual(stats['tls_resumed'], 1)
+        connection = list(dict_values(self.client.cIdleList))[0]
+        self.assertTrue(connection.probe())
+        # a session is not offered to a connection using another
+        # context (which would raise ValueError)
+        self.client.idle_cleanup(0)
+        ca_certs = os.path.join(TEST_DATA_DIR, 'server.crt')
+        self.client.ca_certs = ca_certs
+        self.assertEqual(self.prewarm(url), 1)
+        stats = self.client.pool_stats()
+        self.assertEqual(stats['tls_handshakes'], 3)
+        self.assertEqual(stats['tls_resumed'], 1)
+        self.assertTrue(
+            ("localhost", self.port, ca_certs) in self.client.tls_sessions)
+
+
+class PipelineTests(unittest.TestCase):
+
+    def setUp(self):        # noqa
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('localhost', 0))
+        self.server.listen(5)
+        self.server.settimeout(0.1)
+        self.port = self.server.getsockname()[1]
+        self.stop = threading.Event()
+        self.close_after = 0
+        self.connections = 0
+        self.responses = 0
+        self.delay = 0
+        # (method, event) pairs in the order the server saw them
+        self.log = []
+        self.server_thread = threading.Thread(target=self.run_server)
+        self.server_thread.start()
+
+    def tearDown(self):     # noqa
+        self.stop.set()
+        self.server_thread.join()
+        self.server.close()
+
+    def run_server(self):
+        while not self.stop.is_set():
+            try:
+                s, addr = self.server.accept()
+            except socket.timeout:
+                continue
+            self.connections += 1
+            t = threading.Thread(target=self.run_connection, args=(s, ))
+            t.daemon = True
+            t.start()
+
+    def run_connection(self, s):
+        s.settimeout(10)
+        data = b''
+        n = 0
+        try:
+            while True:
+                while b'\r\n\r\n' not in data:
+                    new_data = s.recv(4096)
+                    if not new_data:
+                        return
+                    data += new_data
+                head, data = data.split(b'\r\n\r\n', 1)
+                method = head.split(b' ', 1)[0]
+                self.log.append((method, 'request'))
+                if self.delay:
+                    time.sleep(self.delay)
+                self.responses += 1
+                n += 1
+                if n == self.close_after:
+                    # give the client time to pipeline more requests
+                    time.sleep(0.2)
+                    s.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n"
+                              b"Connection: close\r\n\r\nok")
+                    return
+                s.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                self.log.append((method, 'response'))
+        except IOError:
+            pass
+        finally:
+            s.close()
+
+    def run_requests(self, client, n):
+        requests = []
+        for i in range3(n):
+            request = http.ClientRequest(
+                "http://localhost:%i/%i" % (self.port, i))
+            client.queue_request(request)
+            requests.append(request)
+        client.thread_loop(timeout=5)
+        for request in requests:
+            self.assertEqual(request.status, 200)
+            self.assertEqual(request.res_body, b"ok")
+        return requests
+
+    def test_spread(self):
+        client = http.Client(max_target_connections=3, max_pipeline=2)
+        try:
+            self.run_requests(client, 6)
+            stats = client.pool_stats()
+            self.assertEqual(stats['new_connections'], 3)
+            self.assertEqual(stats['active_hits'], 3)
+            self.assertEqual(self.connections, 3)
+            tstats = client.target_stats()[
+                "http://localhost:%i" % self.port]
+            self.assertEqual(tstats['requests'], 6)
+            self.assertEqual(tstats['responses'], 6)
+            self.assertEqual(tstats['drops'], 0)
+            self.assertTrue(tstats['mean_latency'] > 0)
+            self.assertTrue(tstats['throughput'] > 0)
+            # the connections are returned to the idle pool, the next
+            # burst reuses them
+            self.run_requests(client, 6)
+            self.assertEqual(self.connections, 3)
+        finally:
+            client.close()
+
+    def test_single(self):
+        # by default, one connection per thread and target
+        client = http.Client()
+        try:
+            self.run_requests(client, 6)
+            self.assertEqual(self.connections, 1)
+            self.assertEqual(client.pool_stats()['active_hits'], 5)
+        finally:
+            client.close()
+
+    def test_drop(self):
+        # the server hangs up after two responses, the pipelined
+        # requests are resent and pipelining is turned off
+        self.close_after = 2
+        client = http.Client()
+        try:
+            self.run_requests(client, 4)
+            tstats = client.target_stats()[
+                "http://localhost:%i" % self.port]
+            self.assertEqual(tstats['drops'], 1)
+            self.assertEqual(tstats['pipeline_depth'], 1)
+            self.assertEqual(tstats['responses'], 4)
+            self.assertTrue(self.connections >= 2)
+        finally:
+            client.close()
+
+    def test_ordering(self):
+        # a PUT is not sent until the thread's earlier GETs are done,
+        # even though another connection is available
+        self.delay = 0.2
+        client = http.Client(max_target_connections=3, max_pipeline=1)
+        try:
+            requests = []
+            for method, body in (("GET", None), ("GET", None), ("PUT", b'')):
+                request = http.ClientRequest(
+                    "http://localhost:%i/resource" % self.port,
+                    method=method, entity_body=body)
+                client.queue_request(request)
+                requests.append(request)
+            client.thread_loop(timeout=5)
+            for request in requests:
+                self.assertEqual(request.status, 200)
+            # the GETs were spread over two connections
+            self.assertEqual(self.connections, 2)
+            put = self.log.index((b'PUT', 'request'))
+            self.assertEqual(
+                [e for e in self.log[:put] if e[0] == b'GET'],
+                [(b'GET', 'request')] * 2 + [(b'GET', 'response')] * 2)
+        finally:
+            client.close()
+
+    def test_adapt(self):
+        tstats = http.ClientTargetStats(4, adaptive=True)
+        tstats.record_request(0.0)
+        tstats.record_drop()
+        self.assertEqual(tstats.pipeline_depth, 1)
+        for i in range3(tstats.INCREASE_AFTER * 3):
+            tstats.record_response(0.1, 1.0 + i)
+        self.assertEqual(tstats.pipeline_depth, 4)
+        # responses slow down
+        tstats.record_response(1.0, 100.0)
+        self.assertEqual(tstats.pipeline_depth, 3)
+        tstats.record_response(1.0, 101.0)
+        self.assertEqual(tstats.pipeline_depth, 2)
+        snapshot = tstats.snapshot()
+        self.assertEqual(snapshot['responses'], tstats.INCREASE_AFTER * 3 + 2)
+        self.assertEqual(snapshot['max_latency'], 1.0)
+        self.assertEqual(snapshot['min_latency'], 0.1)
+        # not adaptive, latency is ignored
+        tstats = http.ClientTargetStats(4)
+        tstats.record_response(0.1, 1.0)
+        tstats.record_response(10.0, 2.0)
+        self.assertEqual(tstats.pipeline_depth, 4)
+
+    def test_adapt_recover(self):
+        # a target that becomes slower for good is eventually treated
+        # as normal again
+        tstats = http.ClientTargetStats(4, adaptive=True)
+        for i in range3(tstats.INCREASE_AFTER):
+            tstats.record_response(0.1, 1.0 + i)
+        self.assertEqual(tstats.min_latency, 0.1)
+        for i in range3(tstats.MIN_WINDOW * 2):
+            tstats.record_response(1.0, 100.0 + i)
+        self.assertTrue(tstats.min_latency > 0.5)
+        self.assertTrue(tstats.pipeline_depth > 1)
+
+    def test_prune_stats(self):
+        client = http.Client(max_connections=2)
+        try:
+            targets = [("http", "host%i.example.com" % i, 80)
+                       for i in range3(5)]
+            for target in targets:
+                client.get_target_stats(target)
+            # there are no connections, after five targets the oldest
+            # statistics are discarded
+            self.assertEqual(len(client.cTargetStats), 2)
+            self.assertEqual(list(client.cTargetStats), targets[3:])
+            # using a target moves it to the most recently used end
+            tstats = client.get_target_stats(targets[3])
+            self.assertEqual(list(client.cTargetStats),
+                             [targets[4], targets[3]])
+            self.assertTrue(client.get_target_stats(targets[3]) is tstats)
+        finally:
+            client.close()
+
+
 class SecureTests(unittest.TestCase):
 
     def setUp(self):        # noqa
@@ -1,7 +1,8 @@
 #! /usr/bin/env python
 
-import unittest
 import logging
+import random
+import unittest
 
 from pyslet.py2 import range3, byte, join_bytes
 from pyslet.http.grammar import *       # noqa
@@ -183,6 +184,87 @@ class GenericParserTests(unittest.TestCase):
                            'Zoo': ('Zoo', b';A="Three"')},
             "Paremters: %s" % repr(parameters))
 
+    def reference_words(self, source, ignore_sp=True):
+        # a byte-by-byte implementation of the word parser
+        words = []
+        src_pos = []
+        p = OctetParser(source)
+        while p.the_char is not None:
+            sp = False
+            pos = p.pos
+            while True:
+                lws_pos = p.pos
+                if p.parse(CRLF) and p.the_char not in (SP, HT):
+                    p.setpos(lws_pos)
+                    break
+                if p.the_char not in (SP, HT):
+                    p.setpos(lws_pos)
+                    break
+                while p.the_char in (SP, HT):
+                    p.next_char()
+                sp = not ignore_sp
+            if sp:
+                words.append(SP)
+                src_pos.append(pos)
+                pos = p.pos
+            if p.the_char is None:
+                break
+            elif p.the_char == LEFT_PARENTHESIS:
+                words.append(p.parse_comment(True))
+            elif p.the_char == DQUOTE:
+                qs = [b'"']
+                p.next_char()
+                while p.the_char is not None:
+                    if p.parse(b'"'):
+                        qs.append(b'"')
+                        break
+                    elif p.match(b"\\"):
+                        qs.append(p.require_production(p.parse_quoted_pair()))
+                    else:
+                        qs.append(p.require_production(p.parse_qdtext(True)))
+                words.append(b''.join(qs))
+            elif is_separator(p.the_char):
+                words.append(p.the_char)
+                p.next_char()
+            else:
+                token = []
+                while not (p.the_char is None or is_ctl(p.the_char) or
+                           is_separator(p.the_char)):
+                    token.append(p.the_char)
+                    p.next_char()
+                if not token:
+                    p.parser_error("TEXT")
+                words.append(join_bytes(token))
+            src_pos.append(pos)
+        return words, src_pos
+
+    def test_word_parser(self):
+        samples = [
+            b'text/html; charset="utf-8"',
+            b'gzip;q=1.0, identity; q=0.5, *;q=0',
+            b'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_2) Safari/537.36',
+            b'max-age=0, private="Set-Cookie, \\"X\\""',
+            b'a,\r\n\tb , "folded\r\n string"',
+            b'caf\xe9 "\xe9t\xe9"',
+            b'x (nested (comment) \\) ok) y']
+        alphabet = b'abc;=,/ \t\r\n"\\()\x00\x7f\xe9'
+        for i in range3(500):
+            samples.append(join_bytes(
+                byte(random.choice(alphabet)) for j in range3(12)))
+        for src in samples:
+            for ignore_sp in (True, False):
+                try:
+                    result = self.reference_words(src, ignore_sp)
+                except ValueError:
+                    result = None
+                try:
+                    p = WordParser(src, ignore_sp)
+                    fast_result = p.words, p.src_pos
+                except ValueError:
+                    fast_result = None
+                self.assertTrue(result == fast_result,
+                                "%s: %s" % (repr(src), repr(fast_result)))
+
     def test_crlf(self):
         try:
             p = WordParser('"\\\r\n"')
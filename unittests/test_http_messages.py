@@ -4,6 +4,7 @@ import io
 import logging
 import random
 import unittest
+import zlib
 
 import pyslet.http.grammar as grammar
 import pyslet.http.params as params
@@ -177,6 +178,44 @@ class MessageTests(unittest.TestCase):
         self.assertTrue(srcbody.getvalue() == dstbody.getvalue())
         self.assertTrue(srcbody.getvalue() != zchunked.getvalue())
 
+    def test_content_coders(self):
+        data = b"The quick brown fox jumped over the lazy dog" * 100
+        for ecls, dcls in ((GzipEncoder, GzipDecoder),
+                           (DeflateEncoder, DeflateDecoder)):
+            src = ecls(io.BytesIO(data), level=9)
+            zdata = []
+            while True:
+                # deliberately small reads to test buffering
+                zchunk = src.read(7)
+                if not zchunk:
+                    break
+                zdata.append(zchunk)
+            zdata = b''.join(zdata)
+            self.assertTrue(len(zdata) < len(data))
+            dst = io.BytesIO()
+            dec = dcls(dst)
+            for i in range(0, len(zdata), 5):
+                dec.write(zdata[i:i + 5])
+            dec.flush()
+            self.assertTrue(dst.getvalue() == data, ecls.__name__)
+        self.assertTrue(CONTENT_DECODERS['gzip'] is GzipDecoder)
+        self.assertTrue(CONTENT_DECODERS['deflate'] is DeflateDecoder)
+        # raw deflate data is tolerated by the deflate decoder
+        c = zlib.compressobj(6, zlib.DEFLATED, -15)
+        zdata = c.compress(data) + c.flush()
+        dst = io.BytesIO()
+        dec = DeflateDecoder(dst)
+        dec.write(zdata)
+        dec.flush()
+        self.assertTrue(dst.getvalue() == data)
+        # but corrupt data is a protocol error
+        dec = GzipDecoder(io.BytesIO())
+        try:
+            dec.write(b"Not gzipped")
+            self.fail("GzipDecoder with bad data")
+        except ProtocolError:
+            pass
+
     def test_multipart(self):
         """RFC 2616:
 
@@ -256,6 +295,42 @@ class MessageTests(unittest.TestCase):
         self.assertTrue(response.get_header("X-test").strip() ==
                         b"hello, good-bye")
 
+    def test_parsed_header_cache(self):
+        request = Request()
+        self.assertTrue(request.get_content_type() is None)
+        request.set_header("Content-Type", "text/plain")
+        mtype = request.get_content_type()
+        self.assertTrue(str(mtype) == "text/plain")
+        # the parsed value is cached...
+        self.assertTrue(request.get_content_type() is mtype)
+        # ...until the header is changed
+        request.set_header("Content-Type", "text/html")
+        self.assertTrue(str(request.get_content_type()) == "text/html")
+        request.set_header("Content-Type", None)
+        self.assertTrue(request.get_content_type() is None)
+        # mutable results are copied
+        request.set_header("Connection", "close")
+        tokens = request.get_connection()
+        tokens.add("keep-alive")
+        self.assertTrue(request.get_connection() == set(["close"]))
+        request.set_header("Connection", "upgrade", True)
+        self.assertTrue(request.get_connection() == set(["close", "upgrade"]))
+        request.set_header("Content-Encoding", "gzip")
+        codings = request.get_content_encoding()
+        codings.append("deflate")
+        self.assertTrue(request.get_content_encoding() == ["gzip"])
+        request.set_header("Content-Length", "123")
+        self.assertTrue(request.get_content_length() == 123)
+        request.set_content_length(456)
+        self.assertTrue(request.get_content_length() == 456)
+        request.set_accept_encoding("gzip")
+        self.assertTrue(
+            request.get_accept_encoding().select_token(["gzip"]) == "gzip")
+        # the cache is cleared when we start receiving
+        request.start_receiving()
+        self.assertTrue(request.get_content_length() is None)
+        self.assertTrue(request.get_accept_encoding() is None)
+
     def test_message_body_req(self):
         """RFC2616:
 
@@ -1363,6 +1438,20 @@ class HeaderTests(unittest.TestCase):
         self.assertTrue(
             str(cc) == "no-transform, ext=token, ext2=\"token=4\"",
             "Token and Quoted string")
+        cc = CacheControl.from_str(
+            ' no-store , max-age = 60, private="x, y,z",ext2="token=4"')
+        self.assertTrue(len(cc) == 4)
+        self.assertTrue(cc["max-age"] == "60")
+        self.assertTrue(cc["private"] == ("x", "y", "z"))
+        self.assertTrue(cc["ext2"] == "token=4")
+        self.assertTrue(
+            str(cc) == 'no-store, max-age=60, private="x, y, z", '
+            'ext2="token=4"', str(cc))
+        try:
+            CacheControl.from_str("  ")
+            self.fail("Cache-Control requires at least one directive")
+        except grammar.BadSyntax:
+            pass
 
     def test_content_range(self):
         cr = ContentRange()
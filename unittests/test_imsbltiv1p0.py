@@ -513,6 +513,84 @@ class LTIProviderTests(unittest.TestCase):
         self.assertTrue(provider.validate_timestamp_and_nonce(
             consumer.key, 0, '9e4a4b085c8c46d6aae6b5d9c8a15418', None))
 
+    def test_consumer_cache(self):
+        with self.silo['Consumers'].open() as collection:
+            consumer = lti.ToolConsumer.new_from_values(
+                collection.new_entity(), self.cipher, 'default', key="12345",
+                secret=ul("secret"))
+            collection.insert_entity(consumer.entity)
+        provider = lti.ToolProvider(
+            self.container['Consumers'], self.container['Nonces'],
+            self.cipher)
+        consumer = provider.lookup_consumer('12345')
+        self.assertTrue(provider.consumer_misses == 1)
+        self.assertTrue(provider.lookup_consumer('12345') is consumer)
+        self.assertTrue(provider.consumer_hits == 1)
+        # an update through a different instance invalidates the cache
+        with self.container['Consumers'].open() as collection:
+            consumer2 = lti.ToolConsumer(
+                collection[consumer.entity.key()], self.cipher)
+        consumer2.update_from_values('updated', ul('password'))
+        consumer = provider.lookup_consumer('12345')
+        self.assertTrue(provider.consumer_misses == 2)
+        self.assertTrue(consumer.secret == 'password')
+        # cached consumers expire
+        self.assertTrue(provider.lookup_consumer('12345') is consumer)
+        self.mock_time.tick(provider.CONSUMER_TTL + 1)
+        self.assertFalse(provider.lookup_consumer('12345') is consumer)
+        self.assertTrue(provider.consumer_misses == 3)
+        provider.invalidate_consumer('12345')
+        provider.lookup_consumer('12345')
+        self.assertTrue(provider.consumer_misses == 4)
+
+    def test_prune_nonces(self):
+        provider = lti.ToolProvider(
+            self.container['Consumers'], self.container['Nonces'],
+            self.cipher)
+        for i in range3(10):
+            self.assertTrue(provider.validate_timestamp_and_nonce(
+                '12345', 0, 'nonce%i' % i, None))
+            self.mock_time.tick(60)
+        with self.container['Nonces'].open() as collection:
+            self.assertTrue(len(collection) == 10)
+        # nothing to prune yet
+        self.assertTrue(provider.prune_nonces() == 0)
+        # move on so that the first 5 nonces are over 90 mins old
+        self.mock_time.tick(85 * 60)
+        self.assertTrue(provider.prune_nonces() == 5)
+        with self.container['Nonces'].open() as collection:
+            self.assertTrue(len(collection) == 5)
+        # pruning also happens during validation
+        self.mock_time.tick(provider.NONCE_PRUNE_INTERVAL)
+        self.assertTrue(provider.validate_timestamp_and_nonce(
+            '12345', 0, 'nonce10', None))
+        with self.container['Nonces'].open() as collection:
+            self.assertTrue(len(collection) == 1)
+
+    def test_prune_failure(self):
+        provider = lti.ToolProvider(
+            self.container['Consumers'], self.container['Nonces'],
+            self.cipher)
+        calls = []
+
+        def broken_delete(now):
+            calls.append(now)
+            raise ValueError("prune failed")
+
+        provider._delete_nonces = broken_delete
+        # a failed prune is logged, the nonce is still checked
+        self.assertTrue(provider.validate_timestamp_and_nonce(
+            '12345', 0, 'nonce0', None))
+        self.assertTrue(len(calls) == 1)
+        self.assertFalse(provider.validate_timestamp_and_nonce(
+            '12345', 0, 'nonce0', None))
+        # and the next prune is not attempted until the interval passes
+        self.assertTrue(len(calls) == 1)
+        self.mock_time.tick(provider.NONCE_PRUNE_INTERVAL)
+        self.assertTrue(provider.validate_timestamp_and_nonce(
+            '12345', 0, 'nonce1', None))
+        self.assertTrue(len(calls) == 2)
+
     def test_launch(self):
         command = "POST"
         url = "http://www.example.com/launch"
@@ -1,5 +1,6 @@
 #! /usr/bin/env python
 
+import json
 import logging
 import os
 import time
@@ -24,6 +25,8 @@ from pyslet.qtiv2 import (
     tests,
     variables,
     xml as qtixml)
+from pyslet.odata2 import metadata as edmx
+from pyslet.odata2.memds import InMemoryEntityContainer
 from pyslet.xml import namespace as xmlns
 
 
@@ -34,6 +37,7 @@ def suite():
         unittest.makeSuite(QTIElementTests, 'test'),
         unittest.makeSuite(VariableTests, 'test'),
         unittest.makeSuite(ResponseProcessingTests, 'test'),
+        unittest.makeSuite(CompiledProcessingTests, 'test'),
         unittest.makeSuite(TemplateProcessingTests, 'test'),
         unittest.makeSuite(ExpressionTests, 'test'),
         unittest.makeSuite(BasicAssessmentTests, 'test'),
@@ -880,6 +884,68 @@ class VariableTests(unittest.TestCase):
         value = session_state['RESPONSE']
         self.assertTrue(value.value == "B", "RESPONSE keeps its value")
 
+    def test_item_snapshot(self):
+        sample = b"""<?xml version="1.0" encoding="UTF-8"?>
+<assessmentItem xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1"
+    identifier="TestCase" title="Test Case" adaptive="false"
+    timeDependent="false">
+    <responseDeclaration identifier="R1" cardinality="multiple"
+        baseType="directedPair">
+        <correctResponse>
+            <value>A B</value>
+            <value>C D</value>
+        </correctResponse>
+    </responseDeclaration>
+    <responseDeclaration identifier="R2" cardinality="ordered"
+        baseType="point"/>
+    <responseDeclaration identifier="R3" cardinality="single"
+        baseType="uri"/>
+    <outcomeDeclaration identifier="SCORE" cardinality="single"
+        baseType="float">
+        <defaultValue>
+            <value>0.5</value>
+        </defaultValue>
+    </outcomeDeclaration>
+    <outcomeDeclaration identifier="REC" cardinality="record"/>
+</assessmentItem>"""
+        doc = qtixml.QTIDocument()
+        doc.read(src=BytesIO(sample))
+        state = variables.ItemSessionState(doc.root)
+        state.begin_session()
+        state.begin_attempt()
+        state['R1'].set_value([("A", "B"), ("A", "B"), ("B", "C")])
+        state['R2'].set_value([(1, 2), (3, 4)])
+        state['R3'].set_value("http://www.example.com/")
+        state['SCORE'].set_value(-1.0 / 3)
+        state['REC'].set_value({
+            'x': variables.IntegerValue(3),
+            'y': variables.PairValue(('B', 'A'))})
+        state.map['R2.SAVED'] = variables.Value.copy_value(state['R2'])
+        # the snapshot must survive a round trip through JSON
+        snapshot = json.loads(json.dumps(state.get_snapshot()))
+        new_state = variables.ItemSessionState(doc.root)
+        new_state.set_snapshot(snapshot)
+        self.assertEqual(sorted(new_state), sorted(state))
+        for name in state:
+            v = state[name]
+            new_v = new_state[name]
+            self.assertTrue(new_v.__class__ is v.__class__, name)
+            self.assertEqual(new_v.baseType, v.baseType, name)
+            if name == 'REC':
+                self.assertEqual(sorted(new_v.value), ['x', 'y'])
+                self.assertEqual(new_v['x'].value, 3)
+                self.assertTrue(isinstance(new_v['y'], variables.PairValue))
+                self.assertEqual(new_v['y'].value, ('A', 'B'))
+            else:
+                self.assertEqual(new_v.value, v.value, name)
+        self.assertEqual(new_state['R1'].value, {('A', 'B'): 2, ('B', 'C'): 1})
+        self.assertEqual(new_state['SCORE'].value, -1.0 / 3)
+        # SAVED values not in the snapshot are removed
+        new_state.map['R3.SAVED'] = variables.Value.copy_value(state['R3'])
+        new_state.set_snapshot(snapshot)
+        self.assertFalse('R3.SAVED' in new_state)
+        self.assertTrue('R2.SAVED' in new_state)
+
     def test_test_session(self):
         sample = b"""<?xml version="1.0" encoding="UTF-8"?>
 <assessmentTest xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1"
@@ -1091,6 +1157,291 @@ class ResponseProcessingTests(unittest.TestCase):
             pass
 
 
+COMPILE_SAMPLE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<assessmentItem xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1"
+    identifier="CompileCase" title="Compile Case" adaptive="false"
+    timeDependent="false">
+    <responseDeclaration identifier="R1" cardinality="multiple"
+        baseType="identifier">
+        <correctResponse>
+            <value>A</value>
+            <value>B</value>
+        </correctResponse>
+        <mapping defaultValue="0" lowerBound="0">
+            <mapEntry mapKey="A" mappedValue="1"/>
+            <mapEntry mapKey="B" mappedValue="1.5"/>
+            <mapEntry mapKey="C" mappedValue="-1"/>
+        </mapping>
+    </responseDeclaration>
+    <responseDeclaration identifier="R2" cardinality="ordered"
+        baseType="identifier"/>
+    <responseDeclaration identifier="R3" cardinality="single"
+        baseType="integer">
+        <defaultValue>
+            <value>1</value>
+        </defaultValue>
+    </responseDeclaration>
+    <responseDeclaration identifier="R4" cardinality="single"
+        baseType="point">
+        <areaMapping defaultValue="-0.5">
+            <areaMapEntry shape="circle" coords="10,10,5" mappedValue="2"/>
+        </areaMapping>
+    </responseDeclaration>
+    <outcomeDeclaration identifier="SCORE" cardinality="single"
+        baseType="float"/>
+    <outcomeDeclaration identifier="POINT" cardinality="single"
+        baseType="float"/>
+    <outcomeDeclaration identifier="N" cardinality="single"
+        baseType="integer"/>
+    <outcomeDeclaration identifier="FLAG" cardinality="single"
+        baseType="boolean"/>
+    <outcomeDeclaration identifier="RATIO" cardinality="single"
+        baseType="float"/>
+    <outcomeDeclaration identifier="CHOSEN" cardinality="multiple"
+        baseType="identifier"/>
+    <outcomeDeclaration identifier="ORDER" cardinality="ordered"
+        baseType="identifier">
+        <defaultValue>
+            <value>V</value>
+        </defaultValue>
+    </outcomeDeclaration>
+    <responseProcessing>
+        <setOutcomeValue identifier="SCORE">
+            <mapResponse identifier="R1"/>
+        </setOutcomeValue>
+        <setOutcomeValue identifier="POINT">
+            <mapResponsePoint identifier="R4"/>
+        </setOutcomeValue>
+        <responseCondition>
+            <responseIf>
+                <and>
+                    <match>
+                        <variable identifier="R1"/>
+                        <correct identifier="R1"/>
+                    </match>
+                    <member>
+                        <baseValue baseType="identifier">X</baseValue>
+                        <variable identifier="R2"/>
+                    </member>
+                </and>
+                <setOutcomeValue identifier="FLAG">
+                    <baseValue baseType="boolean">true</baseValue>
+                </setOutcomeValue>
+            </responseIf>
+            <responseElseIf>
+                <or>
+                    <isNull>
+                        <variable identifier="R3"/>
+                    </isNull>
+                    <gt>
+                        <variable identifier="R3"/>
+                        <baseValue baseType="integer">10</baseValue>
+                    </gt>
+                </or>
+                <setOutcomeValue identifier="FLAG">
+                    <not>
+                        <isNull>
+                            <variable identifier="R2"/>
+                        </isNull>
+                    </not>
+                </setOutcomeValue>
+            </responseElseIf>
+            <responseElse>
+                <setOutcomeValue identifier="FLAG">
+                    <null/>
+                </setOutcomeValue>
+            </responseElse>
+        </responseCondition>
+        <setOutcomeValue identifier="N">
+            <sum>
+                <containerSize>
+                    <variable identifier="R1"/>
+                </containerSize>
+                <containerSize>
+                    <variable identifier="R2"/>
+                </containerSize>
+                <product>
+                    <variable identifier="R3"/>
+                    <baseValue baseType="integer">2</baseValue>
+                </product>
+            </sum>
+        </setOutcomeValue>
+        <setOutcomeValue identifier="CHOSEN">
+            <multiple>
+                <variable identifier="R1"/>
+                <baseValue baseType="identifier">D</baseValue>
+            </multiple>
+        </setOutcomeValue>
+        <setOutcomeValue identifier="RATIO">
+            <divide>
+                <integerToFloat>
+                    <variable identifier="R3"/>
+                </integerToFloat>
+                <subtract>
+                    <containerSize>
+                        <variable identifier="R2"/>
+                    </containerSize>
+                    <baseValue baseType="integer">3</baseValue>
+                </subtract>
+            </divide>
+        </setOutcomeValue>
+        <responseCondition>
+            <responseIf>
+                <lte>
+                    <variable identifier="SCORE"/>
+                    <baseValue baseType="float">0</baseValue>
+                </lte>
+                <exitResponse/>
+            </responseIf>
+        </responseCondition>
+        <setOutcomeValue identifier="ORDER">
+            <ordered>
+                <baseValue baseType="identifier">W</baseValue>
+                <variable identifier="R2"/>
+            </ordered>
+        </setOutcomeValue>
+    </responseProcessing>
+</assessmentItem>"""
+
+COMPILE_RESPONSES = [
+    {},
+    {'R1': ['A', 'B'], 'R2': ['X', 'Y']},
+    {'R1': ['B', 'A', 'A'], 'R2': ['Y', 'Z', 'X'], 'R3': 4},
+    {'R1': ['C'], 'R2': ['X'], 'R3': None},
+    {'R1': ['A', 'C'], 'R3': 11, 'R4': (12, 9)},
+    {'R1': [], 'R2': [], 'R4': (50, 50)},
+    {'R1': ['A', 'B', 'D'], 'R2': ['X'], 'R3': 0, 'R4': "10 10"}]
+
+
+class CompiledProcessingTests(unittest.TestCase):
+
+    def setUp(self):        # noqa
+        self.doc = qtixml.QTIDocument()
+        self.doc.read(src=BytesIO(COMPILE_SAMPLE))
+        self.item = self.doc.root
+        self.session_state = variables.ItemSessionState(self.item)
+
+    def test_compile(self):
+        compiled = self.item.ResponseProcessing.compile(self.session_state)
+        self.assertTrue(isinstance(compiled,
+                                   processing.CompiledResponseProcessing))
+        for r in COMPILE_RESPONSES:
+            outcomes = compiled(r)
+            self.assertTrue(outcomes == self.session_state.score(r),
+                            "%s: %s" % (repr(r), repr(outcomes)))
+        outcomes = compiled(COMPILE_RESPONSES[2])
+        self.assertTrue(outcomes['SCORE'] == 2.5)
+        self.assertTrue(outcomes['POINT'] == 0.0)
+        self.assertTrue(outcomes['FLAG'] is None)
+        self.assertTrue(outcomes['N'] == 14)
+        self.assertTrue(sorted(outcomes['CHOSEN']) == ['A', 'B', 'D'])
+        self.assertTrue(outcomes['RATIO'] is None)
+        self.assertTrue(outcomes['ORDER'] == ['W', 'Y', 'Z', 'X'])
+        self.assertTrue(compiled(COMPILE_RESPONSES[1])['FLAG'] is True)
+        self.assertTrue(compiled(COMPILE_RESPONSES[4])['POINT'] == 2.0)
+        self.assertTrue(compiled(COMPILE_RESPONSES[5])['POINT'] == -0.5)
+        # exitResponse leaves ORDER at its default
+        outcomes = compiled(COMPILE_RESPONSES[3])
+        self.assertTrue(outcomes['SCORE'] == 0.0)
+        self.assertTrue(outcomes['N'] is None)
+        self.assertTrue(outcomes['ORDER'] == ['V'])
+        # outcomes are not shared between calls
+        outcomes['ORDER'].append('U')
+        self.assertTrue(compiled(COMPILE_RESPONSES[3])['ORDER'] == ['V'])
+        # the session itself is untouched by compiled scoring
+        self.session_state.begin_session()
+        compiled(COMPILE_RESPONSES[1])
+        self.assertTrue(self.session_state['N'].value == 0)
+        # bad responses raise the same errors as the interpreter
+        try:
+            compiled({'R3': 'one'})
+            self.fail("Bad integer response")
+        except ValueError:
+            pass
+
+    def test_fallback(self):
+        # randomInteger can't be compiled, interpreter used instead
+        rule = self.item.ResponseProcessing.add_child(
+            processing.SetOutcomeValue)
+        rule.identifier = 'N'
+        e = rule.add_child(expressions.RandomInteger)
+        e.min = e.max = '7'
+        try:
+            self.item.ResponseProcessing.compile(self.session_state)
+            self.fail("randomInteger compiled")
+        except NotImplementedError:
+            pass
+        scorer = self.session_state.get_scorer()
+        self.assertFalse(isinstance(scorer,
+                                    processing.CompiledResponseProcessing))
+        self.session_state.begin_session()
+        outcomes = scorer(COMPILE_RESPONSES[2])
+        self.assertTrue(outcomes['N'] == 7)
+        self.assertTrue(outcomes['SCORE'] == 2.5)
+        # the session is not used by the fall back
+        self.assertTrue(self.session_state['N'].value == 0)
+        # type errors are detected by the compiler
+        rule.Expression = None
+        e = rule.add_child(expressions.BaseValue)
+        e.baseType = variables.BaseType.identifier
+        e.add_data('seven')
+        try:
+            self.item.ResponseProcessing.compile(self.session_state)
+            self.fail("setOutcomeValue type mismatch compiled")
+        except core.ProcessingError:
+            pass
+
+    def test_templates(self):
+        for name, r, score in (
+                ('match_correct', 'ChoiceB', 1.0),
+                ('match_correct', 'ChoiceA', 0.0),
+                ('match_correct', None, 0.0),
+                ('map_response', 'ChoiceA', 0.5),
+                ('map_response', 'ChoiceB', 2.0),
+                ('map_response', None, 0.0)):
+            doc = qtixml.QTIDocument()
+            doc.read(src=BytesIO(TEMPLATE_SAMPLE % name.encode('ascii')))
+            state = variables.ItemSessionState(doc.root)
+            compiled = doc.root.ResponseProcessing.compile(state)
+            self.assertTrue(compiled({'RESPONSE': r}) ==
+                            {'SCORE': score})
+            self.assertTrue(state.score({'RESPONSE': r}) ==
+                            {'SCORE': score}, "%s: %s" % (name, r))
+        doc = qtixml.QTIDocument()
+        doc.read(src=BytesIO(TEMPLATE_SAMPLE % b"unknown"))
+        self.assertTrue(doc.root.ResponseProcessing.get_rules() == [])
+
+    def test_score_responses(self):
+        expected = [self.session_state.score(r) for r in COMPILE_RESPONSES]
+        for compiled in (True, False):
+            result = list(self.session_state.score_responses(
+                COMPILE_RESPONSES, compiled=compiled))
+            self.assertTrue(result == expected)
+        result = list(self.session_state.score_responses(
+            COMPILE_RESPONSES * 10, processes=2, chunksize=4))
+        self.assertTrue(result == expected * 10)
+
+
+TEMPLATE_SAMPLE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<assessmentItem xmlns="http://www.imsglobal.org/xsd/imsqti_v2p1"
+    identifier="TemplateCase" title="Template Case" adaptive="false"
+    timeDependent="false">
+    <responseDeclaration identifier="RESPONSE" cardinality="single"
+        baseType="identifier">
+        <correctResponse>
+            <value>ChoiceB</value>
+        </correctResponse>
+        <mapping defaultValue="0">
+            <mapEntry mapKey="ChoiceA" mappedValue="0.5"/>
+            <mapEntry mapKey="ChoiceB" mappedValue="2"/>
+        </mapping>
+    </responseDeclaration>
+    <outcomeDeclaration identifier="SCORE" cardinality="single"
+        baseType="float"/>
+    <responseProcessing template=
+        "http://www.imsglobal.org/question/qti_v2p1/rptemplates/%s"/>
+</assessmentItem>"""
+
 class TemplateProcessingTests(unittest.TestCase):
 
     def setUp(self):        # noqa
@@ -3667,6 +4018,129 @@ class BasicAssessmentTests(unittest.TestCase):
         for key in state:
             logging.debug("%s: %s", key, repr(state[key].value))
 
+    def test_snapshot(self):
+        doc = qtixml.QTIDocument(baseURI="basic/linearIndividualPart.xml")
+        doc.read()
+        form = tests.TestForm(doc.root)
+        state = variables.TestSessionState(form)
+        first_key = state.key
+        state.begin_session(state.key)
+        time.time.elapse(1.1)
+        state.handle_event({"SAVE": state.key, "Q1.RESPONSE": "C"})
+        snapshot = json.loads(json.dumps(state.get_snapshot()))
+        new_state = variables.TestSessionState.from_snapshot(
+            doc.root, snapshot)
+        self.assertEqual(new_state.form.components, form.components)
+        self.assertEqual(new_state.salt, state.salt)
+        self.assertEqual(new_state.key, state.key)
+        self.assertEqual(new_state.prevKey, state.prevKey)
+        self.assertEqual(list(new_state.keyMap), list(state.keyMap))
+        self.assertEqual(new_state.t, state.t)
+        self.assertEqual(sorted(new_state), sorted(state))
+        for name in state:
+            self.assertEqual(new_state[name].value, state[name].value, name)
+        self.assertEqual(new_state["Q1.RESPONSE.SAVED"].value, "C")
+        self.assertEqual(
+            new_state.get_current_question().identifier, "Q1")
+        try:
+            new_state.handle_event({"SUBMIT": first_key})
+            self.fail("Expired key accepted by restored session")
+        except variables.SessionKeyExpired:
+            pass
+        # the restored session can be continued in the same way
+        time.time.elapse(1.1)
+        for s in (state, new_state):
+            s.handle_event({"SUBMIT": s.key, "Q1.RESPONSE": "D"})
+        self.assertEqual(new_state.key, state.key)
+        self.assertFalse("Q1.RESPONSE.SAVED" in new_state)
+        self.assertEqual(new_state["Q1.RESPONSE"].value, "D")
+        self.assertEqual(new_state["Q1.duration"].value,
+                         state["Q1.duration"].value)
+        self.assertEqual(new_state.get_current_question().identifier, "Q2")
+        # snapshots only restore into the matching form
+        snapshot['form'] = list(reversed(snapshot['form']))
+        self.assertRaises(ValueError, new_state.set_snapshot, snapshot)
+
+    def test_max_keys(self):
+        doc = qtixml.QTIDocument(baseURI="basic/linearIndividualPart.xml")
+        doc.read()
+        state = variables.TestSessionState(tests.TestForm(doc.root),
+                                           max_keys=2)
+        keys = [state.key]
+        state.begin_session(state.key)
+        for i in range3(3):
+            keys.append(state.key)
+            time.time.elapse(1.1)
+            state.handle_event({"SAVE": state.key, "Q1.RESPONSE": "C"})
+        self.assertEqual(list(state.keyMap), keys[-2:])
+        self.assertRaises(variables.SessionKeyExpired, state.handle_event,
+                          {"SAVE": keys[-1]})
+        self.assertRaises(variables.SessionKeyMismatch, state.handle_event,
+                          {"SAVE": keys[0]})
+        snapshot = state.get_snapshot()
+        self.assertEqual(snapshot['keys'], keys[-2:])
+        new_state = variables.TestSessionState.from_snapshot(
+            doc.root, snapshot, max_keys=1)
+        self.assertEqual(list(new_state.keyMap), keys[-1:])
+
+    def test_session_store(self):
+        doc = qtixml.QTIDocument(baseURI="basic/linearIndividualPart.xml")
+        doc.read()
+        store = variables.MemorySessionStore(doc.root, max_live=2)
+        sessions = {}
+        for sid in ("s1", "s2", "s3"):
+            sessions[sid] = state = store.new_session(sid)
+            state.begin_session(state.key)
+        self.assertEqual(len(store), 2)
+        # s1 has been evicted
+        self.assertEqual(sorted(store._snapshots), ["s1"])
+        state = store.get("s1")
+        self.assertFalse(state is sessions["s1"])
+        self.assertEqual(state.key, sessions["s1"].key)
+        self.assertEqual(state.get_current_question().identifier, "Q1")
+        self.assertEqual(sorted(store._snapshots), ["s1", "s2"])
+        self.assertTrue(store.get("s3") is sessions["s3"])
+        time.time.elapse(1.1)
+        state.handle_event({"SUBMIT": state.key, "Q1.RESPONSE": "D"})
+        store.put("s1", state)
+        store.get("s2")
+        # s3 is evicted, s1 is the most recently used
+        self.assertTrue(store.get("s1") is state)
+        store.delete("s1")
+        self.assertRaises(KeyError, store.get, "s1")
+        self.assertRaises(KeyError, store.delete, "s1")
+        store.flush()
+        self.assertEqual(sorted(store._snapshots), ["s2", "s3"])
+        state = store.get("s2")
+        self.assertEqual(state.key, sessions["s2"].key)
+        self.assertTrue(len(store._snapshots["s2"]) < 1024)
+
+    def test_entity_session_store(self):
+        doc = qtixml.QTIDocument(baseURI="basic/linearIndividualPart.xml")
+        doc.read()
+        mdoc = edmx.Document()
+        with open("sessions.xml", 'rb') as f:
+            mdoc.read(f)
+        cdef = mdoc.root.DataServices['SessionSchema.SessionContainer']
+        InMemoryEntityContainer(cdef)
+        store = variables.EntitySessionStore(doc.root, cdef['Sessions'],
+                                             max_live=1)
+        state = store.new_session("s1")
+        state.begin_session(state.key)
+        time.time.elapse(1.1)
+        state.handle_event({"SUBMIT": state.key, "Q1.RESPONSE": "D"})
+        store.put("s1", state)
+        store.new_session("s2")
+        with cdef['Sessions'].open() as coll:
+            self.assertEqual(len(coll), 2)
+        new_state = store.get("s1")
+        self.assertFalse(new_state is state)
+        self.assertEqual(new_state.key, state.key)
+        self.assertEqual(new_state["Q1.RESPONSE"].value, "D")
+        store.delete("s1")
+        with cdef['Sessions'].open() as coll:
+            self.assertEqual(list(coll), ["s2"])
+
 
 class MultiPartAssessmentTests(unittest.TestCase):
 
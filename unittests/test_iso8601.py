@@ -3,6 +3,7 @@
 """Runs unit tests on the pyslet.iso8601 module"""
 
 import logging
+import pickle
 import time
 import unittest
 
@@ -2296,6 +2297,163 @@ class TimePointTests(unittest.TestCase):
         self.assertTrue(t.get_calendar_time_point() ==
                         (20, 16, 12, 31, 23, 59, 60))
 
+    def test_compact(self):
+        tp = iso.TimePoint.from_str("1969-07-20T15:17:40.5-05:00")
+        c = tp.compact()
+        self.assertTrue(isinstance(c, iso.CompactTimePoint))
+        self.assertTrue(isinstance(c, iso.TimePoint))
+        self.assertTrue(c.compact() is c)
+        self.assertTrue(iso.CompactTimePoint(c) is c)
+        self.assertEqual(c.date, tp.date)
+        self.assertEqual(c.time.get_zone3(), tp.time.get_zone3())
+        self.assertEqual(c.get_calendar_time_point(),
+                         tp.get_calendar_time_point())
+        self.assertEqual(c.get_zone(), tp.get_zone())
+        self.assertEqual(str(c), str(tp))
+        self.assertEqual(c.get_calendar_string(basic=True, ndp=3, dp="."),
+                         tp.get_calendar_string(basic=True, ndp=3, dp="."))
+        self.assertEqual(c.get_ordinal_string(), tp.get_ordinal_string())
+        self.assertEqual(c.get_unixtime(), tp.get_unixtime())
+        # compact and regular time points are interchangeable
+        self.assertTrue(c == tp)
+        self.assertTrue(tp == c)
+        self.assertTrue(c == "1969-07-20T20:17:40.5Z")
+        self.assertEqual(hash(c), hash(tp))
+        self.assertTrue(tp in set([c]))
+        later = iso.TimePoint.from_str("1969-07-20T20:17:41Z")
+        self.assertTrue(c < later)
+        self.assertTrue(later.compact() > tp)
+        self.assertTrue(c < later.compact())
+        local = iso.CompactTimePoint.from_str("1969-07-20T20:17:41")
+        self.assertTrue(isinstance(local, iso.CompactTimePoint))
+        try:
+            c < local
+            self.fail("compared time points with and without zones")
+        except TypeError:
+            pass
+        # derived time points are also compact
+        utc = c.shift_zone(zdirection=0)
+        self.assertTrue(isinstance(utc, iso.CompactTimePoint))
+        self.assertEqual(str(utc), "1969-07-20T20:17:40Z")
+        self.assertTrue(isinstance(c.with_zone(None), iso.CompactTimePoint))
+        self.assertTrue(isinstance(iso.CompactTimePoint.from_unix_time(0),
+                                   iso.CompactTimePoint))
+        # instances are immutable and have no __dict__
+        self.assertFalse(hasattr(c, '__dict__'))
+        try:
+            c.date = iso.Date()
+            self.fail("CompactTimePoint date assignment")
+        except TypeError:
+            pass
+        for method, args in (('set_origin', ()), ('now_utc', ()),
+                             ('set_unix_time', (0, )),
+                             ('set_from_string', ("1969-07-20", ))):
+            try:
+                getattr(c, method)(*args)
+                self.fail("CompactTimePoint.%s" % method)
+            except TypeError:
+                pass
+        self.assertTrue(c == tp)
+        # reduced precision and expanded dates are not compact
+        for tp in (iso.TimePoint.from_str("1969-07-20T20:17"),
+                   iso.TimePoint.from_str("+001969-07-20T20:17:40",
+                                          xdigits=2)):
+            self.assertFalse(isinstance(tp.compact(), iso.CompactTimePoint))
+            self.assertFalse(isinstance(iso.CompactTimePoint(tp),
+                                        iso.CompactTimePoint))
+            self.assertTrue(tp.compact() == tp)
+        self.assertFalse(isinstance(
+            c.with_precision(iso.Precision.Minute, True),
+            iso.CompactTimePoint))
+        self.assertFalse(isinstance(c.expand(2), iso.CompactTimePoint))
+        # pickle round trip
+        c2 = pickle.loads(pickle.dumps(c, 2))
+        self.assertTrue(isinstance(c2, iso.CompactTimePoint))
+        self.assertEqual(str(c2), str(c))
+
+    def test_pickle(self):
+        t = iso.TimePoint.from_str("1969-07-20T15:17:40.5-05:00")
+        for protocol in range3(pickle.HIGHEST_PROTOCOL + 1):
+            t2 = pickle.loads(pickle.dumps(t, protocol))
+            self.assertTrue(t2 == t)
+            self.assertTrue(t2.time.second == 40.5)
+        # TimePoints no longer have a __dict__
+        self.assertFalse(hasattr(t, '__dict__'))
+        # a TimePoint pickled by an earlier version
+        old = (
+            b'\x80\x02cpyslet.iso8601\nTimePoint\nq\x00)\x81q\x01}q\x02('
+            b'X\x04\x00\x00\x00dateq\x03cpyslet.iso8601\nDate\nq\x04)\x81q'
+            b'\x05}q\x06(X\x07\x00\x00\x00xdigitsq\x07NX\x04\x00\x00\x00weekq'
+            b'\x08NX\x03\x00\x00\x00bceq\t\x89X\x07\x00\x00\x00centuryq\nK'
+            b'\x13X\x04\x00\x00\x00yearq\x0bKEX\x05\x00\x00\x00monthq\x0cK'
+            b'\x07X\x03\x00\x00\x00dayq\rK\x14ubX\x04\x00\x00\x00timeq\x0e'
+            b'cpyslet.iso8601\nTime\nq\x0f)\x81q\x10}q\x11(X\x04\x00\x00\x00'
+            b'hourq\x12K\x0fX\x06\x00\x00\x00minuteq\x13K\x11X\x06\x00\x00'
+            b'\x00secondq\x14G@D@\x00\x00\x00\x00\x00X\n\x00\x00\x00'
+            b'zdirectionq\x15J\xff\xff\xff\xffX\x07\x00\x00\x00zoffsetq'
+            b'\x16M,\x01ubub.')
+        t2 = pickle.loads(old)
+        self.assertTrue(isinstance(t2.date, iso.Date))
+        self.assertTrue(isinstance(t2.time, iso.Time))
+        self.assertTrue(t2 == t)
+
+    def test_fast_path(self):
+        """Common forms must parse and format as the full parser"""
+        def slow_parse(src, tdesignators):
+            p = iso.ISO8601Parser(src)
+            return p.parse_time_point_format(None, tdesignators)[0]
+
+        def fields(tp):
+            return (tp.date.get_xcalendar_day(), tp.date.xdigits,
+                    tp.time.hour, tp.time.minute, repr(tp.time.second),
+                    tp.time.zdirection, tp.time.zoffset)
+
+        for src, tdesignators in (
+                ("1969-07-20T20:17:40", "T"),
+                ("1969-07-20T20:17:40Z", "T"),
+                ("1969-07-20T20:17:40.25+01:00", "T"),
+                ("1969-07-20T20:17:40,5-05", "T"),
+                ("1969-07-20 20:17:40.123456", "T "),
+                ("19690720T201740.123456+0130   ", "T "),
+                ("19690720T201740-05", "T"),
+                ("20161231T235960Z", "T"),
+                ("2000-02-29T24:00:00", "T"),
+                ("1969-07-20T20:17:40x", "T"),
+                ("1969-07-20T20:17:40+0100", "T"),
+                ("1969-07-20 20:17:40", "T"),
+                ("1969-07-20T20:17", "T"),
+                ("1969-07-20T20:17:61", "T"),
+                ("1969-02-30T20:17:40", "T"),
+                ("1969-0720T20:17:40", "T")):
+            try:
+                expected = fields(slow_parse(src, tdesignators))
+            except (iso.DateTimeError, ValueError) as err:
+                expected = err.__class__
+            try:
+                result = fields(
+                    iso.TimePoint.from_str(src, tdesignators=tdesignators))
+            except (iso.DateTimeError, ValueError) as err:
+                result = err.__class__
+            self.assertEqual(result, expected, src)
+        for src in ("1969-07-20T20:17:40", "1969-07-20T20:17:40.999999Z",
+                    "1969-07-20T20:17:40.5+01:00", "1969-07-20T20:17:40-05:30",
+                    "+001969-07-20T20:17:40", "1969-W29-7T20:17:40"):
+            if src[0] == "+":
+                tp = iso.TimePoint.from_str(src, xdigits=2)
+            else:
+                tp = iso.TimePoint.from_str(src)
+            for basic in (False, True):
+                for ndp in (0, 3, 6):
+                    for zp in (iso.Precision.Complete, iso.Precision.Hour):
+                        expected = (
+                            tp.date.get_calendar_string(basic) + "T" +
+                            tp.time.get_string(basic, iso.NoTruncation, ndp,
+                                               zp, "."))
+                        self.assertEqual(
+                            tp.get_calendar_string(basic, ndp=ndp,
+                                                   zone_precision=zp,
+                                                   dp="."), expected)
+
 
 class DurationTests(unittest.TestCase):
 
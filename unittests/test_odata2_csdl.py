@@ -483,6 +483,27 @@ class ValueTests(unittest.TestCase):
         d0 = iso.TimePoint(date=iso.Date(century=19, year=69, month=7, day=20),
                            time=iso.Time(hour=0, minute=0, second=0))
         self.assertTrue(v.value == d0)
+        # complete values are stored compactly
+        self.assertTrue(isinstance(v.value, iso.CompactTimePoint))
+        v.set_from_value(d)
+        self.assertTrue(isinstance(v.value, iso.CompactTimePoint))
+        # but reduced precision values are not
+        v.set_from_value(iso.TimePoint.from_str("1969-07-20T20:17"))
+        self.assertFalse(isinstance(v.value, iso.CompactTimePoint))
+        self.assertTrue(v.value.get_precision() == iso.Precision.Minute)
+
+    def test_datetime_offset_value(self):
+        """Test the DateTimeOffsetValue class."""
+        v = edm.EDMValue.from_type(edm.SimpleType.DateTimeOffset)
+        self.assertTrue(v.is_null())
+        v.set_from_literal("1969-07-20T15:17:40-05:00")
+        self.assertTrue(isinstance(v.value, iso.CompactTimePoint))
+        self.assertTrue(v.value == iso.TimePoint.from_str(
+            "1969-07-20T20:17:40Z"))
+        self.assertTrue(str(v) == "1969-07-20T15:17:40-05:00")
+        v.set_from_value(0)
+        self.assertTrue(isinstance(v.value, iso.CompactTimePoint))
+        self.assertTrue(str(v) == "1970-01-01T00:00:00+00:00")
 
     def test_string_value(self):
         """Test the StringValue class."""
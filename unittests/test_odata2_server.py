@@ -13,6 +13,7 @@ import time
 import traceback
 import uuid
 import unittest
+import zlib
 
 from threading import Thread
 
@@ -4001,6 +4002,51 @@ class SampleServerTests(unittest.TestCase):
         self.assertTrue("CustomerID" in obj, "CustomerID in response")
         self.assertTrue(obj["CustomerID"] == 'ALFKI', "Bad CustomerID")
 
+    def test_retrieve_streamed(self):
+        for accept in ('application/atom+xml', 'application/json'):
+            request = MockRequest('/service.svc/Customers')
+            request.set_header('Accept', accept)
+            request.send(self.svc)
+            self.assertTrue(request.responseCode == 200)
+            # HTTP/1.0 responses are buffered
+            buffered = request.wfile.getvalue()
+            self.assertTrue(int(request.responseHeaders['CONTENT-LENGTH']) ==
+                            len(buffered))
+            request = MockRequest('/service.svc/Customers')
+            request.set_header('Accept', accept)
+            request.environ['SERVER_PROTOCOL'] = "HTTP/1.1"
+            self.svc.stream_chunk = 1024
+            try:
+                data = self.svc(request.environ, request.start_response)
+                self.assertTrue(request.responseCode == 200)
+                self.assertFalse("CONTENT-LENGTH" in request.responseHeaders)
+                chunks = list(data)
+                data.close()
+            finally:
+                self.svc.stream_chunk = 0x10000
+            self.assertTrue(len(chunks) > 1, "expected multiple chunks")
+            for chunk in chunks[:-1]:
+                self.assertTrue(len(chunk) >= 1024)
+            self.assertTrue(b''.join(chunks) == buffered)
+        # stream_chunk of 0 disables streaming
+        request = MockRequest("/service.svc/Customers('ALFKI')")
+        request.environ['SERVER_PROTOCOL'] = "HTTP/1.1"
+        self.svc.stream_chunk = 0
+        try:
+            request.send(self.svc)
+        finally:
+            self.svc.stream_chunk = 0x10000
+        self.assertTrue(request.responseCode == 200)
+        self.assertTrue(int(request.responseHeaders['CONTENT-LENGTH']) ==
+                        len(request.wfile.getvalue()))
+        # errors raised when the query is first executed are still
+        # reported with an error status
+        request = MockRequest(
+            "/service.svc/Customers?$filter=substringof(1,CompanyName)")
+        request.environ['SERVER_PROTOCOL'] = "HTTP/1.1"
+        request.send(self.svc)
+        self.assertTrue(request.responseCode >= 400, request.responseCode)
+
     def test_retrieve_complex_type(self):
         request = MockRequest("/service.svc/Customers('ALFKI')/Address")
         request.send(self.svc)
@@ -4209,6 +4255,78 @@ class SampleServerTests(unittest.TestCase):
         self.assertTrue(ds.data_services_version() == "2.0",
                         "Expected matching data service version")
 
+    def test_retrieve_metadata_cached(self):
+        request = MockRequest("/service.svc/$metadata")
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 200)
+        data = request.wfile.getvalue()
+        etag = request.responseHeaders['ETAG']
+        self.assertFalse(etag.startswith("W/"), "strong ETag expected")
+        last_modified = request.responseHeaders['LAST-MODIFIED']
+        self.assertTrue(request.responseHeaders['VARY'] == "Accept-Encoding")
+        # the data is calculated once, when the model was set
+        cached = self.svc.get_cached_response('metadata')
+        self.assertTrue(cached.data is self.svc.get_cached_response(
+            'metadata').data)
+        self.assertTrue(cached.data == data)
+        # conditional requests
+        for h, v in (('If-None-Match', etag),
+                     ('If-None-Match', 'W/' + etag),
+                     ('If-None-Match', '"xyz", %s' % etag),
+                     ('If-None-Match', '*'),
+                     ('If-Modified-Since', last_modified)):
+            request = MockRequest("/service.svc/$metadata")
+            request.set_header(h, v)
+            request.send(self.svc)
+            self.assertTrue(request.responseCode == 304, "%s: %s" % (h, v))
+            self.assertTrue(request.responseHeaders['ETAG'] == etag)
+            self.assertTrue(request.wfile.getvalue() == b'')
+        for h, v in (('If-None-Match', '"xyz"'),
+                     ('If-Modified-Since',
+                      "Sun, 06 Nov 1994 08:49:37 GMT")):
+            request = MockRequest("/service.svc/$metadata")
+            request.set_header(h, v)
+            request.send(self.svc)
+            self.assertTrue(request.responseCode == 200, "%s: %s" % (h, v))
+            self.assertTrue(request.wfile.getvalue() == data)
+        # gzip encoded copy
+        request = MockRequest("/service.svc/$metadata")
+        request.set_header('Accept-Encoding', 'gzip')
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 200)
+        self.assertTrue(request.responseHeaders['CONTENT-ENCODING'] == "gzip")
+        gzip_etag = request.responseHeaders['ETAG']
+        self.assertFalse(gzip_etag == etag)
+        zdata = request.wfile.getvalue()
+        self.assertTrue(int(request.responseHeaders['CONTENT-LENGTH']) ==
+                        len(zdata))
+        self.assertTrue(len(zdata) < len(data))
+        self.assertTrue(zlib.decompress(zdata, 31) == data)
+        request = MockRequest("/service.svc/$metadata")
+        request.set_header('Accept-Encoding', 'gzip')
+        request.set_header('If-None-Match', gzip_etag)
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 304)
+        # disable the gzip copies
+        self.svc.gzip_level = 0
+        self.svc.refresh_cached_responses()
+        request = MockRequest("/service.svc/$metadata")
+        request.set_header('Accept-Encoding', 'gzip')
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 200)
+        self.assertFalse('CONTENT-ENCODING' in request.responseHeaders)
+        self.assertTrue(request.responseHeaders['ETAG'] == etag)
+        self.assertTrue(request.wfile.getvalue() == data)
+        # the service document is cached too
+        request = MockRequest("/service.svc/")
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 200)
+        etag = request.responseHeaders['ETAG']
+        request = MockRequest("/service.svc/")
+        request.set_header('If-None-Match', etag)
+        request.send(self.svc)
+        self.assertTrue(request.responseCode == 304)
+
     def test_retrieve_service_document(self):
         request = MockRequest("/service.svc/")
         request.send(self.svc)
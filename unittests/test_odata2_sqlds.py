@@ -5,6 +5,7 @@ import logging
 import random
 import sqlite3
 import threading
+import time
 import uuid
 import unittest
 
@@ -439,6 +440,110 @@ class ContainerTests(unittest.TestCase):
         # success criteria?  that we survived
         pass
 
+    def test_fifo(self):
+        container = MockContainer(container=self.container, dbapi=MockAPI(2),
+                                  max_connections=1)
+        c = container.acquire_connection()
+        order = []
+
+        def runner(i):
+            connection = container.acquire_connection(5)
+            order.append(i)
+            container.release_connection(connection)
+
+        threads = []
+        for i in range3(5):
+            t = threading.Thread(target=runner, args=(i, ))
+            t.start()
+            threads.append(t)
+            # wait for the thread to join the queue
+            while container.pool_stats()['waiting'] < i + 1:
+                time.sleep(0.001)
+        container.release_connection(c)
+        for t in threads:
+            t.join()
+        self.assertTrue(order == [0, 1, 2, 3, 4], order)
+        stats = container.pool_stats()
+        self.assertTrue(stats['waiting'] == 0)
+        self.assertTrue(stats['waits'] == 5)
+        self.assertTrue(stats['acquired'] == 6)
+        self.assertTrue(stats['released'] == 6)
+        self.assertTrue(sum(n for b, n in stats['wait_histogram']) == 6)
+        self.assertTrue(sum(n for b, n in stats['hold_histogram']) == 6)
+        self.assertTrue(stats['size'] == 1)
+        self.assertTrue(stats['max_size'] == 1)
+        # nested acquisitions are not counted
+        c = container.acquire_connection()
+        c2 = container.acquire_connection()
+        container.release_connection(c2)
+        # timeouts are counted
+        t = threading.Thread(target=mock_runner, args=(container, ))
+        container.acquired = None
+        t.start()
+        t.join()
+        self.assertTrue(container.acquired is None)
+        container.release_connection(c)
+        stats = container.pool_stats()
+        self.assertTrue(stats['acquired'] == 7)
+        self.assertTrue(stats['released'] == 7)
+        self.assertTrue(stats['timeouts'] == 1)
+
+    def test_leaks(self):
+        container = MockContainer(container=self.container, dbapi=MockAPI(2),
+                                  max_connections=2, leak_threshold=60)
+        c = container.acquire_connection()
+        self.assertTrue(container.leaked_connections() == [])
+        leaks = container.leaked_connections(0)
+        self.assertTrue(len(leaks) == 1)
+        self.assertTrue(leaks[0]['thread_id'] ==
+                        threading.current_thread().ident)
+        self.assertTrue(leaks[0]['held'] >= 0)
+        self.assertTrue('test_leaks' in leaks[0]['stack'])
+        container.leak_threshold = 0
+        self.assertTrue(len(container.pool_stats()['leaks']) == 1)
+        container.release_connection(c)
+        self.assertTrue(container.leaked_connections() == [])
+        # without a threshold the stack is not saved
+        container.leak_threshold = None
+        c = container.acquire_connection()
+        leaks = container.leaked_connections(0)
+        self.assertTrue(len(leaks) == 1)
+        self.assertTrue(leaks[0]['stack'] is None)
+        container.release_connection(c)
+
+    def test_ping(self):
+        container = MockContainer(container=self.container, dbapi=MockAPI(2),
+                                  max_connections=2)
+        c = container.acquire_connection()
+        dbc = c.dbc
+        container.release_connection(c)
+        dbc.bad = True
+        # no validation by default
+        c = container.acquire_connection()
+        self.assertTrue(c.dbc is dbc)
+        container.release_connection(c)
+        self.assertTrue(container.pool_stats()['pings'] == 0)
+        container.ping_idle = 0
+        time.sleep(0.01)
+        c = container.acquire_connection()
+        self.assertFalse(c.dbc is dbc)
+        dbc = c.dbc
+        container.release_connection(c)
+        stats = container.pool_stats()
+        self.assertTrue(stats['pings'] == 1)
+        self.assertTrue(stats['ping_failures'] == 1)
+        time.sleep(0.01)
+        c = container.acquire_connection()
+        self.assertTrue(c.dbc is dbc)
+        container.release_connection(c)
+        stats = container.pool_stats()
+        self.assertTrue(stats['pings'] == 2)
+        self.assertTrue(stats['ping_failures'] == 1)
+        container.ping_idle = 60
+        c = container.acquire_connection()
+        container.release_connection(c)
+        self.assertTrue(container.pool_stats()['pings'] == 2)
+
     def test_retry(self):
         dbapi = MockAPI(1)
         for i in range3(5):
@@ -524,6 +629,134 @@ class SQLDSTests(unittest.TestCase):
             except edm.ConstraintError:
                 pass
 
+    def test_group_commit(self):
+        try:
+            sqlds.SQLiteEntityContainer(
+                file_path=self.d.join('bad.db'), container=self.container,
+                sqlite_options={'journal_mode': 'WAL; DROP TABLE x'})
+            self.fail("Bad journal_mode accepted")
+        except ValueError:
+            pass
+        self.db.close()
+        db_path = self.d.join('group.db')
+        self.db = sqlds.SQLiteEntityContainer(
+            file_path=db_path, container=self.container,
+            sqlite_options={'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+            group_commit=0.05, group_commit_size=4, max_connections=5)
+        self.assertTrue(self.db.cpool_max == 1)
+        es = self.schema['SampleEntities.Employees']
+        with es.open() as collection:
+            collection.create_table()
+
+        def insert(i):
+            with es.open() as collection:
+                new_hire = collection.new_entity()
+                new_hire.set_key('%05i' % i)
+                new_hire["EmployeeName"].set_from_value('Joe Bloggs')
+                collection.insert_entity(new_hire)
+            # once the collection is closed the write is durable
+            dbc = sqlite3.connect(str(db_path))
+            c = dbc.cursor()
+            c.execute("SELECT EmployeeName FROM Employees WHERE "
+                      "EmployeeID=?", ('%05i' % i, ))
+            if c.fetchall() == [('Joe Bloggs', )]:
+                done.append(i)
+            dbc.close()
+
+        done = []
+        batch = self.db._group_committed
+        threads = []
+        for i in range3(10):
+            threads.append(threading.Thread(target=insert, args=(i, )))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(len(done) == 10)
+        # the inserts were coalesced into fewer commits
+        self.assertTrue(self.db._group_committed - batch < 10)
+        with es.open() as collection:
+            self.assertTrue(len(collection) == 10)
+            new_hire = collection.new_entity()
+            new_hire.set_key('00001')
+            new_hire["EmployeeName"].set_from_value('Jane Doe')
+            try:
+                collection.insert_entity(new_hire)
+                self.fail("Double insert")
+            except edm.ConstraintError:
+                pass
+            # only the failed transaction was rolled back
+            self.assertTrue(len(collection) == 10)
+        insert(10)
+        self.assertTrue(len(done) == 11)
+        dbc = sqlite3.connect(str(db_path))
+        c = dbc.cursor()
+        c.execute("PRAGMA journal_mode")
+        self.assertTrue(c.fetchall() == [('wal', )])
+        c.execute("SELECT COUNT(*) FROM Employees")
+        self.assertTrue(c.fetchall() == [(11, )])
+        dbc.close()
+
+    def test_group_commit_failure(self):
+        self.db.close()
+        db_path = self.d.join('group.db')
+        self.db = sqlds.SQLiteEntityContainer(
+            file_path=db_path, container=self.container,
+            group_commit=0.2, group_commit_size=4)
+        es = self.schema['SampleEntities.Employees']
+        with es.open() as collection:
+            collection.create_table()
+        # a deferred foreign key is only checked on COMMIT
+        dbc = sqlite3.connect(str(db_path))
+        dbc.execute("CREATE TABLE Parent (id INTEGER PRIMARY KEY)")
+        dbc.execute(
+            "CREATE TABLE Child (id INTEGER PRIMARY KEY, parent INTEGER "
+            "REFERENCES Parent(id) DEFERRABLE INITIALLY DEFERRED)")
+        dbc.commit()
+        dbc.close()
+        errors = []
+        joined = threading.Event()
+
+        def insert():
+            try:
+                with es.open() as collection:
+                    new_hire = collection.new_entity()
+                    new_hire.set_key('00001')
+                    new_hire["EmployeeName"].set_from_value('Joe Bloggs')
+                    collection.insert_entity(new_hire)
+                    joined.set()
+            except sqlds.SQLError as err:
+                errors.append(err)
+
+        def orphan():
+            joined.wait(5)
+            connection = self.db.acquire_connection(sqlds.SQL_TIMEOUT)
+            try:
+                t = sqlds.SQLTransaction(self.db, connection)
+                t.begin()
+                t.execute("INSERT INTO Child (id, parent) VALUES (1, 1)",
+                          sqlds.QMarkParams())
+                t.commit()
+            finally:
+                try:
+                    self.db.release_connection(connection)
+                except sqlds.SQLError as err:
+                    errors.append(err)
+
+        threads = [threading.Thread(target=insert),
+                   threading.Thread(target=orphan)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # both transactions were in the failed batch
+        self.assertTrue(len(errors) == 2, errors)
+        with es.open() as collection:
+            self.assertTrue(len(collection) == 0)
+        # closing the container does not raise
+        self.db.close()
+        self.db = None
+
     def test_update(self):
         es = self.schema['SampleEntities.Employees']
         with es.open() as collection:
@@ -665,6 +898,113 @@ class SQLDSTests(unittest.TestCase):
                     "substring(EmployeeName, 8, 3) eq '#13'"))
             self.assertTrue(len(collection) == 1, "Just one matching employee")
 
+    def test_delete_filtered(self):
+        es = self.schema['SampleEntities.Employees']
+        with es.open() as collection:
+            collection.create_table()
+            for i in range3(20):
+                new_hire = collection.new_entity()
+                new_hire.set_key('%05X' % i)
+                new_hire["EmployeeName"].set_from_value('Talent #%i' % i)
+                new_hire["Address"]["City"].set_from_value('Chunton')
+                new_hire["Address"]["Street"].set_from_value(
+                    'Mill Road' if i % 2 else 'Main Street')
+                collection.insert_entity(new_hire)
+            collection.set_filter(
+                core.CommonExpression.from_str(
+                    "Address/Street eq 'Mill Road'"))
+            self.assertTrue(collection.delete_filtered() == 10)
+            self.assertTrue(len(collection) == 0)
+            collection.set_filter(None)
+            self.assertTrue(len(collection) == 10)
+            for talent in collection.values():
+                self.assertTrue(
+                    talent["Address"]["Street"].value == 'Main Street')
+            self.assertTrue(collection.delete_filtered() == 10)
+            self.assertTrue(len(collection) == 0)
+
+    def test_delete_filtered_navigation(self):
+        self.db.create_all_tables()
+        with self.schema['SampleEntities.Customers'].open() as collection:
+            customer = collection.new_entity()
+            customer.set_key('ALFKI')
+            customer["CompanyName"].set_from_value('Widget Inc')
+            customer["Address"]["City"].set_from_value('Chunton')
+            customer["Address"]["Street"].set_from_value('Factory Lane')
+            collection.insert_entity(customer)
+        with customer['Orders'].open() as collection:
+            for i in range3(4):
+                order = collection.new_entity()
+                order.set_key(i + 1)
+                order["ShippedDate"].set_from_literal('2013-10-02T10:20:59')
+                collection.insert_entity(order)
+            collection.set_filter(
+                core.CommonExpression.from_str("OrderID ge 3"))
+            # the orders are deleted, not just unlinked
+            self.assertTrue(collection.delete_filtered() == 2)
+            collection.set_filter(None)
+            self.assertTrue(len(collection) == 2)
+        with self.schema['SampleEntities.Orders'].open() as collection:
+            self.assertTrue(len(collection) == 2)
+
+    def test_inlinecount(self):
+        es = self.schema['SampleEntities.Employees']
+        with es.open() as collection:
+            collection.create_table()
+            for i in range3(20):
+                new_hire = collection.new_entity()
+                new_hire.set_key('%05X' % i)
+                new_hire["EmployeeName"].set_from_value('Talent #%i' % i)
+                new_hire["Address"]["City"].set_from_value('Chunton')
+                new_hire["Address"]["Street"].set_from_value(
+                    'Mill Road' if i % 2 else 'Main Street')
+                collection.insert_entity(new_hire)
+        window = self.db.window_count_column()
+        for count_column in (window, None):
+            self.db.window_count_column = lambda: count_column
+            with es.open() as collection:
+                collection.set_filter(
+                    core.CommonExpression.from_str(
+                        "Address/Street eq 'Mill Road'"))
+                collection.set_inlinecount(True)
+                collection.set_topmax(4)
+                statements = []
+                if hasattr(collection.connection, 'set_trace_callback'):
+                    collection.connection.set_trace_callback(
+                        statements.append)
+                self.assertTrue(len(collection) == 10)
+                page = list(collection.iterpage(True))
+                self.assertTrue(len(page) == 4)
+                if statements:
+                    # one query for the count and the page, or two
+                    selects = [q for q in statements
+                               if q.startswith("SELECT")]
+                    self.assertTrue(
+                        len(selects) == (1 if count_column else 2),
+                        selects)
+                keys = [e.key() for e in page]
+                # the count is remembered for subsequent pages
+                self.assertTrue(len(collection) == 10)
+                page = list(collection.iterpage(True))
+                keys += [e.key() for e in page]
+                self.assertTrue(len(page) == 4)
+                self.assertTrue(len(collection) == 10)
+                keys += [e.key() for e in collection.iterpage(True)]
+                self.assertTrue(len(keys) == 10)
+                self.assertTrue(len(set(keys)) == 10)
+                # a page beyond the end of the collection
+                collection.set_page(4, 12)
+                self.assertTrue(len(collection) == 10)
+                self.assertTrue(len(list(collection.iterpage())) == 0)
+                collection.set_filter(None)
+                collection.set_page(4, 2)
+                self.assertTrue(len(collection) == 20)
+                page = list(collection.iterpage())
+                self.assertTrue(len(page) == 4)
+                self.assertTrue(page[0].key() == '00002')
+                if statements:
+                    collection.connection.set_trace_callback(None)
+
     def test_orderby(self):
         es = self.schema['SampleEntities.Employees']
         with es.open() as collection:
@@ -973,6 +1313,21 @@ class RegressionTests(DataServiceRegressionTests):
         self.run_combined()
 
 
+class GroupCommitRegressionTests(RegressionTests):
+
+    def setUp(self):  # noqa
+        DataServiceRegressionTests.setUp(self)
+        self.container = self.ds['RegressionModel.RegressionContainer']
+        self.d = FilePath.mkdtemp('.d', 'pyslet-test_odata2_sqlds-')
+        self.db = sqlds.SQLiteEntityContainer(
+            file_path=self.d.join('test.db'),
+            container=self.container,
+            streamstore=sqlds.SQLiteStreamStore(
+                file_path=self.d.join('streamstore.db')),
+            sqlite_options={'journal_mode': 'WAL'}, group_commit=0.01)
+        self.db.create_all_tables()
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     unittest.main()
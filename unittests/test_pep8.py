@@ -209,6 +209,26 @@ class MethodTests(unittest.TestCase):
         self.assertTrue(i.OldMethod() == "AbsolutelyNoTreble.OldMethod")
         self.assertTrue(i.new_method() == "AbsolutelyNoTreble.OldMethod")
 
+    def test_renamed_cache(self):
+        # the renamed methods of a base class are found once and reused
+        class NoTreble(Base):
+
+            def OldMethod(self):    # noqa
+                return "NoTreble.OldMethod"
+
+        self.assertTrue(Base in pep8._renamed_methods)
+        names = set(im.__name__ for m, im in pep8._renamed_methods[Base])
+        self.assertTrue("new_method" in names)
+        self.assertTrue("new_class_method" in names)
+
+        class AlsoNoTreble(Base):
+
+            def OldMethod(self):    # noqa
+                return "AlsoNoTreble.OldMethod"
+
+        i = AlsoNoTreble()
+        self.assertTrue(i.new_method() == "AlsoNoTreble.OldMethod")
+
     def test_method_collision(self):
         try:
             class BadOverride(Base):
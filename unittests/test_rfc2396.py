@@ -245,6 +245,15 @@ class RFC2396Tests(unittest.TestCase):
             pass
         # byte strings can contain any data, no UTF-8 encoding is done
         self.assertTrue(uri.escape_data(b'Caf\xe9') == "Caf%E9")
+        # character class tests are table driven, other functions are
+        # called for each character
+        for i in range3(256):
+            b = bytes(bytearray([i]))
+            self.assertTrue(
+                uri.escape_data(b) ==
+                uri.escape_data(b, lambda x: uri.is_reserved(x)),
+                "escape %i" % i)
+        self.assertTrue(uri.escape_data(b'') == '')
 
     def test_unescape(self):
         data = "%3CC%00a%20f%0d%0a%E9%3e"
@@ -269,6 +278,10 @@ class RFC2396Tests(unittest.TestCase):
         self.assertTrue(uri.unescape_data(data) == b"Caf%hay", "partial hex 1")
         data = "Caf%eh"
         self.assertTrue(uri.unescape_data(data) == b"Caf%eh", "partial hex 2")
+        data = "Caf%%41%4%41%"
+        self.assertTrue(uri.unescape_data(data) == b"Caf%%41%4%41",
+                        "partial hex 3")
+        self.assertTrue(uri.unescape_data("Caf%c3%A9%2fe") == b"Caf\xc3\xa9/e")
 
     def compare_strings(self, expected, found, label="Test"):
         for i in range3(len(expected)):
@@ -679,6 +692,58 @@ class URITests(unittest.TestCase):
         u = uri.URI("/path")
         self.assertTrue(u.get_canonical_root() is None)
 
+    def test_cache(self):
+        u1 = uri.URI.from_octets("x-pyslet://host/a/b?q")
+        u2 = uri.URI.from_octets("x-pyslet://host/a/b?q")
+        self.assertTrue(u1 is u2)
+        self.assertTrue(uri.URI.from_octets(b"x-pyslet://host/a/b?q") == u1)
+        # strict parsing is cached separately
+        u3 = uri.URI.from_octets("x-pyslet://host/a/b?q", strict=True)
+        self.assertTrue(u3 == u1)
+        # resolve and relative are memoised
+        r = uri.URI.from_octets("../c#f")
+        u4 = r.resolve(u1)
+        self.assertTrue(str(u4) == "x-pyslet://host/c#f")
+        self.assertTrue(r.resolve(u1) is u4)
+        self.assertTrue(r.resolve("x-pyslet://host/a/b?q") is u4)
+        self.assertTrue(u4.relative(u1) == r)
+        self.assertTrue(str(r.resolve(u1, u4)) == "x-pyslet://host/c#f")
+        # the result depends on current_doc_ref
+        r = uri.URI.from_octets("#f")
+        self.assertTrue(str(r.resolve(u1)) == "x-pyslet://host/a/b?q#f")
+        self.assertTrue(str(r.resolve(u1, u4)) == "x-pyslet://host/c#f")
+        # registering a scheme empties the cache
+        save_class = uri.URI.scheme_class.get('x-pyslet', None)
+
+        class PysletURI(uri.URI):
+            pass
+
+        try:
+            uri.URI.register('x-pyslet', PysletURI)
+            u5 = uri.URI.from_octets("x-pyslet://host/a/b?q")
+            self.assertTrue(isinstance(u5, PysletURI))
+            self.assertFalse(u5 is u1)
+        finally:
+            if save_class is None:
+                del uri.URI.scheme_class['x-pyslet']
+            else:
+                uri.URI.register('x-pyslet', save_class)
+        # the cache is bounded
+        save_size = uri.URI.cache_size
+        try:
+            uri.URI.cache_size = 2
+            u1 = uri.URI.from_octets("x-pyslet:1")
+            uri.URI.from_octets("x-pyslet:2")
+            self.assertTrue(uri.URI.from_octets("x-pyslet:1") is u1)
+            uri.URI.from_octets("x-pyslet:3")
+            self.assertTrue(uri.URI.from_octets("x-pyslet:1") is u1)
+            uri.URI.from_octets("x-pyslet:2")
+            uri.URI.from_octets("x-pyslet:3")
+            self.assertFalse(uri.URI.from_octets("x-pyslet:1") is u1)
+            self.assertTrue(len(uri._uri_cache) <= 2)
+        finally:
+            uri.URI.cache_size = save_size
+
 
 FILE_EXAMPLE = "file://vms.host.edu/disk$user/my/notes/note12345.txt"
 
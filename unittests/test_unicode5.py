@@ -3,6 +3,7 @@
 import codecs
 import logging
 import unittest
+import warnings
 
 from sys import maxunicode
 
@@ -193,6 +194,92 @@ class CharClassTests(unittest.TestCase):
                             "CharClass Re test: expected %s, found %s" %
                             (test[2], result))
 
+    def test_freeze(self):
+        c = unicode5.CharClass(('a', 'c'), ('x', 'z'), '-',
+                               (character(0x2ff), character(0x300)))
+        if MAX_CHAR > 0xFFFF:
+            c.add_range(character(0xFFF0), character(0x10010))
+            c.add_char(character(MAX_CHAR))
+        c2 = unicode5.CharClass(c)
+        self.assertFalse(c.is_frozen())
+        self.assertTrue(c.freeze() is c)
+        self.assertTrue(c.is_frozen())
+        self.assertTrue(c.freeze() is c)
+        self.assertTrue(c == c2)
+        for code in (0x2c, 0x2d, 0x2e, 0x60, 0x61, 0x63, 0x64, 0x2fe, 0x2ff,
+                     0x300, 0x301, 0xFFEF, 0xFFF0, 0xFFFF, 0x10000, 0x10010,
+                     0x10011, MAX_CHAR - 1, MAX_CHAR):
+            if code > MAX_CHAR:
+                continue
+            self.assertTrue(c.test(character(code)) ==
+                            c2.test(character(code)), "test %x" % code)
+        self.assertFalse(c.test(None))
+        self.assertTrue(self.class_test(c) == "abcxyz")
+        # frozen classes can't be modified
+        for method, args in (
+                (c.add_range, ('d', 'e')), (c.subtract_range, ('d', 'e')),
+                (c.add_char, ('d', )), (c.subtract_char, ('a', )),
+                (c.add_class, (c2, )), (c.subtract_class, (c2, )),
+                (c.negate, ())):
+            try:
+                method(*args)
+                self.fail("frozen class modified")
+            except TypeError:
+                pass
+        self.assertTrue(self.class_test(c) == "abcxyz")
+        # but copies can be
+        c3 = unicode5.CharClass(c)
+        self.assertFalse(c3.is_frozen())
+        c3.subtract_char('b')
+        c3.subtract_range('a', 'c')
+        self.assertTrue(self.class_test(c3) == "xyz")
+        self.assertTrue(self.class_test(c) == "abcxyz")
+        # empty and full classes
+        empty = unicode5.CharClass().freeze()
+        self.assertFalse(empty.test('a'))
+        full = unicode5.CharClass().negate().freeze()
+        self.assertTrue(full.test('a'))
+        self.assertTrue(full.test(character(MAX_CHAR)))
+
+    def test_re(self):
+        c = unicode5.CharClass(('a', 'c'), '-', ']', '^')
+        r = c.compile_re()
+        self.assertTrue(r is c.compile_re())
+        for x in "abc-]^":
+            self.assertTrue(r.match(x) is not None)
+        for x in "d\[":
+            self.assertTrue(r.match(x) is None)
+        self.assertTrue(c.scan(ul("ab-^]d")) == 5)
+        self.assertTrue(c.scan(ul("ab-^]d"), 1) == 5)
+        self.assertTrue(c.scan(ul("ab-^]d"), 5) == 5)
+        self.assertTrue(c.scan(ul("ab-^]"), 0) == 5)
+        self.assertTrue(c.scan(ul(""), 0) == 0)
+        # modifying the class discards the expression
+        c.add_char('d')
+        self.assertFalse(r is c.compile_re())
+        self.assertTrue(c.scan(ul("ab-^]d")) == 6)
+        self.assertTrue(unicode5.CharClass().scan(ul("abc")) == 0)
+        full = unicode5.CharClass().negate()
+        self.assertTrue(full.compile_re().match(character(0)) is not None)
+        self.assertTrue(full.scan(ul("abc")) == 3)
+        # characters reserved for nested sets and set operations
+        c = unicode5.CharClass('[', '&', '~', '|', '\\', ('a', 'c'))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            r = c.compile_re()
+            c.negate()
+            rn = c.compile_re()
+            self.assertTrue(len(w) == 0)
+        for x in "[&~|\\abc":
+            self.assertTrue(r.match(x) is not None)
+            self.assertTrue(rn.match(x) is None)
+        for x in "]-d":
+            self.assertTrue(r.match(x) is None)
+            self.assertTrue(rn.match(x) is not None)
+        c = unicode5.CharClass('\\').negate()
+        self.assertTrue(c.compile_re().match("\\") is None)
+        self.assertTrue(c.compile_re().match("]") is not None)
+
     def class_test(self, cclass):
         result = []
         for c in range(ord('a'), ord('z') + 1):
@@ -220,6 +307,21 @@ class UCDTests(unittest.TestCase):
         self.assertTrue(
             unicode5.CharClass.ucd_category('Cf').test(character(0xAD)))
 
+    def test_ucd_load(self):
+        unicode5.load_category_table()
+        self.assertTrue(len(unicode5.UCDCategories) == 0)
+        class_nd = unicode5.CharClass.ucd_category('Nd')
+        # only the requested category is created
+        self.assertTrue(list(unicode5.UCDCategories.keys()) == ['Nd'])
+        self.assertTrue(class_nd is unicode5.CharClass.ucd_category('Nd'))
+        self.assertTrue(class_nd.test('0'))
+        self.assertFalse(class_nd.test('a'))
+        try:
+            unicode5.CharClass.ucd_category('Xx')
+            self.fail("unknown category")
+        except KeyError:
+            pass
+
     def test_ucd_blocks(self):
         class_basic_latin = unicode5.CharClass.ucd_block('Basic Latin')
         self.assertTrue(class_basic_latin is unicode5.CharClass.ucd_block(
@@ -12,6 +12,7 @@ import tempfile
 import threading
 import time
 import unittest
+import zlib
 
 from pyslet import html401 as html
 from pyslet import iso8601 as iso
@@ -42,6 +43,7 @@ def suite(prefix='test'):
         loader.loadTestsFromTestCase(FunctionTests),
         loader.loadTestsFromTestCase(ContextTests),
         loader.loadTestsFromTestCase(AppTests),
+        loader.loadTestsFromTestCase(EncodingMiddlewareTests),
         loader.loadTestsFromTestCase(WSGIDataAppTests),
         loader.loadTestsFromTestCase(AppCipherTests),
         loader.loadTestsFromTestCase(CookieSessionTests),
@@ -932,6 +934,101 @@ class AppTests(unittest.TestCase):
         req.call_app(app)
         self.assertTrue(req.status.startswith('404 '))
 
+    def test_static_cache(self):
+        tmp = tempfile.mkdtemp('.d', 'pyslet-test-wsgi-')
+        try:
+            os.mkdir(os.path.join(tmp, 'res'))
+            fpath = os.path.join(tmp, 'res', 'hello.txt')
+            with open(fpath, 'wb') as f:
+                f.write(b"Hello")
+
+            class App(wsgi.WSGIApp):
+                pass
+            App.static_files = wsgi.OSFilePath(tmp)
+            App.setup()
+            app = App()
+            app.set_method('/*', app.static_page)
+            req = MockRequest(path="/res/hello.txt")
+            req.call_app(app)
+            self.assertTrue(req.status.startswith('200 '))
+            self.assertTrue(req.output.getvalue() == b"Hello")
+            self.assertTrue("/res/hello.txt" in app._static_cache)
+            lm1 = req.headers['last-modified']
+            # a modified file is detected, Last-Modified changes
+            with open(fpath, 'wb') as f:
+                f.write(b"Hello mum!")
+            os.utime(fpath, (0, 86400))
+            req = MockRequest(path="/res/hello.txt")
+            req.call_app(app)
+            self.assertTrue(req.status.startswith('200 '))
+            self.assertTrue(req.output.getvalue() == b"Hello mum!")
+            self.assertTrue(req.headers['content-length'] == ['10'])
+            self.assertTrue(req.headers['last-modified'] ==
+                            ['Fri, 02 Jan 1970 00:00:00 GMT'])
+            self.assertFalse(req.headers['last-modified'] == lm1)
+            # a deleted file is detected
+            os.remove(fpath)
+            req = MockRequest(path="/res/hello.txt")
+            req.call_app(app)
+            self.assertTrue(req.status.startswith('404 '))
+            self.assertFalse("/res/hello.txt" in app._static_cache)
+        finally:
+            shutil.rmtree(tmp, True)
+
+    def test_route_metrics(self):
+        class App(wsgi.WSGIApp):
+
+            def list_page(self, context):
+                context.set_status(200)
+                context.start_response()
+                return [b'list']
+
+            def gen_page(self, context):
+                context.set_status(200)
+                context.start_response()
+                yield b'gen'
+
+            def bad_page(self, context):
+                raise ValueError("bad page")
+        App.setup()
+        app = App()
+        app.set_method('/list', app.list_page)
+        app.set_method('/gen/*', app.gen_page)
+        self.assertTrue(sorted(app.route_metrics.keys()) ==
+                        ['/gen/*', '/list'])
+        for path in ('/list', '/list', '/gen/a', '/gen/b/c', '/gen'):
+            req = MockRequest(path=path)
+            req.call_app(app)
+            self.assertTrue(req.status.startswith('200 '))
+        # add a route after dispatching has started
+        app.set_method('/gen/bad', app.bad_page)
+        app.set_method('/metrics', app.metrics_page)
+        req = MockRequest(path='/gen/bad')
+        req.call_app(app)
+        self.assertTrue(req.status.startswith('500 '))
+        metrics = app.get_route_metrics()
+        self.assertTrue(metrics['/list']['count'] == 2)
+        self.assertTrue(metrics['/gen/*']['count'] == 3)
+        self.assertTrue(metrics['/gen/*']['errors'] == 0)
+        self.assertTrue(metrics['/gen/bad']['count'] == 1)
+        self.assertTrue(metrics['/gen/bad']['errors'] == 1)
+        hist = metrics['/gen/*']['histogram']
+        self.assertTrue(len(hist) == len(wsgi.RouteMetrics.BUCKETS) + 1)
+        self.assertTrue(hist[-1][0] is None)
+        self.assertTrue(sum(n for b, n in hist) == 3)
+        self.assertTrue(app.route_metrics['/list'].mean_time() >= 0)
+        self.assertTrue(app.route_metrics['/metrics'].mean_time() is None)
+        req = MockRequest(path='/metrics')
+        req.call_app(app)
+        self.assertTrue(req.status.startswith('200 '))
+        data = json.loads(req.output.getvalue().decode('utf-8'))
+        self.assertTrue(data['/list']['count'] == 2)
+        # unmatched paths are not recorded
+        req = MockRequest(path='/missing')
+        req.call_app(app)
+        self.assertTrue(req.status.startswith('404 '))
+        self.assertFalse(None in app.route_metrics)
+
     def test_file_response(self):
         # calculate length of public.txt dynamically
         # allows us to check out with CRLF
@@ -1226,6 +1323,152 @@ class AppTests(unittest.TestCase):
             t.join()
 
 
+class EncodingMiddlewareTests(unittest.TestCase):
+
+    DATA = b"The quick brown fox jumped over the lazy dog\r\n" * 100
+
+    def setUp(self):        # noqa
+        self.write_mode = False
+
+    def app(self, environ, start_response):
+        path = environ['PATH_INFO']
+        headers = []
+        if path.startswith('/text'):
+            headers.append(('Content-Type', 'text/plain'))
+        elif path.startswith('/png'):
+            headers.append(('Content-Type', 'image/png'))
+        else:
+            headers.append(('Content-Type', 'application/atom+xml'))
+        if path.endswith('/small'):
+            data = [b"Hello"]
+        elif path.endswith('/stream'):
+            # streamed in small chunks, no Content-Length
+            data = [self.DATA[i:i + 100] for i in
+                    range3(0, len(self.DATA), 100)]
+        else:
+            data = [self.DATA]
+            headers.append(('Content-Length', str(len(self.DATA))))
+            headers.append(('ETag', '"abc"'))
+        if path.endswith('/encoded'):
+            headers.append(('Content-Encoding', 'x-custom'))
+        write = start_response("200 OK", headers)
+        if self.write_mode:
+            write(b''.join(data))
+            return []
+        return data
+
+    def decode(self, req, wbits):
+        return zlib.decompress(req.output.getvalue(), wbits)
+
+    def test_negotiate(self):
+        app = wsgi.ContentEncodingMiddleware(self.app)
+        req = MockRequest(path="/text")
+        self.assertTrue(app.negotiate(req.environ) is None)
+        for accept, coding in (
+                ("gzip", "gzip"),
+                ("deflate", "deflate"),
+                ("gzip, deflate", "gzip"),
+                ("gzip;q=0.5, deflate", "deflate"),
+                ("*", "gzip"),
+                ("gzip;q=0, deflate;q=0", None),
+                ("identity", None),
+                ("compress", None),
+                ("gzip;;;rubbish", None)):
+            req.environ['HTTP_ACCEPT_ENCODING'] = accept
+            self.assertTrue(app.negotiate(req.environ) == coding, accept)
+        req = MockRequest(method="HEAD", path="/text")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "gzip"
+        self.assertTrue(app.negotiate(req.environ) is None)
+
+    def test_compressible(self):
+        app = wsgi.ContentEncodingMiddleware(self.app)
+        for mtype, result in (
+                ("text/plain", True),
+                ("text/html; charset=utf-8", True),
+                ("application/json", True),
+                ("application/xml", True),
+                ("application/atom+xml", True),
+                ("application/vnd.custom+json", True),
+                ("application/octet-stream", False),
+                ("image/png", False)):
+            self.assertTrue(
+                app.compressible(params.MediaType.from_str(mtype)) == result,
+                mtype)
+        self.assertFalse(app.compressible(None))
+
+    def test_gzip(self):
+        app = wsgi.ContentEncodingMiddleware(self.app)
+        req = MockRequest(path="/text")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "gzip, deflate"
+        req.call_app(app)
+        self.assertTrue(req.status.startswith('200 '))
+        self.assertTrue(req.headers['content-encoding'] == ['gzip'])
+        self.assertFalse('content-length' in req.headers)
+        self.assertTrue(req.headers['vary'] == ['Accept-Encoding'])
+        self.assertTrue(req.headers['etag'] == ['"abc-gzip"'])
+        self.assertTrue(self.decode(req, 31) == self.DATA)
+        self.assertTrue(len(req.output.getvalue()) < len(self.DATA))
+
+    def test_deflate(self):
+        app = wsgi.ContentEncodingMiddleware(self.app, level=1)
+        req = MockRequest(path="/atom/stream")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "deflate"
+        req.call_app(app)
+        self.assertTrue(req.headers['content-encoding'] == ['deflate'])
+        self.assertFalse('content-length' in req.headers)
+        self.assertTrue(self.decode(req, 15) == self.DATA)
+
+    def test_passthrough(self):
+        app = wsgi.ContentEncodingMiddleware(self.app)
+        # no Accept-Encoding
+        req = MockRequest(path="/text")
+        req.call_app(app)
+        self.assertFalse('content-encoding' in req.headers)
+        self.assertTrue(req.headers['content-length'] ==
+                        [str(len(self.DATA))])
+        self.assertTrue(req.output.getvalue() == self.DATA)
+        for path in ("/png", "/text/small", "/text/encoded"):
+            req = MockRequest(path=path)
+            req.environ['HTTP_ACCEPT_ENCODING'] = "gzip"
+            req.call_app(app)
+            self.assertFalse(req.headers.get('content-encoding', None) ==
+                             ['gzip'], path)
+        # small streamed responses get a Content-Length
+        app = wsgi.ContentEncodingMiddleware(self.app, min_size=10000)
+        req = MockRequest(path="/text/stream")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "gzip"
+        req.call_app(app)
+        self.assertFalse('content-encoding' in req.headers)
+        self.assertTrue(req.headers['vary'] == ['Accept-Encoding'])
+        self.assertTrue(req.headers['content-length'] ==
+                        [str(len(self.DATA))])
+        self.assertTrue(req.output.getvalue() == self.DATA)
+        # legacy write callable
+        self.write_mode = True
+        req = MockRequest(path="/text")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "gzip"
+        req.call_app(app)
+        self.assertFalse('content-encoding' in req.headers)
+        self.assertTrue(req.output.getvalue() == self.DATA)
+
+    def test_wsgiapp(self):
+        class App(wsgi.WSGIApp):
+
+            def page(self, context):
+                context.set_status(200)
+                return self.text_response(
+                    context, EncodingMiddlewareTests.DATA)
+
+        App.setup()
+        app = App()
+        app.set_method('/*', app.page)
+        req = MockRequest(path="/index.txt")
+        req.environ['HTTP_ACCEPT_ENCODING'] = "gzip"
+        req.call_app(wsgi.ContentEncodingMiddleware(app))
+        self.assertTrue(req.headers['content-encoding'] == ['gzip'])
+        self.assertTrue(self.decode(req, 31) == self.DATA)
+
+
 class WSGIDataAppTests(unittest.TestCase):
 
     DUMMY_SCHEMA = b"""<?xml version="1.0" encoding="utf-8" standalone="yes" ?>
@@ -1404,6 +1647,34 @@ class WSGIDataAppTests(unittest.TestCase):
             except sql.SQLError:
                 self.fail("Tables expected")
 
+    def test_pool_page(self):
+        settings = {'WSGIDataApp': {'metadata': 'data/metadata.xml',
+                                    'leak_threshold': 30}}
+        with open(self.settings_path, 'wb') as f:
+            f.write(json.dumps(settings).encode('utf-8'))
+
+        class PoolApp(wsgi.WSGIDataApp):
+            settings_file = self.settings_path
+            private_files = self.data_dir
+        p = optparse.OptionParser()
+        PoolApp.add_options(p)
+        options, args = p.parse_args(['--memory'])
+        PoolApp.setup(options=options, args=args)
+        self.assertTrue(PoolApp.data_source.leak_threshold == 30)
+        self.assertTrue(PoolApp.data_source.ping_idle is None)
+        app = PoolApp()
+        app.set_method('/pool', app.pool_page)
+        with PoolApp.container['Dummies'].open() as collection:
+            len(collection)
+        req = MockRequest(path='/pool')
+        req.call_app(app)
+        self.assertTrue(req.status.startswith('200 '))
+        data = json.loads(req.output.getvalue().decode('utf-8'))
+        self.assertTrue(data['max_size'] == 1)
+        self.assertTrue(data['acquired'] >= 1)
+        self.assertTrue(data['leaks'] == [])
+        PoolApp.data_source.close()
+
 
 class AppCipherTests(unittest.TestCase):
 
@@ -1514,6 +1785,37 @@ class AppCipherTests(unittest.TestCase):
         except ValueError:
             self.fail("Failed to validate ascii signed message")
 
+    def test_cipher_cache(self):
+        ac = wsgi.AppCipher(0, b'password', self.key_set)
+        sdata0 = ac.ascii_sign(b"Hello")
+        ac.change_key(1, b"pa$$word",
+                      iso.TimePoint.from_unix_time(time.time() - 1))
+        ac2 = wsgi.AppCipher(1, b"pa$$word", self.key_set)
+        self.assertTrue(ac2.check_signature(sdata0) == b"Hello")
+        self.assertTrue(ac2.cipher_misses == 1)
+        # the old cipher is now cached
+        self.assertTrue(ac2.check_signature(sdata0) == b"Hello")
+        self.assertTrue(ac2.cipher_misses == 1)
+        self.assertTrue(ac2.cipher_hits == 1)
+        # unknown keys are treated as bad signatures...
+        bad_sig = "7" + sdata0[1:]
+        try:
+            ac2.check_signature(bad_sig)
+            self.fail("Validated signature with unknown key")
+        except ValueError:
+            pass
+        self.assertTrue(7 in ac2._missing_keys)
+        # ...and remembered
+        save_key_set = ac2.key_set
+        ac2.key_set = None
+        try:
+            ac2.check_signature(bad_sig)
+            self.fail("Validated signature with unknown key")
+        except ValueError:
+            pass
+        ac2.key_set = save_key_set
+        self.assertTrue(ac2.cipher_misses == 3)
+
     def test_aes(self):
         if not wsgi.got_crypto:
             logging.warn("Skipping AESAppCipher tests, PyCrypto not installed")
@@ -1682,6 +1984,44 @@ class FullAppTests(unittest.TestCase):
         self.assertTrue(req.status.startswith('200 '))
         self.assertFalse('location' in req.headers)
 
+    def test_session_refresh(self):
+        req = MockRequest()
+        req.call_app(self.app)
+        target = URI.from_octets(req.headers['location'][0])
+        cflag = req.cookies[self.app._test_cookie]
+        sid = req.cookies[self.app._session_cookie]
+        req = MockRequest(path=target.abs_path, query=target.query)
+        req.add_cookies([cflag, sid])
+        req.call_app(self.app)
+        self.assertTrue(req.status.startswith('303 '), req.status)
+        sid = req.cookies[self.app._session_cookie]
+        # the session is established and was seen just now
+        misses = self.app.session_cache_misses
+        for i in range3(2):
+            req = MockRequest()
+            req.add_cookies([cflag, sid])
+            req.call_app(self.app)
+            self.assertTrue(req.status.startswith('200 '))
+            self.assertFalse(self.app._session_cookie in req.cookies)
+        self.assertTrue(self.app.session_refresh_skips == 2)
+        self.assertTrue(self.app.session_cache_misses == misses + 1)
+        self.assertTrue(self.app.session_cache_hits >= 1)
+        # the cached session must not be modified by a request
+        session = self.app.read_session_cookie(sid.value.decode('ascii'))
+        session.seen_now()
+        session2 = self.app.read_session_cookie(sid.value.decode('ascii'))
+        self.assertFalse(session is session2)
+        # with no refresh interval the cookie is updated every time
+        self.app._session_refresh = 0
+        req = MockRequest()
+        req.add_cookies([cflag, sid])
+        req.call_app(self.app)
+        self.assertTrue(req.status.startswith('200 '))
+        self.assertTrue(self.app._session_cookie in req.cookies)
+        new_sid = req.cookies[self.app._session_cookie]
+        self.assertFalse(new_sid.value == sid.value)
+        self.assertTrue(self.app.session_refresh_skips == 2)
+
     def test_unframed_cookies(self):
         req = MockRequest()
         req.call_app(self.app)
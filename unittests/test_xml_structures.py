@@ -15,6 +15,7 @@ from pyslet.py2 import (
     dict_keys,
     is_unicode,
     range3,
+    uempty,
     ul)
 from pyslet.xml import structures
 
@@ -221,6 +222,35 @@ class XMLCharacterTests(unittest.TestCase):
         self.assertTrue(n_namestartchars == 54002,
                         "name start char total %i" % n_namestartchars)
 
+    def test_escape(self):
+        self.assertTrue(structures.escape_char_data(
+            ul('<a & b>\r"\'\xe9')) == ul('&lt;a &amp; b&gt;&#xD;"\'\xe9'))
+        self.assertTrue(structures.escape_char_data(
+            ul('"\'"'), True) == ul('\'"&apos;"\''))
+        self.assertTrue(structures.escape_char_data(
+            ul('\'"\''), True) == ul('"\'&quot;\'"'))
+        self.assertTrue(structures.escape_char_data(uempty, True) == '""')
+        self.assertTrue(structures.escape_char_data7(
+            ul('<a & b>\r"\'\xe9') + character(0x20ac)) ==
+            ul('&lt;a &amp; b&gt;&#xD;"\'&#xE9;&#x20AC;'))
+        self.assertTrue(structures.escape_char_data7(
+            ul('"\'"'), True) == ul('"&#x22;\'&#x22;"'))
+        self.assertTrue(structures.escape_char_data7(
+            ul('"\xe9'), True) == ul('\'"&#xE9;\''))
+        if MAX_CHAR > 0xFFFF:
+            self.assertTrue(structures.escape_char_data7(
+                character(0x1F600)) == ul('&#x01F600;'))
+
+    def test_collapse_space(self):
+        self.assertTrue(structures.collapse_space(ul(' a \t\r\nb  ')) ==
+                        ul('a b '))
+        self.assertTrue(structures.collapse_space(ul(' a  b'), False) ==
+                        ul(' a b'))
+        self.assertTrue(structures.collapse_space(ul('  ')) == ul(' '))
+        self.assertTrue(structures.collapse_space(uempty) == ul(' '))
+        self.assertTrue(structures.collapse_space(
+            ul('a..b'), stest=lambda c: c == '.') == ul('a b'))
+
     def find_edges(self, test_func, max):
         edges = []
         flag = False
@@ -492,6 +522,22 @@ class ElementTests(unittest.TestCase):
         self.assertTrue(e.GenericElementB is child5,
                         "Generic sub-class element via member")
 
+    def test_factory_cache(self):
+        e = ReflectiveElement(None)
+        e.add_child(GenericSubclassA)
+        e.add_child(structures.Element)
+        cache = ReflectiveElement.__dict__['_xml_factories']
+        self.assertTrue(cache[GenericSubclassA] == 'GenericElementA')
+        self.assertTrue(cache[structures.Element] is None)
+        # the cache is shared by all instances of the class
+        e2 = ReflectiveElement(None)
+        child = e2.add_child(GenericSubclassA)
+        self.assertTrue(e2.generics == [child])
+        # but not by other classes
+        child.add_child(structures.Element)
+        self.assertTrue('_xml_factories' in GenericSubclassA.__dict__)
+        self.assertFalse('_xml_factories' in GenericElementA.__dict__)
+
     def test_data(self):
         e = structures.Element(None)
         self.assertTrue(e.is_mixed(), "Mixed default")
@@ -555,6 +601,38 @@ class ElementTests(unittest.TestCase):
         self.assertTrue(e1 == e2)
         self.assertTrue(e1 is not e2)
 
+    def test_generate_xml(self):
+        class Custom(structures.Element):
+            XMLNAME = "custom"
+
+            def generate_xml(self, escape_function=structures.escape_char_data,
+                             indent='', tab='\t', root=False):
+                yield "<custom indent=%s/>" % escape_function(indent, True)
+
+        doc = structures.Document()
+        e = doc.add_child(ElementContent)
+        b = e.add_child(structures.Element, 'b')
+        b.set_value('x & y\r')
+        b.set_space('preserve')
+        e.add_child(Custom)
+        e.add_child(structures.Element, 'c').set_attribute('d', '"\'"')
+        self.assertTrue(
+            str(e) == '\n<elements>\n\t<b xml:space="preserve">x &amp; '
+            'y&#xD;</b><custom indent="\t"/>\n\t<c d=\'"&apos;"\'/>'
+            '\n</elements>')
+        self.assertTrue(
+            ''.join(e.generate_xml(tab='')) ==
+            '<elements><b xml:space="preserve">x &amp; y&#xD;</b>'
+            '<custom indent=""/><c d=\'"&apos;"\'/></elements>')
+        # the tree is not walked recursively
+        e = e.add_child(structures.Element, 'e')
+        for i in range(2000):
+            e = e.add_child(structures.Element, 'e')
+        e.set_value('deep')
+        data = str(doc)
+        self.assertTrue(data.count('<e>') == 2001)
+        self.assertTrue('<e>deep</e>' in data)
+
 
 class DocumentTests(unittest.TestCase):
 
@@ -770,6 +848,32 @@ class DocumentTests(unittest.TestCase):
         new_id = doc.get_unique_id('test')
         self.assertFalse(new_id == 'test' or new_id == 'test2')
 
+    def test_element_class_table(self):
+        table = structures.get_element_class_table(ReflectiveDocument)
+        self.assertTrue(isinstance(table, dict))
+        d = ReflectiveDocument()
+        d.read(src=b'<reflection><etest/><other/></reflection>')
+        self.assertTrue(isinstance(d.root, ReflectiveElement))
+        self.assertTrue(
+            structures.get_element_class_table(ReflectiveDocument) is table)
+        # the root element is found in the document context
+        self.assertTrue(table['etest'] is ReflectiveElement)
+        self.assertTrue(table['other'] is structures.Element)
+        structures.map_class_elements({}, {})
+        self.assertFalse(
+            structures.get_element_class_table(ReflectiveDocument) is table)
+
+        class InstanceDocument(structures.Document):
+
+            def get_element_class(self, name):
+                return ReflectiveElement
+
+        self.assertTrue(
+            structures.get_element_class_table(InstanceDocument) is None)
+        d = InstanceDocument()
+        d.read(src=b'<test/>')
+        self.assertTrue(isinstance(d.root, ReflectiveElement))
+
     def test_reflection(self):
         """Test the built-in handling of reflective attributes and elements."""
         reflective_xml = ul("""<?xml version="1.0" encoding="UTF-8"?>
@@ -223,6 +223,24 @@ class XSRegularExpressionTests(unittest.TestCase):
         r = xsi.RegularExpression(".*")
         self.assertTrue(r.src == ".*", "Source still available")
 
+    def test_defer(self):
+        r = xsi.RegularExpression("\\i\\c*", defer=True)
+        self.assertTrue(r.src == "\\i\\c*")
+        self.assertTrue(r.match("_x1"))
+        self.assertFalse(r.match("1x"))
+        # errors are raised when the expression is first used
+        r = xsi.RegularExpression("[a-", defer=True)
+        try:
+            r.match("a")
+            self.fail("deferred syntax error")
+        except xsi.RegularExpressionError:
+            pass
+        try:
+            xsi.RegularExpression("[a-")
+            self.fail("syntax error")
+        except xsi.RegularExpressionError:
+            pass
+
 
 class XSRegularExpressionParserTests(unittest.TestCase):
 